@@ -0,0 +1,20 @@
+#%%
+import sys,os
+
+from thermal_index_functions import run_thermal_index
+#%%
+index = sys.argv[1] #'wbgt', 'utci', 'heat_index' or 'utci_cds' (daily statistics only, of the UTCI downloaded from the CDS), see thermal_indices in thermal_index_functions
+y_start = int(sys.argv[2]) #first year
+y_end = int(sys.argv[3]) if len(sys.argv)>3 else y_start #last year (included), default y_start
+nb_workers = int(sys.argv[4]) if len(sys.argv)>4 else 1 #number of years computed in parallel, default 1
+hourly = True #write the hourly index, default True
+daily_stats = [] #daily statistics computed in the same pass (see daily_statistics in thermal_index_functions), for instance ['daymean','daymax','daymin'], default []
+day = 'utc' #days of the daily statistics : 'utc' or 'solar' (local solar days, see DailyAggregator in daily_aggregation_functions), default 'utc'
+days_per_chunk = 1 #number of days read, computed and written at once, default 1
+input_paths = {} #path templates (formatted with datadir and y) and variable names of the hourly inputs replacing the ones of era5_hourly_inputs, required for d2m (UTCI and heat index), as {'d2m':(path_template,'d2m')}
+
+#The hourly inputs are read from the files of era5_hourly_inputs (in the DATADIR directory) or input_paths, cropped to their common grid, and the hourly index and daily statistics of each year are written
+#in their own compressed netCDF files (see the output templates of thermal_indices).
+if __name__ == '__main__' :
+    output_paths = run_thermal_index(index,range(y_start,y_end+1),nb_workers=nb_workers,input_paths=input_paths,hourly=hourly,daily_stats=daily_stats,day=day,days_per_chunk=days_per_chunk)
+    print(*output_paths,sep='\n')
@@ -0,0 +1,18 @@
+#%%
+import sys,os
+
+from cds_download_functions import download_era5
+#%%
+variables = sys.argv[1].split(',') #variables downloaded, separated by commas, for instance 'u10,v10' (see era5_downloads in cds_download_functions)
+y_start = int(sys.argv[2]) #first year
+y_end = int(sys.argv[3]) if len(sys.argv)>3 else y_start #last year (included), default y_start
+nb_requests = int(sys.argv[4]) if len(sys.argv)>4 else 4 #number of requests sent at once to the CDS, default 4
+split = None #'month' (one request per month) or 'year' (one request per year), default the split of each variable in era5_downloads
+retries = 5 #number of retries of a failed request, after exponential delays from backoff seconds
+backoff = 60
+
+#The requests of all the variables, years (and months) are sent concurrently. The downloaded files are recorded in manifests (<file>.manifest.json) with their request and checksum,
+#so that running the script again skips them and only sends the missing (or failed) requests. The monthly parts are merged into the yearly files of era5_downloads (in the DATADIR directory).
+if __name__ == '__main__' :
+    target_paths = download_era5(variables,range(y_start,y_end+1),nb_requests=nb_requests,split=split,retries=retries,backoff=backoff)
+    print(*target_paths,sep='\n')
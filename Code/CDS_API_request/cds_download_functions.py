@@ -0,0 +1,274 @@
+#%%
+import os #read data directories
+import json #manifests of the downloaded files
+import hashlib #checksums of the downloaded files
+import random #jitter of the retry delays
+import time #retry delays
+import shutil #merge of the monthly archives
+import tarfile #monthly tgz archives of the derived products
+import urllib.error #errors of the requests
+import http.client
+from datetime import datetime #completion date of the manifests
+from concurrent.futures import ThreadPoolExecutor, as_completed #requests run concurrently
+import netCDF4 as nc
+from tqdm import tqdm
+
+from file_functions import temporary_path, commit_file, remove_temporary_file
+
+#%%
+months = [f"{m:02d}" for m in range(1,13)]
+days = [f"{d:02d}" for d in range(1,32)]
+hours = [f"{h:02d}:00" for h in range(24)]
+europe_area = [71.5,-12.5,30,45,] #download European data (no Iceland)
+
+#ERA5 variables downloaded from the CDS : dataset name, request (without year, month and day), target path template (formatted with the data directory datadir and the year y)
+#and split of the yearly request ('month' : one request per month, merged into the yearly target once all the months are downloaded, 'year' : a single request).
+era5_downloads = {
+    'u10' : {'name':'reanalysis-era5-single-levels',
+             'request':{'product_type':'reanalysis', 'format':'netcdf', 'variable':'10m_u_component_of_wind', 'time':hours, 'area':europe_area},
+             'target':"{datadir}/ERA5/WBGT/{y}/ERA5_Europe_025deg_hourly_U_wind_{y}010100-{y}123123.nc", 'split':'month'},
+    'v10' : {'name':'reanalysis-era5-single-levels',
+             'request':{'product_type':'reanalysis', 'format':'netcdf', 'variable':'10m_v_component_of_wind', 'time':hours, 'area':europe_area},
+             'target':"{datadir}/ERA5/WBGT/{y}/ERA5_Europe_025deg_hourly_V_wind_{y}010100-{y}123123.nc", 'split':'month'},
+    't850' : {'name':'reanalysis-era5-pressure-levels-preliminary-back-extension',
+              'request':{'product_type':'reanalysis', 'format':'netcdf', 'variable':'temperature', 'pressure_level':'850', 'time':hours, 'area':europe_area},
+              'target':"{datadir}/ERA5/t850/{y}/ERA5_Europe_025deg_hour_t850_{y}010100-{y}123123.nc", 'split':'month'},
+    'z500' : {'name':'reanalysis-era5-pressure-levels',
+              'request':{'product_type':'reanalysis', 'format':'netcdf', 'variable':'geopotential', 'pressure_level':'500', 'time':hours, 'area':europe_area},
+              'target':"{datadir}/ERA5/z500/{y}/ERA5_Global_025deg_hour_z500_{y}010100-{y}123123.nc", 'split':'month'},
+    'mrt' : {'name':'derived-utci-historical',
+             'request':{'variable':'mean_radiant_temperature', 'version':'1_1', 'product_type':'consolidated_dataset', 'format':'tgz'},
+             'target':"{datadir}/ERA5/WBGT/ERA5_Global_025deg_hourly_MRT_{y}0101-{y}1231.tar.gz", 'split':'month'},
+    'utci' : {'name':'derived-utci-historical',
+              'request':{'variable':'universal_thermal_climate_index', 'version':'1_1', 'product_type':'consolidated_dataset', 'format':'tgz'},
+              'target':"{datadir}/ERA5/UTCI/ERA5_Global_025deg_hourly_UTCI_{y}0101-{y}1231.tar.gz", 'split':'month'},
+}
+
+#%%
+#Manifests : once a file is downloaded (or merged), a manifest (path + '.manifest.json') records the request it answers and the checksum of the file.
+#A file is only skipped if its manifest is complete and still matches the request and the file, so that an interrupted run can be resumed by running it again.
+def manifest_path(path):
+    return path+'.manifest.json'
+
+def part_path(target, month):
+    '''This function returns the path of the monthly part of a yearly target (in a .parts directory next to it), merged into the target once all the months are downloaded.'''
+
+    directory, filename = os.path.split(target)
+    root, extension = filename.split('.',1)
+    return os.path.join(directory,'.parts',f"{root}_{month}.{extension}")
+
+def file_checksum(path, block_size=16*2**20):
+    '''This function returns the size and the SHA-256 hash of the file path.'''
+
+    sha = hashlib.sha256()
+    with open(path,'rb') as f :
+        for block in iter(lambda: f.read(block_size),b'') :
+            sha.update(block)
+    return {'size':os.path.getsize(path), 'sha256':sha.hexdigest()}
+
+def write_manifest(path, name, request):
+    '''This function writes (atomically) the manifest of the complete file path, downloaded with the dataset name and request (see check_manifest).'''
+
+    manifest = {'file':os.path.basename(path), 'name':name, 'request':request, 'checksum':file_checksum(path),
+                'created':datetime.now().isoformat(timespec='seconds'), 'complete':True}
+    with open(temporary_path(manifest_path(path)),'w') as f :
+        json.dump(manifest,f,indent=1)
+    commit_file(manifest_path(path))
+    return manifest
+
+def check_manifest(path, name, request, checksum=True):
+    '''This function returns True if the file path can be skipped : it exists, its manifest is complete and matches the dataset name and request,
+    and the file still has the recorded size and (if checksum is True) SHA-256 hash.'''
+
+    if os.path.exists(path)==False or os.path.exists(manifest_path(path))==False :
+        return False
+    try :
+        with open(manifest_path(path)) as f :
+            manifest = json.load(f)
+    except ValueError : #unreadable manifest
+        return False
+    if manifest.get('complete')!=True or manifest.get('name')!=name or manifest.get('request')!=json.loads(json.dumps(request)) :
+        return False
+    if checksum :
+        return manifest.get('checksum')==file_checksum(path)
+    return manifest.get('checksum',{}).get('size')==os.path.getsize(path)
+
+def remove_file(path):
+    '''This function removes the file path and its manifest, if they exist.'''
+
+    for file_path in [path,manifest_path(path)] :
+        if os.path.exists(file_path) :
+            os.remove(file_path)
+    return
+
+#%%
+def plan_downloads(variables, years, datadir=None, split=None):
+    '''This function plans the downloads of the ERA5 variables (see era5_downloads) for every year of years. It returns a list of targets (dicts) with the dataset name, the yearly request
+    and target path (formatted with datadir, default the DATADIR environment variable) and the requests of its parts (list of (path, request)) : one per month if the split of the variable
+    (or split, if given) is 'month', else the yearly request itself.'''
+
+    if datadir is None :
+        datadir = os.environ.get("DATADIR","/data/tmandonnet")
+    targets = []
+    for y in years :
+        for var in variables :
+            definition = era5_downloads[var]
+            target = definition['target'].format(datadir=datadir,y=y)
+            request = definition['request']|{'year':str(y), 'month':months, 'day':days}
+            if (split or definition['split'])=='month' :
+                parts = [(part_path(target,month),request|{'month':month}) for month in months]
+            else :
+                parts = [(target,request)]
+            targets.append({'variable':var, 'year':int(y), 'name':definition['name'], 'request':request, 'target':target, 'parts':parts})
+    return targets
+
+def merge_netcdf(paths, target):
+    '''This function concatenates the netCDF files paths along their time axis ('time', or 'valid_time' for the netCDF files of the new CDS) into the netCDF file target,
+    keeping the attributes and the compression of the variables. The packed variables (scale_factor, add_offset, which differ between the requests) are unpacked to float32,
+    the other ones are copied as they are. The parts are copied one at a time.'''
+
+    packing_atts = ['scale_factor','add_offset','_FillValue','missing_value']
+    with nc.Dataset(paths[0],mode='r') as f_first, nc.Dataset(target,mode='w',format=f_first.data_model) as f_out :
+        time_dim = next(dim for dim in ['time','valid_time'] if dim in f_first.dimensions)
+        f_out.setncatts({att:f_first.getncattr(att) for att in f_first.ncattrs()})
+        for dim,dimension in f_first.dimensions.items() :
+            f_out.createDimension(dim,None if dim==time_dim else len(dimension))
+        compression = f_first.data_model.startswith('NETCDF4') #the classic netCDF files of the CDS are not compressed
+        packed = {var for var,variable in f_first.variables.items() if 'scale_factor' in variable.ncattrs() or 'add_offset' in variable.ncattrs()}
+        for var,variable in f_first.variables.items() :
+            filters = variable.filters() or {}
+            chunking = variable.chunking() if isinstance(variable.chunking(),list) else None
+            if var in packed :
+                var_out = f_out.createVariable(var,'f4',variable.dimensions,zlib=compression,complevel=filters.get('complevel') or 4,chunksizes=chunking,fill_value=nc.default_fillvals['f4'])
+                var_out.setncatts({att:variable.getncattr(att) for att in variable.ncattrs() if att not in packing_atts})
+            else :
+                fill_value = variable.getncattr('_FillValue') if '_FillValue' in variable.ncattrs() else None
+                var_out = f_out.createVariable(var,variable.datatype,variable.dimensions,zlib=filters.get('zlib',False),complevel=filters.get('complevel') or 4,chunksizes=chunking,fill_value=fill_value)
+                var_out.setncatts({att:variable.getncattr(att) for att in variable.ncattrs() if att!='_FillValue'})
+                var_out.set_auto_maskandscale(False)
+                if time_dim not in variable.dimensions :
+                    variable.set_auto_maskandscale(False)
+                    var_out[...] = variable[...]
+        start = 0
+        for path in paths :
+            with nc.Dataset(path,mode='r') as f :
+                nb_times = len(f.dimensions[time_dim])
+                for var,variable in f.variables.items() :
+                    if time_dim in variable.dimensions :
+                        variable.set_auto_maskandscale(var in packed) #the packed values are unpacked with the attributes of their own part
+                        f_out.variables[var][start:start+nb_times] = variable[...]
+            start += nb_times
+    return
+
+def merge_tgz(paths, target):
+    '''This function gathers the members of the tgz archives paths (daily netCDF files of the derived products) into the tgz archive target, streamed member by member.'''
+
+    with tarfile.open(target,mode='w:gz') as tar_out :
+        for path in paths :
+            with tarfile.open(path,mode='r:gz') as tar :
+                for member in tar :
+                    tar_out.addfile(member,tar.extractfile(member) if member.isfile() else None)
+    return
+
+def merge_parts(target, paths):
+    '''This function merges the parts paths of a target (netCDF or tgz, from its extension) into the target, through its temporary path.'''
+
+    if len(paths)==1 and paths[0]==target :
+        return
+    if target.endswith('.tar.gz') or target.endswith('.tgz') :
+        merge_tgz(paths,temporary_path(target))
+    elif len(paths)==1 :
+        shutil.copyfile(paths[0],temporary_path(target))
+    else :
+        merge_netcdf(paths,temporary_path(target))
+    commit_file(target)
+    return
+
+#%%
+#Errors of a request that are retried (see retrieve_part) : network errors (connection, timeout) and server errors (HTTP codes 408, 429 and 5xx).
+#The other errors (invalid request, local I/O errors such as a full disk, ...) are raised at once.
+network_errors = (urllib.error.URLError, http.client.HTTPException, ConnectionError, TimeoutError)
+try :
+    import requests #HTTP library of cdsapi
+    network_errors += (requests.exceptions.RequestException,)
+except ImportError :
+    pass
+
+def is_retried(error):
+    '''This function returns True if the error of a request is a network or server error (see network_errors), worth retrying.'''
+
+    if isinstance(error,urllib.error.HTTPError) :
+        status = error.code
+    else :
+        status = getattr(getattr(error,'response',None),'status_code',None) #HTTP errors of requests
+    return isinstance(error,network_errors) and (status is None or status in (408,429) or status>=500)
+
+def default_client():
+    '''This function returns the client of the CDS API (cdsapi.Client, configured by the ~/.cdsapirc file), imported only when the downloads use it.'''
+
+    import cdsapi
+    return cdsapi.Client()
+
+def retrieve_part(client, name, request, path, retries=5, backoff=60):
+    '''This function downloads the request of the dataset name into the file path with client (any object with the retrieve(name, request, target) method of cdsapi.Client),
+    through its temporary path, and writes its manifest. A request failed because of a network or server error (see is_retried) is retried up to retries times,
+    after exponential delays (backoff*2**attempt seconds, with jitter). It returns the number of attempts, and raises the last error if all of them failed (or the first other error).'''
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)),exist_ok=True)
+    for attempt in range(retries+1) :
+        try :
+            client.retrieve(name,request,temporary_path(path))
+            commit_file(path)
+            break
+        except network_errors as error :
+            if attempt==retries or not is_retried(error) :
+                raise
+        finally :
+            remove_temporary_file(path) #a partial download is never kept
+        time.sleep(backoff*2**attempt*random.uniform(1,1.5))
+    write_manifest(path,name,request)
+    return attempt+1
+
+def download_era5(variables, years, datadir=None, client=None, nb_requests=4, split=None, retries=5, backoff=60, checksum=True, keep_parts=False, progress=True):
+    '''This function downloads the ERA5 variables (see era5_downloads) for every year of years into their target files (see plan_downloads), sending up to nb_requests requests
+    at once to the CDS with client (default cdsapi.Client, see retrieve_part for the retries). The files (targets and monthly parts) whose manifest matches their request and checksum
+    (see check_manifest) are skipped, so that an interrupted run is resumed by running it again. Once all the parts of a target are downloaded, they are merged into the target
+    (and removed, unless keep_parts is True). The targets whose requests failed are listed in a RuntimeError raised once the other ones are complete.
+    It returns the list of the target paths.'''
+
+    targets = plan_downloads(variables,years,datadir,split)
+    todo = [target for target in targets if not check_manifest(target['target'],target['name'],target['request'],checksum)]
+    parts = [(target,path,request) for target in todo for path,request in target['parts'] if not check_manifest(path,target['name'],request,checksum)]
+    print(f"{len(targets)-len(todo)} of {len(targets)} targets already downloaded, {len(parts)} requests to send")
+    if client is None and len(parts)>0 :
+        client = default_client()
+
+    remaining = {target['target']:sum(part_target is target for part_target,path,request in parts) for target in todo} #parts not downloaded yet
+    failed = {}
+    def merge_target(target):
+        merge_parts(target['target'],[path for path,request in target['parts']])
+        write_manifest(target['target'],target['name'],target['request'])
+        if not keep_parts :
+            for path,request in target['parts'] :
+                if path!=target['target'] :
+                    remove_file(path)
+        return
+
+    for target in todo : #targets whose parts were all downloaded by an interrupted run
+        if remaining[target['target']]==0 :
+            merge_target(target)
+    with ThreadPoolExecutor(max_workers=nb_requests) as executor :
+        futures = {executor.submit(retrieve_part,client,target['name'],request,path,retries,backoff):(target,path) for target,path,request in parts}
+        for future in tqdm(as_completed(futures),total=len(futures),disable=not progress) :
+            target, path = futures[future]
+            try :
+                future.result()
+            except Exception as error :
+                failed[path] = error
+                continue
+            remaining[target['target']] -= 1
+            if remaining[target['target']]==0 :
+                merge_target(target)
+    if len(failed)>0 :
+        raise RuntimeError(f"{len(failed)} requests failed (run again to resume) :\n"+'\n'.join(f"{path} : {error!r}" for path,error in failed.items()))
+    return [target['target'] for target in targets]
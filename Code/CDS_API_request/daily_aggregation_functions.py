@@ -0,0 +1,77 @@
+#%%
+import numpy as np
+import numpy.ma as ma
+
+#%%
+#Daily statistics computed from the 24 hourly values of each day (the masked hours are ignored)
+daily_statistics = {'daymean':ma.mean, 'daymax':ma.max, 'daymin':ma.min, 'daystd':ma.std}
+
+def solar_hour_offsets(lon):
+    '''This function returns the hour offset of the local solar time of each longitude (degrees east) from UTC, round(lon/15) : the local solar day of a longitude
+    with offset o covers the UTC hours [24*k-o, 24*k-o+24) of the day k.'''
+
+    return np.round(np.asarray(lon)/15).astype(int)
+
+#%%
+class DailyAggregator:
+    '''This class computes daily statistics of hourly fields (time, lat, lon) streamed in chunks : the hourly chunks are appended in order (add),
+    and the statistics of the days completed so far are returned, the hours of the following days being kept until they are complete.
+    With day='utc', a day is made of the 24 hours of a UTC day. With day='solar', it is made of the 24 hours of the local solar day of each longitude
+    (UTC hours shifted by solar_hour_offsets). The local days east of Greenwich start with hours of the day before the first chunk (hours_before of start, for instance
+    the end of the previous year), the ones west of Greenwich end with hours of the day after the last chunk (hours_after of finish, the beginning of the next year).
+    The hours that are not given are masked, the statistics of these days being computed from the available hours.
+    At most before+after hours (less than a day) are kept in addition to the incomplete day.'''
+
+    def __init__(self, lon, daily_stats, day='utc'):
+        if day not in ('utc','solar') :
+            raise ValueError(f"Unknown day {day}, 'utc' or 'solar'")
+        self.daily_stats = list(daily_stats)
+        offsets = solar_hour_offsets(lon) if day=='solar' else np.zeros(len(lon),dtype=int)
+        self.before = max(int(offsets.max()),0) #hours of the day before the first chunk needed by the first local days
+        self.after = max(-int(offsets.min()),0) #hours of the day after the last chunk needed by the last local days
+        #groups of consecutive longitudes with the same offset, whose days are strided windows of the hours
+        bounds = list(np.flatnonzero(np.diff(offsets))+1)
+        self.groups = [(int(offsets[a]),slice(a,b)) for a,b in zip([0]+bounds,bounds+[len(offsets)])]
+        self.pending = None #hours from the first hour needed by the next day
+
+    def start(self, hours_before=None):
+        '''This method sets the hours_before hours before the first chunk (the last ones of the day before, at least self.before hours, or None if they are not available).'''
+
+        self.pending = None if hours_before is None else hours_before[len(hours_before)-self.before:]
+        return
+
+    def add(self, values):
+        '''This method appends the hourly values of a chunk, following the previous ones, and returns the statistics of the completed days (dict of arrays (days, lat, lon), possibly without day).'''
+
+        if self.pending is None :
+            self.pending = ma.masked_all((self.before,)+values.shape[1:],dtype=values.dtype)
+        self.pending = ma.concatenate([self.pending,values]) if len(self.pending)>0 else values
+        return self.complete_days()
+
+    def finish(self, hours_after=None):
+        '''This method appends the hours_after hours after the last chunk (the first ones of the day after, at least self.after hours, or None if they are not available)
+        and returns the statistics of the remaining days. The hours of an incomplete last day are ignored.'''
+
+        if self.after>0 :
+            if hours_after is None :
+                hours_after = ma.masked_all((self.after,)+self.pending.shape[1:],dtype=self.pending.dtype)
+            self.pending = ma.concatenate([self.pending,hours_after[:self.after]])
+        return self.complete_days()
+
+    def complete_days(self):
+        '''This method computes the statistics of the complete days of the pending hours, and keeps the hours needed by the following days (copied, the chunks can be reused buffers).'''
+
+        nb_days = max((len(self.pending)-self.before-self.after)//24,0)
+        if len(self.groups)==1 and self.groups[0][0]==0 : #UTC days, without copy
+            days = self.pending[:24*nb_days].reshape((nb_days,24)+self.pending.shape[1:])
+            stats_values = {stat:daily_statistics[stat](days,axis=1) for stat in self.daily_stats}
+        else :
+            stats_values = {stat:ma.masked_all((nb_days,)+self.pending.shape[1:],dtype=self.pending.dtype) for stat in self.daily_stats}
+            for offset,lon_slice in self.groups :
+                start = self.before-offset
+                window = self.pending[start:start+24*nb_days,:,lon_slice]
+                days = window.reshape((nb_days,24)+window.shape[1:]) #view, one row of 24 hours per local day
+                for stat in self.daily_stats :
+                    stats_values[stat][:,:,lon_slice] = daily_statistics[stat](days,axis=1)
+        self.pending = self.pending[24*nb_days:].copy()
+        return stats_values
@@ -0,0 +1,120 @@
+#%%
+import os #read data directories
+from concurrent.futures import ProcessPoolExecutor, as_completed #years converted in parallel
+from datetime import datetime, timezone #creation date of the daily files
+import netCDF4 as nc
+from tqdm import tqdm
+
+from daily_aggregation_functions import DailyAggregator
+from thermal_index_functions import coordinate, create_output_file, write_chunk
+from file_functions import commit_file
+
+#%%
+#Hourly ERA5 variables converted to daily statistics : path template of the hourly file (formatted with the data directory datadir and the year y) and name of the variable in it,
+#name and attributes of the daily variable, CDS product of the hourly file, and path template of the daily files (formatted with datadir, y and the statistic stat, see daily_statistics).
+hourly_variables = {
+    't850' : {'input':"{datadir}/ERA5/t850/{y}/ERA5_Europe_025deg_hour_t850_{y}010100-{y}123123.nc", 'input_variable':'t',
+              'variable':'t850', 'units':'K', 'long_name':'850 hPa temperature', 'standard_name':'t850', 'product':'reanalysis-era5-pressure-levels',
+              'daily_output':"{datadir}/ERA5/t850/{y}/ERA5_Europe_025deg_{stat}_t850_{y}0101-{y}1231.nc"},
+    'z500' : {'input':"{datadir}/ERA5/z500/{y}/ERA5_Global_025deg_hour_z500_{y}010100-{y}123123.nc", 'input_variable':'z',
+              'variable':'z', 'units':'m**2.s**-2', 'long_name':'500 hPa geopotential', 'standard_name':'z500', 'product':'reanalysis-era5-pressure-levels',
+              'daily_output':"{datadir}/ERA5/z500/{y}/day/z/ERA5_Europe_025deg_{stat}_z500_{y}0101-{y}1231.nc"},
+}
+
+#%%
+def ascending_grid(f):
+    '''This function returns the latitudes and longitudes of the netCDF file f in ascending order, and the slices reading its (time, lat, lon) variables in this order
+    (reversed axes are read as views with a negative step, without copy).'''
+
+    lat, lon = coordinate(f,['lat','latitude']), coordinate(f,['lon','longitude'])
+    lat_step = -1 if lat[0]>lat[-1] else 1
+    lon_step = -1 if lon[0]>lon[-1] else 1
+    return lat[::lat_step], lon[::lon_step], (slice(None),slice(None,None,lat_step),slice(None,None,lon_step))
+
+def read_hours(variable, time_slice, grid_slices):
+    '''This function reads the hours time_slice of the netCDF variable, with its grid axes in ascending order (see ascending_grid).'''
+
+    return variable[time_slice][grid_slices]
+
+def boundary_hours(definition, datadir, y, nb_hours, lat, lon, last=False):
+    '''This function reads the first nb_hours hours of the hourly variable definition (see hourly_variables) of the year y (or the last ones if last is True),
+    for the local solar days across the boundaries of the years. It returns None if the file of the year y does not exist or is on another grid than lat, lon.'''
+
+    path = definition['input'].format(datadir=datadir,y=y)
+    if not os.path.exists(path) :
+        return None
+    with nc.Dataset(path,mode='r') as f :
+        lat_y, lon_y, grid_slices = ascending_grid(f)
+        if lat_y.shape!=lat.shape or lon_y.shape!=lon.shape :
+            return None
+        variable = f.variables[definition['input_variable']]
+        nb_hours_y = variable.shape[0]
+        return read_hours(variable,slice(nb_hours_y-nb_hours,nb_hours_y) if last else slice(0,nb_hours),grid_slices)
+
+#%%
+def convert_to_daily_year(var, y, datadir=None, daily_stats=('daymean',), day='utc', days_per_chunk=8, complevel=5, progress=True):
+    '''This function computes the daily statistics daily_stats (see daily_statistics) of the hourly variable var (see hourly_variables) of the year y, over the UTC days (day='utc')
+    or the local solar days (day='solar', see DailyAggregator, using the hours of the years before and after if their files exist).
+    The hourly file is streamed in chunks of days_per_chunk days, on a grid in ascending order, and only the daily files are written (compressed with zlib, complevel, and chunked by day),
+    to temporary files renamed once complete. It returns the paths of the daily files.'''
+
+    if datadir is None :
+        datadir = os.environ.get("DATADIR","/data/tmandonnet")
+    y = int(y)
+    definition = hourly_variables[var]
+    output_paths = {stat:definition['daily_output'].format(datadir=datadir,y=y,stat=stat) for stat in daily_stats}
+
+    nc_files_out = {}
+    with nc.Dataset(definition['input'].format(datadir=datadir,y=y),mode='r') as f :
+        try :
+            lat, lon, grid_slices = ascending_grid(f)
+            variable = f.variables[definition['input_variable']]
+            nb_hours = variable.shape[0]
+            for stat,path in output_paths.items() :
+                nc_files_out[stat] = create_output_file(path,f"Daily {stat[3:]} {var} for year {y}",lat,lon,definition,complevel)
+                #global attributes of the daily files of the former conversion scripts
+                nc_files_out[stat].setncatts({'title':"ERA5", 'Conventions':"CF-1.6", 'source':"Climate Data Store", 'product':definition['product'],
+                                              'creation_date':datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')+" (UTC)"})
+                nc_files_out[stat].variables[definition['variable']].coordinates = "lat lon"
+                time = nc_files_out[stat].createVariable('time', 'f4', ('time',))
+                time.units = f"days since {y}-01-01"
+                time.calendar = "proleptic_gregorian"
+                time.axis = "T"
+                time.standard_name = "time"
+                time.long_name = "Time axis"
+                time[:] = range(nb_hours//24)
+            variables_out = {stat:nc_file_out.variables[definition['variable']] for stat,nc_file_out in nc_files_out.items()}
+
+            aggregator = DailyAggregator(lon,daily_stats,day)
+            if aggregator.before>0 :
+                aggregator.start(boundary_hours(definition,datadir,y-1,aggregator.before,lat,lon,last=True))
+            day_start = 0 #first day not written yet
+            chunk_hours = 24*days_per_chunk
+            for start in tqdm(range(0,nb_hours,chunk_hours),disable=not progress) :
+                for stat,values_stat in aggregator.add(read_hours(variable,slice(start,start+chunk_hours),grid_slices)).items() :
+                    write_chunk(variables_out[stat],day_start,values_stat)
+                day_start += len(values_stat)
+            hours_after = boundary_hours(definition,datadir,y+1,aggregator.after,lat,lon) if aggregator.after>0 else None
+            for stat,values_stat in aggregator.finish(hours_after).items() :
+                write_chunk(variables_out[stat],day_start,values_stat)
+            for stat,path in output_paths.items() :
+                nc_files_out[stat].close()
+                commit_file(path)
+        finally :
+            for nc_file_out in nc_files_out.values() :
+                if nc_file_out.isopen() :
+                    nc_file_out.close()
+    return list(output_paths.values())
+
+def run_daily_conversion(var, years, nb_workers=1, **kwargs):
+    '''This function converts the hourly variable var to daily statistics for every year of years (see convert_to_daily_year, with the keyword arguments kwargs),
+    in parallel in nb_workers processes, each one streaming its own hourly file. It returns the paths of the daily files.'''
+
+    if nb_workers==1 :
+        return [path for y in years for path in convert_to_daily_year(var,y,**kwargs)]
+    output_paths = []
+    with ProcessPoolExecutor(max_workers=nb_workers) as executor :
+        futures = [executor.submit(convert_to_daily_year,var,y,progress=False,**kwargs) for y in years]
+        for future in tqdm(as_completed(futures),total=len(futures)) :
+            output_paths += future.result()
+    return sorted(output_paths)
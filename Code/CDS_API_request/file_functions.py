@@ -0,0 +1,38 @@
+#%%
+import os #read data directories
+import threading #temporary files of each writer
+
+#%%
+#Atomic writes : each output file (downloaded file, merged file, manifest, hourly index or daily statistics) is written to temporary_path(path), then commit_file(path) flushes it to the disk
+#and renames it to path. A crashed or killed run can only leave a temporary file, never a truncated file at the final path. The temporary path is specific to the process and thread
+#writing the file, so that two writers of the same file (for instance two downloads or two years run in parallel) never share it : the last one committed wins.
+def temporary_path(path):
+    '''This function returns the temporary path a file is written to before commit_file (same directory and extension, so that the writers recognize the format),
+    made unique to the writing process and thread.'''
+
+    root, extension = os.path.splitext(path)
+    if root.endswith('.tar') : #.tar.gz archives
+        root, extension = root[:-4], '.tar'+extension
+    return f"{root}.tmp.{os.getpid()}.{threading.get_ident()}{extension}"
+
+def commit_file(path):
+    '''This function flushes the temporary file of path to the disk (fsync) and renames it to path atomically (os.replace), replacing any previous version.'''
+
+    tmp_path = temporary_path(path)
+    with open(tmp_path,'rb+') as f :
+        os.fsync(f.fileno())
+    os.replace(tmp_path,path)
+    if os.name == 'posix' : #the renaming itself is made durable by syncing the directory
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)),os.O_RDONLY)
+        try :
+            os.fsync(dir_fd)
+        finally :
+            os.close(dir_fd)
+    return
+
+def remove_temporary_file(path):
+    '''This function removes the temporary file of path, if it exists (after a failed write).'''
+
+    if os.path.exists(temporary_path(path)) :
+        os.remove(temporary_path(path))
+    return
@@ -0,0 +1,226 @@
+#%%
+import os #temporary files of the generated data
+import io
+import json #requests and task states
+import time #queue time of the requests
+import random #failures of the requests
+import tarfile #tgz archives of the derived products
+import tempfile
+import threading #server run in a background thread
+import urllib.request #client of the local server
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+from scipy.io import netcdf_file
+
+#%%
+#Short names of the variables in the generated files (as in the files of the CDS)
+short_names = {'10m_u_component_of_wind':'u10', '10m_v_component_of_wind':'v10', 'temperature':'t', 'geopotential':'z',
+               '2m_temperature':'t2m', '2m_dewpoint_temperature':'d2m', 'mean_radiant_temperature':'mrt', 'universal_thermal_climate_index':'utci'}
+
+def as_list(value):
+    return value if isinstance(value,list) else [value]
+
+def request_times(request):
+    '''This function returns the hours (datetime) of the request (year, month, day and time fields, the invalid dates such as 31 February being ignored, as by the CDS).'''
+
+    times = []
+    for y in as_list(request['year']) :
+        for m in as_list(request['month']) :
+            for d in as_list(request['day']) :
+                for t in as_list(request.get('time',[f"{h:02d}:00" for h in range(24)])) :
+                    try :
+                        times.append(datetime(int(y),int(m),int(d),int(t[:2])))
+                    except ValueError :
+                        continue
+    return sorted(times)
+
+def mock_values(var, times, lat, lon):
+    '''This function returns deterministic values of the variable var at the hours times on the grid lat, lon (a daily cycle and a gradient of latitude), which the tests can recompute.'''
+
+    hours = np.array([(t-datetime(1900,1,1)).total_seconds()/3600 for t in times])
+    cycle = np.sin(2*np.pi*hours/24)[:,None,None]
+    return 280+10*cycle-0.5*np.asarray(lat)[None,:,None]+0.01*np.asarray(lon)[None,None,:]
+
+def write_mock_netcdf(path, var, times, area, resolution, packed=True):
+    '''This function writes a netCDF file like the ones of the CDS (classic format, values packed in short integers with their own scale_factor and add_offset)
+    with the variable var at the hours times on the area [north, west, south, east] at the given resolution (degrees).
+    It is written with scipy (pure Python), as the netCDF library is not thread-safe and the server answers the requests in parallel threads.'''
+
+    north, west, south, east = area
+    lat = np.arange(north,south-resolution/2,-resolution)
+    lon = np.arange(west,east+resolution/2,resolution)
+    values = mock_values(var,times,lat,lon)
+    with netcdf_file(path,mode='w',version=2) as f :
+        f.createDimension('time',None)
+        f.createDimension('latitude',len(lat))
+        f.createDimension('longitude',len(lon))
+        f.Conventions = 'CF-1.6'
+        f.history = 'mock CDS server'
+        longitude = f.createVariable('longitude','f4',('longitude',))
+        longitude.units = 'degrees_east'
+        longitude[:] = lon
+        latitude = f.createVariable('latitude','f4',('latitude',))
+        latitude.units = 'degrees_north'
+        latitude[:] = lat
+        time_var = f.createVariable('time','i4',('time',))
+        time_var.units = 'hours since 1900-01-01 00:00:00.0'
+        time_var.calendar = 'gregorian'
+        time_var[:] = [int((t-datetime(1900,1,1)).total_seconds()//3600) for t in times]
+        if packed :
+            variable = f.createVariable(var,'i2',('time','latitude','longitude'))
+            vmin, vmax = values.min(), values.max()
+            scale_factor = (vmax-vmin)/(2**16-4) if vmax>vmin else 1.
+            add_offset = (vmax+vmin)/2
+            variable.scale_factor = scale_factor
+            variable.add_offset = add_offset
+            variable._FillValue = np.int16(-32767)
+            variable[:] = np.round((values-add_offset)/scale_factor).astype(np.int16)
+        else :
+            variable = f.createVariable(var,'f4',('time','latitude','longitude'))
+            variable[:] = values
+        variable.units = 'K'
+    return
+
+def mock_content(name, request, resolution):
+    '''This function returns the content (bytes) of the file answering the request of the dataset name : a netCDF file, or for the tgz format a tgz archive of daily netCDF files (as the derived-utci-historical dataset).'''
+
+    var = short_names.get(request['variable'],request['variable'])
+    times = request_times(request)
+    area = request.get('area',[90,-180,-90,180])
+    with tempfile.TemporaryDirectory() as tmp_dir :
+        if request.get('format')=='tgz' :
+            buffer = io.BytesIO()
+            with tarfile.open(fileobj=buffer,mode='w:gz') as tar :
+                for day in sorted({t.date() for t in times}) :
+                    day_path = os.path.join(tmp_dir,f"ECMWF_{var}_{day:%Y%m%d}_v1.1_con.nc")
+                    write_mock_netcdf(day_path,var,[t for t in times if t.date()==day],area,resolution,packed=False)
+                    tar.add(day_path,arcname=os.path.basename(day_path))
+            return buffer.getvalue()
+        path = os.path.join(tmp_dir,'data.nc')
+        write_mock_netcdf(path,var,times,area,resolution)
+        with open(path,'rb') as f :
+            return f.read()
+
+#%%
+class MockCDSServer:
+    '''This class is a local stand-in of the CDS API, to test the downloads (see cds_download_functions) without a CDS account. It runs an HTTP server in a background thread
+    following the request cycle of the CDS API : a request is submitted (POST /resources/<dataset>), queued for queue_time seconds (GET /tasks/<id>), then its file is downloaded
+    (GET /download/<id>) and the task is deleted (DELETE /tasks/<id>). The files are generated from the requests (see mock_content) on a grid of the given resolution (degrees).
+    The first failures submissions, and then a fraction failure_rate of them, fail with an HTTP error 500. The submitted requests are recorded in submitted.'''
+
+    def __init__(self, queue_time=0., failures=0, failure_rate=0., resolution=2.5, seed=0):
+        self.queue_time = queue_time
+        self.failures = failures
+        self.failure_rate = failure_rate
+        self.resolution = resolution
+        self.random = random.Random(seed)
+        self.submitted = [] #(dataset name, request) of every submission, failed ones included
+        self.tasks = {} #{request id : (submission time, dataset name, request)}
+        self.lock = threading.Lock()
+        self.httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def start(self):
+        '''This method starts the server on a free local port (see url).'''
+
+        server = self
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                return
+            def send_json(self, code, content):
+                body = json.dumps(content).encode()
+                self.send_response(code)
+                self.send_header('Content-Type','application/json')
+                self.send_header('Content-Length',str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            def do_POST(self):
+                name = self.path.rstrip('/').split('/')[-1]
+                request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                code, content = server.submit(name,request)
+                self.send_json(code,content)
+            def do_GET(self):
+                kind, request_id = self.path.rstrip('/').split('/')[-2:]
+                if request_id not in server.tasks :
+                    return self.send_json(404,{'error':{'message':f"Unknown request {request_id}"}})
+                if kind=='tasks' :
+                    return self.send_json(200,server.state(request_id))
+                submission_time, name, request = server.tasks[request_id]
+                body = mock_content(name,request,server.resolution)
+                self.send_response(200)
+                self.send_header('Content-Type','application/octet-stream')
+                self.send_header('Content-Length',str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            def do_DELETE(self):
+                server.tasks.pop(self.path.rstrip('/').split('/')[-1],None)
+                self.send_response(204)
+                self.end_headers()
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1',0),Handler)
+        threading.Thread(target=self.httpd.serve_forever,daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        return
+
+    def submit(self, name, request):
+        '''This method submits the request of the dataset name, and returns the HTTP code and the content of the answer (the state of the new task, or an error).'''
+
+        with self.lock :
+            self.submitted.append((name,request))
+            fail = len(self.submitted)<=self.failures or self.random.random()<self.failure_rate
+            request_id = str(len(self.submitted))
+            if not fail :
+                self.tasks[request_id] = (time.monotonic(),name,request)
+        if fail :
+            return 500, {'error':{'message':'Mock CDS server error', 'reason':'injected failure'}}
+        return 202, self.state(request_id)
+
+    def state(self, request_id):
+        '''This method returns the state of the task request_id : queued during queue_time seconds after its submission, then completed with the location of its file.'''
+
+        submission_time, name, request = self.tasks[request_id]
+        if time.monotonic()-submission_time<self.queue_time :
+            return {'state':'queued', 'request_id':request_id}
+        return {'state':'completed', 'request_id':request_id, 'location':f"{self.url}/download/{request_id}"}
+
+#%%
+class MockCDSClient:
+    '''This class is a client of MockCDSServer with the retrieve method of cdsapi.Client (see retrieve_part in cds_download_functions) : it submits the request,
+    polls its state every sleep seconds until it is completed, downloads its file to target and deletes the task. The HTTP errors are raised (urllib.error.HTTPError), as the errors of the CDS by cdsapi.'''
+
+    def __init__(self, url, sleep=0.01):
+        self.url = url
+        self.sleep = sleep
+
+    def call(self, method, path, content=None):
+        data = None if content is None else json.dumps(content).encode()
+        request = urllib.request.Request(self.url+path,data=data,method=method,headers={'Content-Type':'application/json'})
+        with urllib.request.urlopen(request) as answer :
+            body = answer.read()
+        return json.loads(body) if len(body)>0 else None
+
+    def retrieve(self, name, request, target):
+        state = self.call('POST',f"/resources/{name}",request)
+        while state['state']!='completed' :
+            time.sleep(self.sleep)
+            state = self.call('GET',f"/tasks/{state['request_id']}")
+        with urllib.request.urlopen(state['location']) as answer, open(target,'wb') as f :
+            while block := answer.read(2**20) :
+                f.write(block)
+        self.call('DELETE',f"/tasks/{state['request_id']}")
+        return target
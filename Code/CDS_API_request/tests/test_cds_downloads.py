@@ -0,0 +1,282 @@
+import os
+import sys
+import tarfile
+import threading
+import urllib.error
+from datetime import datetime, timedelta
+
+import netCDF4 as nc
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+cdf = pytest.importorskip("cds_download_functions")
+from mock_cds_server import MockCDSClient, MockCDSServer, mock_values  # noqa: E402
+
+
+class CountingClient(MockCDSClient):
+    # records the number of requests running at the same time
+    def __init__(self, url):
+        super().__init__(url)
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def retrieve(self, name, request, target):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            return super().retrieve(name, request, target)
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+class FailingClient:
+    # raises error on every request
+    def __init__(self, error):
+        self.error = error
+        self.calls = 0
+
+    def retrieve(self, name, request, target):
+        self.calls += 1
+        with open(target, "wb") as f:
+            f.write(b"partial")
+        raise self.error
+
+
+def targets_of(variables, years, root):
+    return {t["target"]: t for t in cdf.plan_downloads(variables, years, root)}
+
+
+def test_monthly_parts_downloaded_concurrently(tmp_path):
+    with MockCDSServer(queue_time=0.05, resolution=5) as server:
+        client = CountingClient(server.url)
+        paths = cdf.download_era5(
+            ["u10"],
+            [2001],
+            datadir=str(tmp_path),
+            client=client,
+            nb_requests=4,
+            progress=False,
+        )
+        assert len(server.submitted) == 12
+    assert client.max_running > 1
+    assert sorted(request["month"] for name, request in server.submitted) == cdf.months
+
+    target = targets_of(["u10"], [2001], str(tmp_path))[paths[0]]
+    assert cdf.check_manifest(paths[0], target["name"], target["request"])
+    # the parts are removed once merged
+    assert os.listdir(os.path.join(os.path.dirname(paths[0]), ".parts")) == []
+    assert not [
+        name for name in os.listdir(os.path.dirname(paths[0])) if ".tmp." in name
+    ]
+
+
+def test_merge_netcdf_matches_requested_values(tmp_path):
+    with MockCDSServer(resolution=5) as server:
+        (path,) = cdf.download_era5(
+            ["u10"],
+            [2004],
+            datadir=str(tmp_path),
+            client=MockCDSClient(server.url),
+            progress=False,
+        )
+    with nc.Dataset(path) as f:
+        time = f.variables["time"][:]
+        values = f.variables["u10"][:]
+        times = [datetime(1900, 1, 1) + timedelta(hours=int(h)) for h in time]
+        expected = mock_values(
+            "u10", times, f.variables["latitude"][:], f.variables["longitude"][:]
+        )
+    assert len(time) == 366 * 24
+    assert np.all(np.diff(time) == 1)
+    # the monthly parts are packed with their own scale_factor and add_offset : the merged file is unpacked
+    assert values.dtype == np.float32
+    np.testing.assert_allclose(values, expected, atol=1e-3)
+
+
+def test_merge_tgz_keeps_every_member(tmp_path):
+    with MockCDSServer(resolution=5) as server:
+        (path,) = cdf.download_era5(
+            ["utci"],
+            [2004],
+            datadir=str(tmp_path),
+            client=MockCDSClient(server.url),
+            progress=False,
+        )
+    with tarfile.open(path) as tar:
+        names = tar.getnames()
+    assert len(names) == 366
+    assert len(set(names)) == 366
+
+
+def test_merge_parts_single_part(tmp_path):
+    with MockCDSServer(resolution=5) as server:
+        (path,) = cdf.download_era5(
+            ["u10"],
+            [2001],
+            datadir=str(tmp_path),
+            client=MockCDSClient(server.url),
+            split="year",
+            progress=False,
+        )
+        assert len(server.submitted) == 1
+    with nc.Dataset(path) as f:
+        assert len(f.variables["time"]) == 365 * 24
+
+
+def test_retry_after_injected_failures(tmp_path):
+    with MockCDSServer(failures=3, resolution=5) as server:
+        (path,) = cdf.download_era5(
+            ["u10"],
+            [2001],
+            datadir=str(tmp_path),
+            client=MockCDSClient(server.url),
+            retries=3,
+            backoff=0.001,
+            progress=False,
+        )
+        assert len(server.submitted) == 12 + 3
+    target = targets_of(["u10"], [2001], str(tmp_path))[path]
+    assert cdf.check_manifest(path, target["name"], target["request"])
+
+
+def test_retry_part_attempts(tmp_path):
+    path = str(tmp_path / "part.nc")
+    request = cdf.plan_downloads(["u10"], [2001], str(tmp_path), split="year")[0][
+        "request"
+    ]
+    with MockCDSServer(failures=2, resolution=5) as server:
+        attempts = cdf.retrieve_part(
+            MockCDSClient(server.url),
+            "reanalysis-era5-single-levels",
+            request,
+            path,
+            retries=2,
+            backoff=0.001,
+        )
+    assert attempts == 3
+    assert cdf.check_manifest(path, "reanalysis-era5-single-levels", request)
+
+    # all the attempts fail : the last error is raised and no partial file is left
+    with MockCDSServer(failures=10, resolution=5) as server:
+        with pytest.raises(urllib.error.HTTPError):
+            cdf.retrieve_part(
+                MockCDSClient(server.url),
+                "reanalysis-era5-single-levels",
+                request,
+                str(tmp_path / "failed.nc"),
+                retries=2,
+                backoff=0.001,
+            )
+        assert len(server.submitted) == 3
+    assert sorted(os.listdir(tmp_path)) == ["part.nc", "part.nc.manifest.json"]
+
+
+@pytest.mark.parametrize(
+    "error, retried",
+    [
+        (urllib.error.HTTPError("url", 500, "Internal Server Error", None, None), True),
+        (urllib.error.HTTPError("url", 429, "Too Many Requests", None, None), True),
+        (urllib.error.URLError("connection refused"), True),
+        (ConnectionResetError(), True),
+        (TimeoutError(), True),
+        (urllib.error.HTTPError("url", 400, "Bad Request", None, None), False),
+        (ValueError("invalid request"), False),
+        (OSError(28, "No space left on device"), False),
+    ],
+)
+def test_retry_only_network_and_server_errors(tmp_path, error, retried):
+    client = FailingClient(error)
+    with pytest.raises(type(error)):
+        cdf.retrieve_part(
+            client,
+            "reanalysis-era5-single-levels",
+            {},
+            str(tmp_path / "part.nc"),
+            retries=2,
+            backoff=0.001,
+        )
+    assert client.calls == (3 if retried else 1)
+    assert os.listdir(tmp_path) == []
+
+
+def test_skip_target_with_matching_manifest(tmp_path):
+    with MockCDSServer(resolution=5) as server:
+        paths = cdf.download_era5(
+            ["u10", "utci"],
+            [2001],
+            datadir=str(tmp_path),
+            client=MockCDSClient(server.url),
+            progress=False,
+        )
+    with MockCDSServer(resolution=5) as server:
+        assert (
+            cdf.download_era5(
+                ["u10", "utci"],
+                [2001],
+                datadir=str(tmp_path),
+                client=MockCDSClient(server.url),
+                progress=False,
+            )
+            == paths
+        )
+        assert server.submitted == []
+
+    # a modified target no longer matches the checksum of its manifest : it is downloaded again
+    with open(paths[0], "ab") as f:
+        f.write(b"x")
+    with MockCDSServer(resolution=5) as server:
+        cdf.download_era5(
+            ["u10", "utci"],
+            [2001],
+            datadir=str(tmp_path),
+            client=MockCDSClient(server.url),
+            progress=False,
+        )
+        assert len(server.submitted) == 12
+        assert {name for name, request in server.submitted} == {
+            "reanalysis-era5-single-levels"
+        }
+    target = targets_of(["u10"], [2001], str(tmp_path))[paths[0]]
+    assert cdf.check_manifest(paths[0], target["name"], target["request"])
+
+
+def test_resume_partial_run(tmp_path):
+    with MockCDSServer(failure_rate=0.5, resolution=5, seed=1) as server:
+        with pytest.raises(RuntimeError, match="run again to resume"):
+            cdf.download_era5(
+                ["t850"],
+                [2007],
+                datadir=str(tmp_path),
+                client=MockCDSClient(server.url),
+                retries=0,
+                backoff=0,
+                progress=False,
+            )
+        first_run = [request["month"] for name, request in server.submitted]
+    (target,) = cdf.plan_downloads(["t850"], [2007], str(tmp_path))
+    done = [
+        path
+        for path, request in target["parts"]
+        if cdf.check_manifest(path, target["name"], request)
+    ]
+    assert 0 < len(done) < 12
+    assert not os.path.exists(target["target"])
+
+    # the second run only sends the requests of the missing parts, then merges the year
+    with MockCDSServer(resolution=5) as server:
+        cdf.download_era5(
+            ["t850"],
+            [2007],
+            datadir=str(tmp_path),
+            client=MockCDSClient(server.url),
+            progress=False,
+        )
+        assert len(server.submitted) == 12 - len(done)
+        assert len(first_run) == 12
+    assert cdf.check_manifest(target["target"], target["name"], target["request"])
+    with nc.Dataset(target["target"]) as f:
+        assert len(f.variables["time"]) == 365 * 24
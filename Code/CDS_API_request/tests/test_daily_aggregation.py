@@ -0,0 +1,139 @@
+import os
+import sys
+
+import numpy as np
+import numpy.ma as ma
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+daf = pytest.importorskip("daily_aggregation_functions")
+
+lon = np.array([-100.0, -37.6, -7.4, 0.0, 7.6, 22.4, 52.5, 170.0])
+stats = ("daymean", "daymax", "daymin", "daystd")
+
+
+def reference(hours, offsets, before=None, after=None):
+    # plain numpy statistics of the local day d of each longitude i : hours 24*d-offset[i] to 24*(d+1)-offset[i]
+    pad = 24
+    padded = ma.masked_all((len(hours) + 2 * pad,) + hours.shape[1:])
+    padded[pad : pad + len(hours)] = hours
+    if before is not None:
+        padded[pad - len(before) : pad] = before
+    if after is not None:
+        padded[pad + len(hours) : pad + len(hours) + len(after)] = after
+    result = {stat: np.empty((len(hours) // 24,) + hours.shape[1:]) for stat in stats}
+    for i, offset in enumerate(offsets):
+        for d in range(len(hours) // 24):
+            window = padded[pad + 24 * d - offset : pad + 24 * (d + 1) - offset, :, i]
+            for stat in stats:
+                result[stat][d, :, i] = daf.daily_statistics[stat](window, axis=0)
+    return result
+
+
+def aggregate(aggregator, hours, chunk_hours, before=None, after=None):
+    aggregator.start(before)
+    days = {stat: [] for stat in aggregator.daily_stats}
+    for start in range(0, len(hours), chunk_hours):
+        for stat, values in aggregator.add(hours[start : start + chunk_hours]).items():
+            days[stat].append(values)
+    for stat, values in aggregator.finish(after).items():
+        days[stat].append(values)
+    return {stat: ma.concatenate(values) for stat, values in days.items()}
+
+
+def test_solar_hour_offsets():
+    np.testing.assert_array_equal(
+        daf.solar_hour_offsets(lon), [-7, -3, 0, 0, 1, 1, 4, 11]
+    )
+    aggregator = daf.DailyAggregator(lon, stats, day="solar")
+    assert (aggregator.before, aggregator.after) == (11, 7)
+    aggregator = daf.DailyAggregator(lon, stats, day="utc")
+    assert (aggregator.before, aggregator.after) == (0, 0)
+    with pytest.raises(ValueError):
+        daf.DailyAggregator(lon, stats, day="local")
+
+
+@pytest.mark.parametrize("chunk_hours", [24, 5 * 24, 7 * 24, 17, 1000])
+def test_utc_days(chunk_hours):
+    hours = (
+        np.random.default_rng(0).normal(size=(10 * 24, 3, len(lon))).astype(np.float32)
+    )
+    days = aggregate(daf.DailyAggregator(lon, stats, day="utc"), hours, chunk_hours)
+    expected = reference(hours, np.zeros(len(lon), dtype=int))
+    for stat in stats:
+        assert days[stat].shape == (10, 3, len(lon))
+        np.testing.assert_allclose(days[stat], expected[stat], rtol=1e-5, atol=1e-6)
+        np.testing.assert_allclose(
+            days[stat],
+            daf.daily_statistics[stat](hours.reshape(10, 24, 3, len(lon)), axis=1),
+            rtol=1e-5,
+            atol=1e-6,
+        )
+
+
+@pytest.mark.parametrize("chunk_hours", [24, 3 * 24, 7 * 24, 13])
+@pytest.mark.parametrize("boundaries", [True, False])
+def test_solar_days(chunk_hours, boundaries):
+    rng = np.random.default_rng(1)
+    hours = rng.normal(size=(10 * 24, 3, len(lon))).astype(np.float32)
+    # hours of the day before and after the period (end and beginning of the neighbouring years), ignored if not given
+    before = (
+        rng.normal(size=(24, 3, len(lon))).astype(np.float32) if boundaries else None
+    )
+    after = (
+        rng.normal(size=(24, 3, len(lon))).astype(np.float32) if boundaries else None
+    )
+    days = aggregate(
+        daf.DailyAggregator(lon, stats, day="solar"), hours, chunk_hours, before, after
+    )
+    expected = reference(hours, daf.solar_hour_offsets(lon), before, after)
+    for stat in stats:
+        assert days[stat].shape == (10, 3, len(lon))
+        assert not ma.is_masked(days[stat])
+        np.testing.assert_allclose(days[stat], expected[stat], rtol=1e-5, atol=1e-6)
+    # the longitudes of offset 0 are UTC days
+    np.testing.assert_allclose(
+        days["daymean"][:, :, 2:4],
+        hours.reshape(10, 24, 3, len(lon))[:, :, :, 2:4].mean(axis=1),
+        rtol=1e-5,
+    )
+    if (
+        not boundaries
+    ):  # the first day of the east and the last day of the west use fewer hours
+        np.testing.assert_allclose(
+            days["daymean"][0, :, -1], hours[:13, :, -1].mean(axis=0), rtol=1e-5
+        )
+        np.testing.assert_allclose(
+            days["daymean"][-1, :, 0], hours[-17:, :, 0].mean(axis=0), rtol=1e-5
+        )
+
+
+def test_masked_hours_ignored():
+    hours = ma.array(np.arange(2 * 24 * 2, dtype=np.float32).reshape(48, 1, 2))
+    hours[5:10, 0, 0] = ma.masked
+    days = aggregate(daf.DailyAggregator(np.array([0.0, 0.0]), ("daymean",)), hours, 24)
+    np.testing.assert_allclose(
+        days["daymean"][0, 0, 0], np.delete(np.arange(0, 48, 2), range(5, 10)).mean()
+    )
+
+
+def test_chunks_are_not_kept():
+    # the pending hours are copied : the chunks can be buffers reused for the next chunk
+    hours = (
+        np.random.default_rng(2).normal(size=(4 * 24, 2, len(lon))).astype(np.float32)
+    )
+    aggregator = daf.DailyAggregator(lon, ("daymean",), day="solar")
+    aggregator.start(None)
+    buffer = np.empty((30, 2, len(lon)), dtype=np.float32)
+    days = []
+    for start in range(0, len(hours), 30):
+        chunk = buffer[: len(hours[start : start + 30])]
+        chunk[...] = hours[start : start + 30]
+        days.append(aggregator.add(chunk)["daymean"])
+        buffer[...] = np.nan
+    days.append(aggregator.finish(None)["daymean"])
+    np.testing.assert_allclose(
+        ma.concatenate(days),
+        reference(hours, daf.solar_hour_offsets(lon))["daymean"],
+        rtol=1e-5,
+    )
@@ -0,0 +1,131 @@
+import os
+import sys
+
+import netCDF4 as nc
+import numpy as np
+import numpy.ma as ma
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+dcf = pytest.importorskip("daily_conversion_functions")
+
+lat = np.arange(40.0, 46.0, 1.5)
+lon = np.arange(-40.0, 50.0, 10.0)  # solar offsets from -3 to 3 hours
+
+
+def hours_of_year(y):
+    return 24 * (366 if y % 4 == 0 else 365)
+
+
+def write_hourly(datadir, y, lat_step=-1, lon_step=1, seed=0):
+    # hourly t850 file of the year y, with its latitudes in descending order as the ERA5 files (lat_step=-1)
+    values = (
+        np.random.default_rng(seed + y)
+        .normal(280, 5, (hours_of_year(y), len(lat), len(lon)))
+        .astype(np.float32)
+    )
+    path = dcf.hourly_variables["t850"]["input"].format(datadir=datadir, y=y)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with nc.Dataset(path, mode="w") as f:
+        f.createDimension("time", None)
+        f.createDimension("latitude", len(lat))
+        f.createDimension("longitude", len(lon))
+        f.createVariable("latitude", "f4", ("latitude",))[:] = lat[::lat_step]
+        f.createVariable("longitude", "f4", ("longitude",))[:] = lon[::lon_step]
+        f.createVariable("t", "f4", ("time", "latitude", "longitude"))[:] = values[
+            :, ::lat_step, ::lon_step
+        ]
+    return values  # on the ascending grid
+
+
+def read_daily(datadir, y, stat="daymean"):
+    with nc.Dataset(
+        dcf.hourly_variables["t850"]["daily_output"].format(
+            datadir=datadir, y=y, stat=stat
+        )
+    ) as f:
+        return f.variables["t850"][:], f.variables["lat"][:], f.variables["lon"][:]
+
+
+def solar_reference(values, before=None, after=None, stat=np.mean):
+    # local solar day d of the longitude of index i : hours 24*d-round(lon/15) to 24*(d+1)-round(lon/15) in UTC,
+    # the missing hours of the years before and after being ignored
+    pad = 24
+    hours = ma.masked_all((len(values) + 2 * pad,) + values.shape[1:])
+    hours[pad : pad + len(values)] = values
+    if before is not None:
+        hours[:pad] = before[-pad:]
+    if after is not None:
+        hours[-pad:] = after[:pad]
+    offsets = np.round(lon / 15).astype(int)
+    reference = np.empty((len(values) // 24,) + values.shape[1:])
+    for i, offset in enumerate(offsets):
+        for d in range(len(reference)):
+            start = pad + 24 * d - offset
+            reference[d, :, i] = stat(hours[start : start + 24, :, i], axis=0)
+    return reference
+
+
+@pytest.mark.parametrize("lat_step, lon_step", [(-1, 1), (1, 1), (-1, -1)])
+def test_utc_daily_mean_matches_numpy(tmp_path, lat_step, lon_step):
+    datadir = str(tmp_path)
+    values = write_hourly(datadir, 2003, lat_step, lon_step)
+    # 7 days per chunk do not divide the year
+    dcf.convert_to_daily_year(
+        "t850",
+        2003,
+        datadir=datadir,
+        daily_stats=("daymean", "daymax"),
+        days_per_chunk=7,
+        progress=False,
+    )
+
+    daymean, lat_out, lon_out = read_daily(datadir, 2003)
+    np.testing.assert_array_equal(lat_out, lat)
+    np.testing.assert_array_equal(lon_out, lon)
+    days = values.reshape(365, 24, len(lat), len(lon))
+    np.testing.assert_allclose(daymean, days.mean(axis=1), rtol=1e-6)
+    np.testing.assert_array_equal(
+        read_daily(datadir, 2003, "daymax")[0], days.max(axis=1)
+    )
+
+
+@pytest.mark.parametrize("neighbours", [True, False])
+def test_solar_daily_mean_matches_numpy(tmp_path, neighbours):
+    datadir = str(tmp_path)
+    values = {
+        y: write_hourly(datadir, y)
+        for y in ([2003, 2004, 2005] if neighbours else [2004])
+    }
+    dcf.convert_to_daily_year(
+        "t850", 2004, datadir=datadir, day="solar", days_per_chunk=5, progress=False
+    )
+
+    daymean = read_daily(datadir, 2004)[0]
+    assert daymean.shape == (366, len(lat), len(lon))
+    reference = solar_reference(values[2004], values.get(2003), values.get(2005))
+    np.testing.assert_allclose(daymean, reference, rtol=1e-6)
+    if (
+        neighbours
+    ):  # the first and last days of the year use the hours of the years before and after
+        assert not np.allclose(daymean[[0, -1]], solar_reference(values[2004])[[0, -1]])
+
+
+def test_daily_file_attributes(tmp_path):
+    datadir = str(tmp_path)
+    write_hourly(datadir, 2003)
+    (path,) = dcf.convert_to_daily_year("t850", 2003, datadir=datadir, progress=False)
+    assert not [name for name in os.listdir(os.path.dirname(path)) if ".tmp." in name]
+    with nc.Dataset(path) as f:
+        assert f.title == "ERA5"
+        assert f.Conventions == "CF-1.6"
+        assert f.source == "Climate Data Store"
+        assert f.product == "reanalysis-era5-pressure-levels"
+        assert f.creation_date.endswith("(UTC)")
+        time = f.variables["time"]
+        assert time.standard_name == "time"
+        assert time.axis == "T"
+        assert time.units == "days since 2003-01-01"
+        np.testing.assert_array_equal(time[:], np.arange(365))
+        assert f.variables["t850"].units == "K"
+        assert f.variables["lat"].standard_name == "latitude"
@@ -0,0 +1,190 @@
+import os
+import sys
+
+import netCDF4 as nc
+import numpy as np
+import numpy.ma as ma
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+tif = pytest.importorskip("thermal_index_functions")
+
+lat = np.arange(50.0, 46.9, -0.5)  # descending, as the ERA5 files
+lon = np.arange(-40.0, 41.0, 8.0)  # solar offsets from -3 to 3 hours
+nb_days = 5  # short "years", streamed in chunks that do not divide them
+years = [2000, 2001, 2002]
+stats = ["daymean", "daymax", "daystd"]
+
+
+def write_input(
+    path,
+    name,
+    lat_values,
+    lon_values,
+    values,
+    lat_name="latitude",
+    lon_name="longitude",
+):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with nc.Dataset(path, mode="w") as f:
+        f.createDimension(lat_name, len(lat_values))
+        f.createDimension(lon_name, len(lon_values))
+        f.createDimension("time", None)
+        f.createVariable(lat_name, "f4", (lat_name,))[:] = lat_values
+        f.createVariable(lon_name, "f4", (lon_name,))[:] = lon_values
+        time = f.createVariable("time", "i4", ("time",))
+        time.units = "hours since 1900-01-01 00:00:00.0"
+        time.calendar = "gregorian"
+        time[:] = np.arange(values.shape[0]) + 1_000_000
+        f.createVariable(
+            name, "f4", ("time", lat_name, lon_name), fill_value=np.float32(-32767)
+        )[:] = values
+
+
+@pytest.fixture
+def wbgt_inputs(tmp_path, monkeypatch):
+    # hourly inputs of the years : t2m on a larger ascending grid (as the North Atlantic t2m), cropped by the engine,
+    # and the hourly WBGT of each year computed at once with numpy on the grid of the smallest inputs, as a reference
+    datadir = str(tmp_path)
+    lat_large = np.arange(45.0, 52.1, 0.5)
+    lon_large = np.arange(-48.0, 49.0, 8.0)
+    il = [int(np.argmin(abs(lat_large - x))) for x in lat]
+    jl = [int(np.argmin(abs(lon_large - x))) for x in lon]
+    wbgt = {}
+    for y in years:
+        rng = np.random.default_rng(y)
+        t2m = rng.uniform(
+            260, 310, (24 * nb_days, len(lat_large), len(lon_large))
+        ).astype(np.float32)
+        data = {"t2m": t2m[:, il][:, :, jl]}
+        data["mrt"] = (data["t2m"] + rng.uniform(-10, 40, data["t2m"].shape)).astype(
+            np.float32
+        )
+        data["u10"] = rng.normal(0, 4, data["t2m"].shape).astype(np.float32)
+        data["v10"] = rng.normal(0, 4, data["t2m"].shape).astype(np.float32)
+        write_input(
+            f"{datadir}/t2m_{y}.nc", "t2m", lat_large, lon_large, t2m, "lat", "lon"
+        )
+        for name in ["mrt", "u10", "v10"]:
+            write_input(f"{datadir}/{name}_{y}.nc", name, lat, lon, data[name])
+        wbgt[y] = tif.wbgt_index(data, np.empty(data["t2m"].shape, dtype=np.float32))
+    monkeypatch.setitem(
+        tif.thermal_indices["wbgt"], "daily_output", "{datadir}/out/{stat}_{y}.nc"
+    )
+    input_paths = {
+        name: ("{datadir}/" + name + "_{y}.nc", name)
+        for name in ["t2m", "mrt", "u10", "v10"]
+    }
+    return datadir, input_paths, wbgt
+
+
+def read_output(path, name="wbgt"):
+    with nc.Dataset(path) as f:
+        return f.variables[name][:], f.variables["lat"][:], f.variables["lon"][:]
+
+
+def solar_reference(wbgt, y, stat):
+    # local solar day d of the longitude i : UTC hours 24*d-round(lon/15) to 24*(d+1)-round(lon/15), the hours of the missing years being ignored
+    hours = ma.masked_all((3 * 24 * nb_days,) + wbgt[y].shape[1:])
+    for k, year in enumerate([y - 1, y, y + 1]):
+        if year in wbgt:
+            hours[k * 24 * nb_days : (k + 1) * 24 * nb_days] = wbgt[year]
+    offsets = np.round(lon / 15).astype(int)
+    reference = np.empty((nb_days,) + wbgt[y].shape[1:])
+    for i, offset in enumerate(offsets):
+        for d in range(nb_days):
+            start = 24 * nb_days + 24 * d - offset
+            reference[d, :, i] = tif.daily_statistics[stat](
+                hours[start : start + 24, :, i], axis=0
+            )
+    return reference
+
+
+@pytest.mark.parametrize("days_per_chunk", [1, 2, 3, 7])
+def test_hourly_matches_numpy(wbgt_inputs, days_per_chunk):
+    datadir, input_paths, wbgt = wbgt_inputs
+    hourly_path = os.path.join(datadir, "out", "wbgt_2001.nc")
+    paths = tif.compute_thermal_index_year(
+        "wbgt",
+        2001,
+        datadir=datadir,
+        input_paths=input_paths,
+        output_path=hourly_path,
+        days_per_chunk=days_per_chunk,
+        progress=False,
+    )
+    assert paths == [hourly_path]
+    assert os.listdir(os.path.join(datadir, "out")) == ["wbgt_2001.nc"]
+
+    hourly, lat_out, lon_out = read_output(hourly_path)
+    np.testing.assert_allclose(lat_out, lat)
+    np.testing.assert_allclose(lon_out, lon)
+    np.testing.assert_allclose(hourly, wbgt[2001], rtol=1e-6, atol=1e-5)
+    with nc.Dataset(hourly_path) as f:
+        np.testing.assert_array_equal(
+            f.variables["time"][:], np.arange(24 * nb_days) + 1_000_000
+        )
+
+
+def test_missing_input_path(wbgt_inputs):
+    datadir, input_paths, wbgt = wbgt_inputs
+    # the hourly d2m of the UTCI has no known location
+    with pytest.raises(ValueError, match="d2m"):
+        tif.compute_thermal_index_year(
+            "utci", 2001, datadir=datadir, input_paths=input_paths, progress=False
+        )
+
+
+@pytest.mark.parametrize("days_per_chunk", [1, 2, 3, 7])
+def test_utc_daily_in_same_pass(wbgt_inputs, days_per_chunk):
+    datadir, input_paths, wbgt = wbgt_inputs
+    hourly_path = os.path.join(datadir, "out", "wbgt_2001.nc")
+    paths = tif.compute_thermal_index_year(
+        "wbgt",
+        2001,
+        datadir=datadir,
+        input_paths=input_paths,
+        output_path=hourly_path,
+        daily_stats=stats,
+        days_per_chunk=days_per_chunk,
+        progress=False,
+    )
+    assert len(paths) == 1 + len(stats)
+    assert not [
+        name for name in os.listdir(os.path.join(datadir, "out")) if ".tmp." in name
+    ]
+
+    np.testing.assert_allclose(
+        read_output(hourly_path)[0], wbgt[2001], rtol=1e-6, atol=1e-5
+    )
+    days = wbgt[2001].reshape((nb_days, 24) + wbgt[2001].shape[1:])
+    for stat in stats:
+        daily = read_output(os.path.join(datadir, "out", f"{stat}_2001.nc"))[0]
+        np.testing.assert_allclose(
+            daily, tif.daily_statistics[stat](days, axis=1), rtol=1e-5, atol=1e-5
+        )
+
+
+@pytest.mark.parametrize("days_per_chunk", [1, 3])
+@pytest.mark.parametrize("y", years)
+def test_solar_daily_across_years(wbgt_inputs, days_per_chunk, y):
+    # 2001 uses the hours of 2000 and 2002, the first and last years have no neighbouring file on one side
+    datadir, input_paths, wbgt = wbgt_inputs
+    tif.compute_thermal_index_year(
+        "wbgt",
+        y,
+        datadir=datadir,
+        input_paths=input_paths,
+        hourly=False,
+        daily_stats=stats,
+        day="solar",
+        days_per_chunk=days_per_chunk,
+        progress=False,
+    )
+    assert not os.path.exists(os.path.join(datadir, "out", f"wbgt_{y}.nc"))
+    for stat in stats:
+        daily = read_output(os.path.join(datadir, "out", f"{stat}_{y}.nc"))[0]
+        assert not ma.is_masked(daily)
+        np.testing.assert_allclose(
+            daily, solar_reference(wbgt, y, stat), rtol=1e-5, atol=1e-4
+        )
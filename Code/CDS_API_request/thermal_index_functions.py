@@ -0,0 +1,281 @@
+#%%
+import os #read data directories
+from collections import deque #chunks read in advance
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed #I/O thread of a year, years computed in parallel
+import numpy as np
+import numpy.ma as ma
+import netCDF4 as nc
+from tqdm import tqdm
+
+from thermofeel import calculate_wbgt, calculate_utci, calculate_heat_index_adjusted, calculate_saturation_vapour_pressure
+from daily_aggregation_functions import daily_statistics, DailyAggregator
+from file_functions import temporary_path, commit_file
+
+#%%
+#Hourly ERA5 input files of a year : path template (formatted with the data directory datadir and the year y) and name of the variable in the file.
+#The grids of the files may differ (for instance t2m covers the North Atlantic), they are cropped once to the smallest one (see common_grid).
+#The hourly 2m dew point temperature (d2m, input of the UTCI and the heat index) has no known location, its path template has to be given in input_paths.
+era5_hourly_inputs = {
+    't2m' : ("/data/ajeze/ERA5/t2m/hour/t2m/ERA5_NorthAtlantic_hour_t2m_{y}010100-{y}123123.nc",'t2m'),
+    'd2m' : (None,'d2m'),
+    'mrt' : ("{datadir}/ERA5/WBGT/{y}/ERA5_Europe_025deg_MRT_{y}.nc",'mrt'),
+    'u10' : ("{datadir}/ERA5/WBGT/{y}/ERA5_Europe_025deg_hourly_U_wind_{y}010100-{y}123123.nc",'u10'),
+    'v10' : ("{datadir}/ERA5/WBGT/{y}/ERA5_Europe_025deg_hourly_V_wind_{y}010100-{y}123123.nc",'v10'),
+    'utci' : ("{datadir}/ERA5/UTCI/{y}/ERA5_Europe_025deg_hourly_UTCI_{y}010100-{y}123123.nc",'utci'),
+}
+
+def wbgt_index(data, out):
+    '''This function computes the hourly Wet Bulb Globe Temperature (°C) from the 2m temperature, the mean radiant temperature (K) and the 10m wind components (m/s), in float32 in the buffer out.'''
+
+    va = np.hypot(data['u10'],data['v10']) #wind speed
+    return calculate_wbgt(data['t2m'],data['mrt'],va,out=out,dtype=np.float32)
+
+def utci_index(data, out):
+    '''This function computes the hourly Universal Thermal Climate Index (°C) from the 2m temperature, the mean radiant temperature, the 2m dew point temperature (K) and the 10m wind components (m/s), in the buffer out.
+    The points out of the validity range of the UTCI approximation (-9999) are masked.'''
+
+    va = np.hypot(data['u10'],data['v10']) #wind speed
+    e_hPa = calculate_saturation_vapour_pressure(data['d2m']) #water vapour pressure
+    utci = calculate_utci(data['t2m'],va,data['mrt'],e_hPa,out=out)
+    return ma.masked_where(ma.getdata(utci)==-9999,utci,copy=False)
+
+def heat_index(data, out):
+    '''This function computes the hourly adjusted heat index (°C) from the 2m temperature and the 2m dew point temperature (K), in the buffer out.'''
+
+    hi = calculate_heat_index_adjusted(data['t2m'],data['d2m'])
+    out[...] = ma.getdata(hi)
+    return ma.array(out,mask=ma.getmask(hi),copy=False)
+
+def utci_cds_index(data, out):
+    '''This function returns the hourly UTCI (K) downloaded from the CDS (derived-utci-historical, see ERA5_UTCI_download_hourly.py), to compute its daily statistics without recomputing it.'''
+
+    return data['utci']
+
+#Thermal indices computed from the hourly ERA5 inputs : input variables, function computing the index of a chunk in a float32 buffer, name and attributes of the output variable,
+#path templates of the hourly output file (None if the index is an input) and of the daily statistics files (formatted with the statistic stat, see daily_statistics)
+thermal_indices = {
+    'wbgt' : {'inputs':['t2m','mrt','u10','v10'], 'function':wbgt_index, 'variable':'wbgt', 'units':'°C', 'long_name':'Wet Bulb Globe Temperature (Brimicombe et al, 2023)', 'standard_name':'wbgt_Brimicombe',
+              'output':"{datadir}/ERA5/WBGT/{y}/ERA5_Europe_025deg_hourly_WBGT_{y}010100-{y}123123.nc",
+              'daily_output':"{datadir}/ERA5/WBGT/{y}/ERA5_Europe_025deg_{stat}_WBGT_{y}0101-{y}1231.nc"},
+    'utci' : {'inputs':['t2m','mrt','d2m','u10','v10'], 'function':utci_index, 'variable':'utci', 'units':'°C', 'long_name':'Universal Thermal Climate Index', 'standard_name':'utci',
+              'output':"{datadir}/ERA5/UTCI/{y}/ERA5_Europe_025deg_hourly_UTCI_thermofeel_{y}010100-{y}123123.nc",
+              'daily_output':"{datadir}/ERA5/UTCI/{y}/ERA5_Europe_025deg_{stat}_UTCI_thermofeel_{y}0101-{y}1231.nc"},
+    'utci_cds' : {'inputs':['utci'], 'function':utci_cds_index, 'variable':'utci', 'units':'K', 'long_name':'Universal Thermal Climate Index', 'standard_name':'utci',
+                  'output':None,
+                  'daily_output':"{datadir}/ERA5/UTCI/{y}/ERA5_Europe_025deg_{stat}_UTCI_{y}0101-{y}1231.nc"},
+    'heat_index' : {'inputs':['t2m','d2m'], 'function':heat_index, 'variable':'heat_index', 'units':'°C', 'long_name':'Heat Index (adjusted)', 'standard_name':'heat_index',
+                    'output':"{datadir}/ERA5/heat_index/{y}/ERA5_Europe_025deg_hourly_heat_index_{y}010100-{y}123123.nc",
+                    'daily_output':"{datadir}/ERA5/heat_index/{y}/ERA5_Europe_025deg_{stat}_heat_index_{y}0101-{y}1231.nc"},
+}
+
+#%%
+def coordinate(f, names):
+    '''This function returns the values of the first coordinate of names found in the netCDF file f (for instance 'lat' or 'latitude').'''
+
+    for name in names :
+        if name in f.variables :
+            return ma.getdata(f.variables[name][:])
+    raise KeyError(f"None of the coordinates {names} is in {f.filepath()}")
+
+def axis_slice(axis, ref_axis):
+    '''This function returns the slice of axis covering the values of ref_axis, and whether the slice must be flipped to follow the order of ref_axis.
+    It raises a ValueError if ref_axis is not a contiguous part of axis (same resolution, up to 1e-4 degree).'''
+
+    idx_first, idx_last = int(np.abs(axis-ref_axis[0]).argmin()), int(np.abs(axis-ref_axis[-1]).argmin())
+    flip = idx_first>idx_last
+    index_slice = slice(min(idx_first,idx_last),max(idx_first,idx_last)+1)
+    values = axis[index_slice][::-1] if flip else axis[index_slice]
+    if len(values)!=len(ref_axis) or not np.allclose(values,ref_axis,atol=1e-4) :
+        raise ValueError(f"The grid {ref_axis[0]}..{ref_axis[-1]} is not a part of the grid {axis[0]}..{axis[-1]} with the same resolution")
+    return index_slice, flip
+
+def grid_slices(datasets, lat_ref, lon_ref):
+    '''This function returns, for every input file (dict of netCDF file and variable name), the slices of its latitude and longitude axes covering the grid lat_ref, lon_ref and whether they are flipped (see axis_slice).'''
+
+    grids = {var:(coordinate(f,['lat','latitude']),coordinate(f,['lon','longitude'])) for var,(f,name) in datasets.items()}
+    return {var:axis_slice(lat,lat_ref)+axis_slice(lon,lon_ref) for var,(lat,lon) in grids.items()}
+
+def common_grid(datasets):
+    '''This function crops the grids of the input files (dict of netCDF file and variable name) to the smallest of them, which must be included in the others with the same resolution.
+    It returns the latitudes and longitudes of the common grid and, for every input, the slices of its latitude and longitude axes and whether they are flipped, computed once for the whole run.'''
+
+    grids = [(coordinate(f,['lat','latitude']),coordinate(f,['lon','longitude'])) for f,name in datasets.values()]
+    lat_ref, lon_ref = min(grids,key=lambda grid : len(grid[0])*len(grid[1]))
+    return lat_ref, lon_ref, grid_slices(datasets,lat_ref,lon_ref)
+
+def read_chunk(datasets, slices, time_slice):
+    '''This function reads the hours time_slice of every input, cropped to the common grid (see common_grid). The flipped axes are reversed with views, without copy.'''
+
+    data = {}
+    for var,(f,name) in datasets.items() :
+        lat_slice, flip_lat, lon_slice, flip_lon = slices[var]
+        values = f.variables[name][time_slice,lat_slice,lon_slice]
+        data[var] = values[:,::-1 if flip_lat else 1,::-1 if flip_lon else 1]
+    return data
+
+def write_chunk(variable, start, values):
+    '''This function writes the time steps of a chunk from start in the netCDF variable.'''
+
+    variable[start:start+len(values),:,:] = values
+    return
+
+def create_output_file(path, title, lat_in, lon_in, definition, complevel=4):
+    '''This function creates the netCDF output file path (at its temporary path) on the grid lat_in, lon_in, with an unlimited time axis and the float32 variable of the thermal index definition (see thermal_indices),
+    compressed (zlib, complevel) and chunked by time step. The file is written without pre-fill, every value being written once. It returns the netCDF file.'''
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)),exist_ok=True)
+    nc_file_out = nc.Dataset(temporary_path(path),mode='w',format='NETCDF4_CLASSIC')
+    nc_file_out.set_fill_off()
+    nc_file_out.createDimension('lat', len(lat_in))    # latitude axis
+    nc_file_out.createDimension('lon', len(lon_in))    # longitude axis
+    nc_file_out.createDimension('time', None) # unlimited axis (can be appended to).
+    nc_file_out.title = title
+
+    lat = nc_file_out.createVariable('lat', np.float32, ('lat',))
+    lat.units = 'degrees_north'
+    lat.standard_name = "latitude"
+    lat.long_name = 'latitude'
+    lat.axis = "Y"
+    lon = nc_file_out.createVariable('lon', np.float32, ('lon',))
+    lon.units = 'degrees_east'
+    lon.standard_name = 'longitude'
+    lon.long_name = 'longitude'
+    lon.axis = "X"
+    lat[:] = lat_in
+    lon[:] = lon_in
+
+    # Define a 3D variable to hold the data, chunked by time step
+    var_out = nc_file_out.createVariable(definition['variable'],np.float32,('time','lat','lon'),zlib=True,complevel=complevel,chunksizes=(1,len(lat_in),len(lon_in)),fill_value=nc.default_fillvals['f4'])
+    var_out.units = definition['units']
+    var_out.long_name = definition['long_name']
+    var_out.standard_name = definition['standard_name']
+    return nc_file_out
+
+def boundary_values(definition, inputs, datadir, y, lat_in, lon_in, nb_hours, last=False):
+    '''This function computes the thermal index definition (see thermal_indices) on the first nb_hours hours of the year y (or the last ones if last is True), on the grid lat_in, lon_in,
+    for the local solar days across the boundaries of the years. It returns None if an input file of the year y does not exist (for instance the year after the last one available).'''
+
+    paths = {var:(path.format(datadir=datadir,y=y),name) for var,(path,name) in inputs.items()}
+    if not all(os.path.exists(path) for path,name in paths.values()) :
+        return None
+    datasets = {var:(nc.Dataset(path,mode='r'),name) for var,(path,name) in paths.items()}
+    try :
+        slices = grid_slices(datasets,lat_in,lon_in)
+        nb_hours_y = len(datasets[definition['inputs'][0]][0].variables['time'])
+        data = read_chunk(datasets,slices,slice(nb_hours_y-nb_hours,nb_hours_y) if last else slice(0,nb_hours))
+        return definition['function'](data,np.empty((nb_hours,len(lat_in),len(lon_in)),dtype=np.float32))
+    finally :
+        for f,name in datasets.values() :
+            f.close()
+
+#%%
+def compute_thermal_index_year(index, y, datadir=None, input_paths={}, output_path=None, hourly=True, daily_stats=(), day='utc', days_per_chunk=1, prefetch=2, complevel=4, progress=True):
+    '''This function computes the hourly thermal index (see thermal_indices) of the year y from the hourly ERA5 inputs (era5_hourly_inputs, whose path templates can be replaced in input_paths),
+    and in the same pass its daily statistics daily_stats (see daily_statistics, for instance ['daymean','daymax','daymin']) over the UTC days (day='utc') or the local solar days (day='solar', see DailyAggregator).
+    The local solar days at the boundaries of the year use the last (first) hours of the index computed from the inputs of the year before (after), and the hours of missing years are ignored.
+    The hourly index is written in output_path (default the output template of the index) if hourly is True, and each daily statistic in the daily output template of the index,
+    all formatted with datadir (default the DATADIR environment variable) and y.
+    The year is streamed in chunks of days_per_chunk days : one I/O thread reads the next prefetch chunks and writes the computed ones while the main thread computes,
+    all netCDF calls going through this thread as the HDF5 library is not thread-safe. The outputs are written without pre-fill, compressed (zlib, complevel) and chunked by time step,
+    to temporary files renamed once complete. It returns the paths of the output files.'''
+
+    if datadir is None :
+        datadir = os.environ.get("DATADIR","/data/tmandonnet")
+    y = int(y)
+    definition = thermal_indices[index]
+    inputs = {var:(era5_hourly_inputs|input_paths)[var] for var in definition['inputs']}
+    missing = [var for var,(path,name) in inputs.items() if path is None]
+    if len(missing)>0 :
+        raise ValueError(f"No hourly file of {', '.join(missing)} for the index {index} : give their path templates (formatted with datadir and y) and variable names in input_paths, "
+                         f"for instance input_paths={{'{missing[0]}':(path_template,'{missing[0]}')}}")
+    if output_path is None :
+        output_path = definition['output']
+    if hourly and output_path is None :
+        raise ValueError(f"The hourly {index} is an input, only its daily statistics can be computed")
+    output_paths = {'hourly':output_path.format(datadir=datadir,y=y)} if hourly else {}
+    output_paths |= {stat:definition['daily_output'].format(datadir=datadir,y=y,stat=stat) for stat in daily_stats}
+
+    datasets = {var:(nc.Dataset(path.format(datadir=datadir,y=y),mode='r'),name) for var,(path,name) in inputs.items()}
+    nc_files_out = {}
+    try :
+        lat_in, lon_in, slices = common_grid(datasets)
+        time_in = datasets[definition['inputs'][0]][0].variables['time']
+        nb_hours = len(time_in)
+        for var,(f,name) in datasets.items() :
+            if f.variables[name].shape[0]!=nb_hours :
+                raise ValueError(f"{f.filepath()} has {f.variables[name].shape[0]} time steps instead of {nb_hours}")
+
+        for output,path in output_paths.items() :
+            if output=='hourly' :
+                nc_files_out[output] = create_output_file(path,f"Hourly {index.upper()} for year {y}",lat_in,lon_in,definition,complevel)
+                time = nc_files_out[output].createVariable('time', time_in.dtype, ('time',))
+                time.units = getattr(time_in,'units','hours since 1900-01-01 00:00')
+                time.calendar = getattr(time_in,'calendar','gregorian')
+                time[:] = time_in[:]
+            else :
+                nc_files_out[output] = create_output_file(path,f"Daily {output[3:]} {index.upper()} for year {y}",lat_in,lon_in,definition,complevel)
+                time = nc_files_out[output].createVariable('time', np.float32, ('time',))
+                time.units = f"days since {y}-01-01"
+                time.calendar = "proleptic_gregorian"
+                time.axis = "T"
+                time[:] = range(nb_hours//24)
+            time.long_name = 'time'
+        variables_out = {output:nc_file_out.variables[definition['variable']] for output,nc_file_out in nc_files_out.items()}
+        aggregator = DailyAggregator(lon_in,daily_stats,day)
+        if aggregator.before>0 :
+            aggregator.start(boundary_values(definition,inputs,datadir,y-1,lat_in,lon_in,aggregator.before,last=True))
+        day_start = 0 #first day not written yet
+
+        chunk_hours = 24*days_per_chunk
+        starts = list(range(0,nb_hours,chunk_hours))
+        buffers = [np.empty((chunk_hours,len(lat_in),len(lon_in)),dtype=np.float32) for k in range(2)] #a chunk is computed in one buffer while the other one is written
+        with ThreadPoolExecutor(max_workers=1) as io_thread :
+            reads = deque(io_thread.submit(read_chunk,datasets,slices,slice(start,start+chunk_hours)) for start in starts[:prefetch])
+            writes = deque()
+            for k,start in enumerate(tqdm(starts,disable=not progress)) :
+                data = reads.popleft().result()
+                if k+prefetch<len(starts) :
+                    reads.append(io_thread.submit(read_chunk,datasets,slices,slice(starts[k+prefetch],starts[k+prefetch]+chunk_hours)))
+                if len(writes)==len(buffers) : #the buffer of this chunk has been written
+                    for write in writes.popleft() :
+                        write.result()
+                out = buffers[k%len(buffers)][:len(data[definition['inputs'][0]])]
+                values = definition['function'](data,out)
+                chunk_writes = [io_thread.submit(write_chunk,variables_out['hourly'],start,values)] if hourly else []
+                if len(daily_stats)>0 :
+                    stats_values = aggregator.add(values)
+                    for stat,values_stat in stats_values.items() :
+                        chunk_writes.append(io_thread.submit(write_chunk,variables_out[stat],day_start,values_stat))
+                    day_start += len(values_stat)
+                writes.append(chunk_writes)
+            if len(daily_stats)>0 :
+                #the netCDF library is not thread-safe : the next year is read by the I/O thread, once the pending writes are done
+                hours_after = io_thread.submit(boundary_values,definition,inputs,datadir,y+1,lat_in,lon_in,aggregator.after).result() if aggregator.after>0 else None
+                for stat,values_stat in aggregator.finish(hours_after).items() :
+                    writes.append([io_thread.submit(write_chunk,variables_out[stat],day_start,values_stat)])
+            for chunk_writes in writes :
+                for write in chunk_writes :
+                    write.result()
+        for output,path in output_paths.items() :
+            nc_files_out[output].close()
+            commit_file(path)
+    finally :
+        for nc_file_out in nc_files_out.values() :
+            if nc_file_out.isopen() :
+                nc_file_out.close()
+        for f,name in datasets.values() :
+            f.close()
+    return list(output_paths.values())
+
+def run_thermal_index(index, years, nb_workers=1, **kwargs):
+    '''This function computes the thermal index (hourly and/or daily statistics) for every year of years (see compute_thermal_index_year, with the keyword arguments kwargs), in parallel in nb_workers processes,
+    each year streaming its own inputs. It returns the paths of the output files.'''
+
+    if nb_workers==1 :
+        return [path for y in years for path in compute_thermal_index_year(index,y,**kwargs)]
+    output_paths = []
+    with ProcessPoolExecutor(max_workers=nb_workers) as executor :
+        futures = [executor.submit(compute_thermal_index_year,index,y,progress=False,**kwargs) for y in years]
+        for future in tqdm(as_completed(futures),total=len(futures)) :
+            output_paths += future.result()
+    return sorted(output_paths)
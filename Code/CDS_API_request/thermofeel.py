@@ -30,8 +30,6 @@
 
   """
 
-import math
-
 import numpy as np
 
 from helpers import (
@@ -47,26 +45,25 @@ from helpers import (
 # solar declination angle [degrees] + time correction for solar angle
 def solar_declination_angle(jd, h):
     g = (360 / 365.25) * (jd + (h / 24))  # fractional year g in degrees
-    while g > 360:
-        g = g - 360
+    g = np.where(g > 360, g - 360 * (np.ceil(g / 360) - 1), g)  # in ]0, 360]
     grad = g * to_radians
     # declination in [degrees]
     d = (
         0.396372
-        - 22.91327 * math.cos(grad)
-        + 4.025430 * math.sin(grad)
-        - 0.387205 * math.cos(2 * grad)
-        + 0.051967 * math.sin(2 * grad)
-        - 0.154527 * math.cos(3 * grad)
-        + 0.084798 * math.sin(3 * grad)
+        - 22.91327 * np.cos(grad)
+        + 4.025430 * np.sin(grad)
+        - 0.387205 * np.cos(2 * grad)
+        + 0.051967 * np.sin(2 * grad)
+        - 0.154527 * np.cos(3 * grad)
+        + 0.084798 * np.sin(3 * grad)
     )
     # time correction in [ h.degrees ]
     tc = (
         0.004297
-        + 0.107029 * math.cos(grad)
-        - 1.837877 * math.sin(grad)
-        - 0.837378 * math.cos(2 * grad)
-        - 2.340475 * math.sin(2 * grad)
+        + 0.107029 * np.cos(grad)
+        - 1.837877 * np.sin(grad)
+        - 0.837378 * np.cos(2 * grad)
+        - 2.340475 * np.sin(2 * grad)
     )
     return d, tc
 
@@ -161,13 +158,17 @@ def calculate_cos_solar_zenith_angle_integrated(lat, lon, y, m, d, h, base, step
     calculate solar zenith angle
     :param lat: (int array) latitude [degrees]
     :param lon: (int array) longitude [degrees]
-    :param y: year [int]
-    :param m: month [int]
-    :param d: day [int]
-    :param h: hour [int]
+    :param y: year [int array]
+    :param m: month [int array]
+    :param d: day [int array]
+    :param h: hour [int array]
     :param base: base time of forecast enum [0,6,12,18]
     :param step: step interval of forecast enum [0,1,3,6,..]
 
+    All the arguments broadcast together, e.g. the dates and hours with shape
+    (time, 1, 1), the latitudes (lat, 1) and the longitudes (lon,) give the
+    values on the (time, lat, lon) grid in one call.
+
     https://agupubs.onlinelibrary.wiley.com/doi/epdf/10.1002/2015GL066868
 
     returns cosine of the solar zenith angle [degrees]
@@ -226,90 +227,49 @@ def calculate_cos_solar_zenith_angle_integrated(lat, lon, y, m, d, h, base, step
     zhalftimestep = (2 * np.pi) / 24 * accumulationperiod / 2
     zsolartimestart = sharad - zhalftimestep
     zsolartimeend = sharad + zhalftimestep
-    ztandec = math.sin(drad) / max((math.cos(drad), 1.0e-12))
+    ztandec = np.sin(drad) / np.maximum(np.cos(drad), 1.0e-12)
     zcoshouranglesunset = (
         -ztandec * np.sin(latrad) / np.clip(np.cos(latrad), 1.0e-12, None)
     )
-    zsindecsinlat = math.sin(drad) * np.sin(latrad)
-    zcosdeccoslat = math.cos(drad) * np.cos(latrad)
-
-    def solar_zenith_angle_average(
-        lonrad,
-        zcoshouranglesunset,
-        zsindecsinlat,
-        zcosdeccoslat,
-        zsolartimestart,
-        zsolartimeend,
-        sha,
-    ):
-        # start and end hour
-        def horizon(val, rrange, lonrad, zsolartimestart, zsolartimeend, maxx):
-            if val < rrange * math.pi:
-                zhouranglestart = zsolartimestart + lonrad - ((rrange - 1.0) * math.pi)
-                zhourangleend = zsolartimeend + lonrad - ((rrange - 1.0) * math.pi)
-            else:
-                if rrange < maxx:
-                    zhouranglestart, zhourangleend = horizon(
-                        val, rrange + 2.0, lonrad, zsolartimestart, zsolartimeend, maxx
-                    )
-                else:
-                    zhouranglestart = zsolartimestart + lonrad - (maxx + 1.0) * math.pi
-                    zhourangleend = zsolartimeend + lonrad - (maxx + 1.0) * math.pi
-
-            return (zhouranglestart, zhourangleend)
-
-        # calculating the solar zenith angle
-
-        PMU0 = 0
-        if zcoshouranglesunset <= 1:
-            zhouranglestart, zhourangleend = horizon(
-                sha * math.pi / 180 + lonrad,
-                2,
-                lonrad,
-                zsolartimestart,
-                zsolartimeend,
-                maxx,
-            )
+    zsindecsinlat = np.sin(drad) * np.sin(latrad)
+    zcosdeccoslat = np.cos(drad) * np.cos(latrad)
+
+    # start and end hour : the hour angles are shifted by (rrange - 1) * pi,
+    # rrange being the smallest even number from 2 to maxx such that
+    # sharad + lonrad < rrange * pi, and by (maxx + 1) * pi beyond
+    rrange = np.maximum(2 * np.floor((sharad + lonrad) / (2 * np.pi)) + 2, 2)
+    shift = np.where(rrange <= maxx, rrange - 1.0, maxx + 1.0) * np.pi
+    zhouranglestart = zsolartimestart + lonrad - shift
+    zhourangleend = zsolartimeend + lonrad - shift
+
+    # clip the period to the daylight hours where the sun rises and sets
+    sunset = zcoshouranglesunset >= -1
+    zhouranglesunset = np.arccos(np.clip(zcoshouranglesunset, -1, 1))
+    zhouranglestart = np.where(
+        sunset,
+        np.clip(zhouranglestart, -zhouranglesunset, zhouranglesunset),
+        zhouranglestart,
+    )
+    zhourangleend = np.where(
+        sunset,
+        np.clip(zhourangleend, -zhouranglesunset, zhouranglesunset),
+        zhourangleend,
+    )
 
-            if zcoshouranglesunset >= -1:
-                zhouranglesunset = math.acos(zcoshouranglesunset)
-                if (
-                    zhourangleend <= -zhouranglesunset
-                    or zhouranglestart >= zhouranglesunset
-                ):
-                    PMU0 = 0
-                zhouranglestart = max(
-                    -zhouranglesunset, min(zhouranglestart, zhouranglesunset)
-                )
-                zhourangleend = max(
-                    -zhouranglesunset, min(zhourangleend, zhouranglesunset)
-                )
-
-            if (zhourangleend - zhouranglestart) > 1.0e-8:
-                PMU0 = max(
-                    0.0,
-                    zsindecsinlat
-                    + (
-                        zcosdeccoslat
-                        * (math.sin(zhourangleend) - math.sin(zhouranglestart))
-                    )
-                    / (zhourangleend - zhouranglestart),
-                )
-            else:
-                PMU0 = 0.0
-
-        return PMU0
-
-    return np.vectorize(solar_zenith_angle_average)(
-        lonrad,
-        zcoshouranglesunset,
-        zsindecsinlat,
-        zcosdeccoslat,
-        zsolartimestart,
-        zsolartimeend,
-        sha,
+    # calculating the solar zenith angle averaged over the daylight hours,
+    # 0 during the polar night (zcoshouranglesunset > 1)
+    zdaylight = zhourangleend - zhouranglestart
+    day = (zcoshouranglesunset <= 1) & (zdaylight > 1.0e-8)
+    PMU0 = np.maximum(
+        0.0,
+        zsindecsinlat
+        + zcosdeccoslat
+        * (np.sin(zhourangleend) - np.sin(zhouranglestart))
+        / np.where(day, zdaylight, 1.0),
     )
 
+    return np.where(day, PMU0, 0.0)
+
 
 def calculate_mean_radiant_temperature(ssrd, ssr, fdir, strd, strr, cossza):
     """
@@ -353,18 +313,349 @@ def calculate_mean_radiant_temperature(ssrd, ssr, fdir, strd, strr, cossza):
     return mrt
 
 
-def calculate_utci(t2_k, va_ms, mrt_k, e_hPa):
+def _flat_inputs(inputs, out=None, dtype=None):
+    """
+    broadcast and flatten the inputs of a kernel evaluated over chunks
+    :param inputs: (list of float arrays) inputs, possibly masked
+    :param out: (float array) optional C-contiguous output buffer
+    :param dtype: dtype of the output if out is None, default the one of the inputs
+
+    returns the flattened inputs, the output, its flattened view and the mask of
+    the output (None if no input is masked)
+    """
+    shape = np.broadcast_shapes(*[np.shape(x) for x in inputs])
+    mask = None
+    if any(np.ma.isMaskedArray(x) for x in inputs):
+        mask = np.logical_or.reduce(
+            [np.broadcast_to(np.ma.getmaskarray(x), shape) for x in inputs]
+        )
+        inputs = [np.ma.getdata(x) for x in inputs]
+    flat = [np.broadcast_to(x, shape).reshape(-1) for x in inputs]
+
+    if out is None:
+        out = np.empty(shape, dtype=dtype or np.result_type(*inputs, 1.0))
+    elif out.shape != shape or not out.flags.c_contiguous:
+        raise ValueError(f"out must be a C-contiguous array of shape {shape}")
+    return flat, out, out.reshape(-1), mask
+
+
+# Coefficients of the 6th order polynomial approximation of UTCI - t2m
+# (Brode et al. 2012)
+# as (coefficient, power of t2m, power of va, power of e_mrt, power of rh),
+# with t2m and e_mrt in Celsius, va in m/s and rh (water vapour pressure) in kPa
+_UTCI_COEFFICIENTS = (
+    (6.07562052e-01, 0, 0, 0, 0),
+    (-2.27712343e-02, 1, 0, 0, 0),
+    (8.06470249e-04, 2, 0, 0, 0),
+    (-1.54271372e-04, 3, 0, 0, 0),
+    (-3.24651735e-06, 4, 0, 0, 0),
+    (7.32602852e-08, 5, 0, 0, 0),
+    (1.35959073e-09, 6, 0, 0, 0),
+    (-2.25836520e00, 0, 1, 0, 0),
+    (8.80326035e-02, 1, 1, 0, 0),
+    (2.16844454e-03, 2, 1, 0, 0),
+    (-1.53347087e-05, 3, 1, 0, 0),
+    (-5.72983704e-07, 4, 1, 0, 0),
+    (-2.55090145e-09, 5, 1, 0, 0),
+    (-7.51269505e-01, 0, 2, 0, 0),
+    (-4.08350271e-03, 1, 2, 0, 0),
+    (-5.21670675e-05, 2, 2, 0, 0),
+    (1.94544667e-06, 3, 2, 0, 0),
+    (1.14099531e-08, 4, 2, 0, 0),
+    (1.58137256e-01, 0, 3, 0, 0),
+    (-6.57263143e-05, 1, 3, 0, 0),
+    (2.22697524e-07, 2, 3, 0, 0),
+    (-4.16117031e-08, 3, 3, 0, 0),
+    (-1.27762753e-02, 0, 4, 0, 0),
+    (9.66891875e-06, 1, 4, 0, 0),
+    (2.52785852e-09, 2, 4, 0, 0),
+    (4.56306672e-04, 0, 5, 0, 0),
+    (-1.74202546e-07, 1, 5, 0, 0),
+    (-5.91491269e-06, 0, 6, 0, 0),
+    (3.98374029e-01, 0, 0, 1, 0),
+    (1.83945314e-04, 1, 0, 1, 0),
+    (-1.73754510e-04, 2, 0, 1, 0),
+    (-7.60781159e-07, 3, 0, 1, 0),
+    (3.77830287e-08, 4, 0, 1, 0),
+    (5.43079673e-10, 5, 0, 1, 0),
+    (-2.00518269e-02, 0, 1, 1, 0),
+    (8.92859837e-04, 1, 1, 1, 0),
+    (3.45433048e-06, 2, 1, 1, 0),
+    (-3.77925774e-07, 3, 1, 1, 0),
+    (-1.69699377e-09, 4, 1, 1, 0),
+    (1.69992415e-04, 0, 2, 1, 0),
+    (-4.99204314e-05, 1, 2, 1, 0),
+    (2.47417178e-07, 2, 2, 1, 0),
+    (1.07596466e-08, 3, 2, 1, 0),
+    (8.49242932e-05, 0, 3, 1, 0),
+    (1.35191328e-06, 1, 3, 1, 0),
+    (-6.21531254e-09, 2, 3, 1, 0),
+    (-4.99410301e-06, 0, 4, 1, 0),
+    (-1.89489258e-08, 1, 4, 1, 0),
+    (8.15300114e-08, 0, 5, 1, 0),
+    (7.55043090e-04, 0, 0, 2, 0),
+    (-5.65095215e-05, 1, 0, 2, 0),
+    (-4.52166564e-07, 1, 0, 2, 0),  # t2m2 * e_mrt2 in Brode et al., kept as is
+    (2.46688878e-08, 3, 0, 2, 0),
+    (2.42674348e-10, 4, 0, 2, 0),
+    (1.54547250e-04, 0, 1, 2, 0),
+    (5.24110970e-06, 1, 1, 2, 0),
+    (-8.75874982e-08, 2, 1, 2, 0),
+    (-1.50743064e-09, 3, 1, 2, 0),
+    (-1.56236307e-05, 0, 2, 2, 0),
+    (-1.33895614e-07, 1, 2, 2, 0),
+    (2.49709824e-09, 2, 2, 2, 0),
+    (6.51711721e-07, 0, 3, 2, 0),
+    (1.94960053e-09, 1, 3, 2, 0),
+    (-1.00361113e-08, 0, 4, 2, 0),
+    (-1.21206673e-05, 0, 0, 3, 0),
+    (-2.18203660e-07, 1, 0, 3, 0),
+    (7.51269482e-09, 2, 0, 3, 0),
+    (9.79063848e-11, 3, 0, 3, 0),
+    (1.25006734e-06, 0, 1, 3, 0),
+    (-1.81584736e-09, 1, 1, 3, 0),
+    (-3.52197671e-10, 2, 1, 3, 0),
+    (-3.36514630e-08, 0, 2, 3, 0),
+    (1.35908359e-10, 1, 2, 3, 0),
+    (4.17032620e-10, 0, 3, 3, 0),
+    (-1.30369025e-09, 0, 0, 4, 0),
+    (4.13908461e-10, 1, 0, 4, 0),
+    (9.22652254e-12, 2, 0, 4, 0),
+    (-5.08220384e-09, 0, 1, 4, 0),
+    (-2.24730961e-11, 1, 1, 4, 0),
+    (1.17139133e-10, 0, 2, 4, 0),
+    (6.62154879e-10, 0, 0, 5, 0),
+    (4.03863260e-13, 1, 0, 5, 0),
+    (1.95087203e-12, 0, 1, 5, 0),
+    (-4.73602469e-12, 0, 0, 6, 0),
+    (5.12733497e00, 0, 0, 0, 1),
+    (-3.12788561e-01, 1, 0, 0, 1),
+    (-1.96701861e-02, 2, 0, 0, 1),
+    (9.99690870e-04, 3, 0, 0, 1),
+    (9.51738512e-06, 4, 0, 0, 1),
+    (-4.66426341e-07, 5, 0, 0, 1),
+    (5.48050612e-01, 0, 1, 0, 1),
+    (-3.30552823e-03, 1, 1, 0, 1),
+    (-1.64119440e-03, 2, 1, 0, 1),
+    (-5.16670694e-06, 3, 1, 0, 1),
+    (9.52692432e-07, 4, 1, 0, 1),
+    (-4.29223622e-02, 0, 2, 0, 1),
+    (5.00845667e-03, 1, 2, 0, 1),
+    (1.00601257e-06, 2, 2, 0, 1),
+    (-1.81748644e-06, 3, 2, 0, 1),
+    (-1.25813502e-03, 0, 3, 0, 1),
+    (-1.79330391e-04, 1, 3, 0, 1),
+    (2.34994441e-06, 2, 3, 0, 1),
+    (1.29735808e-04, 0, 4, 0, 1),
+    (1.29064870e-06, 1, 4, 0, 1),
+    (-2.28558686e-06, 0, 5, 0, 1),
+    (-3.69476348e-02, 0, 0, 1, 1),
+    (1.62325322e-03, 1, 0, 1, 1),
+    (-3.14279680e-05, 2, 0, 1, 1),
+    (2.59835559e-06, 3, 0, 1, 1),
+    (-4.77136523e-08, 4, 0, 1, 1),
+    (8.64203390e-03, 0, 1, 1, 1),
+    (-6.87405181e-04, 1, 1, 1, 1),
+    (-9.13863872e-06, 2, 1, 1, 1),
+    (5.15916806e-07, 3, 1, 1, 1),
+    (-3.59217476e-05, 0, 2, 1, 1),
+    (3.28696511e-05, 1, 2, 1, 1),
+    (-7.10542454e-07, 2, 2, 1, 1),
+    (-1.24382300e-05, 0, 3, 1, 1),
+    (-7.38584400e-09, 1, 3, 1, 1),
+    (2.20609296e-07, 0, 4, 1, 1),
+    (-7.32469180e-04, 0, 0, 2, 1),
+    (-1.87381964e-05, 1, 0, 2, 1),
+    (4.80925239e-06, 2, 0, 2, 1),
+    (-8.75492040e-08, 3, 0, 2, 1),
+    (2.77862930e-05, 0, 1, 2, 1),
+    (-5.06004592e-06, 1, 1, 2, 1),
+    (1.14325367e-07, 2, 1, 2, 1),
+    (2.53016723e-06, 0, 2, 2, 1),
+    (-1.72857035e-08, 1, 2, 2, 1),
+    (-3.95079398e-08, 0, 3, 2, 1),
+    (-3.59413173e-07, 0, 0, 3, 1),
+    (7.04388046e-07, 1, 0, 3, 1),
+    (-1.89309167e-08, 2, 0, 3, 1),
+    (-4.79768731e-07, 0, 1, 3, 1),
+    (7.96079978e-09, 1, 1, 3, 1),
+    (1.62897058e-09, 0, 2, 3, 1),
+    (3.94367674e-08, 0, 0, 4, 1),
+    (-1.18566247e-09, 1, 0, 4, 1),
+    (3.34678041e-10, 0, 1, 4, 1),
+    (-1.15606447e-10, 0, 0, 5, 1),
+    (-2.80626406e00, 0, 0, 0, 2),
+    (5.48712484e-01, 1, 0, 0, 2),
+    (-3.99428410e-03, 2, 0, 0, 2),
+    (-9.54009191e-04, 3, 0, 0, 2),
+    (1.93090978e-05, 4, 0, 0, 2),
+    (-3.08806365e-01, 0, 1, 0, 2),
+    (1.16952364e-02, 1, 1, 0, 2),
+    (4.95271903e-04, 2, 1, 0, 2),
+    (-1.90710882e-05, 3, 1, 0, 2),
+    (2.10787756e-03, 0, 2, 0, 2),
+    (-6.98445738e-04, 1, 2, 0, 2),
+    (2.30109073e-05, 2, 2, 0, 2),
+    (4.17856590e-04, 0, 3, 0, 2),
+    (-1.27043871e-05, 1, 3, 0, 2),
+    (-3.04620472e-06, 0, 4, 0, 2),
+    (5.14507424e-02, 0, 0, 1, 2),
+    (-4.32510997e-03, 1, 0, 1, 2),
+    (8.99281156e-05, 2, 0, 1, 2),
+    (-7.14663943e-07, 3, 0, 1, 2),
+    (-2.66016305e-04, 0, 1, 1, 2),
+    (2.63789586e-04, 1, 1, 1, 2),
+    (-7.01199003e-06, 2, 1, 1, 2),
+    (-1.06823306e-04, 0, 2, 1, 2),
+    (3.61341136e-06, 1, 2, 1, 2),
+    (2.29748967e-07, 0, 3, 1, 2),
+    (3.04788893e-04, 0, 0, 2, 2),
+    (-6.42070836e-05, 1, 0, 2, 2),
+    (1.16257971e-06, 2, 0, 2, 2),
+    (7.68023384e-06, 0, 1, 2, 2),
+    (-5.47446896e-07, 1, 1, 2, 2),
+    (-3.59937910e-08, 0, 2, 2, 2),
+    (-4.36497725e-06, 0, 0, 3, 2),
+    (1.68737969e-07, 1, 0, 3, 2),
+    (2.67489271e-08, 0, 1, 3, 2),
+    (3.23926897e-09, 0, 0, 4, 2),
+    (-3.53874123e-02, 0, 0, 0, 3),
+    (-2.21201190e-01, 1, 0, 0, 3),
+    (1.55126038e-02, 2, 0, 0, 3),
+    (-2.63917279e-04, 3, 0, 0, 3),
+    (4.53433455e-02, 0, 1, 0, 3),
+    (-4.32943862e-03, 1, 1, 0, 3),
+    (1.45389826e-04, 2, 1, 0, 3),
+    (2.17508610e-04, 0, 2, 0, 3),
+    (-6.66724702e-05, 1, 2, 0, 3),
+    (3.33217140e-05, 0, 3, 0, 3),
+    (-2.26921615e-03, 0, 0, 1, 3),
+    (3.80261982e-04, 1, 0, 1, 3),
+    (-5.45314314e-09, 2, 0, 1, 3),
+    (-7.96355448e-04, 0, 1, 1, 3),
+    (2.53458034e-05, 1, 1, 1, 3),
+    (-6.31223658e-06, 0, 2, 1, 3),
+    (3.02122035e-04, 0, 0, 2, 3),
+    (-4.77403547e-06, 1, 0, 2, 3),
+    (1.73825715e-06, 0, 1, 2, 3),
+    (-4.09087898e-07, 0, 0, 3, 3),
+    (6.14155345e-01, 0, 0, 0, 4),
+    (-6.16755931e-02, 1, 0, 0, 4),
+    (1.33374846e-03, 2, 0, 0, 4),
+    (3.55375387e-03, 0, 1, 0, 4),
+    (-5.13027851e-04, 1, 1, 0, 4),
+    (1.02449757e-04, 0, 2, 0, 4),
+    (-1.48526421e-03, 0, 0, 1, 4),
+    (-4.11469183e-05, 1, 0, 1, 4),
+    (-6.80434415e-06, 0, 1, 1, 4),
+    (-9.77675906e-06, 0, 0, 2, 4),
+    (8.82773108e-02, 0, 0, 0, 5),
+    (-3.01859306e-03, 1, 0, 0, 5),
+    (1.04452989e-03, 0, 1, 0, 5),
+    (2.47090539e-04, 0, 0, 1, 5),
+    (1.48348065e-03, 0, 0, 0, 6),
+)
+
+
+def _utci_horner_tree(coefficients):
+    """
+    nest the polynomial coefficients for a Horner evaluation
+    :param coefficients: (tuple) of (coefficient, power of t2m, power of va,
+        power of e_mrt, power of rh)
+
+    returns nested lists indexed by the powers of rh, e_mrt, va and t2m,
+    None where a power has no term
+    """
+    nested = {}
+    for coefficient, p_t2m, p_va, p_e_mrt, p_rh in coefficients:
+        node = nested
+        for power in (p_rh, p_e_mrt, p_va):
+            node = node.setdefault(power, {})
+        node[p_t2m] = node.get(p_t2m, 0.0) + coefficient
+
+    def to_list(node):
+        tree = [None] * (max(node) + 1)
+        for power, child in node.items():
+            tree[power] = to_list(child) if isinstance(child, dict) else child
+        return tree
+
+    return to_list(nested)
+
+
+_UTCI_HORNER = _utci_horner_tree(_UTCI_COEFFICIENTS)
+_UTCI_VARIABLES = ("rh", "e_mrt", "va", "t2m")  # from the outer to the inner level
+
+
+def _horner(tree, variables, buffers, level=0):
+    """
+    evaluate a nested polynomial in Horner form, in place in the buffers
+    :param tree: (list) nested coefficients, see _utci_horner_tree
+    :param variables: (list of float arrays) variable of each level
+    :param buffers: (list of float arrays) accumulator of each level
+
+    returns the accumulator of the level
+    """
+    acc = buffers[level]
+    x = variables[level]
+    leaf = level == len(variables) - 1
+    started = False
+    for node in reversed(tree):
+        if started:
+            np.multiply(acc, x, out=acc)
+        if node is None:
+            continue
+        value = node if leaf else _horner(node, variables, buffers, level + 1)
+        if started:
+            np.add(acc, value, out=acc)
+        else:
+            acc[...] = value
+            started = True
+    return acc
+
+
+def _horner_expression(tree, names, level=0):
+    """
+    write a nested polynomial in Horner form as an expression, for numexpr
+    :param tree: (list) nested coefficients, see _utci_horner_tree
+    :param names: (list of str) variable of each level
+
+    returns the expression (str)
+    """
+    leaf = level == len(names) - 1
+    expression = None
+    for node in reversed(tree):
+        if expression is not None:
+            expression = f"({expression}) * {names[level]}"
+        if node is None:
+            continue
+        term = repr(node) if leaf else _horner_expression(node, names, level + 1)
+        expression = term if expression is None else f"{expression} + ({term})"
+    return expression
+
+
+def calculate_utci(
+    t2_k, va_ms, mrt_k, e_hPa, out=None, chunk_size=16384, backend="numpy"
+):
     """
     UTCI
     :param t2m: (float array) is 2m temperature [K]
     :param va: (float array) is wind speed at 10 meters [m/s]
     :param mrt:(float array) is mean radiant temperature [K]
     :param ehPa: (float array) is water vapour pressure [hPa]
+    :param out: (float array) optional C-contiguous buffer of the broadcast shape
+        of the inputs, receiving UTCI
+    :param chunk_size: (int) number of points evaluated at once, the temporaries
+        of a chunk stay in the CPU cache
+    :param backend: (str) "numpy" or "numexpr" (optional dependency)
 
     Calculate UTCI with a 6th order polynomial approximation according to:
     Brode, P. et al. Deriving the operational procedure for the
     Universal Thermal Climate Index (UTCI). Int J Biometeorol (2012) 56: 48.1
 
+    The polynomial is evaluated in nested (Horner) form over chunks of the
+    flattened inputs, in float64. Points out of the validity range of the
+    approximation are set to -9999, masked inputs give a masked UTCI.
+
     returns UTCI [°C]
 
     """
@@ -373,279 +664,55 @@ def calculate_utci(t2_k, va_ms, mrt_k, e_hPa):
     mrt_kw = __wrap(mrt_k)
     ehPa = __wrap(e_hPa)
 
-    rh = ehPa / 10.0  # rh in kPa
-
-    t2m = kelvin_to_celcius(t2)  # polynomial approx. is in Celsius
-    mrt = kelvin_to_celcius(mrt_kw)  # polynomial approx. is in Celsius
-
-    e_mrt = np.subtract(mrt, t2m)
-
-    t2m2 = t2m * t2m
-    t2m3 = t2m2 * t2m
-    t2m4 = t2m3 * t2m
-    t2m5 = t2m4 * t2m
-    t2m6 = t2m5 * t2m
-
-    va2 = va * va
-    va3 = va2 * va
-    va4 = va3 * va
-    va5 = va4 * va
-    va6 = va5 * va
-
-    e_mrt2 = e_mrt * e_mrt
-    e_mrt3 = e_mrt2 * e_mrt
-    e_mrt4 = e_mrt3 * e_mrt
-    e_mrt5 = e_mrt4 * e_mrt
-    e_mrt6 = e_mrt5 * e_mrt
-
-    rh2 = rh * rh
-    rh3 = rh2 * rh
-    rh4 = rh3 * rh
-    rh5 = rh4 * rh
-    rh6 = rh5 * rh
-
-    utci = (
-        t2m
-        + 6.07562052e-01
-        + -2.27712343e-02 * t2m
-        + 8.06470249e-04 * t2m2
-        + -1.54271372e-04 * t2m3
-        + -3.24651735e-06 * t2m4
-        + 7.32602852e-08 * t2m5
-        + 1.35959073e-09 * t2m6
-        + -2.25836520e00 * va
-        + 8.80326035e-02 * t2m * va
-        + 2.16844454e-03 * t2m2 * va
-        + -1.53347087e-05 * t2m3 * va
-        + -5.72983704e-07 * t2m4 * va
-        + -2.55090145e-09 * t2m5 * va
-        + -7.51269505e-01 * va2
-        + -4.08350271e-03 * t2m * va2
-        + -5.21670675e-05 * t2m2 * va2
-        + 1.94544667e-06 * t2m3 * va2
-        + 1.14099531e-08 * t2m4 * va2
-        + 1.58137256e-01 * va3
-        + -6.57263143e-05 * t2m * va3
-        + 2.22697524e-07 * t2m2 * va3
-        + -4.16117031e-08 * t2m3 * va3
-        + -1.27762753e-02 * va4
-        + 9.66891875e-06 * t2m * va4
-        + 2.52785852e-09 * t2m2 * va4
-        + 4.56306672e-04 * va5
-        + -1.74202546e-07 * t2m * va5
-        + -5.91491269e-06 * va6
-        + 3.98374029e-01 * e_mrt
-        + 1.83945314e-04 * t2m * e_mrt
-        + -1.73754510e-04 * t2m2 * e_mrt
-        + -7.60781159e-07 * t2m3 * e_mrt
-        + 3.77830287e-08 * t2m4 * e_mrt
-        + 5.43079673e-10 * t2m5 * e_mrt
-        + -2.00518269e-02 * va * e_mrt
-        + 8.92859837e-04 * t2m * va * e_mrt
-        + 3.45433048e-06 * t2m2 * va * e_mrt
-        + -3.77925774e-07 * t2m3 * va * e_mrt
-        + -1.69699377e-09 * t2m4 * va * e_mrt
-        + 1.69992415e-04 * va2 * e_mrt
-        + -4.99204314e-05 * t2m * va2 * e_mrt
-        + 2.47417178e-07 * t2m2 * va2 * e_mrt
-        + 1.07596466e-08 * t2m3 * va2 * e_mrt
-        + 8.49242932e-05 * va3 * e_mrt
-        + 1.35191328e-06 * t2m * va3 * e_mrt
-        + -6.21531254e-09 * t2m2 * va3 * e_mrt
-        + -4.99410301e-06 * va4 * e_mrt
-        + -1.89489258e-08 * t2m * va4 * e_mrt
-        + 8.15300114e-08 * va5 * e_mrt
-        + 7.55043090e-04 * e_mrt2
-        + -5.65095215e-05 * t2m * e_mrt2
-        + -4.52166564e-07 * t2m * e_mrt2
-        + 2.46688878e-08 * t2m3 * e_mrt2
-        + 2.42674348e-10 * t2m4 * e_mrt2
-        + 1.54547250e-04 * va * e_mrt2
-        + 5.24110970e-06 * t2m * va * e_mrt2
-        + -8.75874982e-08 * t2m2 * va * e_mrt2
-        + -1.50743064e-09 * t2m3 * va * e_mrt2
-        + -1.56236307e-05 * va2 * e_mrt2
-        + -1.33895614e-07 * t2m * va2 * e_mrt2
-        + 2.49709824e-09 * t2m2 * va2 * e_mrt2
-        + 6.51711721e-07 * va3 * e_mrt2
-        + 1.94960053e-09 * t2m * va3 * e_mrt2
-        + -1.00361113e-08 * va4 * e_mrt2
-        + -1.21206673e-05 * e_mrt3
-        + -2.18203660e-07 * t2m * e_mrt3
-        + 7.51269482e-09 * t2m2 * e_mrt3
-        + 9.79063848e-11 * t2m3 * e_mrt3
-        + 1.25006734e-06 * va * e_mrt3
-        + -1.81584736e-09 * t2m * va * e_mrt3
-        + -3.52197671e-10 * t2m2 * va * e_mrt3
-        + -3.36514630e-08 * va2 * e_mrt3
-        + 1.35908359e-10 * t2m * va2 * e_mrt3
-        + 4.17032620e-10 * va3 * e_mrt3
-        + -1.30369025e-09 * e_mrt4
-        + 4.13908461e-10 * t2m * e_mrt4
-        + 9.22652254e-12 * t2m2 * e_mrt4
-        + -5.08220384e-09 * va * e_mrt4
-        + -2.24730961e-11 * t2m * va * e_mrt4
-        + 1.17139133e-10 * va2 * e_mrt4
-        + 6.62154879e-10 * e_mrt5
-        + 4.03863260e-13 * t2m * e_mrt5
-        + 1.95087203e-12 * va * e_mrt5
-        + -4.73602469e-12 * e_mrt6
-        + 5.12733497e00 * rh
-        + -3.12788561e-01 * t2m * rh
-        + -1.96701861e-02 * t2m2 * rh
-        + 9.99690870e-04 * t2m3 * rh
-        + 9.51738512e-06 * t2m4 * rh
-        + -4.66426341e-07 * t2m5 * rh
-        + 5.48050612e-01 * va * rh
-        + -3.30552823e-03 * t2m * va * rh
-        + -1.64119440e-03 * t2m2 * va * rh
-        + -5.16670694e-06 * t2m3 * va * rh
-        + 9.52692432e-07 * t2m4 * va * rh
-        + -4.29223622e-02 * va2 * rh
-        + 5.00845667e-03 * t2m * va2 * rh
-        + 1.00601257e-06 * t2m2 * va2 * rh
-        + -1.81748644e-06 * t2m3 * va2 * rh
-        + -1.25813502e-03 * va3 * rh
-        + -1.79330391e-04 * t2m * va3 * rh
-        + 2.34994441e-06 * t2m2 * va3 * rh
-        + 1.29735808e-04 * va4 * rh
-        + 1.29064870e-06 * t2m * va4 * rh
-        + -2.28558686e-06 * va5 * rh
-        + -3.69476348e-02 * e_mrt * rh
-        + 1.62325322e-03 * t2m * e_mrt * rh
-        + -3.14279680e-05 * t2m2 * e_mrt * rh
-        + 2.59835559e-06 * t2m3 * e_mrt * rh
-        + -4.77136523e-08 * t2m4 * e_mrt * rh
-        + 8.64203390e-03 * va * e_mrt * rh
-        + -6.87405181e-04 * t2m * va * e_mrt * rh
-        + -9.13863872e-06 * t2m2 * va * e_mrt * rh
-        + 5.15916806e-07 * t2m3 * va * e_mrt * rh
-        + -3.59217476e-05 * va2 * e_mrt * rh
-        + 3.28696511e-05 * t2m * va2 * e_mrt * rh
-        + -7.10542454e-07 * t2m2 * va2 * e_mrt * rh
-        + -1.24382300e-05 * va3 * e_mrt * rh
-        + -7.38584400e-09 * t2m * va3 * e_mrt * rh
-        + 2.20609296e-07 * va4 * e_mrt * rh
-        + -7.32469180e-04 * e_mrt2 * rh
-        + -1.87381964e-05 * t2m * e_mrt2 * rh
-        + 4.80925239e-06 * t2m2 * e_mrt2 * rh
-        + -8.75492040e-08 * t2m3 * e_mrt2 * rh
-        + 2.77862930e-05 * va * e_mrt2 * rh
-        + -5.06004592e-06 * t2m * va * e_mrt2 * rh
-        + 1.14325367e-07 * t2m2 * va * e_mrt2 * rh
-        + 2.53016723e-06 * va2 * e_mrt2 * rh
-        + -1.72857035e-08 * t2m * va2 * e_mrt2 * rh
-        + -3.95079398e-08 * va3 * e_mrt2 * rh
-        + -3.59413173e-07 * e_mrt3 * rh
-        + 7.04388046e-07 * t2m * e_mrt3 * rh
-        + -1.89309167e-08 * t2m2 * e_mrt3 * rh
-        + -4.79768731e-07 * va * e_mrt3 * rh
-        + 7.96079978e-09 * t2m * va * e_mrt3 * rh
-        + 1.62897058e-09 * va2 * e_mrt3 * rh
-        + 3.94367674e-08 * e_mrt4 * rh
-        + -1.18566247e-09 * t2m * e_mrt4 * rh
-        + 3.34678041e-10 * va * e_mrt4 * rh
-        + -1.15606447e-10 * e_mrt5 * rh
-        + -2.80626406e00 * rh2
-        + 5.48712484e-01 * t2m * rh2
-        + -3.99428410e-03 * t2m2 * rh2
-        + -9.54009191e-04 * t2m3 * rh2
-        + 1.93090978e-05 * t2m4 * rh2
-        + -3.08806365e-01 * va * rh2
-        + 1.16952364e-02 * t2m * va * rh2
-        + 4.95271903e-04 * t2m2 * va * rh2
-        + -1.90710882e-05 * t2m3 * va * rh2
-        + 2.10787756e-03 * va2 * rh2
-        + -6.98445738e-04 * t2m * va2 * rh2
-        + 2.30109073e-05 * t2m2 * va2 * rh2
-        + 4.17856590e-04 * va3 * rh2
-        + -1.27043871e-05 * t2m * va3 * rh2
-        + -3.04620472e-06 * va4 * rh2
-        + 5.14507424e-02 * e_mrt * rh2
-        + -4.32510997e-03 * t2m * e_mrt * rh2
-        + 8.99281156e-05 * t2m2 * e_mrt * rh2
-        + -7.14663943e-07 * t2m3 * e_mrt * rh2
-        + -2.66016305e-04 * va * e_mrt * rh2
-        + 2.63789586e-04 * t2m * va * e_mrt * rh2
-        + -7.01199003e-06 * t2m2 * va * e_mrt * rh2
-        + -1.06823306e-04 * va2 * e_mrt * rh2
-        + 3.61341136e-06 * t2m * va2 * e_mrt * rh2
-        + 2.29748967e-07 * va3 * e_mrt * rh2
-        + 3.04788893e-04 * e_mrt2 * rh2
-        + -6.42070836e-05 * t2m * e_mrt2 * rh2
-        + 1.16257971e-06 * t2m2 * e_mrt2 * rh2
-        + 7.68023384e-06 * va * e_mrt2 * rh2
-        + -5.47446896e-07 * t2m * va * e_mrt2 * rh2
-        + -3.59937910e-08 * va2 * e_mrt2 * rh2
-        + -4.36497725e-06 * e_mrt3 * rh2
-        + 1.68737969e-07 * t2m * e_mrt3 * rh2
-        + 2.67489271e-08 * va * e_mrt3 * rh2
-        + 3.23926897e-09 * e_mrt4 * rh2
-        + -3.53874123e-02 * rh3
-        + -2.21201190e-01 * t2m * rh3
-        + 1.55126038e-02 * t2m2 * rh3
-        + -2.63917279e-04 * t2m3 * rh3
-        + 4.53433455e-02 * va * rh3
-        + -4.32943862e-03 * t2m * va * rh3
-        + 1.45389826e-04 * t2m2 * va * rh3
-        + 2.17508610e-04 * va2 * rh3
-        + -6.66724702e-05 * t2m * va2 * rh3
-        + 3.33217140e-05 * va3 * rh3
-        + -2.26921615e-03 * e_mrt * rh3
-        + 3.80261982e-04 * t2m * e_mrt * rh3
-        + -5.45314314e-09 * t2m2 * e_mrt * rh3
-        + -7.96355448e-04 * va * e_mrt * rh3
-        + 2.53458034e-05 * t2m * va * e_mrt * rh3
-        + -6.31223658e-06 * va2 * e_mrt * rh3
-        + 3.02122035e-04 * e_mrt2 * rh3
-        + -4.77403547e-06 * t2m * e_mrt2 * rh3
-        + 1.73825715e-06 * va * e_mrt2 * rh3
-        + -4.09087898e-07 * e_mrt3 * rh3
-        + 6.14155345e-01 * rh4
-        + -6.16755931e-02 * t2m * rh4
-        + 1.33374846e-03 * t2m2 * rh4
-        + 3.55375387e-03 * va * rh4
-        + -5.13027851e-04 * t2m * va * rh4
-        + 1.02449757e-04 * va2 * rh4
-        + -1.48526421e-03 * e_mrt * rh4
-        + -4.11469183e-05 * t2m * e_mrt * rh4
-        + -6.80434415e-06 * va * e_mrt * rh4
-        + -9.77675906e-06 * e_mrt2 * rh4
-        + 8.82773108e-02 * rh5
-        + -3.01859306e-03 * t2m * rh5
-        + 1.04452989e-03 * va * rh5
-        + 2.47090539e-04 * e_mrt * rh5
-        + 1.48348065e-03 * rh6
-    )
-
-    print(f"utci {utci}")
-
-    utci_filtert2m = np.where(t2m >= 70)
-    utci_filtert2m2 = np.where(t2m <= -70)
-    utci_filterva = np.where(17 <= va)
-    utci_filterva2 = np.where(0 >= va)
-    utci_filterrh = np.where(5 < rh)
-    utci_filtere_mrt = np.where(e_mrt >= 100.0)
-    utci_filtere_mrt2 = np.where(e_mrt <= -30)
-
-    utci[utci_filtert2m] = -9999
-    # print(f"utci f1 {utci}")
-    utci[utci_filtert2m2] = -9999
-    # print(f"utci f2 {utci}")
-    utci[utci_filterva] = -9999
-    # print(f"utci f3 {utci}")
-    utci[utci_filterva2] = -9999
-    # print(f"utci f4 {utci}")
-    utci[utci_filterrh] = -9999
-    # print(f"utci f5 {utci}")
-    utci[utci_filtere_mrt] = -9999
-    # print(f"utci f6 {utci}")
-    utci[utci_filtere_mrt2] = -9999
-    # print(f"utci f7 {utci}")
-
-    print(f"utci {utci}")
+    if backend == "numexpr":
+        import numexpr
+
+        expression = _horner_expression(_UTCI_HORNER, _UTCI_VARIABLES)
+    elif backend != "numpy":
+        raise ValueError(f"unknown UTCI backend {backend}")
+
+    flat, out, utci, mask = _flat_inputs((t2, va, mrt_kw, ehPa), out)
+
+    size = utci.size
+    chunk_size = max(1, min(chunk_size, size))
+    # rh, e_mrt, va, t2m and the accumulator of each level of the polynomial
+    buffers = np.empty((8, chunk_size))
+    for start in range(0, size, chunk_size):
+        stop = min(start + chunk_size, size)
+        n = stop - start
+        rh, e_mrt, va_c, t2m = variables = buffers[:4, :n]
+        # polynomial approx. is in Celsius
+        np.subtract(flat[0][start:stop], 273.15, out=t2m)
+        va_c[...] = flat[1][start:stop]
+        np.subtract(flat[2][start:stop], 273.15, out=e_mrt)
+        np.subtract(e_mrt, t2m, out=e_mrt)
+        np.divide(flat[3][start:stop], 10.0, out=rh)  # rh in kPa
+
+        if backend == "numexpr":
+            poly = buffers[4, :n]
+            numexpr.evaluate(
+                expression,
+                local_dict=dict(zip(_UTCI_VARIABLES, variables)),
+                out=poly,
+            )
+        else:
+            poly = _horner(_UTCI_HORNER, variables, buffers[4:, :n])
+        np.add(t2m, poly, out=utci[start:stop], casting="unsafe")
+
+        invalid = (
+            (t2m >= 70)
+            | (t2m <= -70)
+            | (17 <= va_c)
+            | (0 >= va_c)
+            | (5 < rh)
+            | (e_mrt >= 100.0)
+            | (e_mrt <= -30)
+        )
+        utci[start:stop][invalid] = -9999
 
-    return utci
+    if mask is not None:
+        return np.ma.masked_array(out, mask=mask)
+    return out
 
 
 def calculate_wbgts(t2m):
@@ -668,12 +735,24 @@ def calculate_wbgts(t2m):
     return wbgts
 
 
-def calculate_wbgt(t2m, mrt, va):
+def calculate_wbgt(t2m, mrt, va, out=None, chunk_size=65536, dtype=np.float64):
     """
     calculate wet bulb globe temperature
     :param t2m: 2m temperature [K]
     :param mrt: mean radiant temperature [K]
     :param va: wind speed at 10 meters [m/s]
+    :param out: (float array) optional C-contiguous buffer of the broadcast shape
+        of the inputs, receiving the wet bulb globe temperature
+    :param chunk_size: (int) number of points evaluated at once
+    :param dtype: dtype of the computation (and of the output if out is None),
+        np.float32 halves the memory traffic and agrees with np.float64 within
+        1e-3 °C (for t2m from -43 to 52 °C, mrt - t2m from -30 to 70 K and va
+        from 0.1 to 60 m/s), np.float64 within 1e-10 °C of the former solver
+
+    The globe temperature is the real root of the quartic heat balance of the
+    globe, solved in closed form over chunks of the flattened inputs with each
+    shared term computed once. The temperatures are scaled by 1/100 in the
+    quartic (which is homogeneous), so float32 does not overflow.
 
     returns wet bulb globe temperature [°C]
     """
@@ -681,28 +760,60 @@ def calculate_wbgt(t2m, mrt, va):
     mrt = __wrap(mrt)
     va = __wrap(va)
 
-    f = (1.1e8 * va ** 0.6) / (0.98 * 0.15 ** 0.4)
-    a = f / 2
-    b = -f * t2m - mrt ** 4
+    flat, out, wbgt, mask = _flat_inputs((t2m, mrt, va), out, dtype)
+
+    # x**4 + f * x - (f * t2m + mrt**4) = 0 with the temperatures in hK
+    f_factor = (1.1e8 / (0.98 * 0.15 ** 0.4)) * 1.0e-6
     rt1 = 3 ** (1 / 3)
-    rt2 = np.sqrt(3) * np.sqrt(27 * a ** 4 - 16 * b ** 3) + 9 * a ** 2
-    rt3 = 2 * 2 ** (2 / 3) * b
-    va = va
-    if va.any() <= 0:
-        va = 0
-    wbgt_quartic = -1 / 2 * np.sqrt(
-        rt3 / (rt1 * rt2 ** (1 / 3)) + (2 ** (1 / 3) * rt2 ** (1 / 3)) / 3 ** (2 / 3)
-    ) + 1 / 2 * np.sqrt(
-        (4 * a)
-        / np.sqrt(
-            rt3 / (rt1 * rt2 ** (1 / 3))
-            + (2 ** (1 / 3) * rt2 ** (1 / 3)) / 3 ** (2 / 3)
-        )
-        - (2 ** (1 / 3) * rt2 ** (1 / 3)) / 3 ** (2 / 3)
-        - rt3 / (rt1 * rt2 ** (1 / 3))
-    )
-    wbgt_quartic = kelvin_to_celcius(wbgt_quartic)
-    return wbgt_quartic
+    rt3_factor = 2 * 2 ** (2 / 3)
+    rt_factor = 2 ** (1 / 3) / 3 ** (2 / 3)
+
+    size = wbgt.size
+    chunk_size = max(1, min(chunk_size, size))
+    buffers = np.empty((5, chunk_size), dtype=dtype)
+    for start in range(0, size, chunk_size):
+        stop = min(start + chunk_size, size)
+        f, c, t, s, x = buffers[:, : stop - start]
+        np.power(flat[2][start:stop], 0.6, out=f)
+        f *= f_factor
+        # c = -b = f * t2m + mrt**4
+        np.multiply(flat[1][start:stop], 0.01, out=c)
+        np.square(c, out=c)
+        np.square(c, out=c)
+        np.multiply(flat[0][start:stop], 0.01, out=t)
+        t *= f
+        c += t
+        # rt2 = sqrt(3) * sqrt(27 * a**4 - 16 * b**3) + 9 * a**2, with a = f / 2
+        np.square(f, out=s)
+        np.square(s, out=x)
+        x *= 27 / 16
+        np.multiply(c, c, out=t)
+        t *= c
+        t *= 16
+        x += t
+        np.sqrt(x, out=x)
+        x *= np.sqrt(3)
+        s *= 9 / 4
+        x += s
+        np.cbrt(x, out=x)  # rt2 ** (1 / 3)
+        # s = rt3 / (rt1 * rt2 ** (1 / 3)) + (2 * rt2) ** (1 / 3) / 3 ** (2 / 3)
+        np.divide(c, x, out=t)
+        t *= rt3_factor / rt1
+        np.multiply(x, rt_factor, out=s)
+        s -= t
+        # root = (sqrt(4 * a / sqrt(s) - s) - sqrt(s)) / 2
+        np.sqrt(s, out=x)
+        np.divide(f, x, out=t)
+        t *= 2
+        t -= s
+        np.sqrt(t, out=t)
+        t -= x
+        t *= 50  # / 2, in K
+        np.subtract(t, 273.15, out=wbgt[start:stop], casting="unsafe")
+
+    if mask is not None:
+        return np.ma.masked_array(out, mask=mask)
+    return out
 
 
 def calculate_mrt_from_wbgt(t2m, wbgt, va):
@@ -15,11 +15,17 @@ import cartopy.crs as ccrs
 import cartopy.feature as cfeature
 import matplotlib.colors as clrs
 from scipy import stats
-from scipy import signal
-from adjustText import adjust_text
-import ast
 from sklearn import metrics
+
+from data_preprocessing_functions import load_hammond_event_table, dict_country_labels, load_population_cube, get_population_year
+from detection_overlap_functions import load_emdat_detected_heatwaves, load_heatwaves_groups
+from storage_functions import read_table, write_table, temporary_path, commit_file
+from instrumentation_functions import instrument_stage
+from heatwaves_indices_functions import heatwaves_indices, heatwaves_indices_primitives, compute_heatwaves_primitives, compute_heatwaves_indices
+from scoring_functions import batch_scores, bootstrap_scores
+from distribution_plot_functions import load_distribution_data, criterion_data, render_distribution_figures
 #%%
+@instrument_stage
 def compute_Russo_HWMId(database='ERA5', datavar='t2m', daily_var='tg', year_beg=1950, year_end=2021, year_beg_climatology=1950, year_end_climatology=2021, distrib_window_size=15, anomaly=True):
     """Compute the pseudo_HWMId index map.
     Based on HWMId defined by Russo et al (2015, https://dx.doi.org/10.1088/1748-9326/10/12/124003 )."""
@@ -56,7 +62,8 @@ def compute_Russo_HWMId(database='ERA5', datavar='t2m', daily_var='tg', year_beg
     var_75 = f_var_meteo_75p.variables['threshold'][152:244,:,:] #JJA days, 1st June to 31st August
 
     #-------------------
-    nc_file_out = nc.Dataset(os.path.join(datadir,database,datavar,f"Russo_HWMId_{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_{year_beg_climatology}_{year_end_climatology}_{distrib_window_size}days.nc.nc"),mode='w',format='NETCDF4_CLASSIC')#path to the output netCDF file
+    nc_out_path = os.path.join(datadir,database,datavar,f"Russo_HWMId_{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_{year_beg_climatology}_{year_end_climatology}_{distrib_window_size}days.nc.nc") #path to the output netCDF file
+    nc_file_out = nc.Dataset(temporary_path(nc_out_path),mode='w',format='NETCDF4_CLASSIC')
 
     #Define netCDF output file :
     nc_file_out.createDimension('lat', len(lat_in))    # latitude axis
@@ -88,13 +95,23 @@ def compute_Russo_HWMId(database='ERA5', datavar='t2m', daily_var='tg', year_beg
         Russo_HWMId[i*92:(i+1)*92,:,:] = (var-var_25)/(var_75-var_25)
     f_var_meteo.close()
     nc_file_out.close()
+    commit_file(nc_out_path)
     f_var_meteo_25p.close()
     f_var_meteo_75p.close()
     return
 
 #%%
-def create_heatwaves_indices_database(database='ERA5', datavar='t2m', daily_var='tg', year_beg=1950, year_end=2021, threshold_value=95, year_beg_climatology=1950, year_end_climatology=2021, distrib_window_size=15,nb_days=4,flex_time_span=7, count_all_impacts=True, anomaly=True, relative_threshold=True, threshold_NL=1000, coeff_PL=1000):
-    '''This function is used to create the dataset of the indices of the detected heatwaves. The set of detected heatwaves depends on all the parameters.'''
+def read_heatwave_labels(label_variable, time_slice):
+    '''This function reads the cc3d labels of the days time_slice of the netCDF variable label_variable as integers.
+    The points outside of the heatwaves are masked in the netCDF file (they hold its fill value) and are set to 0, the label of no heatwave.'''
+
+    return ma.filled(label_variable[time_slice],0).astype(np.int64)
+
+@instrument_stage
+def create_heatwaves_indices_database(database='ERA5', datavar='t2m', daily_var='tg', year_beg=1950, year_end=2021, threshold_value=95, year_beg_climatology=1950, year_end_climatology=2021, distrib_window_size=15,nb_days=4,flex_time_span=7, count_all_impacts=True, anomaly=True, relative_threshold=True, threshold_NL=1000, coeff_PL=1000, pop_interpolation=False, excel_export=False):
+    '''This function is used to create the dataset of the indices of the detected heatwaves. The set of detected heatwaves depends on all the parameters.
+    The population density of each year is taken from the nearest GHS-POP epoch, or linearly interpolated between epochs if pop_interpolation is True.
+    If excel_export is True, an Excel copy of the indices table is also written.'''
 
     print('database :',database)
     print('datavar :',datavar)
@@ -128,17 +145,8 @@ def create_heatwaves_indices_database(database='ERA5', datavar='t2m', daily_var=
     f_Russo_HWMId = nc.Dataset(os.path.join(datadir,database,datavar,f"Russo_HWMId_{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_{year_beg_climatology}_{year_end_climatology}_{distrib_window_size}days.nc.nc"),mode='r')#path to the output netCDF file
     f_gdp_cap = nc.Dataset(os.path.join(datadir,database,"Socio_eco_maps",f"GDP_cap_{database}_Europe_{resolution}deg.nc"),mode='r')#path to the output netCDF file
     
-    f_pop_GHS_1975 = nc.Dataset(os.path.join(datadir,"Pop","GHS_POP",f"GHS_POP_1975_{database}_grid_Europe.nc"))
-    f_pop_GHS_1980 = nc.Dataset(os.path.join(datadir,"Pop","GHS_POP",f"GHS_POP_1980_{database}_grid_Europe.nc"))
-    f_pop_GHS_1985 = nc.Dataset(os.path.join(datadir,"Pop","GHS_POP",f"GHS_POP_1985_{database}_grid_Europe.nc"))
-    f_pop_GHS_1990 = nc.Dataset(os.path.join(datadir,"Pop","GHS_POP",f"GHS_POP_1990_{database}_grid_Europe.nc"))
-    f_pop_GHS_1995 = nc.Dataset(os.path.join(datadir,"Pop","GHS_POP",f"GHS_POP_1995_{database}_grid_Europe.nc"))
-    f_pop_GHS_2000 = nc.Dataset(os.path.join(datadir,"Pop","GHS_POP",f"GHS_POP_2000_{database}_grid_Europe.nc"))
-    f_pop_GHS_2005 = nc.Dataset(os.path.join(datadir,"Pop","GHS_POP",f"GHS_POP_2005_{database}_grid_Europe.nc"))
-    f_pop_GHS_2010 = nc.Dataset(os.path.join(datadir,"Pop","GHS_POP",f"GHS_POP_2010_{database}_grid_Europe.nc"))
-    f_pop_GHS_2015 = nc.Dataset(os.path.join(datadir,"Pop","GHS_POP",f"GHS_POP_2015_{database}_grid_Europe.nc"))
-    f_pop_GHS_2020 = nc.Dataset(os.path.join(datadir,"Pop","GHS_POP",f"GHS_POP_2020_{database}_grid_Europe.nc"))
-    
+    #LOAD POPULATION FILES
+    pop_epochs, pop_cube = load_population_cube(database=database) #all GHS-POP epochs, stacked in a single (epoch, lat, lon) array
     
     #f_age_over65_worldpop_2000 = nc.Dataset(os.path.join(datadir,"Pop","WorldPop","over65",f"GHS_POP_2000_{database}_grid_Europe.nc"))
     #f_age_over65_worldpop_2001 = nc.Dataset(os.path.join(datadir,"Pop","WorldPop","over65",f"GHS_POP_2000_{database}_grid_Europe.nc"))
@@ -161,230 +169,136 @@ def create_heatwaves_indices_database(database='ERA5', datavar='t2m', daily_var=
     #f_age_over65_worldpop_2018 = nc.Dataset(os.path.join(datadir,"Pop","WorldPop","over65",f"GHS_POP_2010_{database}_grid_Europe.nc"))
     #f_age_over65_worldpop_2019 = nc.Dataset(os.path.join(datadir,"Pop","WorldPop","over65",f"GHS_POP_2015_{database}_grid_Europe.nc"))
     #f_age_over65_worldpop_2020 = nc.Dataset(os.path.join(datadir,"Pop","WorldPop","over65",f"GHS_POP_2020_{database}_grid_Europe.nc"))
-    #LOAD POPULATION FILES
-    #Redirect the different years towards the correct (nearest in time) population data file :
-    htw_year_to_pop_dict = {}
-    #htw_year_to_age_dict = {}
-    for year in range(1950,1978):
-        htw_year_to_pop_dict[year]=f_pop_GHS_1975
-    for year in range(1978,1983):
-        htw_year_to_pop_dict[year]=f_pop_GHS_1980
-    for year in range(1983,1988):
-        htw_year_to_pop_dict[year]=f_pop_GHS_1985
-    for year in range(1988,1993):
-        htw_year_to_pop_dict[year]=f_pop_GHS_1990
-    for year in range(1993,1998):
-        htw_year_to_pop_dict[year]=f_pop_GHS_1995
-    for year in range(1998,2003):
-        htw_year_to_pop_dict[year]=f_pop_GHS_2000
-    for year in range(2003,2008):
-        htw_year_to_pop_dict[year]=f_pop_GHS_2005
-    for year in range(2008,2013):
-        htw_year_to_pop_dict[year]=f_pop_GHS_2010
-    for year in range(2013,2018):
-        htw_year_to_pop_dict[year]=f_pop_GHS_2015
-    for year in range(2018,2023) :
-        htw_year_to_pop_dict[year]=f_pop_GHS_2020
 
     output_dir = os.path.join("Output",database,f"{datavar}_{daily_var}",
                             f"{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_JJA_{nb_days}days_before_scan_{year_beg}_{year_end}_{threshold_value}{name_dict_threshold[relative_threshold]}_{distrib_window_size}days_window_climatology_{year_beg_climatology}_{year_end_climatology}")
-    df_htw = pd.read_excel(os.path.join(output_dir,f"df_htws_V0_detected_{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_JJA_{nb_days}days_before_scan_{year_beg}_{year_end}_{threshold_value}{name_dict_threshold[relative_threshold]}_{distrib_window_size}days_window_climatology_{year_beg_climatology}_{year_end_climatology}.xlsx"),header=0,index_col=0)
-    df_emdat_not_merged = pd.read_excel(os.path.join(datadir,"GDIS_EM-DAT","EMDAT_Europe-1950-2022-heatwaves.xlsx"),header=0, index_col=0) #heatwaves are not merged by event, they are dissociated when affecting several countries
-    df_emdat_merged = pd.read_excel(os.path.join(datadir,"GDIS_EM-DAT","EMDAT_Europe-1950-2022-heatwaves_merged.xlsx"),header=0, index_col=0) #heatwaves are merged by event number Dis No 
-    # #Read txt file containing detected heatwaves to create detected heatwaves list
-    with open(os.path.join(output_dir,f"emdat_detected_heatwaves_{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_{threshold_value}{name_dict_threshold[relative_threshold]}_flex_time_{flex_time_span}_days.txt"),'r') as f_txt:
-        detected_htw_list = f_txt.readlines()
-    f_txt.close()
-    # #Remove '\n' from strings
-    emdat_to_meteo_db_id_dico_not_merged = {}
-    emdat_heatwaves_list = []
-    for i in range(len(detected_htw_list)) :
-        emdat_to_meteo_db_id_dico_not_merged[detected_htw_list[i][:13]] = ast.literal_eval(detected_htw_list[i][14:-1])#Remove '\n' from strings
-        emdat_heatwaves_list = np.append(emdat_heatwaves_list,emdat_to_meteo_db_id_dico_not_merged[detected_htw_list[i][:13]])
-    emdat_heatwaves_list = [int(i) for i in np.unique(emdat_heatwaves_list)]
-    #Need to consider the possibility that several EM-DAT heatwaves are not distinguishable in meteo database
-    htw_multi = []
-    inverted_emdat_to_meteo_db_id_dico_not_merged = {}
-    for htw,v in emdat_to_meteo_db_id_dico_not_merged.items() :
-        for val in v :
-            try : 
-                inverted_emdat_to_meteo_db_id_dico_not_merged[val].append(htw[:9])
-            except :
-                inverted_emdat_to_meteo_db_id_dico_not_merged[val]=[htw[:9]]
-    for k,v in inverted_emdat_to_meteo_db_id_dico_not_merged.items():
-        inverted_emdat_to_meteo_db_id_dico_not_merged[k]=[s for s in np.unique(inverted_emdat_to_meteo_db_id_dico_not_merged[k])]
-        if len(inverted_emdat_to_meteo_db_id_dico_not_merged[k])>1:
-            htw_multi.append(k)
-    #--------------------------
-    #For all EM-DAT merged event, record every associated EM-DAT not merged heatwave (dico_merged_htw) that are detected in meteo database, and record every associated meteo database heatwave (dico_merged_label)
-    emdat_to_meteo_db_id_dico_merged_htw = {}
-    emdat_to_meteo_db_id_dico_merged_label = {}
-    for i in df_emdat_merged.index.values[:]:
-        dis_no = str(df_emdat_merged.loc[i,'disasterno'])
-        for k,v in emdat_to_meteo_db_id_dico_not_merged.items():
-            if dis_no in k :
-                try :
-                    emdat_to_meteo_db_id_dico_merged_htw[dis_no].append(k)
-                    emdat_to_meteo_db_id_dico_merged_label[dis_no] = np.append(emdat_to_meteo_db_id_dico_merged_label[dis_no],v)
-                except :
-                    emdat_to_meteo_db_id_dico_merged_htw[dis_no]=[k]
-                    emdat_to_meteo_db_id_dico_merged_label[dis_no]=[v]
-    not_computed_htw = []
-    links_not_computed_dict = {}
-    for k,v in emdat_to_meteo_db_id_dico_merged_label.items():
-        emdat_to_meteo_db_id_dico_merged_label[k]=[int(i) for i in np.unique(v)]
-        if len(emdat_to_meteo_db_id_dico_merged_label[k])>1:
-            not_computed_htw = np.append(not_computed_htw,emdat_to_meteo_db_id_dico_merged_label[k][1:])
-            links_not_computed_dict[emdat_to_meteo_db_id_dico_merged_label[k][0]]=[int(i) for i in emdat_to_meteo_db_id_dico_merged_label[k][1:]]
-    not_computed_htw = [int(i) for i in not_computed_htw]
-    careful_htw = list(links_not_computed_dict.keys())
-
-    htw_criteria = ['Global_mean','Spatial_extent','Duration','Max','Max_spatial','Temp_sum','Pseudo_HWMId','Total_affected_pop','Global_mean_pop','Duration_pop','Max_pop','Max_spatial_pop',
-    'Spatial_extent_pop','Temp_sum_pop','Pseudo_HWMId_pop','Multi_index_temp','Multi_index_HWMId','Temp_sum_pop_NL','Pseudo_HWMId_pop_NL','Multi_index_temp_NL','Multi_index_HWMId_NL']#,'Mean_log_GDP',
+    df_htw = read_table(os.path.join(output_dir,f"df_htws_V0_detected_{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_JJA_{nb_days}days_before_scan_{year_beg}_{year_end}_{threshold_value}{name_dict_threshold[relative_threshold]}_{distrib_window_size}days_window_climatology_{year_beg_climatology}_{year_end_climatology}.parquet"))
+    df_emdat_not_merged = read_table(os.path.join(datadir,"GDIS_EM-DAT","EMDAT_Europe-1950-2022-heatwaves.xlsx")) #heatwaves are not merged by event, they are dissociated when affecting several countries
+    #Load the links between EM-DAT heatwaves and detected heatwaves, written by analyse_impact_overlap
+    links_path = os.path.join(output_dir,f"emdat_detected_heatwaves_{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_{threshold_value}{name_dict_threshold[relative_threshold]}_flex_time_{flex_time_span}_days.parquet")
+    emdat_to_meteo_db_id_dico_not_merged, _ = load_emdat_detected_heatwaves(links_path, key='Dis No')
+    #For every meteo database heatwave, record every associated EM-DAT merged event
+    _, inverted_emdat_to_meteo_db_id_dico_not_merged = load_emdat_detected_heatwaves(links_path, key='disasterno')
+    emdat_heatwaves_list = list(inverted_emdat_to_meteo_db_id_dico_not_merged.keys())
+    #Groups of heatwaves that are not distinguishable (linked to the same EM-DAT event, directly or through other heatwaves), only the smallest label of each group is computed
+    label_to_group, group_to_labels = load_heatwaves_groups(os.path.join(output_dir,f"emdat_heatwaves_groups_{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_{threshold_value}{name_dict_threshold[relative_threshold]}_flex_time_{flex_time_span}_days.parquet"))
+
+    htw_criteria = list(heatwaves_indices.keys()) #all the indices of the registry, see heatwaves_indices_functions
+    primitives = heatwaves_indices_primitives(htw_criteria) #minimal set of primitive aggregates needed to compute the indices
+    primitives_var = sorted(set(var for (kind,var,weights),pop_class in primitives if var in ['temp','HWMId'])) #meteorological variables actually needed
 
     print("count_all_impacts :",count_all_impacts)
 
-    df_htw['Computed_heatwave'] = False
-    df_htw['Extreme_heatwave'] = False
-    df_htw['Total_Deaths'] = None
-    df_htw['Total_Affected'] = None
-    df_htw['Material_Damages'] = None
-    df_htw['Impact_sum'] = None
-
-    for htw_charac in htw_criteria:
-        df_htw[htw_charac] = None
+    #The results are stored in preallocated typed arrays (one value per detected heatwave), the dataframe is built once at the end
+    nb_htw_all = len(df_htw.index)
+    htw_pos = pd.Series(np.arange(nb_htw_all),index=df_htw.index.values) #position of each heatwave in the arrays
+    htw_columns = {'Computed_heatwave':np.zeros(nb_htw_all,dtype=bool), 'Extreme_heatwave':np.zeros(nb_htw_all,dtype=bool)}
+    for impact_charac in ['Total_Deaths','Total_Affected','Material_Damages','Impact_sum'] :
+        htw_columns[impact_charac] = np.full(nb_htw_all,np.nan) #only defined for extreme heatwaves
+    for htw_charac in htw_criteria :
+        htw_columns[htw_charac] = np.full(nb_htw_all,np.nan) #only defined for computed heatwaves
 
     res_lat = np.abs(np.mean(lat_in[1:]-lat_in[:-1])) #latitude resolution in degrees
     res_lon = np.abs(np.mean(lon_in[1:]-lon_in[:-1])) #longitude resolution in degrees
 
     cell_area = np.array([6371**2*np.cos(np.pi*lat_in/180)*res_lat*np.pi/180*res_lon*np.pi/180]*len(lon_in)).T # the area in km² of each cell, depending on the latitude
-    cell_area_3d = np.array([cell_area]*92)
-    cell_area_3d_ratio = cell_area_3d/(6371**2*res_lat*np.pi/180*res_lon*np.pi/180) #each cell area as a percentage of the maximum possible cell area (obtained with lat=0°) in order to correctly weigh each cell when carrying out average
-
-    gdp_time = f_gdp_cap.variables['time'][:]
-
-    for htw_id in tqdm(df_htw.index.values[:]) : #list of heatwaves detected in the meteo database
-        if htw_id not in not_computed_htw :
-            df_htw.loc[htw_id,'Computed_heatwave']=True
-            new_computed_htw = [htw_id]
-            if htw_id in careful_htw : #create list of all heatwaves that are not distinguishable from the htw_id heatwave (either because of EM-DAT overlap or meteo database overlap)
-                old_computed_htw = []
-                while new_computed_htw!=old_computed_htw :
-                    old_computed_htw = new_computed_htw
-                    for i in old_computed_htw :
-                        if i in links_not_computed_dict.keys() :
-                            new_computed_htw = np.append(new_computed_htw,links_not_computed_dict[i])
-                    new_computed_htw = [int(j) for j in np.unique(new_computed_htw)]
-            #Compute meteo indices
-            year = df_htw.loc[htw_id,'Year']
-            data_label = f_label.variables['label'][(year-year_beg)*92:(year-year_beg+1)*92,:,:]
-            vals = np.array(new_computed_htw)
-            mask_htw = ~np.isin(data_label,vals)
-            table_temp = f_temp.variables[datavar][(year-year_beg)*92:(year-year_beg+1)*92,:,:]
-            #table_temp = table_temp.data*(data_label == vals[:, None, None, None])[0].data
-            table_temp = ma.masked_where(mask_htw+(land_sea_mask>0), table_temp)
-            table_HWMId = f_Russo_HWMId.variables['Russo_HWMId'][(year-year_beg)*92:(year-year_beg+1)*92,:,:]
-            #table_HWMId = table_HWMId.data*(data_label == vals[:, None, None, None])[0].data
-            table_HWMId = ma.masked_where(mask_htw+(land_sea_mask>0), table_HWMId)
-            pop0 = htw_year_to_pop_dict[year].variables['Band1'][:] #Population density
-            pop = ma.array([pop0]*np.shape(table_temp)[0])
-            pop = ma.masked_where(mask_htw,pop) #population density set to zero for points that are not affected by the considered heatwave(s)
-            pop_unique = pop0*(np.nanmean(pop,axis=0)>0) #population density set to zero for points that are not affected by the considered heatwave(s) and "flattened" into a 2D array
-            area_unique = cell_area*(pop_unique>0) #cell area set to zero for points that are not affected by the considered heatwave(s)
-            duration = len(np.unique(np.where((data_label == vals[:, None, None, None])[0].data)[0]))
-            affected_pop = np.nansum(pop_unique*cell_area)
-            gdp_cap_map = f_gdp_cap.variables['gdp_cap'][np.argwhere(np.array(gdp_time)==year)[0][0],:,:]
-            gdp_cap_map = ma.masked_where(np.nanmean(pop,axis=0)==0,gdp_cap_map)
-            gdp_cap_map = ma.masked_where(gdp_cap_map==0,gdp_cap_map)
-            #mean temperature anomaly over every point recorded as a part of the heatwave
-            masked_temp = ma.masked_where(table_temp==0,table_temp)
-            df_htw.loc[htw_id,'Global_mean'] = np.nanmean(table_temp*cell_area_3d_ratio)
-            df_htw.loc[htw_id,'Global_mean_pop'] = df_htw.loc[htw_id,'Global_mean']*affected_pop
-            #area of the considered heatwave in km²
-            df_htw.loc[htw_id,'Spatial_extent'] = np.nansum(area_unique)
-            df_htw.loc[htw_id,'Spatial_extent_pop'] = df_htw.loc[htw_id,'Spatial_extent']*affected_pop
-            #duration in days
-            df_htw.loc[htw_id,'Duration'] = duration
-            df_htw.loc[htw_id,'Duration_pop'] = df_htw.loc[htw_id,'Duration']*affected_pop
-            #Sum of the normalized cell area multiplied by the temperature anomaly of every point recorded as a part of the heatwave
-            df_htw.loc[htw_id,'Temp_sum'] = np.nansum(table_temp*cell_area_3d_ratio)
-            df_htw.loc[htw_id,'Temp_sum_pop'] = df_htw.loc[htw_id,'Temp_sum']*affected_pop
-            #Sum of HWMId index over the heatwave (time and space), multiplied by the normalized cell area
-            df_htw.loc[htw_id,'Pseudo_HWMId'] = np.nansum(cell_area_3d_ratio*table_HWMId)
-            df_htw.loc[htw_id,'Pseudo_HWMId_pop'] = df_htw.loc[htw_id,'Pseudo_HWMId']*affected_pop
-            #maximum of the temperature anomaly of the heatwave, multiplied by the cumulative normalized area
-            df_htw.loc[htw_id,'Max_spatial'] = np.max(table_temp)*np.nansum(area_unique) 
-            df_htw.loc[htw_id,'Max_spatial_pop'] = df_htw.loc[htw_id,'Max_spatial']*affected_pop
-            #maximum temperature anomaly of the heatwave
-            df_htw.loc[htw_id,'Max'] = np.max(table_temp)
-            df_htw.loc[htw_id,'Max_pop'] = df_htw.loc[htw_id,'Max']*affected_pop
-            #Total affected population
-            df_htw.loc[htw_id,'Total_affected_pop'] = affected_pop
-            #
-            df_htw.loc[htw_id,'Multi_index_HWMId'] =  np.nansum((cell_area_3d_ratio*table_HWMId*pop_unique)) #np.nansum((cell_area**2*table_HWMId*pop_unique))
-            #
-            df_htw.loc[htw_id,'Multi_index_temp'] =  np.nansum((cell_area_3d_ratio*table_temp*pop_unique)) #np.nansum((cell_area**2*table_temp*pop_unique))
-            #
-            df_htw.loc[htw_id,'Temp_sum_pop_NL'] = np.nansum(cell_area_3d_ratio*table_temp*coeff_PL*(pop_unique>threshold_NL))*np.nansum(pop_unique*cell_area*(pop_unique>threshold_NL))+np.nansum(cell_area_3d_ratio*table_temp*(pop_unique<=threshold_NL))*np.nansum(pop_unique*cell_area*(pop_unique<=threshold_NL))
-            #Sum of HWMId index over the heatwave (time and space), multiplied by the normalized cell area
-            df_htw.loc[htw_id,'Pseudo_HWMId_pop_NL'] = np.nansum(cell_area_3d_ratio*table_HWMId*coeff_PL*(pop_unique>threshold_NL))*np.nansum(pop_unique*cell_area*(pop_unique>threshold_NL))+np.nansum(cell_area_3d_ratio*table_HWMId*(pop_unique<=threshold_NL))*np.nansum(pop_unique*cell_area*(pop_unique<=threshold_NL))
-            #
-            df_htw.loc[htw_id,'Multi_index_HWMId_NL'] = np.nansum((cell_area_3d_ratio*table_HWMId*pop_unique*coeff_PL*(pop_unique>threshold_NL))) + np.nansum((cell_area_3d_ratio*table_HWMId*pop_unique*(pop_unique<=threshold_NL))) #np.nansum((cell_area**2*table_HWMId*pop_unique*coeff_PL*(pop_unique>threshold_NL)) + (cell_area**2*table_HWMId*pop_unique*(pop_unique<=threshold_NL)))
-            #
-            df_htw.loc[htw_id,'Multi_index_temp_NL'] = np.nansum((cell_area_3d_ratio*table_temp*pop_unique*coeff_PL*(pop_unique>threshold_NL))) + np.nansum((cell_area_3d_ratio*table_temp*pop_unique*(pop_unique<=threshold_NL))) # np.nansum((cell_area**2*temp*pop_unique*coeff_PL*(pop_unique>threshold_NL)) + (cell_area**2*temp*pop_unique*(pop_unique<=threshold_NL)))
-            #
-            #df_htw.loc[htw_id,'Mean_log_GDP'] = -np.log10(np.nanmean(gdp_cap_map*pop0))
-            
-            #df_htw.loc[htw_id,'Mean_exp_GDP'] = np.exp(-np.nanmean(gdp_cap_map*pop0))
-            
-            #df_htw.loc[htw_id,'Mean_inv_GDP'] = 1/(np.nanmean(gdp_cap_map*pop0))
-            
-            #df_htw.loc[htw_id,'GDP_inv_log_temp_sum'] = (np.nansum((1/np.log10(gdp_cap_map))*table_temp*cell_area_3d_ratio))
-            
-            #df_htw.loc[htw_id,'GDP_inv_log_temp_mean'] = (np.nanmean((1/np.log10(gdp_cap_map))*pop0*table_temp*cell_area_3d_ratio))
-      
+    cell_area_ratio = cell_area/(6371**2*res_lat*np.pi/180*res_lon*np.pi/180) #each cell area as a percentage of the maximum possible cell area (obtained with lat=0°) in order to correctly weigh each cell when carrying out average
+
+    sea_mask = ma.filled(land_sea_mask>0,True) #points outside of the land mask are not taken into account in the meteorological indices
+
+    #Heatwaves for which the indices are computed, one for each group of heatwaves that are not distinguishable
+    computed_htw = np.array([htw_id for htw_id in df_htw.index.values if label_to_group.get(htw_id,htw_id)==htw_id],dtype=np.int64)
+    htw_columns['Computed_heatwave'][htw_pos[computed_htw].to_numpy()] = True
+    years_computed_htw = df_htw.loc[computed_htw,'Year'].to_numpy()
+
+    for year in tqdm(np.unique(years_computed_htw)) : #each year of data is read once, and the indices of all the heatwaves of the year are computed together
+        year_htw = computed_htw[years_computed_htw==year]
+        nb_htw = len(year_htw)
+        data_label = read_heatwave_labels(f_label.variables['label'],slice((year-year_beg)*92,(year-year_beg+1)*92))
+        #index (from 0 to nb_htw-1) of the computed heatwave each point belongs to, -1 if the point is not part of a computed heatwave of the year
+        label_to_idx = np.full(max(int(np.max(data_label)),int(np.max(year_htw)))+1,-1,dtype=np.int64)
+        for k,htw_id in enumerate(year_htw) :
+            label_to_idx[group_to_labels.get(htw_id,[htw_id])] = k
+        htw_idx = label_to_idx[data_label]
+        in_htw = htw_idx>=0
+        nb_time, nb_cells = np.shape(data_label)[0], np.size(data_label[0])
+        #Compute meteo indices
+        pop0 = get_population_year(pop_epochs,pop_cube,year,interpolation=pop_interpolation) #Population density
+        pop_valid = ~ma.getmaskarray(pop0)
+        pop0 = ma.filled(pop0,0).astype(np.float64)
+        pop_high = pop_valid*(pop0>threshold_NL) #densely populated points
+        pop_low = pop_valid*(pop0<=threshold_NL) #sparsely populated points
+        #points (cells) affected at least once by each heatwave : every (heatwave, cell) pair is recorded once
+        cells_3d = np.broadcast_to(np.arange(nb_cells).reshape(np.shape(data_label[0])),np.shape(data_label))
+        pairs_keys, pairs_inverse = np.unique(htw_idx[in_htw]*nb_cells+cells_3d[in_htw],return_inverse=True)
+        pairs_htw, pairs_cell = pairs_keys//nb_cells, pairs_keys%nb_cells
+        nb_pairs = len(pairs_keys)
+        #the duration is the one of the computed heatwave itself, not of its whole group
+        first_label_idx = np.full(len(label_to_idx),-1,dtype=np.int64)
+        first_label_idx[year_htw] = np.arange(nb_htw)
+        first_label_idx = first_label_idx[data_label]
+        days_htw = np.unique(first_label_idx[first_label_idx>=0]*nb_time+np.broadcast_to(np.arange(nb_time)[:,None,None],np.shape(data_label))[first_label_idx>=0])//nb_time
+        duration = np.bincount(days_htw,minlength=nb_htw)
+
+        #Collapse the time axis once : sum, count and maximum of temperature and HWMId over the days each (heatwave, cell) pair is part of the heatwave
+        pairs_land = ~sea_mask.ravel()[pairs_cell][pairs_inverse]
+        pairs_values = {}
+        for var_name, f_var, nc_var in [('temp',f_temp,datavar),('HWMId',f_Russo_HWMId,'Russo_HWMId')] :
+            if var_name not in primitives_var : #the variable is not used by any index
+                continue
+            table = f_var.variables[nc_var][(year-year_beg)*92:(year-year_beg+1)*92,:,:]
+            values = ma.getdata(table)[in_htw].astype(np.float64)
+            valid = pairs_land*~ma.getmaskarray(table)[in_htw]*np.isfinite(values) #points of the heatwaves where the variable is defined
+            pairs_values[f'{var_name}_sum'] = np.bincount(pairs_inverse[valid],weights=values[valid],minlength=nb_pairs)
+            pairs_values[f'{var_name}_count'] = np.bincount(pairs_inverse[valid],minlength=nb_pairs)
+            pairs_values[f'{var_name}_max'] = np.full(nb_pairs,-np.inf)
+            np.maximum.at(pairs_values[f'{var_name}_max'],pairs_inverse[valid],values[valid])
+
+        #Every index is then derived from the primitive aggregates of the registry, computed from these pairs and from 2D maps taken at the cell of each pair
+        cells_maps = {'area':cell_area, 'area_ratio':cell_area_ratio, 'pop':pop0, 'pop_positive':pop_valid*(pop0>0), 'high':pop_high, 'low':pop_low}
+        primitives_values = compute_heatwaves_primitives(primitives,nb_htw,pairs_htw,pairs_cell,pairs_values,cells_maps,duration)
+        indices_values = compute_heatwaves_indices(primitives_values,coeff_PL=coeff_PL,indices=htw_criteria)
+        year_htw_pos = htw_pos[year_htw].to_numpy()
+        for htw_charac in htw_criteria :
+            htw_columns[htw_charac][year_htw_pos] = indices_values[htw_charac]
+
+        for htw_id, pos in zip(year_htw, year_htw_pos) :
             if htw_id in emdat_heatwaves_list :
-                df_htw.loc[htw_id,'Extreme_heatwave'] = True
+                new_computed_htw = group_to_labels.get(htw_id,[htw_id]) #all heatwaves that are not distinguishable from the htw_id heatwave
+                htw_columns['Extreme_heatwave'][pos] = True
                 #Compute impact metrics
                 disasterno_list = []
                 for i in new_computed_htw :
-                    if count_all_impacts : #count all affected countries according to EM-DAT
-                        dis_no_name = 'disasterno'
-                        disasterno_list = np.append(disasterno_list,inverted_emdat_to_meteo_db_id_dico_not_merged[i])
-                    else : #count only visibly affected countries according to the meteorological database
-                        dis_no_name = 'Dis No'
-                        disasterno_list = np.append(disasterno_list,[emdat_to_meteo_db_id_dico_merged_htw[k] for k in inverted_emdat_to_meteo_db_id_dico_not_merged[i]])
-                disasterno_list = [st for st in np.unique(disasterno_list)]
-                df_impact = df_emdat_not_merged[df_emdat_not_merged[dis_no_name].isin(disasterno_list)]
+                    disasterno_list.extend(inverted_emdat_to_meteo_db_id_dico_not_merged.get(i,[]))
+                df_impact = df_emdat_not_merged[df_emdat_not_merged['disasterno'].isin(disasterno_list)]
+                if count_all_impacts==False : #count only visibly affected countries according to the meteorological database
+                    df_impact = df_impact[df_impact['Dis No'].isin(emdat_to_meteo_db_id_dico_not_merged.keys())]
                 df_impact = df_impact.fillna(value=0)
-                df_htw.loc[htw_id,'Total_Deaths'] = int(df_impact['Total Deaths'].sum())
-                df_htw.loc[htw_id,'Total_Affected'] = int(df_impact['Total Affected'].sum())
-                df_htw.loc[htw_id,'Material_Damages'] = (df_impact["Total Damages, Adjusted ('000 US$)"].sum())*1e3 #in 2022 US$
-                df_htw.loc[htw_id,'Impact_sum'] = (int(df_htw.loc[htw_id,'Total_Deaths'])*(2.907921e6*1.1069*1.2194)+ #2.907e6 2016€ is UE28 mean VSL (according to Handbook on the external costs of transport: version 2019, European Commission), then convert €2016 to US$2016 (*1.1069),  then convert US$2016 to US$2022 (*1.2194)
-                int(df_htw.loc[htw_id,'Total_Affected'])*(2.907921e6*0.07*1.1069*1.2194)+ #mean value of affected people (7% of the VSL), convert €2016 to US$2016 (*1.1069),  then convert US$2014 – 1.16 to US$2022 (*1.2194)
-                (df_htw.loc[htw_id,'Material_Damages'])) #socio-economic calculation, in 2022 US$
+                htw_columns['Total_Deaths'][pos] = int(df_impact['Total Deaths'].sum())
+                htw_columns['Total_Affected'][pos] = int(df_impact['Total Affected'].sum())
+                htw_columns['Material_Damages'][pos] = (df_impact["Total Damages, Adjusted ('000 US$)"].sum())*1e3 #in 2022 US$
+                htw_columns['Impact_sum'][pos] = (htw_columns['Total_Deaths'][pos]*(2.907921e6*1.1069*1.2194)+ #2.907e6 2016€ is UE28 mean VSL (according to Handbook on the external costs of transport: version 2019, European Commission), then convert €2016 to US$2016 (*1.1069),  then convert US$2016 to US$2022 (*1.2194)
+                htw_columns['Total_Affected'][pos]*(2.907921e6*0.07*1.1069*1.2194)+ #mean value of affected people (7% of the VSL), convert €2016 to US$2016 (*1.1069),  then convert US$2014 – 1.16 to US$2022 (*1.2194)
+                htw_columns['Material_Damages'][pos]) #socio-economic calculation, in 2022 US$
+
+    htw_columns['Duration'] = pd.array(htw_columns['Duration'],dtype='Int64') #number of days, undefined for heatwaves that are not computed
+    df_htw = pd.concat([df_htw,pd.DataFrame(htw_columns,index=df_htw.index)],axis=1)
 
     #Save dataframe 
-    df_htw.to_excel(os.path.join(output_dir,f"df_htws_detected{'_count_all_impacts'*count_all_impacts}_flex_time_{flex_time_span}days.xlsx"))
+    write_table(df_htw,os.path.join(output_dir,f"df_htws_detected{'_count_all_impacts'*count_all_impacts}_flex_time_{flex_time_span}days.parquet"),excel_export=excel_export)
     #close netCDF files
     f_label.close()
     f_Russo_HWMId.close()
     f_temp.close()
-    f_pop_GHS_1975.close()
-    f_pop_GHS_1980.close()
-    f_pop_GHS_1985.close()
-    f_pop_GHS_1990.close()
-    f_pop_GHS_1995.close()
-    f_pop_GHS_2000.close()
-    f_pop_GHS_2005.close()
-    f_pop_GHS_2010.close()
-    f_pop_GHS_2015.close()
-    f_pop_GHS_2020.close()
     return
 
 #%%
-def compute_heatwaves_indices_scores(database='ERA5', datavar='t2m', daily_var='tg', year_beg=1950, year_end=2021, threshold_value=95, year_beg_climatology=1950, year_end_climatology=2021, distrib_window_size=15,nb_days=4,flex_time_span=7, count_all_impacts=True, anomaly=True, relative_threshold=True):
-    '''This function is used to compute the scores of the indices of the detected heatwaves. The set of detected heatwaves depends on all the parameters.'''
+@instrument_stage
+def compute_heatwaves_indices_scores(database='ERA5', datavar='t2m', daily_var='tg', year_beg=1950, year_end=2021, threshold_value=95, year_beg_climatology=1950, year_end_climatology=2021, distrib_window_size=15,nb_days=4,flex_time_span=7, count_all_impacts=True, anomaly=True, relative_threshold=True, excel_export=False, bootstrap=False, nb_resamples=10000, confidence=0.95):
+    '''This function is used to compute the scores of the indices of the detected heatwaves. The set of detected heatwaves depends on all the parameters.
+    If excel_export is True, an Excel copy of the scores table is also written.
+    If bootstrap is True, the heatwaves are also resampled nb_resamples times (stratified bootstrap, see scoring_functions.bootstrap_scores) to write a second table with the confidence intervals (at the confidence level) of r_pearson, roc_auc and Global_score,
+    and the rank stability of the indices (probability to have the best Global_score and mean rank).'''
 
     print('database :',database)
     print('datavar :',datavar)
@@ -396,6 +310,7 @@ def compute_heatwaves_indices_scores(database='ERA5', datavar='t2m', daily_var='
     print('year_end_climatology :',year_end_climatology)
     print('nb_days :',nb_days)
     print('count_all_impacts :',count_all_impacts)
+    print('bootstrap :',bootstrap)
     
     if os.name == 'posix' :
         datadir = "Data/"
@@ -407,10 +322,10 @@ def compute_heatwaves_indices_scores(database='ERA5', datavar='t2m', daily_var='
     
     dataframe_dir = os.path.join("Output",database,f"{datavar}_{daily_var}",
                                         f"{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_JJA_{nb_days}days_before_scan_{year_beg}_{year_end}_{threshold_value}{name_dict_threshold[relative_threshold]}_{distrib_window_size}days_window_climatology_{year_beg_climatology}_{year_end_climatology}")
-    df_htw = pd.read_excel(os.path.join(dataframe_dir,
-                                        f"df_htws_detected{'_count_all_impacts'*count_all_impacts}_flex_time_{flex_time_span}days.xlsx"),header=0,index_col=0)
+    df_htw = read_table(os.path.join(dataframe_dir,
+                                        f"df_htws_detected{'_count_all_impacts'*count_all_impacts}_flex_time_{flex_time_span}days.parquet"))
     impact_criteria = ['Total_Deaths','Total_Affected','Material_Damages','Impact_sum']
-    meteo_criteria=df_htw.columns.values[np.argwhere((df_htw.columns.values)=='Global_mean')[0][0]:np.argwhere((df_htw.columns.values)=='Multi_index_HWMId_NL')[0][0]+1]
+    meteo_criteria = [index for index in heatwaves_indices.keys() if index in df_htw.columns] #indices of the registry, see heatwaves_indices_functions
     arr = []
     for i in range(len(impact_criteria)) :
         arr+=[impact_criteria[i]]*8
@@ -422,62 +337,82 @@ def compute_heatwaves_indices_scores(database='ERA5', datavar='t2m', daily_var='
     figs_output_dir = os.path.join(dataframe_dir,f"figs_flex_time_span_{flex_time_span}","roc_curve")
     pathlib.Path(figs_output_dir).mkdir(parents=True, exist_ok=True) #create output directory and parent directories if necessary
 
+    extreme_mask = df_htw['Extreme_heatwave'].to_numpy(dtype=bool)
+    computed_mask = df_htw['Computed_heatwave'].to_numpy(dtype=bool)
+    extreme_meteo = df_htw.loc[extreme_mask,meteo_criteria].to_numpy(dtype=np.float64).T #one row per meteo criterion
+    meteo_matrix = df_htw.loc[computed_mask,meteo_criteria].to_numpy(dtype=np.float64).T
+    extreme_bool_list = extreme_mask[computed_mask].astype(int)
     for chosen_impact in ['Total_Deaths','Impact_sum']:#tqdm(impact_criteria) :
-        for chosen_meteo in meteo_criteria :
-            extreme_list_impact = [df_htw.loc[i,chosen_impact] for i in df_htw[df_htw['Extreme_heatwave']==True].index.values[:]]
-            extreme_list_meteo = [df_htw.loc[i,chosen_meteo] for i in df_htw[df_htw['Extreme_heatwave']==True].index.values[:]]
-            meteo_list = [df_htw.loc[i,chosen_meteo] for i in df_htw[df_htw['Computed_heatwave']==True].index.values[:]]
-            extreme_bool_list = [int(df_htw.loc[i,'Extreme_heatwave']) for i in df_htw[df_htw['Computed_heatwave']==True].index.values[:]]
-            if len(extreme_list_impact)>=2 and len(extreme_list_meteo)>=2 :
-                (slope,intercept,Rpearson,pvalue,stderr)=stats.linregress(extreme_list_impact, extreme_list_meteo, alternative='two-sided')
-                #Rpearson = stats.pearsonr(extreme_list_impact,extreme_list_meteo)
-                Rspearman = stats.spearmanr(extreme_list_impact,extreme_list_meteo)
-                Kendall_tau = stats.kendalltau(extreme_list_impact,extreme_list_meteo)
-                significance = ''+'*'*(pvalue<0.05)+'*'*(pvalue<0.01)+'*'*(pvalue<0.001) #''+'*'*(Rpearson[1]<0.05)+'*'*(Rpearson[1]<0.01)+'*'*(Rpearson[1]<0.001) 
-                roc_auc = metrics.roc_auc_score(extreme_bool_list,meteo_list)
-                df_scores.loc[chosen_meteo,(chosen_impact,'r_pearson')] = str(np.round(Rpearson,6))+significance
-                df_scores.loc[chosen_meteo,(chosen_impact,'roc_auc')] = np.round(roc_auc,6)
-                df_scores.loc[chosen_meteo,(chosen_impact,'Global_score')] = np.round(np.sqrt(np.abs(Rpearson*roc_auc)),6)
-                df_scores.loc[chosen_meteo,(chosen_impact,'RMSE_R')] = 0
-                df_scores.loc[chosen_meteo,(chosen_impact,'r_spearman')] = np.round(Rspearman[0],6)
-                df_scores.loc[chosen_meteo,(chosen_impact,'Global_score_spearman')] = np.round(np.sqrt(np.abs(Rspearman[0]*roc_auc)),6)
-                df_scores.loc[chosen_meteo,(chosen_impact,'kendall_tau')] = np.round(Kendall_tau[0],6)
-                df_scores.loc[chosen_meteo,(chosen_impact,'Global_score_kendall')] = np.round(np.sqrt(np.abs(Kendall_tau[0]*roc_auc)),6)
-                #display roc_curve and correlation
-                if chosen_impact==impact_criteria[0] : #save this fig only once since it does not depend on the impact criterion
-                    plt.close()
-                    x=np.linspace(np.min(extreme_list_impact),np.max(extreme_list_impact),100)
-                    y=x*slope+intercept
-                    plt.plot(x,y,'k-')
-                    plt.plot(extreme_list_impact,extreme_list_meteo,'r+')
-                    plt.xlabel(f"{chosen_impact}")
-                    plt.ylabel(f"{chosen_meteo}")
-                    plt.ylim([0.95*np.min(extreme_list_meteo),1.05*np.max(extreme_list_meteo)])
-                    plt.title(f"Correlation between {chosen_meteo} and {chosen_impact}")
-                    #plt.legend()
-                    plt.savefig(os.path.join(figs_output_dir,f"correlation_{chosen_meteo}.png"))
-                    plt.close()
-                    
-                    plt.plot(extreme_bool_list,meteo_list)
-                    fpr, tpr, thresholds = metrics.roc_curve(extreme_bool_list,meteo_list)
-                    display = metrics.RocCurveDisplay(fpr=fpr, tpr=tpr, roc_auc=roc_auc,estimator_name=chosen_meteo)
-                    display.plot()
-                    plt.plot([0, 1], [0, 1], "k--", label="chance level (AUC = 0.5)")
-                    plt.axis("square")
-                    plt.xlabel(f"Impact ({impact_criteria})")
-                    plt.ylabel("True Positive Rate")
-                    plt.title(f"Correlation: {chosen_meteo}")
-                    plt.legend()
-                    plt.savefig(os.path.join(figs_output_dir,f"roc_curve_{chosen_meteo}.png"))
-                    plt.close()                   
-                    
-                    
-    df_scores.to_excel(os.path.join(dataframe_dir,f"df_scores{'_count_all_impacts'*(count_all_impacts)}_flex_time_span_{flex_time_span}_days.xlsx"))
+        extreme_list_impact = df_htw.loc[extreme_mask,chosen_impact].to_numpy(dtype=np.float64)
+        if len(extreme_list_impact)<2 :
+            continue
+        scores = batch_scores(extreme_list_impact,extreme_meteo,extreme_bool_list,meteo_matrix) #all the meteo criteria at once, see scoring_functions
+        for k,chosen_meteo in enumerate(meteo_criteria) :
+            Rpearson, pvalue, roc_auc = scores['r_pearson'][k], scores['pvalue'][k], scores['roc_auc'][k]
+            significance = '*'*int(np.sum(pvalue<np.array([0.05,0.01,0.001]))) #one star per significance level passed
+            df_scores.loc[chosen_meteo,(chosen_impact,'r_pearson')] = str(np.round(Rpearson,6))+significance
+            df_scores.loc[chosen_meteo,(chosen_impact,'roc_auc')] = np.round(roc_auc,6)
+            df_scores.loc[chosen_meteo,(chosen_impact,'Global_score')] = np.round(np.sqrt(np.abs(Rpearson*roc_auc)),6)
+            df_scores.loc[chosen_meteo,(chosen_impact,'RMSE_R')] = 0
+            df_scores.loc[chosen_meteo,(chosen_impact,'r_spearman')] = np.round(scores['r_spearman'][k],6)
+            df_scores.loc[chosen_meteo,(chosen_impact,'Global_score_spearman')] = np.round(np.sqrt(np.abs(scores['r_spearman'][k]*roc_auc)),6)
+            df_scores.loc[chosen_meteo,(chosen_impact,'kendall_tau')] = np.round(scores['kendall_tau'][k],6)
+            df_scores.loc[chosen_meteo,(chosen_impact,'Global_score_kendall')] = np.round(np.sqrt(np.abs(scores['kendall_tau'][k]*roc_auc)),6)
+            #display roc_curve and correlation
+            if chosen_impact==impact_criteria[0] : #save this fig only once since it does not depend on the impact criterion
+                extreme_list_meteo = extreme_meteo[k]
+                meteo_list = meteo_matrix[k]
+                slope, intercept = scores['slope'][k], scores['intercept'][k]
+                plt.close()
+                x=np.linspace(np.min(extreme_list_impact),np.max(extreme_list_impact),100)
+                y=x*slope+intercept
+                plt.plot(x,y,'k-')
+                plt.plot(extreme_list_impact,extreme_list_meteo,'r+')
+                plt.xlabel(f"{chosen_impact}")
+                plt.ylabel(f"{chosen_meteo}")
+                plt.ylim([0.95*np.min(extreme_list_meteo),1.05*np.max(extreme_list_meteo)])
+                plt.title(f"Correlation between {chosen_meteo} and {chosen_impact}")
+                #plt.legend()
+                plt.savefig(os.path.join(figs_output_dir,f"correlation_{chosen_meteo}.png"))
+                plt.close()
+                
+                plt.plot(extreme_bool_list,meteo_list)
+                fpr, tpr, thresholds = metrics.roc_curve(extreme_bool_list,meteo_list)
+                display = metrics.RocCurveDisplay(fpr=fpr, tpr=tpr, roc_auc=roc_auc,estimator_name=chosen_meteo)
+                display.plot()
+                plt.plot([0, 1], [0, 1], "k--", label="chance level (AUC = 0.5)")
+                plt.axis("square")
+                plt.xlabel(f"Impact ({impact_criteria})")
+                plt.ylabel("True Positive Rate")
+                plt.title(f"Correlation: {chosen_meteo}")
+                plt.legend()
+                plt.savefig(os.path.join(figs_output_dir,f"roc_curve_{chosen_meteo}.png"))
+                plt.close()                   
+                
+                
+    write_table(df_scores,os.path.join(dataframe_dir,f"df_scores{'_count_all_impacts'*(count_all_impacts)}_flex_time_span_{flex_time_span}_days.parquet"),excel_export=excel_export)
+
+    if bootstrap :
+        bootstrap_impacts = ['Total_Deaths','Impact_sum']
+        bootstrap_metrics = ['r_pearson_low','r_pearson_high','roc_auc_low','roc_auc_high','Global_score_low','Global_score_high','prob_best','mean_rank']
+        col_idx = pd.MultiIndex.from_product([bootstrap_impacts,bootstrap_metrics], names=('impact', 'metric'))
+        df_scores_bootstrap = pd.DataFrame(columns=col_idx, index = meteo_criteria,data=np.nan)
+        for chosen_impact in bootstrap_impacts :
+            extreme_list_impact = df_htw.loc[extreme_mask,chosen_impact].to_numpy(dtype=np.float64)
+            if len(extreme_list_impact)<2 :
+                continue
+            bootstrap_results = bootstrap_scores(extreme_list_impact,meteo_matrix,extreme_bool_list,nb_resamples=nb_resamples,confidence=confidence) #all the resamples at once, see scoring_functions
+            for metric in bootstrap_metrics :
+                df_scores_bootstrap[(chosen_impact,metric)] = np.round(bootstrap_results[metric],6)
+        write_table(df_scores_bootstrap,os.path.join(dataframe_dir,f"df_scores_bootstrap{'_count_all_impacts'*(count_all_impacts)}_flex_time_span_{flex_time_span}_days.parquet"),excel_export=excel_export)
     return
 
 #%%
-def plot_heatwaves_distribution(database='ERA5', datavar='t2m', daily_var='tg', year_beg=1950, year_end=2021, threshold_value=95, year_beg_climatology=1950, year_end_climatology=2021, distrib_window_size=15,nb_days=4,flex_time_span=7, count_all_impacts=True, anomaly=True, relative_threshold=True):
-    '''This function is used to plot the distribution of the detected heatwaves according to different indices. The set of detected heatwaves depends on all the parameters.'''
+@instrument_stage
+def plot_heatwaves_distribution(database='ERA5', datavar='t2m', daily_var='tg', year_beg=1950, year_end=2021, threshold_value=95, year_beg_climatology=1950, year_end_climatology=2021, distrib_window_size=15,nb_days=4,flex_time_span=7, count_all_impacts=True, anomaly=True, relative_threshold=True, nb_processes=1, label_placement='adjust_text'):
+    '''This function is used to plot the distribution of the detected heatwaves according to different indices. The set of detected heatwaves depends on all the parameters.
+    The histograms are computed once and cached next to the figures (see distribution_plot_functions). The figures of the indices are rendered in a pool of nb_processes processes (Agg backend) if nb_processes>1,
+    and label_placement='fast' replaces adjust_text by a fast deterministic placement of the labels of the extreme heatwaves.'''
 
     print('database :',database)
     print('datavar :',datavar)
@@ -500,170 +435,32 @@ def plot_heatwaves_distribution(database='ERA5', datavar='t2m', daily_var='tg',
     
     dataframe_dir = os.path.join("Output",database,f"{datavar}_{daily_var}",
                                         f"{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_JJA_{nb_days}days_before_scan_{year_beg}_{year_end}_{threshold_value}{name_dict_threshold[relative_threshold]}_{distrib_window_size}days_window_climatology_{year_beg_climatology}_{year_end_climatology}")
-    df_htw = pd.read_excel(os.path.join(dataframe_dir,
-                                        f"df_htws_detected{'_count_all_impacts'*count_all_impacts}_flex_time_{flex_time_span}days.xlsx"),header=0,index_col=0)
+    df_htw_path = os.path.join(dataframe_dir,f"df_htws_detected{'_count_all_impacts'*count_all_impacts}_flex_time_{flex_time_span}days.parquet")
+    df_htw = read_table(df_htw_path)
     
-    def max_boundary(x) :
-        if x<0 :
-            x=0.95
-        else :
-            x=1.05
-        return(x)
-
-    def min_boundary(x) :
-        if x<0 :
-            x=1.05
-        else :
-            x=0.95
-        return(x)
-
-    def id_func(x) :
-        return(x)
-
-    dict_func = {"Global_mean": id_func, 
-    "Spatial_extent": np.log10,
-    "Duration": id_func, 
-    "Temp_sum": np.log10,
-    'Pseudo_HWMId': np.log10, 
-    'Max_spatial' : np.log10, 
-    'Max': id_func,
-    "Global_mean_pop": np.log10, 
-    "Spatial_extent_pop": np.log10, 
-    "Duration_pop": np.log10, 
-    "Temp_sum_pop": np.log10,
-    'Pseudo_HWMId_pop': np.log10, 
-    'Max_pop': np.log10,
-    'Max_spatial_pop': np.log10, 
-    'Temp_sum_pop_NL': np.log10, 
-    'Pseudo_HWMId_pop_NL': np.log10, 
-    'Total_affected_pop':np.log10,
-    'Multi_index_HWMId':np.log10,
-    'Multi_index_temp':np.log10, 
-    'Multi_index_HWMId_NL':np.log10,
-    'Multi_index_temp_NL':np.log10,
-    'Mean_log_GDP':id_func,
-    'Mean_exp_GDP':id_func,
-    'Mean_inv_GDP':np.log10,
-    'GDP_inv_log_temp_sum':np.log10,
-    'GDP_inv_log_temp_mean':np.log10} #bins of the histogram
-
     clrs_dico = {"Total_Deaths": clrs.LogNorm(vmin=1, vmax=np.max(df_htw['Total_Deaths'])), "Total_Affected": clrs.Normalize(vmin=0, vmax=500), "Total_Damages": clrs.LogNorm(vmin=1, vmax=12120000) , "Impact_sum": clrs.LogNorm(vmin=1e4, vmax=np.max(df_htw['Impact_sum']))} #colormap depending on the selected criterion
 
     #impact_criteria = ['TotalDeaths', 'Impact_fct']
     #meteo_criteria = ['Global_mean','Spatial_extent','Duration','Max','Max_spatial','Temp_sum','Pseudo_HWMId','Pop_unique','Global_mean_pop','Duration_pop','Max_pop','Max_spatial_pop',
     #'Spatial_extent_pop','Temp_sum_pop','Pseudo_HWMId_pop','Temp_sum_pop_NL','Pseudo_HWMId_pop_NL','Multi_index_temp','Multi_index_HWMId','Multi_index_temp_NL','Multi_index_HWMId_NL']
 
-    df_emdat_not_merged = pd.read_excel(os.path.join(datadir,"GDIS_EM-DAT","EMDAT_Europe-1950-2022-heatwaves.xlsx"),header=0, index_col=0) #heatwaves are not merged by event, they are dissociated when affecting several countries
-    df_emdat_merged = pd.read_excel(os.path.join(datadir,"GDIS_EM-DAT","EMDAT_Europe-1950-2022-heatwaves_merged.xlsx"),header=0, index_col=0) #heatwaves are merged by event number Dis No
-    
-    # #Read txt file containing detected heatwaves to create detected heatwaves list
-    with open(os.path.join(dataframe_dir,f"emdat_detected_heatwaves_{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_{threshold_value}{name_dict_threshold[relative_threshold]}_flex_time_{flex_time_span}_days.txt"),'r') as f_txt:
-        detected_htw_list = f_txt.readlines()
-    f_txt.close()
-    # #Remove '\n' from strings
-    emdat_to_era5_id_dico_not_merged = {}
-    emdat_heatwaves_list = []
-    for i in range(len(detected_htw_list)) :
-        emdat_to_era5_id_dico_not_merged[detected_htw_list[i][:13]] = ast.literal_eval(detected_htw_list[i][14:-1])#Remove '\n' from strings
-        emdat_heatwaves_list = np.append(emdat_heatwaves_list,emdat_to_era5_id_dico_not_merged[detected_htw_list[i][:13]])
-    emdat_heatwaves_list = [int(i) for i in np.unique(emdat_heatwaves_list)]
-    #Need to consider the possibility that several EM-DAT heatwaves are not distinguishable in ERA5
-    htw_multi = []
-    inverted_emdat_to_era5_id_dico_not_merged = {}
-    for htw,v in emdat_to_era5_id_dico_not_merged.items() :
-        for val in v :
-            try : 
-                inverted_emdat_to_era5_id_dico_not_merged[val].append(htw[:9])
-            except :
-                inverted_emdat_to_era5_id_dico_not_merged[val]=[htw[:9]]
-    for k,v in inverted_emdat_to_era5_id_dico_not_merged.items():
-        inverted_emdat_to_era5_id_dico_not_merged[k]=[s for s in np.unique(inverted_emdat_to_era5_id_dico_not_merged[k])]
-        if len(inverted_emdat_to_era5_id_dico_not_merged[k])>1:
-            htw_multi.append(k)
-    #For all EM-DAT merged event, record every associated EM-DAT not merged heatwave (dico_merged_htw) that are detected in ERA5, and record every associated ERA5 heatwave (dico_merged_label)
-    emdat_to_era5_id_dico_merged_htw = {}
-    emdat_to_era5_id_dico_merged_label = {}
-    for i in df_emdat_merged.index.values[:]:
-        dis_no = str(df_emdat_merged.loc[i,'disasterno'])
-        for k,v in emdat_to_era5_id_dico_not_merged.items():
-            if dis_no in k :
-                try :
-                    emdat_to_era5_id_dico_merged_htw[dis_no].append(k)
-                    emdat_to_era5_id_dico_merged_label[dis_no] = np.append(emdat_to_era5_id_dico_merged_label[dis_no],v)
-                except :
-                    emdat_to_era5_id_dico_merged_htw[dis_no]=[k]
-                    emdat_to_era5_id_dico_merged_label[dis_no]=[v]
-    not_computed_htw = []
-    links_not_computed_dict = {}
-    for k,v in emdat_to_era5_id_dico_merged_label.items():
-        emdat_to_era5_id_dico_merged_label[k]=[int(i) for i in np.unique(v)]
-        if len(emdat_to_era5_id_dico_merged_label[k])>1:
-            not_computed_htw = np.append(not_computed_htw,emdat_to_era5_id_dico_merged_label[k][1:])
-            links_not_computed_dict[emdat_to_era5_id_dico_merged_label[k][0]]=[int(i) for i in emdat_to_era5_id_dico_merged_label[k][1:]]
-    not_computed_htw = [int(i) for i in not_computed_htw]
-    careful_htw = list(links_not_computed_dict.keys())
-
     figs_output_dir = os.path.join(dataframe_dir,f"figs_flex_time_span_{flex_time_span}",f"distrib{'_count_all_impacts'*count_all_impacts}")
     pathlib.Path(figs_output_dir).mkdir(parents=True, exist_ok=True) #create output directory and parent directories if necessary
 
     impact_criteria = ['Total_Deaths']#[Total_Deaths,Total_Affected,Material_Damages,Impact_sum]
     #List of indices
-    meteo_criteria=df_htw.columns.values[np.argwhere((df_htw.columns.values)=='Global_mean')[0][0]:]#all indices, starting with Global_mean
+    meteo_criteria = [index for index in heatwaves_indices.keys() if index in df_htw.columns] #indices of the registry, see heatwaves_indices_functions
 
-    df_scores = pd.read_excel(os.path.join(dataframe_dir,f"df_scores{'_count_all_impacts'*(count_all_impacts)}_flex_time_span_{flex_time_span}_days.xlsx"),index_col=0,header=[0,1])
+    df_scores = read_table(os.path.join(dataframe_dir,f"df_scores{'_count_all_impacts'*(count_all_impacts)}_flex_time_span_{flex_time_span}_days.parquet"),index_col=0,header=[0,1])
 
     for chosen_impact in impact_criteria :
-        scatter_list_impact = [df_htw.loc[i,chosen_impact] for i in df_htw[df_htw['Extreme_heatwave']==True].index.values[:]]
+        distrib_data = load_distribution_data(df_htw,meteo_criteria,chosen_impact,os.path.join(figs_output_dir,f"distrib_data_{chosen_impact}.npz"),df_htw_path) #histograms computed once and cached
+        scatter_list_impact = distrib_data['impact']
         if len(scatter_list_impact)>=2 :
-            for chosen_meteo in tqdm(meteo_criteria) :
-                scatter_list_meteo = [df_htw.loc[i,chosen_meteo] for i in df_htw[df_htw['Extreme_heatwave']==True].index.values[:]]
-                meteo_list = [df_htw.loc[i,chosen_meteo] for i in df_htw[df_htw['Computed_heatwave']==True].index.values[:]]
-
-                min_val = np.min(meteo_list)
-                max_val = np.max(meteo_list)
-                #print(chosen_meteo,'min',np.min(meteo_list),'max',np.max(meteo_list))
-                fig = plt.figure(1,figsize=(24,16),facecolor='white')
-                if dict_func[chosen_meteo] == id_func :
-                    Y,bins_edges=np.histogram(meteo_list,bins=np.linspace(start=min_val*min_boundary(min_val), stop=max_val*max_boundary(max_val), num=30)) #histogram of the E-OBS heatwaves distribution
-                elif dict_func[chosen_meteo] == np.log10 :
-                    Y,bins_edges=np.histogram(meteo_list,bins=np.logspace(start=np.log10(min_val*min_boundary(min_val)), stop=np.log10(max_val*max_boundary(max_val)), num=30)) #histogram of the E-OBS heatwaves distribution
-                X=[0]*len(Y)
-
-                for k in range(len(Y)) :
-                    X[k]=(bins_edges[k+1]+bins_edges[k])/2
-                Y=np.array(Y)
-                Y2=signal.savgol_filter(Y, 9,3)#savgol_window_dico[chosen_meteo], 3) #smooth the histogram edges with a savitzky-golay filter
-                if dict_func[chosen_meteo] == (id_func) : 
-                    plt.plot(X,Y,'ko')
-                    plt.plot(X,Y2,'r-')
-                elif dict_func[chosen_meteo] == np.log10: #have to plot on semilog scale for these criteria
-                    plt.semilogx(X,Y,'ko')
-                    plt.semilogx(X,Y2,'r-')
-                plt.plot(X,Y,'ko')
-                plt.plot(X,Y2,'r-')
-                plt.ylim([-2,45])
-                plt.xlim([min_val*min_boundary(min_val),max_val*max_boundary(max_val)])
-                plt.axvline(np.percentile(meteo_list,25),linewidth=2) #add 1st quartile of the meteo criterion list
-                plt.axvline(np.median(meteo_list),linewidth=2) #add median of the meteo criterion list
-                plt.axvline(np.percentile(meteo_list,75),linewidth=2) #add 3rd quartile of the meteo criterion list
-                plt.grid()
-                plt.xlabel(chosen_meteo,size=25)#+' '+units_dico[chosen_meteo])
-                plt.ylabel('Frequency',size=25)
-                #plt.title(f'Heatwaves distribution over {chosen_meteo} criterion',size=25)# ('+criteria_dico[chosen_meteo]+')',y=1)
-
-                texts=[]
-                for k in range(len(scatter_list_meteo)):
-                    closest_x = min(range(len(X)), key=lambda i: abs(X[i]-scatter_list_meteo[k]))
-                    plt.scatter(np.linspace(scatter_list_meteo[k],scatter_list_meteo[k],1000),np.linspace(0,Y2[closest_x],1000),c=[scatter_list_impact[k]]*1000,edgecolor=None, cmap = 'YlOrRd',norm=clrs_dico[chosen_impact],linewidths=4)
-                    texts.append(plt.annotate(df_htw[df_htw['Extreme_heatwave']==True].index.values[k],(scatter_list_meteo[k],Y2[closest_x]),size=15))
-                adjust_text(texts, only_move={'points':'y', 'texts':'y'}, arrowprops=dict(arrowstyle="->", color='k', lw=1))
-                cax = plt.axes([0.35, 0.02, 0.35, 0.02])
-                plt.title('Impact of the extreme heatwaves ('+chosen_impact+')',y=1,size=25)
-                plt.colorbar(cax=cax,orientation='horizontal')
-                #plt.tight_layout()
-                plt.savefig(os.path.join(figs_output_dir,f"distrib_{chosen_impact}_{chosen_meteo}{'_count_all_impacts'*count_all_impacts}.png"))
-                fig.clear()
-                #plt.show()
+            tasks = [{'data':criterion_data(distrib_data,chosen_meteo), 'impact':scatter_list_impact, 'labels':distrib_data['labels'], 'norm':clrs_dico[chosen_impact],
+                      'chosen_impact':chosen_impact, 'chosen_meteo':chosen_meteo, 'label_placement':label_placement,
+                      'output_path':os.path.join(figs_output_dir,f"distrib_{chosen_impact}_{chosen_meteo}{'_count_all_impacts'*count_all_impacts}.png")} for chosen_meteo in meteo_criteria]
+            render_distribution_figures(tasks,nb_processes=nb_processes)
                 
             try :
                 best_scoring_index = df_scores[df_scores[('Total_Deaths','Global_score')]==np.nanmax(df_scores[('Total_Deaths','Global_score')])].index.values[0]
@@ -671,86 +468,37 @@ def plot_heatwaves_distribution(database='ERA5', datavar='t2m', daily_var='tg',
             except :
                 pass
             f, (ax1, ax2) = plt.subplots(2, 1, figsize=(16,12))
-            scatter_list_meteo = [df_htw.loc[i,worst_scoring_index] for i in df_htw[df_htw['Extreme_heatwave']==True].index.values[:]]
-            meteo_list = [df_htw.loc[i,worst_scoring_index] for i in df_htw[df_htw['Computed_heatwave']==True].index.values[:]]
-            min_val = np.min(meteo_list)
-            max_val = np.max(meteo_list)
-            #print(worst_scoring_index,'min',np.min(meteo_list),'max',np.max(meteo_list))
-            if dict_func[worst_scoring_index] == id_func :
-                Y,bins_edges=np.histogram(meteo_list,bins=np.linspace(start=min_val*min_boundary(min_val), stop=max_val*max_boundary(max_val), num=30)) #histogram of the E-OBS heatwaves distribution
-            elif dict_func[worst_scoring_index] == np.log10 :
-                Y,bins_edges=np.histogram(meteo_list,bins=np.logspace(start=np.log10(min_val*min_boundary(min_val)), stop=np.log10(max_val*max_boundary(max_val)), num=30)) #histogram of the E-OBS heatwaves distribution
-            X=[0]*len(Y)
-
-            for k in range(len(Y)) :
-                X[k]=(bins_edges[k+1]+bins_edges[k])/2
-            Y=np.array(Y)
-            Y2=signal.savgol_filter(Y, 9,3)#savgol_window_dico[chosen_meteo], 3) #smooth the histogram edges with a savitzky-golay filter
-            if dict_func[worst_scoring_index] == (id_func) : 
-            #    plt.plot(X,Y,'ko')
-                ax1.plot(X,Y2,'r-')
-            elif dict_func[worst_scoring_index] == np.log10: #have to plot on semilog scale for these criteria
-            #    plt.semilogx(X,Y,'ko')
-                ax1.semilogx(X,Y2,'r-')
-            #plt.plot(X,Y,'ko')
-            ax1.set_ylim([-1,45])
-            ax1.set_xlim([min_val*min_boundary(min_val),max_val*max_boundary(max_val)])
-            ax1.axvline(np.percentile(meteo_list,25),linewidth=2) #add 1st quartile of the meteo criterion list
-            ax1.axvline(np.median(meteo_list),linewidth=2) #add median of the meteo criterion list
-            ax1.axvline(np.percentile(meteo_list,75),linewidth=2) #add 3rd quartile of the meteo criterion list
-            ax1.grid()
-            ax1.set_ylabel("Frequency", fontsize = 20.0) # Y label
-            ax1.set_xlabel(worst_scoring_index, fontsize = 20) # X label
-            ax1.tick_params(axis='both', which='major', labelsize=20)
-            plt.text(.7, .9, 'Worst', ha='left', va='top', fontsize=30, transform=ax1.transAxes,bbox=dict(boxstyle="round", ec=(0.0, 0.0, 0.0), fc=(1., 1, 1)))
-            for k in range(len(scatter_list_meteo)):
-                closest_x = min(range(len(X)), key=lambda i: abs(X[i]-scatter_list_meteo[k]))
-                CS1 = ax1.scatter(np.linspace(scatter_list_meteo[k],scatter_list_meteo[k],1000),np.linspace(0,Y2[closest_x],1000),c=[scatter_list_impact[k]]*1000,edgecolor=None, cmap = 'YlOrRd',norm=clrs_dico[chosen_impact],linewidths=4)
-            
-            scatter_list_meteo = [df_htw.loc[i,best_scoring_index] for i in df_htw[df_htw['Extreme_heatwave']==True].index.values[:]]
-            meteo_list = [df_htw.loc[i,best_scoring_index] for i in df_htw[df_htw['Computed_heatwave']==True].index.values[:]]
-            min_val = np.min(meteo_list)
-            max_val = np.max(meteo_list)
-            if dict_func[best_scoring_index] == id_func :
-                Y,bins_edges=np.histogram(meteo_list,bins=np.linspace(start=min_val*min_boundary(min_val), stop=max_val*max_boundary(max_val), num=30)) #histogram of the E-OBS heatwaves distribution
-            elif dict_func[best_scoring_index] == np.log10 :
-                Y,bins_edges=np.histogram(meteo_list,bins=np.logspace(start=np.log10(min_val*min_boundary(min_val)), stop=np.log10(max_val*max_boundary(max_val)), num=30)) #histogram of the E-OBS heatwaves distribution
-            X=[0]*len(Y)
-
-            for k in range(len(Y)) :
-                X[k]=(bins_edges[k+1]+bins_edges[k])/2
-            Y=np.array(Y)
-            Y2=signal.savgol_filter(Y, 9,3)#savgol_window_dico[best_scoring_index], 3) #smooth the histogram edges with a savitzky-golay filter
-            if dict_func[best_scoring_index] == (id_func) : 
-            #    plt.plot(X,Y,'ko')
-                ax2.plot(X,Y2,'r-')
-            elif dict_func[best_scoring_index] == np.log10: #have to plot on semilog scale for these criteria
-            #    plt.semilogx(X,Y,'ko')
-                ax2.semilogx(X,Y2,'r-')
-            #plt.plot(X,Y,'ko')
-            ax2.set_ylim([-1,45])
-            ax2.set_xlim([min_val*min_boundary(min_val),max_val*max_boundary(max_val)])
-            ax2.axvline(np.percentile(meteo_list,25),linewidth=2) #add 1st quartile of the meteo criterion list
-            ax2.axvline(np.median(meteo_list),linewidth=2) #add median of the meteo criterion list
-            ax2.axvline(np.percentile(meteo_list,75),linewidth=2) #add 3rd quartile of the meteo criterion list
-            ax2.grid()
-            ax2.set_ylabel("Frequency", fontsize = 20.0) # Y label
-            ax2.set_xlabel(best_scoring_index, fontsize = 20) # X label
-            ax2.tick_params(axis='both', which='major', labelsize=20)
-            plt.text(.2, .9, 'Best', ha='left', va='top', fontsize=30, transform=ax2.transAxes,bbox=dict(boxstyle="round", ec=(0.0, 0.0, 0.0), fc=(1., 1, 1)))
-            for k in range(len(scatter_list_meteo)):
-                closest_x = min(range(len(X)), key=lambda i: abs(X[i]-scatter_list_meteo[k]))
-                CS2 = ax2.scatter(np.linspace(scatter_list_meteo[k],scatter_list_meteo[k],1000),np.linspace(0,Y2[closest_x],1000),c=[scatter_list_impact[k]]*1000,edgecolor=None, cmap = 'YlOrRd',norm=clrs_dico[chosen_impact],linewidths=4)
+            for ax, scoring_index, text_x, text in [(ax1,worst_scoring_index,.7,'Worst'),(ax2,best_scoring_index,.2,'Best')] :
+                index_data = criterion_data(distrib_data,scoring_index)
+                X, Y2 = index_data['X'], index_data['Y2']
+                if heatwaves_indices[scoring_index]['scale']=='linear' :
+                    ax.plot(X,Y2,'r-')
+                else : #have to plot on semilog scale for these criteria
+                    ax.semilogx(X,Y2,'r-')
+                ax.set_ylim([-1,45])
+                ax.set_xlim(index_data['xlim'])
+                for quartile in index_data['quartiles'] : #add 1st quartile, median and 3rd quartile of the meteo criterion list
+                    ax.axvline(quartile,linewidth=2)
+                ax.grid()
+                ax.set_ylabel("Frequency", fontsize = 20.0) # Y label
+                ax.set_xlabel(scoring_index, fontsize = 20) # X label
+                ax.tick_params(axis='both', which='major', labelsize=20)
+                plt.text(text_x, .9, text, ha='left', va='top', fontsize=30, transform=ax.transAxes,bbox=dict(boxstyle="round", ec=(0.0, 0.0, 0.0), fc=(1., 1, 1)))
+                scatter_list_meteo, scatter_height = index_data['scatter_meteo'], index_data['scatter_height']
+                for k in range(len(scatter_list_meteo)):
+                    CS = ax.scatter(np.linspace(scatter_list_meteo[k],scatter_list_meteo[k],1000),np.linspace(0,scatter_height[k],1000),c=[scatter_list_impact[k]]*1000,edgecolor=None, cmap = 'YlOrRd',norm=clrs_dico[chosen_impact],linewidths=4)
             cax = plt.axes([0.92, 0.12, 0.02, 0.75])
-            cbar = f.colorbar(CS2, cax=cax, orientation='vertical')#,location='right')
+            cbar = f.colorbar(CS, cax=cax, orientation='vertical')#,location='right')
             cbar.ax.tick_params(labelsize=20)
             cbar.set_label('Total Deaths', rotation=270, size=25, labelpad=25)
             plt.savefig(os.path.join(figs_output_dir,f"distrib_best_{best_scoring_index}_worst_{worst_scoring_index}{'_count_all_impacts'*count_all_impacts}.pdf"), dpi=1200)
     return
 
 #%%
-def analysis_top_detected_events(database='ERA5', datavar='t2m', daily_var='tg', year_beg=1950, year_end=2021, threshold_value=95, year_beg_climatology=1950, year_end_climatology=2021, distrib_window_size=15,nb_days=4,flex_time_span=7,nb_top_events=30,best_scoring_index='Multi_index_HWMId',count_all_impacts=True, anomaly=True, relative_threshold=True):
-    '''This function is used to search for the top detected heatwaves in an alternate impact database.'''
+@instrument_stage
+def analysis_top_detected_events(database='ERA5', datavar='t2m', daily_var='tg', year_beg=1950, year_end=2021, threshold_value=95, year_beg_climatology=1950, year_end_climatology=2021, distrib_window_size=15,nb_days=4,flex_time_span=7,nb_top_events=30,best_scoring_index='Multi_index_HWMId',count_all_impacts=True, anomaly=True, relative_threshold=True, excel_export=False):
+    '''This function is used to search for the top detected heatwaves in an alternate impact database.
+    If excel_export is True, an Excel copy of the sensitivity summary table is also written (the top events table is always written as an Excel report).'''
     
     print('database :',database)
     print('datavar :',datavar)
@@ -773,35 +521,6 @@ def analysis_top_detected_events(database='ERA5', datavar='t2m', daily_var='tg',
     
     resolution_dict = {"ERA5" : "0.25", "E-OBS" : "0.1"}
     resolution = resolution_dict[database]
-    #Link databse country names format to netCDF mask country names format
-    country_dict = {'Albania':'Albania', 'Austria':'Austria', 'Belarus':'Belarus',
-                    'Belgium':'Belgium', 'Bosnia and Herzegovina':'Bosnia_and_Herzegovina',
-                    'Bulgaria':'Bulgaria', 'Canary Is':None, 'Croatia':'Croatia', 'Cyprus':'Cyprus', 
-                    'Czech Republic (the)':'Czechia', 'Denmark':'Denmark', 'Estonia':'Estonia', 
-                    'Finland':'Finland', 'France':'France', 'Germany':'Germany', 'Greece':'Greece', 
-                    'Hungary':'Hungary', 'Iceland':'Iceland', 'Ireland':'Ireland', 
-                    'Italy':'Italy', 'Latvia':'Latvia', 'Lithuania':'Lithuania',
-                    'Luxembourg':'Luxembourg', 'Montenegro':'Montenegro',
-                    'Macedonia (the former Yugoslav Republic of)':'Macedonia',
-                    'Moldova':'Moldova', 'Netherlands (the)':'Netherlands', 'Norway':'Norway', 
-                    'Poland':'Poland','Portugal':'Portugal', 'Romania':'Romania',
-                    'Russian Federation (the)':'Russia', 'Serbia':'Serbia', 
-                    'Serbia Montenegro':'Serbia', #The corresponding heatwave happened in Serbia, cf 'Location' data of EM-DAT
-                    'Slovakia':'Slovakia', 'Slovenia':'Slovenia', 'Spain':'Spain', 'Sweden':'Sweden',
-                    'Switzerland':'Switzerland', 'Turkey':'Turkey',
-                    'United Kingdom of Great Britain and Northern Ireland (the)':'United_Kingdom',
-                    'Ukraine':'Ukraine','Yugoslavia':'Serbia',#The corresponding heatwave happened in Serbia, cf 'Location' data of EM-DAT
-                    'England':'United_Kingdom','England and Wales':'United_Kingdom','Czech Republic':'Czechia'} 
-    
-    dict_country_labels = {'Albania': 1, 'Austria': 2, 'Belarus': 3, 'Belgium': 4, 'Bosnia_and_Herzegovina': 5, 
-                           'Bulgaria': 6, 'Croatia': 7, 'Cyprus': 8, 'Czechia': 9, 'Denmark': 10, 'Estonia': 11, 
-                           'Finland': 12, 'France': 13, 'Germany': 14, 'Greece': 15, 'Hungary': 16, 'Iceland': 17, 
-                           'Ireland': 18, 'Italy': 19, 'Latvia': 20, 'Lithuania': 21, 'Luxembourg': 22, 
-                           'Montenegro': 23, 'Macedonia': 24, 'Moldova': 25, 'Netherlands': 26, 'Norway': 27, 
-                           'Poland': 28, 'Portugal': 29, 'Romania': 30, 'Russia': 31, 'Serbia': 32, 'Slovakia': 33, 
-                           'Slovenia': 34, 'Spain': 35, 'Sweden': 36, 'Switzerland': 37, 'Turkey': 38, 
-                           'United_Kingdom': 39, 'Ukraine': 40}
-    
     inv_dict_country_labels = {v: k for k, v in dict_country_labels.items()}
     
     
@@ -809,18 +528,18 @@ def analysis_top_detected_events(database='ERA5', datavar='t2m', daily_var='tg',
     output_dir_df = os.path.join("Output",database,f"{datavar}_{daily_var}" ,
                             f"{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_JJA_{nb_days}days_before_scan_{year_beg}_{year_end}_{threshold_value}{name_dict_threshold[relative_threshold]}_{distrib_window_size}days_window_climatology_{year_beg_climatology}_{year_end_climatology}")
     try :
-        df_htw = pd.read_excel(os.path.join(output_dir_df,f"df_htws_detected{'_count_all_impacts'*count_all_impacts}_flex_time_{flex_time_span}days.xlsx"), header=0, index_col=0)
+        df_htw = read_table(os.path.join(output_dir_df,f"df_htws_detected{'_count_all_impacts'*count_all_impacts}_flex_time_{flex_time_span}days.parquet"))
     except :
         return
-    df_impact_alternate = pd.read_excel(os.path.join(datadir,"GDIS_EM-DAT","Lucy_Hammond_ETE_data_V2.xlsx"), header=0, index_col=0)
-    df_impact_alternate = df_impact_alternate[df_impact_alternate['Country'].isin(country_dict.keys())]
+    #alternate impact database events, with precomputed all-year indices (see data_preprocessing_functions.py)
+    df_impact_alternate = load_hammond_event_table(year_beg=year_beg)
 
-    df_scores = pd.read_excel(os.path.join(output_dir_df,f"df_scores{'_count_all_impacts'*(count_all_impacts)}_flex_time_span_{flex_time_span}_days.xlsx"),index_col=0,header=[0,1])
+    df_scores = read_table(os.path.join(output_dir_df,f"df_scores{'_count_all_impacts'*(count_all_impacts)}_flex_time_span_{flex_time_span}_days.parquet"),index_col=0,header=[0,1])
     try :
         best_scoring_index = df_scores[df_scores[('Total_Deaths','Global_score')]==np.nanmax(df_scores[('Total_Deaths','Global_score')])].index.values[0]
     except :
         pass
-    database_stats = pd.read_excel(os.path.join("Output","summary_detection_overlap_sensitivity.xlsx"),index_col=0,header=0)
+    database_stats = read_table(os.path.join("Output","summary_detection_overlap_sensitivity.xlsx"))
     get_index = database_stats[(database_stats['database']==database)&(database_stats['datavar']==datavar)&(database_stats['daily_var']==daily_var)&(database_stats['year_beg']==year_beg)&(database_stats['year_end']==year_end)&(database_stats['year_beg_climatology']==year_beg_climatology)&(database_stats['year_end_climatology']==year_end_climatology)&(database_stats['anomaly']==anomaly)&(database_stats['nb_days']==nb_days)&(database_stats['relative_threshold']==relative_threshold)&(database_stats['threshold_value']==threshold_value)&(database_stats['distrib_window_size']==distrib_window_size)&(database_stats['flex_time_span']==flex_time_span)&(database_stats['count_all_impacts']==count_all_impacts)].index.values[0]
     with open(os.path.join(output_dir_df,f"emdat_undetected_heatwaves_{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_{threshold_value}{name_dict_threshold[relative_threshold]}_flex_time_{flex_time_span}_days.txt"),'r') as f_txt:
         undetected_htw_list = f_txt.readlines()
@@ -834,10 +553,10 @@ def analysis_top_detected_events(database='ERA5', datavar='t2m', daily_var='tg',
         pass
     if np.isnan(database_stats.loc[get_index,'best_score']) :
         database_stats.loc[get_index,'best_index'] = None
-    database_stats.to_excel(os.path.join("Output","summary_detection_overlap_sensitivity.xlsx"))
+    write_table(database_stats,os.path.join("Output","summary_detection_overlap_sensitivity.parquet"),excel_export=excel_export)
     
     if len(df_htw)>0 :
-        df_htw = df_htw[df_htw['Computed_heatwave']==True]
+        df_htw = df_htw[df_htw['Computed_heatwave']]
         df_htw = df_htw[np.isnan(df_htw['Total_Deaths'])]#we study top events that are not recorded in EM-DAT
         top_events_id = np.sort(df_htw.sort_values(by=best_scoring_index).index[-nb_top_events:])
         df_htw = df_htw[df_htw.index.isin(top_events_id)]
@@ -854,6 +573,7 @@ def analysis_top_detected_events(database='ERA5', datavar='t2m', daily_var='tg',
             country_labels=np.maximum(country_labels,[~np.array(mask_file.variables['mask'][:],dtype=bool)*dict_country_labels[ctry]]*92) #assign a country label to each point of the map. np.maximum() is used to avoid the superposition of labels : a few pixels are assigned to several countries.
         overlap_list_dict = {}
         affected_countries_labels_dict = {}
+        masks_country = {} #country masks are loaded only once
 
         output_overlap_df = pd.DataFrame(columns=['detected_rank','Year','idx_beg_JJA','idx_end_JJA','idx_beg_all_year','idx_end_all_year','detected_start_date','detected_end_date','detected_affected_countries','Hammond_htw_indices','Hammond_affected_countries','Hammond_deaths'],index=None,data=None)
         
@@ -865,14 +585,16 @@ def analysis_top_detected_events(database='ERA5', datavar='t2m', daily_var='tg',
             overlap_list = []
             labels_cc3d = f_label.variables['label'][(year_event-year_beg)*92:(year_event-year_beg+1)*92,:,:] #load all JJA label data for the given year
             
-            for impact_idx in df_impact_alternate.index :
-                idx_beg_impact = (df_impact_alternate.loc[impact_idx,'Start date'].date() - date(year_beg,1,1)).days
-                idx_end_impact = (df_impact_alternate.loc[impact_idx,'End date'].date() - date(year_beg,1,1)).days
-                if ((start_date_idx_all_year>=idx_beg_impact and start_date_idx_all_year<=idx_end_impact) or (end_date_idx_all_year>=idx_beg_impact and end_date_idx_all_year<=idx_end_impact)) or ((idx_beg_impact>=start_date_idx_all_year and idx_beg_impact<=end_date_idx_all_year) or (idx_end_impact>=start_date_idx_all_year and idx_end_impact<=end_date_idx_all_year)) :
-                    f_mask = nc.Dataset(os.path.join(datadir, database,"Mask",f"Mask_{country_dict[df_impact_alternate.loc[impact_idx,'Country']]}_{database}_{resolution}deg.nc"),mode='r')
-                    mask_country = f_mask.variables['mask'][:]
-                    if np.any(ma.masked_where([mask_country]*92,(labels_cc3d==htw_id))) : #if there is also a spatial overlap (check only at the country level).
-                        overlap_list.append(impact_idx)
+            #temporal overlap between the detected heatwave and the alternate database events
+            time_overlap = (df_impact_alternate['idx_beg_all_year']<=end_date_idx_all_year) & (df_impact_alternate['idx_end_all_year']>=start_date_idx_all_year)
+            for impact_idx in df_impact_alternate[time_overlap].index :
+                country = df_impact_alternate.loc[impact_idx,'mask_country']
+                if country not in masks_country :
+                    f_mask = nc.Dataset(os.path.join(datadir, database,"Mask",f"Mask_{country}_{database}_{resolution}deg.nc"),mode='r')
+                    masks_country[country] = f_mask.variables['mask'][:]
+                    f_mask.close()
+                if np.any(ma.masked_where([masks_country[country]]*92,(labels_cc3d==htw_id))) : #if there is also a spatial overlap (check only at the country level).
+                    overlap_list.append(impact_idx)
             overlap_list_dict[htw_id]=overlap_list
             affected_countries_labels_dict[htw_id] = [int(val) for val in np.unique((ma.filled(labels_cc3d,fill_value=0)==htw_id)*country_labels)[1:]] #ignore value 0
             hammond_affected_countries = [df_impact_alternate.loc[index,'Country'] for index in overlap_list]
@@ -882,5 +604,7 @@ def analysis_top_detected_events(database='ERA5', datavar='t2m', daily_var='tg',
     else :
         output_overlap_df = pd.DataFrame(columns=['detected_rank','Year','idx_beg_JJA','idx_end_JJA','idx_beg_all_year','idx_end_all_year','detected_start_date','detected_end_date','detected_affected_countries','Hammond_htw_indices','Hammond_affected_countries','Hammond_deaths'],index=None,data=None)
     
-    output_overlap_df.to_excel(os.path.join(output_dir_df,f"top_{nb_top_events}_events_overlap{'_count_all_impacts'*count_all_impacts}_flex_time_{flex_time_span}days.xlsx"))
+    output_path = os.path.join(output_dir_df,f"top_{nb_top_events}_events_overlap{'_count_all_impacts'*count_all_impacts}_flex_time_{flex_time_span}days.xlsx")
+    output_overlap_df.to_excel(temporary_path(output_path))
+    commit_file(output_path)
     return
\ No newline at end of file
@@ -0,0 +1,93 @@
+#%%
+import os #read data directories
+import json #run reports
+import subprocess #revision of the benchmarked code
+from datetime import datetime #date of the benchmarks
+import pathlib
+import pandas as pd #handle dataframes
+
+from pipeline_functions import pipeline_stages, run_pipeline
+from synthetic_data_functions import create_synthetic_dataset, synthetic_params
+from storage_functions import temporary_path, commit_file
+
+#%%
+#Benchmark of the stages on synthetic data (see synthetic_data_functions) : every stage of the pipeline is run on a synthetic dataset of a given size, in its own directory (Benchmark/{size}),
+#and the instrumentation records of the stages (wall and CPU time, peak RSS, I/O, see instrumentation_functions) are appended to a history table with the git revision of the code,
+#so that the timings of each stage can be compared between commits (see compare_benchmarks).
+benchmark_columns = ['stage','status','wall_time','cpu_time','peak_rss_mb','bytes_read','bytes_written','netcdf_read_calls','cache_hits','cache_misses']
+
+def git_revision():
+    '''This function returns the git revision (commit hash) of the code, and whether the working tree has uncommitted changes. The revision is 'unknown' outside of a git repository.'''
+
+    code_dir = os.path.dirname(os.path.abspath(__file__))
+    try :
+        revision = subprocess.run(['git','-C',code_dir,'rev-parse','HEAD'],capture_output=True,text=True,check=True).stdout.strip()
+        dirty = len(subprocess.run(['git','-C',code_dir,'status','--porcelain','--untracked-files=no'],capture_output=True,text=True,check=True).stdout.strip())>0
+    except (OSError, subprocess.CalledProcessError) :
+        return 'unknown', False
+    return revision, dirty
+
+def run_benchmark(size='small', targets=tuple(pipeline_stages.keys()), database='ERA5', datavar='t2m', daily_var='tg', root=None, history_path=None, nb_workers=1, profiler=None, seed=0):
+    '''This function benchmarks the target stages (default every stage) on a synthetic dataset of the given size ('small', 'medium' or 'full'), written in root (default Benchmark/{size}) if it does not exist yet.
+    All the stages needed by the targets are run again (overwrite_files=True), so that every run measures the same work. The run report is written in root/Output/run_reports,
+    and one row per stage call is appended to the history table history_path (default Benchmark/benchmark_history.csv). It returns the rows of this benchmark.'''
+
+    if root is None :
+        root = os.path.join("Benchmark",size)
+    if history_path is None :
+        history_path = os.path.join("Benchmark","benchmark_history.csv")
+    root, history_path = os.path.abspath(root), os.path.abspath(history_path)
+    p = synthetic_params(size,database,datavar,daily_var)
+    create_synthetic_dataset(root,size,database,[datavar],[daily_var],params_list=[p],seed=seed)
+
+    revision, dirty = git_revision()
+    date = datetime.now()
+    report_path = os.path.join(root,"Output","run_reports",f"benchmark_{size}_{revision[:10]}_{date.strftime('%Y%m%d_%H%M%S')}")
+    current_dir = os.getcwd()
+    os.chdir(root) #the stages read Data/ and write Output/ in their working directory
+    try :
+        run_pipeline(list(targets),[p],nb_workers=nb_workers,overwrite_files=True,profiler=profiler,report_path=report_path)
+    finally :
+        os.chdir(current_dir)
+    with open(report_path+'.json') as f :
+        report = json.load(f)
+
+    df_benchmark = pd.DataFrame([{name:record[name] for name in benchmark_columns} for record in report['stages']],columns=benchmark_columns)
+    df_benchmark.insert(0,'revision',revision)
+    df_benchmark.insert(1,'dirty',dirty)
+    df_benchmark.insert(2,'date',date.isoformat(timespec='seconds'))
+    df_benchmark.insert(3,'host',report['host'])
+    df_benchmark.insert(4,'size',size)
+    df_benchmark.insert(5,'nb_workers',nb_workers)
+    df_history = pd.concat([pd.read_csv(history_path),df_benchmark],ignore_index=True) if os.path.exists(history_path) else df_benchmark
+    pathlib.Path(history_path).parents[0].mkdir(parents=True, exist_ok=True)
+    df_history.to_csv(temporary_path(history_path),index=False)
+    commit_file(history_path)
+    return df_benchmark
+
+def compare_benchmarks(history_path=os.path.join("Benchmark","benchmark_history.csv"), size='small', revision=None, reference=None):
+    '''This function compares the benchmarks of two revisions for a dataset size : for each stage, the median (over the benchmarks of each revision) of the total wall time, CPU time and peak RSS of its calls,
+    and the ratio of the wall times (revision over reference, below 1 if the revision is faster). revision defaults to the last benchmarked revision, and reference to the one benchmarked before it.
+    Benchmarks run on other hosts than the last one are ignored, as their timings are not comparable.'''
+
+    df_history = pd.read_csv(history_path)
+    df_history = df_history[(df_history['size']==size) & (df_history['status']=='ok')]
+    df_history = df_history[df_history['host']==df_history['host'].iloc[-1]]
+    revisions = list(dict.fromkeys(df_history['revision'])) #in order of the first benchmark of each revision
+    if revision is None :
+        revision = df_history['revision'].iloc[-1]
+    if reference is None :
+        previous = [rev for rev in revisions if rev!=revision]
+        if len(previous)==0 :
+            raise ValueError(f"There is no benchmark of another revision than {revision} for the size {size}.")
+        reference = previous[-1]
+
+    def stage_summary(rev) :
+        df_rev = df_history[df_history['revision']==rev]
+        df_runs = df_rev.groupby(['date','stage']).agg(wall_time=('wall_time','sum'),cpu_time=('cpu_time','sum'),peak_rss_mb=('peak_rss_mb','max')) #one row per benchmark run and stage
+        return df_runs.groupby('stage').median()
+
+    df_comparison = stage_summary(reference).join(stage_summary(revision),how='outer',lsuffix='_reference',rsuffix='_revision')
+    df_comparison['wall_time_ratio'] = df_comparison['wall_time_revision']/df_comparison['wall_time_reference']
+    df_comparison.attrs = {'revision':revision, 'reference':reference}
+    return df_comparison.sort_values('wall_time_reference',ascending=False)
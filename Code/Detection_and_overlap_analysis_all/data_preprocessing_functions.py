@@ -1,6 +1,257 @@
+#%%
+import numpy as np
+import numpy.ma as ma #use masked array
+import netCDF4 as nc #load and write netcdf data
+import os #read data directories
+import pandas as pd #handle dataframes
+import pathlib
+
+from storage_functions import read_table, temporary_path, commit_file, notify_file_event
+
+#Link EM-DAT (and Hammond) country names format to netCDF mask country names format
+country_dict = {'Albania':'Albania', 'Austria':'Austria', 'Belarus':'Belarus',
+                'Belgium':'Belgium', 'Bosnia and Herzegovina':'Bosnia_and_Herzegovina',
+                'Bulgaria':'Bulgaria', 'Canary Is':None, 'Croatia':'Croatia', 'Cyprus':'Cyprus',
+                'Czech Republic (the)':'Czechia', 'Denmark':'Denmark', 'Estonia':'Estonia',
+                'Finland':'Finland', 'France':'France', 'Germany':'Germany', 'Greece':'Greece',
+                'Hungary':'Hungary', 'Iceland':'Iceland', 'Ireland':'Ireland',
+                'Italy':'Italy', 'Latvia':'Latvia', 'Lithuania':'Lithuania',
+                'Luxembourg':'Luxembourg', 'Montenegro':'Montenegro',
+                'Macedonia (the former Yugoslav Republic of)':'Macedonia',
+                'Moldova':'Moldova', 'Netherlands (the)':'Netherlands', 'Norway':'Norway',
+                'Poland':'Poland','Portugal':'Portugal', 'Romania':'Romania',
+                'Russian Federation (the)':'Russia', 'Serbia':'Serbia',
+                'Serbia Montenegro':'Serbia', #The corresponding heatwave happened in Serbia, cf 'Location' data of EM-DAT
+                'Slovakia':'Slovakia', 'Slovenia':'Slovenia', 'Spain':'Spain', 'Sweden':'Sweden',
+                'Switzerland':'Switzerland', 'Turkey':'Turkey',
+                'United Kingdom of Great Britain and Northern Ireland (the)':'United_Kingdom',
+                'Ukraine':'Ukraine','Yugoslavia':'Serbia',#The corresponding heatwave happened in Serbia, cf 'Location' data of EM-DAT
+                'England':'United_Kingdom','England and Wales':'United_Kingdom','Czech Republic':'Czechia'} #Hammond country names
+
+#Integer identifier of each netCDF mask country, 0 is kept for points (or events) without country
+dict_country_labels = {'Albania': 1, 'Austria': 2, 'Belarus': 3, 'Belgium': 4, 'Bosnia_and_Herzegovina': 5,
+                       'Bulgaria': 6, 'Croatia': 7, 'Cyprus': 8, 'Czechia': 9, 'Denmark': 10, 'Estonia': 11,
+                       'Finland': 12, 'France': 13, 'Germany': 14, 'Greece': 15, 'Hungary': 16, 'Iceland': 17,
+                       'Ireland': 18, 'Italy': 19, 'Latvia': 20, 'Lithuania': 21, 'Luxembourg': 22,
+                       'Montenegro': 23, 'Macedonia': 24, 'Moldova': 25, 'Netherlands': 26, 'Norway': 27,
+                       'Poland': 28, 'Portugal': 29, 'Romania': 30, 'Russia': 31, 'Serbia': 32, 'Slovakia': 33,
+                       'Slovenia': 34, 'Spain': 35, 'Sweden': 36, 'Switzerland': 37, 'Turkey': 38,
+                       'United_Kingdom': 39, 'Ukraine': 40}
+
+#indices of beggining and end of month for a JJA set of data (92 days from 1st June to 31st August)
+beg_month_only_idx_dict = {6:0,7:30,8:61} #30 days in June, 31 days in July and August
+end_month_only_idx_dict = {6:29,7:60,8:91} #30 days in June, 31 days in July and August
+
+ignored_events = ['1994-0759-ROU','2004-0361-SPI'] #'1994-0759-ROU' occured in May, '2004-0361-SPI' occured in Canary Island which is not in the studied area
+
 #%%
 #EM-DAT/GDIS formatting
+def create_emdat_event_table(year_beg=1950, year_end=2021, flex_time_span=7):
+    '''This function converts the EM-DAT heatwaves table into a typed event table, with one row per EM-DAT (not merged) heatwave of the studied period (default 1950-2021).
+    For each event, it records the mask country name and its integer identifier, and the JJA indices (0 to 91) and all-year indices (days from 01-01-year_beg) of the beginning and the end of the event,
+    both as recorded in EM-DAT and extended by flex_time_span days to account for potential EM-DAT imprecisions. All the bounds are inclusive.
+    When the start day is unknown, the whole months are used and no flexibility is added. When only the end day is unknown, the event lasts until the end of the end month.
+    The table is saved as a parquet file next to the EM-DAT file, so that every stage of the analysis can reuse it (see load_emdat_event_table).'''
+
+    if os.name == 'posix' :
+        datadir = "Data/"
+    else :
+        datadir = os.environ["DATADIR"]
+
+    df_emdat = read_table(os.path.join(datadir,"GDIS_EM-DAT","EMDAT_Europe-1950-2022-heatwaves.xlsx"))
+    df_emdat = df_emdat[(df_emdat['Year']>=year_beg) & (df_emdat['Year']<=year_end)] #only keep events of the studied period (default 1950-2021)
+
+    df_events = pd.DataFrame(index=df_emdat.index)
+    df_events['Dis No'] = df_emdat['Dis No'].astype(str)
+    df_events['disasterno'] = df_emdat['disasterno'].astype(str)
+    df_events['Country'] = df_emdat['Country'].astype(str)
+    df_events['mask_country'] = df_emdat['Country'].map(country_dict)
+    df_events['country_id'] = df_events['mask_country'].map(dict_country_labels).fillna(0).astype(np.int32)
+    df_events['Year'] = df_emdat['Year'].astype(np.int32)
+    for col in ['Start Month','Start Day','End Month','End Day'] :
+        df_events[col] = df_emdat[col].astype('Int32')
+    df_events['Total Deaths'] = df_emdat['Total Deaths'].astype(np.float64)
+    df_events['Total Affected'] = df_emdat['Total Affected'].astype(np.float64)
+    df_events["Total Damages, Adjusted ('000 US$)"] = df_emdat["Total Damages, Adjusted ('000 US$)"].astype(np.float64)
+
+    start_day_unknown = df_events['Start Day'].isna()
+    end_day_unknown = df_events['End Day'].isna() | start_day_unknown #if the start day is unknown, the end day is not used either
+    #months outside JJA are mapped to NaN, the corresponding events are flagged as ignored
+    beg_month = df_events['Start Month'].map(beg_month_only_idx_dict).astype('Int32')
+    end_month_beg = df_events['End Month'].map(beg_month_only_idx_dict).astype('Int32')
+    end_month_end = df_events['End Month'].map(end_month_only_idx_dict).astype('Int32')
+
+    df_events['idx_beg_JJA'] = beg_month + (df_events['Start Day'].fillna(1)-1)
+    df_events['idx_end_JJA'] = end_month_end.where(end_day_unknown, end_month_beg + df_events['End Day'].fillna(1)-1)
+    df_events['idx_beg_JJA_flex'] = df_events['idx_beg_JJA'].where(start_day_unknown, (df_events['idx_beg_JJA']-flex_time_span).clip(lower=0))
+    df_events['idx_end_JJA_flex'] = df_events['idx_end_JJA'].where(end_day_unknown, (df_events['idx_end_JJA']+flex_time_span).clip(upper=91))
+
+    #1st of June of each event year, as a number of days from 01-01-year_beg
+    first_june_idx = (pd.to_datetime(df_events['Year'].astype(np.int64)*10000+601, format='%Y%m%d') - pd.Timestamp(year_beg,1,1)).dt.days.astype('Int32')
+    for bound in ['beg','end'] :
+        df_events[f'idx_{bound}_all_year'] = first_june_idx + df_events[f'idx_{bound}_JJA']
+        df_events[f'idx_{bound}_all_year_flex'] = first_june_idx + df_events[f'idx_{bound}_JJA_flex']
+
+    df_events['ignored'] = (df_events['Dis No'].isin(ignored_events) | df_events['mask_country'].isna() | df_events['idx_beg_JJA'].isna() | df_events['idx_end_JJA'].isna()).astype(bool)
+
+    out_path = os.path.join(datadir,"GDIS_EM-DAT",f"EMDAT_Europe-1950-2022-heatwaves_events_{year_beg}_{year_end}_flex_time_{flex_time_span}_days.parquet")
+    pathlib.Path(out_path).parents[0].mkdir(parents=True, exist_ok=True)
+    df_events.to_parquet(temporary_path(out_path))
+    commit_file(out_path)
+    return df_events
+
+def load_emdat_event_table(year_beg=1950, year_end=2021, flex_time_span=7):
+    '''This function loads the EM-DAT event table created by create_emdat_event_table.
+    The table is (re)created if it does not exist or if the EM-DAT file is more recent.'''
+
+    if os.name == 'posix' :
+        datadir = "Data/"
+    else :
+        datadir = os.environ["DATADIR"]
+
+    table_path = os.path.join(datadir,"GDIS_EM-DAT",f"EMDAT_Europe-1950-2022-heatwaves_events_{year_beg}_{year_end}_flex_time_{flex_time_span}_days.parquet")
+    source_path = os.path.join(datadir,"GDIS_EM-DAT","EMDAT_Europe-1950-2022-heatwaves.xlsx")
+    if os.path.exists(table_path)==False or os.path.getmtime(table_path)<os.path.getmtime(source_path) :
+        notify_file_event('cache_miss',table_path)
+        return create_emdat_event_table(year_beg=year_beg, year_end=year_end, flex_time_span=flex_time_span)
+    notify_file_event('cache_hit',table_path)
+    return pd.read_parquet(table_path)
+
+def create_hammond_event_table(year_beg=1950):
+    '''This function converts the alternate impact database (Lucy Hammond's table of extreme temperature events) into a typed event table, restricted to the countries of the studied area.
+    For each event, it records the mask country name and its integer identifier, the year, and the all-year indices (days from 01-01-year_beg) of the beginning and the end of the event (inclusive).
+    The table is saved as a parquet file next to the original file (see load_hammond_event_table).'''
+
+    if os.name == 'posix' :
+        datadir = "Data/"
+    else :
+        datadir = os.environ["DATADIR"]
+
+    df_hammond = read_table(os.path.join(datadir,"GDIS_EM-DAT","Lucy_Hammond_ETE_data_V2.xlsx"))
+    df_hammond = df_hammond[df_hammond['Country'].isin(country_dict.keys())]
+    df_hammond = df_hammond[df_hammond['Country'].map(country_dict).notna()]
+
+    df_events = pd.DataFrame(index=df_hammond.index)
+    df_events['Country'] = df_hammond['Country'].astype(str)
+    df_events['mask_country'] = df_hammond['Country'].map(country_dict)
+    df_events['country_id'] = df_events['mask_country'].map(dict_country_labels).fillna(0).astype(np.int32)
+    df_events['Deaths'] = df_hammond['Deaths'].astype(np.float64)
+    start_date = pd.to_datetime(df_hammond['Start date']).dt.normalize()
+    end_date = pd.to_datetime(df_hammond['End date']).dt.normalize()
+    df_events['Year'] = start_date.dt.year.astype(np.int32)
+    df_events['idx_beg_all_year'] = (start_date - pd.Timestamp(year_beg,1,1)).dt.days.astype(np.int32)
+    df_events['idx_end_all_year'] = (end_date - pd.Timestamp(year_beg,1,1)).dt.days.astype(np.int32)
+
+    out_path = os.path.join(datadir,"GDIS_EM-DAT",f"Lucy_Hammond_ETE_data_V2_events_{year_beg}.parquet")
+    df_events.to_parquet(temporary_path(out_path))
+    commit_file(out_path)
+    return df_events
+
+def load_hammond_event_table(year_beg=1950):
+    '''This function loads the alternate impact event table created by create_hammond_event_table.
+    The table is (re)created if it does not exist or if the original file is more recent.'''
+
+    if os.name == 'posix' :
+        datadir = "Data/"
+    else :
+        datadir = os.environ["DATADIR"]
+
+    table_path = os.path.join(datadir,"GDIS_EM-DAT",f"Lucy_Hammond_ETE_data_V2_events_{year_beg}.parquet")
+    source_path = os.path.join(datadir,"GDIS_EM-DAT","Lucy_Hammond_ETE_data_V2.xlsx")
+    if os.path.exists(table_path)==False or os.path.getmtime(table_path)<os.path.getmtime(source_path) :
+        notify_file_event('cache_miss',table_path)
+        return create_hammond_event_table(year_beg=year_beg)
+    notify_file_event('cache_hit',table_path)
+    return pd.read_parquet(table_path)
+
+#%%
 #Masks
+#%%
 #GHS-POP formatting
+pop_epochs = list(range(1975,2025,5)) #GHS-POP epochs, one population density map every 5 years from 1975 to 2020
+
+pop_cube_cache = {} #population cubes already loaded, by database
+
+def create_population_cube(database='ERA5'):
+    '''This function stacks the GHS-POP population density maps of all the epochs (regridded on the grid of the meteorological database, default ERA5) into a single netCDF file,
+    with a (epoch, lat, lon) population density variable, so that the population of any year is read from one file only (see load_population_cube and get_population_year).'''
+
+    if os.name == 'posix' :
+        datadir = "Data/"
+    else :
+        datadir = os.environ["DATADIR"]
+
+    f_pop = nc.Dataset(os.path.join(datadir,"Pop","GHS_POP",f"GHS_POP_{pop_epochs[0]}_{database}_grid_Europe.nc"),mode='r')
+    lat_in = f_pop.variables['lat'][:]
+    lon_in = f_pop.variables['lon'][:]
+    f_pop.close()
+
+    nc_out_path = os.path.join(datadir,"Pop","GHS_POP",f"GHS_POP_{pop_epochs[0]}_{pop_epochs[-1]}_{database}_grid_Europe.nc")
+    nc_file_out = nc.Dataset(temporary_path(nc_out_path),mode='w',format='NETCDF4_CLASSIC')
+
+    #Define netCDF output file :
+    nc_file_out.createDimension('epoch', len(pop_epochs)) # epoch axis
+    nc_file_out.createDimension('lat', len(lat_in))    # latitude axis
+    nc_file_out.createDimension('lon', len(lon_in))    # longitude axis
+
+    nc_file_out.title=f"GHS-POP population density on the {database} grid, epochs {pop_epochs[0]} to {pop_epochs[-1]}"
+
+    epoch = nc_file_out.createVariable('epoch', np.int32, ('epoch',))
+    epoch.units = 'year'
+    epoch.long_name = 'epoch'
+    lat = nc_file_out.createVariable('lat', np.float32, ('lat',))
+    lat.units = 'degrees_north'
+    lat.long_name = 'latitude'
+    lon = nc_file_out.createVariable('lon', np.float32, ('lon',))
+    lon.units = 'degrees_east'
+    lon.long_name = 'longitude'
+    pop = nc_file_out.createVariable('pop',np.float32,('epoch','lat','lon'),fill_value=-9999.)
+    pop.units = 'inhabitants per km²'
+    epoch[:] = pop_epochs
+    lat[:] = lat_in[:]
+    lon[:] = lon_in[:]
+
+    for i,year in enumerate(pop_epochs) :
+        f_pop = nc.Dataset(os.path.join(datadir,"Pop","GHS_POP",f"GHS_POP_{year}_{database}_grid_Europe.nc"),mode='r')
+        pop[i,:,:] = f_pop.variables['Band1'][:]
+        f_pop.close()
+    nc_file_out.close()
+    commit_file(nc_out_path)
+    return
+
+def load_population_cube(database='ERA5'):
+    '''This function returns the GHS-POP epochs and the (epoch, lat, lon) population density masked array created by create_population_cube.
+    The cube is (re)created if it does not exist or if one of the epoch files is more recent, and it is kept in memory so that it is only read once per session.'''
+
+    if os.name == 'posix' :
+        datadir = "Data/"
+    else :
+        datadir = os.environ["DATADIR"]
+
+    cube_path = os.path.join(datadir,"Pop","GHS_POP",f"GHS_POP_{pop_epochs[0]}_{pop_epochs[-1]}_{database}_grid_Europe.nc")
+    if database not in pop_cube_cache :
+        epoch_paths = [os.path.join(datadir,"Pop","GHS_POP",f"GHS_POP_{year}_{database}_grid_Europe.nc") for year in pop_epochs]
+        if os.path.exists(cube_path)==False or os.path.getmtime(cube_path)<max(os.path.getmtime(path) for path in epoch_paths if os.path.exists(path)) :
+            notify_file_event('cache_miss',cube_path)
+            create_population_cube(database=database)
+        f_pop = nc.Dataset(cube_path,mode='r')
+        pop_cube_cache[database] = (np.array(f_pop.variables['epoch'][:]), f_pop.variables['pop'][:])
+        f_pop.close()
+    else :
+        notify_file_event('cache_hit',cube_path)
+    return pop_cube_cache[database]
+
+def get_population_year(epochs, pop_cube, year, interpolation=False):
+    '''This function returns the population density map of a given year from the population cube (see load_population_cube).
+    By default, the map of the nearest epoch is used (for instance 1975 for every year until 1977, 1980 from 1978 to 1982...).
+    If interpolation is True, the map is linearly interpolated between the two surrounding epochs (the first and last epochs are used before and after the covered period).'''
+
+    if interpolation==False :
+        return pop_cube[np.argmin(np.abs(epochs-year))]
+    idx = int(np.clip(np.searchsorted(epochs,year,side='right')-1,0,len(epochs)-2))
+    weight = np.clip((year-epochs[idx])/(epochs[idx+1]-epochs[idx]),0,1)
+    return (1-weight)*pop_cube[idx]+weight*pop_cube[idx+1]
+
+#%%
 #Russo indices
-#GDP map
\ No newline at end of file
+#GDP map
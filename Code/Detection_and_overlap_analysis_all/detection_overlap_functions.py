@@ -20,8 +20,12 @@ import shapely
 from cartopy.io import shapereader
 import geopandas
 
+from data_preprocessing_functions import load_emdat_event_table
+from storage_functions import read_table, write_table, temporary_path, commit_file
+from instrumentation_functions import instrument_stage
 
 #%%
+@instrument_stage
 def compute_climatology_smooth(database='ERA5', datavar='t2m', daily_var='tg', year_beg=1950, year_end=2021,year_beg_climatology=1950, year_end_climatology=2021):
     '''This function computes a climatology for each calendar day of the year. The seasonal cycle is then smoothed with a 31-day window. 
     By default, the climatology is computed over the studied period (default 1950-2021).
@@ -52,7 +56,7 @@ def compute_climatology_smooth(database='ERA5', datavar='t2m', daily_var='tg', y
 
     #-------------------------------------
     #import a xlsx table containing the index of each 1st january and 31st December
-    df_bis_year = pd.read_excel(os.path.join(datadir,"Dates_converter.xlsx"),header=0, index_col=0)
+    df_bis_year = read_table(os.path.join(datadir,"Dates_converter.xlsx"))
     df_bis_year = df_bis_year.loc[year_beg_climatology:year_end_climatology,:] #select period to compute climatology
     nb_day_in_year = np.array(df_bis_year.loc[:,"Nb_days"].values) #365 or 366, depending on whether the year is bisextile or not
     idx_start_year = np.array(df_bis_year.loc[:,"Idx_start"].values) #index of 1st january for each year
@@ -62,7 +66,7 @@ def compute_climatology_smooth(database='ERA5', datavar='t2m', daily_var='tg', y
     #Compute the temperature data averaged over the chosen period (default 1950-2021) for every calendar day of the year and store it in a netCDF file.
     nc_out_path = os.path.join(datadir,database,datavar,f"{database}_{datavar}_{daily_var}_daily_avg_{year_beg_climatology}_{year_end_climatology}_smoothed.nc")
     pathlib.Path(nc_out_path).parents[0].mkdir(parents=True, exist_ok=True) #create output directory and parent directories if necessary
-    nc_file_out=nc.Dataset(nc_out_path,mode='w',format='NETCDF4_CLASSIC') #path to the output netCDF file
+    nc_file_out=nc.Dataset(temporary_path(nc_out_path),mode='w',format='NETCDF4_CLASSIC') #path to the output netCDF file
 
     nc_file_out.createDimension('lat', len(lat_in))    # latitude axis
     nc_file_out.createDimension('lon', len(lon_in))    # longitude axis
@@ -149,9 +153,11 @@ def compute_climatology_smooth(database='ERA5', datavar='t2m', daily_var='tg', y
 
     f.close()
     nc_file_out.close()
+    commit_file(nc_out_path) #the output only appears at its final path once complete
     return
 
 #%%
+@instrument_stage
 def compute_distrib_percentile(database='ERA5', datavar='t2m', daily_var='tg', year_beg=1950, year_end=2021, threshold_value=95, year_beg_climatology=1950, year_end_climatology=2021, distrib_window_size=15,anomaly=True):
     '''This function computes, for every calendar day, the n-th (n is the threshold_value, default 95) percentile of the corresponding distribution of daily. 
     By default, the distribution is computed over the default studied period (1950-2021).
@@ -197,7 +203,7 @@ def compute_distrib_percentile(database='ERA5', datavar='t2m', daily_var='tg', y
 
     #path to output netCDF file, no need to check the existence of parents directory, already created in previous function
     nc_out_path = os.path.join(datadir,database,datavar,f"distrib_{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_{year_beg_climatology}_{year_end_climatology}_{threshold_value}th_threshold_{distrib_window_size}days.nc")
-    nc_file_out=nc.Dataset(nc_out_path,mode='w',format='NETCDF4_CLASSIC') #path to the output netCDF file
+    nc_file_out=nc.Dataset(temporary_path(nc_out_path),mode='w',format='NETCDF4_CLASSIC') #path to the output netCDF file
     #-----------
     #Define netCDF output file :
     nc_file_out.createDimension('lat', len(lat_in))    # latitude axis
@@ -230,7 +236,7 @@ def compute_distrib_percentile(database='ERA5', datavar='t2m', daily_var='tg', y
 
     #-------------------------------------
     #import a xlsx table containing the index of each 1st january and 31st December
-    df_bis_year = pd.read_excel(os.path.join(datadir,"Dates_converter.xlsx"),header=0, index_col=0)
+    df_bis_year = read_table(os.path.join(datadir,"Dates_converter.xlsx"))
     df_bis_year = df_bis_year.loc[year_beg_climatology:year_end_climatology,:]
     nb_day_in_year = np.array(df_bis_year.loc[:,"Nb_days"].values) #365 or 366, depending on whether the year is bisextile or not
     idx_start_year = np.array(df_bis_year.loc[:,"Idx_start"].values) #index of 1st january for each year
@@ -322,9 +328,11 @@ def compute_distrib_percentile(database='ERA5', datavar='t2m', daily_var='tg', y
     if anomaly :
         f_mean.close()
     nc_file_out.close()
+    commit_file(nc_out_path)
     return
 
 #%%
+@instrument_stage
 def select_scale_jja(database='ERA5', datavar='t2m', daily_var='tg', year_beg=1950, year_end=2021, threshold_value=95, year_beg_climatology=1950, year_end_climatology=2021, distrib_window_size=15, anomaly=True, relative_threshold=True):
     '''This function creates a netCDF file with daily min, mean or max temperature (or climate comfort index) (anomaly or absolute) for concatenated JJAs for the chosen period (default 1950-2021) when and where the n-th (default 95th) percentile threshold of the climatology distribution (or an absolute value in °C) is exceeded ; 
     Otherwise, values are set to -9999.
@@ -367,7 +375,7 @@ def select_scale_jja(database='ERA5', datavar='t2m', daily_var='tg', year_beg=19
     #Only record the JJA temperatures and REMOVE the values that do not exceed the n-th (default 95th) percentile (or absolute value in °C) threshold
     #No need to create directory, already created in previous scripts
     nc_out_name = os.path.join(datadir,database,datavar,f"{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_JJA_{year_beg}_{year_end}_scaled_{threshold_value}{name_dict_threshold[relative_threshold]}_{distrib_window_size}days_window_climatology_{year_beg_climatology}_{year_end_climatology}.nc")
-    nc_file_out=nc.Dataset(nc_out_name,mode='w',format='NETCDF4_CLASSIC') #path to the output netCDF file
+    nc_file_out=nc.Dataset(temporary_path(nc_out_name),mode='w',format='NETCDF4_CLASSIC') #path to the output netCDF file
     #Define netCDF output file :
     nc_file_out.createDimension('lat', len(lat_in))    # latitude axis
     nc_file_out.createDimension('lon', len(lon_in))    # longitude axis
@@ -397,7 +405,7 @@ def select_scale_jja(database='ERA5', datavar='t2m', daily_var='tg', year_beg=19
     #-----------
     #Only record the JJA temperatures and KEEP the values that do not exceed the n-th (default 95th) percentile threshold
     nc_out_not_scaled_path = os.path.join(datadir,database,datavar,f"{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_JJA_{year_beg}_{year_end}_climatology_{year_beg_climatology}_{year_end_climatology}_{distrib_window_size}days.nc")#path to the output netCDF file
-    nc_file_out_not_scaled=nc.Dataset(nc_out_not_scaled_path,mode='w',format='NETCDF4_CLASSIC') 
+    nc_file_out_not_scaled=nc.Dataset(temporary_path(nc_out_not_scaled_path),mode='w',format='NETCDF4_CLASSIC') 
     #Define netCDF output file :
     nc_file_out_not_scaled.createDimension('lat', len(lat_in))    # latitude axis
     nc_file_out_not_scaled.createDimension('lon', len(lon_in))    # longitude axis
@@ -425,7 +433,7 @@ def select_scale_jja(database='ERA5', datavar='t2m', daily_var='tg', year_beg=19
     output_var_not_scaled.long_name = long_name_dict[datavar]
     #-----------
     #import a xlsx table containing the index of each 1st january and 31st December
-    df_bis_year = pd.read_excel(os.path.join(datadir,"Dates_converter.xlsx"),header=0, index_col=0)
+    df_bis_year = read_table(os.path.join(datadir,"Dates_converter.xlsx"))
     df_bis_year = df_bis_year.loc[year_beg:year_end,:]
     idx_start_year = np.array(df_bis_year.loc[:,"Idx_start"].values) #index of 1st january for each year
     #-------------------------------------
@@ -483,14 +491,17 @@ def select_scale_jja(database='ERA5', datavar='t2m', daily_var='tg', year_beg=19
 
     f.close()
     nc_file_out.close()
+    commit_file(nc_out_name)
     if anomaly :
         f_climatology_mean.close()
     nc_file_out_not_scaled.close()
+    commit_file(nc_out_not_scaled_path)
     if relative_threshold :
         f_threshold.close()
     return
 
 #%%
+@instrument_stage
 def detect_potential_heatwaves(database='ERA5', datavar='t2m', daily_var='tg', year_beg=1950, year_end=2021, threshold_value=95, year_beg_climatology=1950, year_end_climatology=2021, distrib_window_size=15,nb_days=4, anomaly=True, relative_threshold=True):
     '''This function deletes the temperature anomaly (or absolute values) data if it is not strictly positive for at least the given number of consecutive days (default value is 4 days). Since it is meant to be used on the output of select_var_scaled_jja, "strictly positive" means that the value exceeds the threshold_value percentile of the climatology distribution (or the absolute threshold if relative_threshold is set to False).
     Otherwise, values are set to -9999.
@@ -527,7 +538,7 @@ def detect_potential_heatwaves(database='ERA5', datavar='t2m', daily_var='tg', y
     #-------------------
     nc_out_path = os.path.join(datadir,database,datavar,"Detection_Heatwave",f"potential_heatwaves_{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_{nb_days}days_before_scan_{year_beg}_{year_end}_{threshold_value}{name_dict_threshold[relative_threshold]}_{distrib_window_size}days_window_climatology_{year_beg_climatology}_{year_end_climatology}.nc")
     pathlib.Path(nc_out_path).parents[0].mkdir(parents=True, exist_ok=True) #create output directory and parent directories if necessary
-    nc_file_out=nc.Dataset(nc_out_path,mode='w',format='NETCDF4_CLASSIC') #path to the output netCDF file
+    nc_file_out=nc.Dataset(temporary_path(nc_out_path),mode='w',format='NETCDF4_CLASSIC') #path to the output netCDF file
 
     #Define netCDF output file :
     nc_file_out.createDimension('lat', len(lat_in))    # latitude axis
@@ -603,14 +614,17 @@ def detect_potential_heatwaves(database='ERA5', datavar='t2m', daily_var='tg', y
 
     f.close()
     nc_file_out.close()
+    commit_file(nc_out_path)
     
 #%%
-def cc3d_scan_heatwaves(database='ERA5', datavar='t2m', daily_var='tg', year_beg=1950, year_end=2021, threshold_value=95, year_beg_climatology=1950, year_end_climatology=2021, distrib_window_size=15,nb_days=4,run_animation=True, anomaly=True, relative_threshold=True):
+@instrument_stage
+def cc3d_scan_heatwaves(database='ERA5', datavar='t2m', daily_var='tg', year_beg=1950, year_end=2021, threshold_value=95, year_beg_climatology=1950, year_end_climatology=2021, distrib_window_size=15,nb_days=4,run_animation=True, anomaly=True, relative_threshold=True, excel_export=False):
     '''This function carries out a cc3d scan (https://pypi.org/project/connected-components-3d/) to detect heatwaves in the meteorological database (default ERA5, t2m, tg).
     The heatwaves point are labeled with a number corresponding to a heatwave identifier.
     Otherwise, values are set to -9999.
     The detection threshold depends on the parameters used precedently, which is why all the above parameters are required.
-    This function can be used with several databases and variables : ERA5 (t2m, wbgt and utci) and E-OBS (t2m).'''
+    This function can be used with several databases and variables : ERA5 (t2m, wbgt and utci) and E-OBS (t2m).
+    The table of the detected heatwaves is written in Parquet format, with an Excel copy if excel_export is True.'''
 
     print('database :',database)
     print('datavar :',datavar)
@@ -663,7 +677,7 @@ def cc3d_scan_heatwaves(database='ERA5', datavar='t2m', daily_var='tg', year_beg
     #define pathway to output netCDF file, no need to create directory.
     nc_out_path = os.path.join(datadir,database,datavar,"Detection_Heatwave",f"detected_heatwaves_{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_JJA_{nb_days}days_before_scan_{year_beg}_{year_end}_{threshold_value}{name_dict_threshold[relative_threshold]}_{distrib_window_size}days_window_climatology_{year_beg_climatology}_{year_end_climatology}.nc")
     #Create output netCDF file
-    nc_file_out=nc.Dataset(nc_out_path,mode='w',format='NETCDF4_CLASSIC') #mode='w' for 'write', 'a' for 'append'
+    nc_file_out=nc.Dataset(temporary_path(nc_out_path),mode='w',format='NETCDF4_CLASSIC') #mode='w' for 'write', 'a' for 'append'
 
     #Create output file dimensions
     nc_file_out.createDimension('lat', len(lat_in))    # latitude axis
@@ -849,13 +863,15 @@ def cc3d_scan_heatwaves(database='ERA5', datavar='t2m', daily_var='tg', year_beg
     f_temp.close()
     f_land_sea_mask.close()
     nc_file_out.close()
+    commit_file(nc_out_path)
     f_pot_htws.close()
     output_dir_df = os.path.join("Output",database,f"{datavar}_{daily_var}" ,
                             f"{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_JJA_{nb_days}days_before_scan_{year_beg}_{year_end}_{threshold_value}{name_dict_threshold[relative_threshold]}_{distrib_window_size}days_window_climatology_{year_beg_climatology}_{year_end_climatology}")
-    df_htw.to_excel(os.path.join(output_dir_df,f"df_htws_V0_detected_{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_JJA_{nb_days}days_before_scan_{year_beg}_{year_end}_{threshold_value}{name_dict_threshold[relative_threshold]}_{distrib_window_size}days_window_climatology_{year_beg_climatology}_{year_end_climatology}.xlsx"))
+    write_table(df_htw,os.path.join(output_dir_df,f"df_htws_V0_detected_{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_JJA_{nb_days}days_before_scan_{year_beg}_{year_end}_{threshold_value}{name_dict_threshold[relative_threshold]}_{distrib_window_size}days_window_climatology_{year_beg_climatology}_{year_end_climatology}.parquet"),excel_export=excel_export)
     return
 
 #%%
+@instrument_stage
 def analyse_impact_overlap(database='ERA5', datavar='t2m', daily_var='tg', year_beg=1950, year_end=2021, threshold_value=95, year_beg_climatology=1950, year_end_climatology=2021, distrib_window_size=15,nb_days=4,flex_time_span=7, anomaly=True, relative_threshold=True):
     '''This function is used to analyse the spatial and temporal overlap between EM-DAT heatwaves and the meteorological database heatwaves (default ERA5) detected with the CC3D scan.
     The detection threshold depends on the parameters used precedently, which is why all these parameters are required.
@@ -881,104 +897,116 @@ def analyse_impact_overlap(database='ERA5', datavar='t2m', daily_var='tg', year_
     
     resolution_dict = {"ERA5" : "0.25", "E-OBS" : "0.1"}
     resolution = resolution_dict[database]
-    df_emdat = pd.read_excel(os.path.join(datadir,"GDIS_EM-DAT","EMDAT_Europe-1950-2022-heatwaves.xlsx"),header=0, index_col=0)
-    df_emdat = df_emdat[(df_emdat['Year']>=year_beg) & (df_emdat['Year']<=year_end)] #only keep events of the studied period (default 1950-2021)
+    #EM-DAT events of the studied period, with precomputed JJA indices (see data_preprocessing_functions.py)
+    df_events = load_emdat_event_table(year_beg=year_beg, year_end=year_end, flex_time_span=flex_time_span)
+    df_events = df_events[df_events['ignored']==False] #events outside JJA or outside the studied area
     nc_file_in = os.path.join(datadir,database,datavar,"Detection_Heatwave",f"detected_heatwaves_{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_JJA_{nb_days}days_before_scan_{year_beg}_{year_end}_{threshold_value}{name_dict_threshold[relative_threshold]}_{distrib_window_size}days_window_climatology_{year_beg_climatology}_{year_end_climatology}.nc")
     f=nc.Dataset(nc_file_in,mode='r')
-    time_in=f.variables['time'][:]
-    date_idx_JJA = [int(i) for i in time_in.data]
-    time_in = np.ndarray(shape=np.shape(date_idx_JJA),dtype=int)
-    time_in[:] = date_idx_JJA[:]
-    #Link EM-DAT country names format to netCDF mask country names format
-    country_dict = {'Albania':'Albania', 'Austria':'Austria', 'Belarus':'Belarus',
-                    'Belgium':'Belgium', 'Bosnia and Herzegovina':'Bosnia_and_Herzegovina',
-                    'Bulgaria':'Bulgaria', 'Canary Is':None, 'Croatia':'Croatia', 'Cyprus':'Cyprus', 
-                    'Czech Republic (the)':'Czechia', 'Denmark':'Denmark', 'Estonia':'Estonia', 
-                    'Finland':'Finland', 'France':'France', 'Germany':'Germany', 'Greece':'Greece', 
-                    'Hungary':'Hungary', 'Iceland':'Iceland', 'Ireland':'Ireland', 
-                    'Italy':'Italy', 'Latvia':'Latvia', 'Lithuania':'Lithuania',
-                    'Luxembourg':'Luxembourg', 'Montenegro':'Montenegro',
-                    'Macedonia (the former Yugoslav Republic of)':'Macedonia',
-                    'Moldova':'Moldova', 'Netherlands (the)':'Netherlands', 'Norway':'Norway', 
-                    'Poland':'Poland','Portugal':'Portugal', 'Romania':'Romania',
-                    'Russian Federation (the)':'Russia', 'Serbia':'Serbia', 
-                    'Serbia Montenegro':'Serbia', #The corresponding heatwave happened in Serbia, cf 'Location' data of EM-DAT
-                    'Slovakia':'Slovakia', 'Slovenia':'Slovenia', 'Spain':'Spain', 'Sweden':'Sweden',
-                    'Switzerland':'Switzerland', 'Turkey':'Turkey',
-                    'United Kingdom of Great Britain and Northern Ireland (the)':'United_Kingdom',
-                    'Ukraine':'Ukraine','Yugoslavia':'Serbia'} #The corresponding heatwave happened in Serbia, cf 'Location' data of EM-DAT
-    #indices of beggining and end of month for a JJA set of data (92 days from 1st June to 31st August)
-    beg_month_only_idx_dict = {6:0,7:30,8:61} #30 days in June, 31 days in July and August
-    end_month_only_idx_dict = {6:29,7:60,8:91} #30 days in June, 31 days in July and August
-    
-    ignored_events = ['1994-0759-ROU','2004-0361-SPI'] #'1994-0759-ROU' occured in May, '2004-0361-SPI' occured in Canary Island which is not in the studied area
     
+    masks_country = {} #country masks are loaded only once
+    htw_lists = {}
+    for year_event, df_year in tqdm(df_events.groupby('Year')) :
+        labels_year = f.variables['label'][(year_event-year_beg)*92:(year_event-year_beg+1)*92,:,:] #load all JJA data for the given year, only once for all the events of the year
+        for emdat_event in df_year.index.values :
+            country = df_year.loc[emdat_event,'mask_country']
+            if country not in masks_country :
+                f_mask=nc.Dataset(os.path.join(datadir, database,"Mask",f"Mask_{country}_{database}_{resolution}deg.nc"),mode='r')
+                masks_country[country] = f_mask.variables['mask'][:,:]
+                f_mask.close()
+            idx_beg = int(df_year.loc[emdat_event,'idx_beg_JJA_flex'])
+            idx_end = int(df_year.loc[emdat_event,'idx_end_JJA_flex'])
+            labels_cc3d = labels_year[idx_beg:idx_end+1,:,:]
+            labels_cc3d = ma.masked_where([masks_country[country]]*np.shape(labels_cc3d)[0], labels_cc3d)
+            htw_lists[emdat_event] = [int(i) for i in np.unique(labels_cc3d.compressed())]
+
     undetected_heatwaves = []
     detected_heatwaves = []
-    for emdat_event in tqdm(df_emdat.index.values[:]) :
-        if df_emdat.loc[emdat_event,'Dis No'] not in ignored_events :
-            country=df_emdat.loc[emdat_event,'Country']
-            f_mask=nc.Dataset(os.path.join(datadir, database,"Mask",f"Mask_{country_dict[country]}_{database}_{resolution}deg.nc"),mode='r')
-            mask_country = f_mask.variables['mask'][:,:]
-            htw_list = []
-            year_event = df_emdat.loc[emdat_event,'Year']
-            labels_cc3d = f.variables['label'][(year_event-year_beg)*92:(year_event-year_beg+1)*92,:,:] #load all JJA data for the given year
-            labels_cc3d[:] = ma.masked_where([mask_country]*92,labels_cc3d)
-            if np.isnan(df_emdat.loc[emdat_event,'Start Day']) :
-                month_beg_event = int(df_emdat.loc[emdat_event,'Start Month'])
-                month_end_event = int(df_emdat.loc[emdat_event,'End Month'])
-                labels_cc3d = labels_cc3d[beg_month_only_idx_dict[month_beg_event]:end_month_only_idx_dict[month_end_event]+1,:,:]
-                for i in np.unique(labels_cc3d[:]) :
-                    try :
-                        htw_list.append(int(i))
-                    except :
-                        pass
-            
-            elif np.isnan(df_emdat.loc[emdat_event,'End Day']) :
-                day_beg_event = int(df_emdat.loc[emdat_event,'Start Day'])
-                month_beg_event = int(df_emdat.loc[emdat_event,'Start Month'])
-                month_end_event = int(df_emdat.loc[emdat_event,'End Month'])
-                idx_beg = np.max([0, beg_month_only_idx_dict[month_beg_event] + day_beg_event-1 - flex_time_span])
-                idx_end = end_month_only_idx_dict[month_end_event]+1
-                labels_cc3d = labels_cc3d[idx_beg:idx_end,:,:]
-                for i in np.unique(labels_cc3d[:]) :
-                    try :
-                        htw_list.append(int(i))
-                    except :
-                        pass
-            else :
-                day_beg_event = int(df_emdat.loc[emdat_event,'Start Day'])
-                month_beg_event = int(df_emdat.loc[emdat_event,'Start Month'])
-                day_end_event = int(df_emdat.loc[emdat_event,'End Day'])
-                month_end_event = int(df_emdat.loc[emdat_event,'End Month'])
-                idx_beg = np.max([0, beg_month_only_idx_dict[month_beg_event] + day_beg_event-1 - flex_time_span])
-                idx_end = np.min([92,beg_month_only_idx_dict[month_end_event] + day_end_event + flex_time_span])
-                labels_cc3d = labels_cc3d[idx_beg:idx_end,:,:]
-                for i in np.unique(labels_cc3d[:]) :
-                    try :
-                        htw_list.append(int(i))
-                    except :
-                        pass
-            if htw_list==[] :
-                undetected_heatwaves.append(df_emdat.loc[emdat_event,'Dis No'])
-            else :
-                detected_heatwaves.append(str(df_emdat.loc[emdat_event,'Dis No'])+" "+str(htw_list))        
+    for emdat_event in df_events.index.values : #keep EM-DAT order
+        if htw_lists[emdat_event]==[] :
+            undetected_heatwaves.append(df_events.loc[emdat_event,'Dis No'])
+        else :
+            detected_heatwaves.append(str(df_events.loc[emdat_event,'Dis No'])+" "+str(htw_lists[emdat_event]))
+    #one row per link between an EM-DAT heatwave and a detected heatwave label
+    df_links = df_events.loc[[i for i in df_events.index.values if htw_lists[i]!=[]],['Dis No','disasterno']]
+    df_links['label'] = [htw_lists[i] for i in df_links.index.values]
+    df_links = df_links.explode('label').reset_index(drop=True)
+    df_links['label'] = df_links['label'].astype(np.int32)
     output_dir = os.path.join("Output",database,f"{datavar}_{daily_var}" ,
                             f"{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_JJA_{nb_days}days_before_scan_{year_beg}_{year_end}_{threshold_value}{name_dict_threshold[relative_threshold]}_{distrib_window_size}days_window_climatology_{year_beg_climatology}_{year_end_climatology}")
     pathlib.Path(output_dir).mkdir(parents=True,exist_ok=True)
-    with open(os.path.join(output_dir,f"emdat_undetected_heatwaves_{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_{threshold_value}{name_dict_threshold[relative_threshold]}_flex_time_{flex_time_span}_days.txt"), 'w') as output :
+    undetected_path = os.path.join(output_dir,f"emdat_undetected_heatwaves_{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_{threshold_value}{name_dict_threshold[relative_threshold]}_flex_time_{flex_time_span}_days.txt")
+    with open(temporary_path(undetected_path), 'w') as output :
         for row in undetected_heatwaves:
             output.write(str(row) + '\n')
+    commit_file(undetected_path)
             
-    with open(os.path.join(output_dir,f"emdat_detected_heatwaves_{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_{threshold_value}{name_dict_threshold[relative_threshold]}_flex_time_{flex_time_span}_days.txt"), 'w') as output :
+    detected_path = os.path.join(output_dir,f"emdat_detected_heatwaves_{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_{threshold_value}{name_dict_threshold[relative_threshold]}_flex_time_{flex_time_span}_days.txt")
+    with open(temporary_path(detected_path), 'w') as output :
         for row in detected_heatwaves:
             output.write(str(row) + '\n')
+    commit_file(detected_path)
+    #typed version of the detected heatwaves file, used by the following stages (see load_emdat_detected_heatwaves)
+    write_table(df_links,os.path.join(output_dir,f"emdat_detected_heatwaves_{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_{threshold_value}{name_dict_threshold[relative_threshold]}_flex_time_{flex_time_span}_days.parquet"))
+    #groups of detected heatwaves that are not distinguishable because they are linked to the same EM-DAT event (see group_emdat_detected_heatwaves)
+    write_table(group_emdat_detected_heatwaves(df_links),os.path.join(output_dir,f"emdat_heatwaves_groups_{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_{threshold_value}{name_dict_threshold[relative_threshold]}_flex_time_{flex_time_span}_days.parquet"))
 
     f.close()
-    f_mask.close()
     return
 
 #%%
+def load_emdat_detected_heatwaves(file_path, key='Dis No'):
+    '''This function loads the table of the links between EM-DAT heatwaves and detected heatwaves labels written by analyse_impact_overlap.
+    key is the EM-DAT identifier used for the mapping : 'Dis No' (EM-DAT heatwave, one per affected country) or 'disasterno' (merged EM-DAT event).
+    It returns the dictionary {EM-DAT identifier : list of labels} and the inverted dictionary {label : list of EM-DAT identifiers}, both with sorted unique values.'''
+
+    df_links = pd.read_parquet(file_path)
+    df_links = df_links.drop_duplicates([key,'label']).sort_values([key,'label'])
+    emdat_to_labels = {k: [int(i) for i in v] for k,v in df_links.groupby(key)['label']}
+    labels_to_emdat = {int(k): list(v) for k,v in df_links.sort_values(['label',key]).groupby('label')[key]}
+    return emdat_to_labels, labels_to_emdat
+
+def group_emdat_detected_heatwaves(df_links):
+    '''This function groups the detected heatwaves labels that are linked, directly or through other labels, to the same merged EM-DAT event (disasterno).
+    The connected components of the bipartite graph label <-> disasterno are computed with a union-find structure, in a single pass over the links.
+    It returns a table with one row per linked label : the label, the group identifier (smallest label of the group, which is the heatwave for which the indices are computed) and the number of labels of the group.'''
+
+    labels = df_links['label'].to_numpy(dtype=np.int64)
+    label_values, label_nodes = np.unique(labels, return_inverse=True)
+    event_values, event_nodes = np.unique(df_links['disasterno'].astype(str).to_numpy(), return_inverse=True)
+    event_nodes = event_nodes + len(label_values) #labels nodes first, then disasterno nodes
+    parent = list(range(len(label_values)+len(event_values)))
+
+    def find(node) :
+        root = node
+        while parent[root]!=root :
+            root = parent[root]
+        while parent[node]!=root : #path compression
+            parent[node], node = root, parent[node]
+        return root
+
+    for label_node, event_node in zip(label_nodes, event_nodes) :
+        root_label, root_event = find(int(label_node)), find(int(event_node))
+        if root_label!=root_event :
+            #the root of a component is always its smallest label node, since label nodes are sorted and come first
+            parent[max(root_label,root_event)] = min(root_label,root_event)
+
+    roots = np.array([find(i) for i in range(len(label_values))], dtype=np.int64)
+    df_groups = pd.DataFrame({'label':label_values.astype(np.int32), 'group':label_values[roots].astype(np.int32)})
+    df_groups['group_size'] = df_groups.groupby('group')['label'].transform('size').astype(np.int32)
+    return df_groups
+
+def load_heatwaves_groups(file_path):
+    '''This function loads the table of the groups of detected heatwaves written by analyse_impact_overlap (see group_emdat_detected_heatwaves).
+    It returns the dictionary {label : group identifier} and the dictionary {group identifier : list of labels of the group}.
+    Labels that are not in the table are alone in their group, whose identifier is the label itself.'''
+
+    df_groups = pd.read_parquet(file_path).sort_values('label')
+    label_to_group = {int(k): int(v) for k,v in zip(df_groups['label'],df_groups['group'])}
+    group_to_labels = {int(k): [int(i) for i in v] for k,v in df_groups.groupby('group')['label']}
+    return label_to_group, group_to_labels
+
+#%%
+@instrument_stage
 def undetected_heatwaves_animation(database='ERA5', datavar='t2m', daily_var='tg', year_beg=1950, year_end=2021, threshold_value=95, year_beg_climatology=1950, year_end_climatology=2021, distrib_window_size=15,nb_days=4,flex_time_span=7, anomaly=True, relative_threshold=True):
     '''This function is used to create animated maps for the dates around which EM-DAT heatwaves are not detected in the meteorological database (default ERA5).
     The detection threshold depends on the parameters used precedently, which is why all the above parameters are required.
@@ -1031,7 +1059,8 @@ def undetected_heatwaves_animation(database='ERA5', datavar='t2m', daily_var='tg
     shpfilename = shapereader.natural_earth(resolution_cartopy, category, name)
     df_countries = geopandas.read_file(shpfilename)
     
-    df_emdat = pd.read_excel(os.path.join(datadir,"GDIS_EM-DAT","EMDAT_Europe-1950-2022-heatwaves.xlsx"),header=0, index_col=0)
+    #EM-DAT events of the studied period, with precomputed JJA indices (see data_preprocessing_functions.py)
+    df_emdat = load_emdat_event_table(year_beg=year_beg, year_end=year_end, flex_time_span=flex_time_span)
     # load cc3d labels netCDF file
     nc_file_in = os.path.join(datadir,database,datavar,"Detection_Heatwave",f"detected_heatwaves_{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_JJA_{nb_days}days_before_scan_{year_beg}_{year_end}_{threshold_value}{name_dict_threshold[relative_threshold]}_{distrib_window_size}days_window_climatology_{year_beg_climatology}_{year_end_climatology}.nc")
 
@@ -1059,9 +1088,6 @@ def undetected_heatwaves_animation(database='ERA5', datavar='t2m', daily_var='tg
     #load JJA temperature anomaly data file
     nc_file_temp = os.path.join(datadir,database,datavar,f"{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_JJA_{year_beg}_{year_end}_climatology_{year_beg_climatology}_{year_end_climatology}_{distrib_window_size}days.nc")
     f_temp=nc.Dataset(nc_file_temp, mode='r')
-    # #indices of beggining and end of month for a JJA set of data (92 days from 1st June to 31st August)
-    beg_month_only_idx_dict = {6:0,7:30,8:61} #30 days in June, 31 days in July and August
-    end_month_only_idx_dict = {6:29,7:60,8:91} #30 days in June, 31 days in July and August
     # #Read txt file containing undetected heatwaves to create undetected heatwaves list
     output_dir = os.path.join("Output",database,f"{datavar}_{daily_var}" ,
                             f"{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_JJA_{nb_days}days_before_scan_{year_beg}_{year_end}_{threshold_value}{name_dict_threshold[relative_threshold]}_{distrib_window_size}days_window_climatology_{year_beg_climatology}_{year_end_climatology}")
@@ -1115,26 +1141,8 @@ def undetected_heatwaves_animation(database='ERA5', datavar='t2m', daily_var='tg
             year_event = df_emdat.loc[idx,'Year']
             labels_cc3d = f.variables['label'][(year_event-year_beg)*92:(year_event-year_beg+1)*92,:,:] #load all JJA cc3d label data for the given year
             temp = f_temp.variables[datavar][(year_event-year_beg)*92:(year_event-year_beg+1)*92,:,:]
-            if np.isnan(df_emdat.loc[idx,'Start Day']) :
-                month_beg_event = int(df_emdat.loc[idx,'Start Month'])
-                month_end_event = int(df_emdat.loc[idx,'End Month'])
-                idx_beg = beg_month_only_idx_dict[month_beg_event]
-                idx_end = end_month_only_idx_dict[month_end_event]+1
-                
-            elif np.isnan(df_emdat.loc[idx,'End Day']) :
-                day_beg_event = int(df_emdat.loc[idx,'Start Day'])
-                month_beg_event = int(df_emdat.loc[idx,'Start Month'])
-                month_end_event = int(df_emdat.loc[idx,'End Month'])
-                idx_beg = np.max([0, beg_month_only_idx_dict[month_beg_event] + day_beg_event-1 - flex_time_span])
-                idx_end = end_month_only_idx_dict[month_end_event]+1
-
-            else : #start day and end day are known
-                day_beg_event = int(df_emdat.loc[idx,'Start Day'])
-                month_beg_event = int(df_emdat.loc[idx,'Start Month'])
-                day_end_event = int(df_emdat.loc[idx,'End Day'])
-                month_end_event = int(df_emdat.loc[idx,'End Month'])
-                idx_beg = np.max([0, beg_month_only_idx_dict[month_beg_event] + day_beg_event-1 - flex_time_span])
-                idx_end = np.min([92,beg_month_only_idx_dict[month_end_event] + day_end_event + flex_time_span])
+            idx_beg = int(df_emdat.loc[idx,'idx_beg_JJA_flex'])
+            idx_end = int(df_emdat.loc[idx,'idx_end_JJA_flex'])+1 #the table bounds are inclusive
             
             labels_cc3d = ma.filled(labels_cc3d[idx_beg:idx_end,:,:],fill_value=-9999)
             labels_cc3d = (labels_cc3d!=-9999)
@@ -0,0 +1,157 @@
+#%%
+import numpy as np
+import os #read data directories
+from concurrent.futures import ProcessPoolExecutor #render the figures in parallel
+from tqdm import tqdm #create a user-friendly feedback while script is running
+import matplotlib
+import matplotlib.pyplot as plt
+from scipy import signal
+from adjustText import adjust_text
+
+from heatwaves_indices_functions import heatwaves_indices
+from storage_functions import temporary_path, commit_file, notify_file_event
+
+#%%
+def min_boundary(x) :
+    if x<0 :
+        x=1.05
+    else :
+        x=0.95
+    return(x)
+
+def max_boundary(x) :
+    if x<0 :
+        x=0.95
+    else :
+        x=1.05
+    return(x)
+
+def distribution_histogram(meteo_list, scale='linear'):
+    '''This function computes the histogram (30 bins, linearly or logarithmically spaced depending on the scale of the index) of the values of an index over the computed heatwaves,
+    smoothed with a Savitzky-Golay filter. It returns the bins centers X, the frequencies Y, the smoothed frequencies Y2 and the x limits of the plot.'''
+
+    min_val = np.min(meteo_list)
+    max_val = np.max(meteo_list)
+    xlim = np.array([min_val*min_boundary(min_val),max_val*max_boundary(max_val)])
+    if scale=='linear' :
+        bins = np.linspace(start=xlim[0], stop=xlim[1], num=30)
+    elif scale=='log' :
+        bins = np.logspace(start=np.log10(xlim[0]), stop=np.log10(xlim[1]), num=30)
+    Y,bins_edges = np.histogram(meteo_list,bins=bins) #histogram of the heatwaves distribution
+    X = (bins_edges[1:]+bins_edges[:-1])/2
+    Y2 = signal.savgol_filter(Y, 9,3) #smooth the histogram edges with a savitzky-golay filter
+    return X, Y, Y2, xlim
+
+def compute_distribution_data(df_htw, meteo_criteria, chosen_impact):
+    '''This function computes once everything the distribution figures need : for each index, the histogram of the computed heatwaves (see distribution_histogram), the quartiles,
+    the values of the index for the extreme heatwaves and the height of the smoothed histogram at these values. It returns a flat dictionary of arrays, the keys of the index data being f'{index}:{field}'.'''
+
+    extreme_mask = df_htw['Extreme_heatwave'].to_numpy(dtype=bool)
+    computed_mask = df_htw['Computed_heatwave'].to_numpy(dtype=bool)
+    data = {'impact':df_htw.loc[extreme_mask,chosen_impact].to_numpy(dtype=np.float64), 'labels':df_htw.index.values[extreme_mask]}
+    for chosen_meteo in meteo_criteria :
+        meteo_list = df_htw.loc[computed_mask,chosen_meteo].to_numpy(dtype=np.float64)
+        scatter_list_meteo = df_htw.loc[extreme_mask,chosen_meteo].to_numpy(dtype=np.float64)
+        X, Y, Y2, xlim = distribution_histogram(meteo_list,heatwaves_indices[chosen_meteo]['scale'])
+        closest_x = np.argmin(np.abs(X[np.newaxis,:]-scatter_list_meteo[:,np.newaxis]),axis=1) #bin of the histogram closest to each extreme heatwave
+        for field, values in [('X',X),('Y',Y),('Y2',Y2),('xlim',xlim),('quartiles',np.percentile(meteo_list,[25,50,75])),('scatter_meteo',scatter_list_meteo),('scatter_height',Y2[closest_x])] :
+            data[f'{chosen_meteo}:{field}'] = values
+    return data
+
+def load_distribution_data(df_htw, meteo_criteria, chosen_impact, cache_path, source_path):
+    '''This function returns the distribution data of compute_distribution_data, read from the cache file cache_path (.npz) if it is more recent than the table source_path it was computed from, and computed and cached otherwise.'''
+
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path)>=os.path.getmtime(source_path) :
+        with np.load(cache_path,allow_pickle=False) as cache :
+            data = {key:cache[key] for key in cache.files}
+        if all(f'{chosen_meteo}:X' in data for chosen_meteo in meteo_criteria) :
+            notify_file_event('cache_hit',cache_path)
+            return data
+    notify_file_event('cache_miss',cache_path)
+    data = compute_distribution_data(df_htw,meteo_criteria,chosen_impact)
+    np.savez(temporary_path(cache_path),**data)
+    commit_file(cache_path)
+    return data
+
+def criterion_data(data, chosen_meteo):
+    '''This function returns the distribution data of one index, as a dictionary {field : values}.'''
+
+    return {key.split(':',1)[1]:values for key,values in data.items() if key.startswith(f'{chosen_meteo}:')}
+
+#%%
+def fast_label_positions(x, y, xlim, ylim, log_x=False, label_width=0.04, label_height=0.035):
+    '''This function places the labels of the points (x, y) without overlap, as a fast and deterministic alternative to adjust_text (which only moves the labels vertically in this plot).
+    The labels are processed from the lowest point to the highest one, and each label is moved up just above the labels it overlaps with. label_width and label_height are the size of a label as a fraction of the axes.
+    It returns the heights of the labels in data coordinates.'''
+
+    x_scale = np.log10 if log_x else (lambda v: v)
+    x_axes = (x_scale(np.asarray(x,dtype=np.float64))-x_scale(xlim[0]))/(x_scale(xlim[1])-x_scale(xlim[0])) #positions as fractions of the axes
+    y_axes = (np.asarray(y,dtype=np.float64)-ylim[0])/(ylim[1]-ylim[0])
+    label_y = y_axes.copy()
+    placed = []
+    for k in np.lexsort((x_axes,y_axes)) :
+        for j in sorted(placed,key=lambda j: label_y[j]) : #the label only moves up, so one sweep over the placed labels sorted by height is enough
+            if abs(x_axes[j]-x_axes[k])<label_width and label_y[k]-label_height<label_y[j]<label_y[k]+label_height :
+                label_y[k] = label_y[j]+label_height
+        placed.append(k)
+    return ylim[0]+label_y*(ylim[1]-ylim[0])
+
+def use_agg_backend():
+    '''This function selects the non interactive Agg backend of matplotlib, used by the processes rendering the figures.'''
+
+    plt.switch_backend('Agg')
+    return
+
+def plot_distribution_figure(task):
+    '''This function renders the distribution figure of one index from the precomputed distribution data : histogram of the computed heatwaves, quartiles and extreme heatwaves colored by impact.
+    task is a dictionary with the keys 'data' (see criterion_data), 'impact', 'labels', 'norm', 'chosen_impact', 'chosen_meteo', 'label_placement' ('adjust_text' or 'fast') and 'output_path'.
+    It is a top-level function so that it can be run in a process pool.'''
+
+    data = task['data']
+    log_x = heatwaves_indices[task['chosen_meteo']]['scale']=='log'
+    X, Y, Y2 = data['X'], data['Y'], data['Y2']
+    fig = plt.figure(figsize=(24,16),facecolor='white')
+    if log_x : #have to plot on semilog scale for these criteria
+        plt.semilogx(X,Y,'ko')
+        plt.semilogx(X,Y2,'r-')
+    else :
+        plt.plot(X,Y,'ko')
+        plt.plot(X,Y2,'r-')
+    plt.plot(X,Y,'ko')
+    plt.plot(X,Y2,'r-')
+    ylim = [-2,45]
+    plt.ylim(ylim)
+    plt.xlim(data['xlim'])
+    for quartile in data['quartiles'] : #add 1st quartile, median and 3rd quartile of the meteo criterion list
+        plt.axvline(quartile,linewidth=2)
+    plt.grid()
+    plt.xlabel(task['chosen_meteo'],size=25)
+    plt.ylabel('Frequency',size=25)
+
+    scatter_list_meteo, scatter_height = data['scatter_meteo'], data['scatter_height']
+    if task['label_placement']=='fast' :
+        labels_height = fast_label_positions(scatter_list_meteo,scatter_height,data['xlim'],ylim,log_x=log_x)
+    texts=[]
+    for k in range(len(scatter_list_meteo)):
+        plt.scatter(np.linspace(scatter_list_meteo[k],scatter_list_meteo[k],1000),np.linspace(0,scatter_height[k],1000),c=[task['impact'][k]]*1000,edgecolor=None, cmap = 'YlOrRd',norm=task['norm'],linewidths=4)
+        if task['label_placement']=='fast' :
+            moved = labels_height[k]!=scatter_height[k]
+            plt.annotate(task['labels'][k],(scatter_list_meteo[k],scatter_height[k]),xytext=(scatter_list_meteo[k],labels_height[k]),size=15,arrowprops=dict(arrowstyle="->", color='k', lw=1) if moved else None)
+        else :
+            texts.append(plt.annotate(task['labels'][k],(scatter_list_meteo[k],scatter_height[k]),size=15))
+    if task['label_placement']!='fast' :
+        adjust_text(texts, only_move={'points':'y', 'texts':'y'}, arrowprops=dict(arrowstyle="->", color='k', lw=1))
+    cax = plt.axes([0.35, 0.02, 0.35, 0.02])
+    plt.title('Impact of the extreme heatwaves ('+task['chosen_impact']+')',y=1,size=25)
+    plt.colorbar(cax=cax,orientation='horizontal')
+    plt.savefig(task['output_path'])
+    plt.close(fig)
+    return task['output_path']
+
+def render_distribution_figures(tasks, nb_processes=1):
+    '''This function renders the distribution figures of the tasks (see plot_distribution_figure), serially if nb_processes is 1, or in a pool of nb_processes processes using the Agg backend.'''
+
+    if nb_processes>1 :
+        with ProcessPoolExecutor(max_workers=nb_processes,initializer=use_agg_backend) as executor :
+            return list(tqdm(executor.map(plot_distribution_figure,tasks),total=len(tasks)))
+    return [plot_distribution_figure(task) for task in tqdm(tasks)]
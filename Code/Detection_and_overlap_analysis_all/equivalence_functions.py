@@ -0,0 +1,264 @@
+#%%
+import numpy as np
+import netCDF4 as nc #load and write netcdf data
+import os #read data directories
+import sys
+import io
+import json #run reports
+import shutil #copy the synthetic inputs
+import tarfile #export of a revision of the code
+import subprocess #run each implementation in its own process
+import pathlib
+import pandas as pd #handle dataframes
+
+from pipeline_functions import pipeline_stages
+from synthetic_data_functions import create_synthetic_dataset, synthetic_params
+from storage_functions import temporary_path, commit_file
+
+#%%
+#Equivalence of two implementations of the pipeline : the reference and the candidate (for instance an accelerated version of a stage) are run on the same synthetic inputs
+#(see synthetic_data_functions), each in its own directory and process, and every file written by the stages is compared : netCDF variables with tolerances,
+#labels of the detected heatwaves up to a renumbering, and tables (Parquet and Excel) column by column. The differences are reported per stage and per file.
+#An implementation is either a git revision (exported with git archive) or a directory of the code.
+
+#Tolerances of the comparison of the floating point values of each stage, np.isclose(candidate, reference, rtol, atol) : the netCDF files are written in float32.
+equivalence_tolerances = {'default' : {'rtol':1e-5, 'atol':1e-6},
+                          'distrib_percentile' : {'rtol':1e-5, 'atol':1e-4}, #percentiles of float32 values
+                          'heatwaves_indices' : {'rtol':1e-6, 'atol':1e-9},
+                          'indices_scores' : {'rtol':1e-6, 'atol':1e-9}}
+label_variables = ['label'] #variables (and table columns) of the labels of the heatwaves, compared up to a renumbering
+group_columns = ['group'] #table columns of the groups of heatwaves (numbered after one of their labels), compared as partitions of the heatwaves
+status_order = ['identical','renumbered','within_tolerance','not_compared','drift','missing'] #from the best to the worst status
+
+def export_code(implementation, dest):
+    '''This function returns the directory of the code of an implementation : the directory itself if implementation is a directory,
+    otherwise the code directory at the git revision implementation, exported in dest.'''
+
+    if os.path.isdir(implementation) :
+        return os.path.abspath(implementation)
+    code_dir = os.path.dirname(os.path.abspath(__file__))
+    prefix = subprocess.run(['git','-C',code_dir,'rev-parse','--show-prefix'],capture_output=True,text=True,check=True).stdout.strip()
+    top_dir = subprocess.run(['git','-C',code_dir,'rev-parse','--show-toplevel'],capture_output=True,text=True,check=True).stdout.strip() #git archive is run from the top of the repository
+    archive = subprocess.run(['git','-C',top_dir,'archive','--format=tar',f"{implementation}:{prefix}"],capture_output=True,check=True).stdout
+    shutil.rmtree(dest,ignore_errors=True)
+    pathlib.Path(dest).mkdir(parents=True, exist_ok=True)
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar :
+        tar.extractall(dest)
+    return os.path.abspath(dest)
+
+def run_implementation(code_dir, root, targets, params_list):
+    '''This function runs the target stages (with the stages they require) of the code of code_dir for every parameters set of params_list, in a new process working in root.
+    It returns the run report (see instrumentation_functions.write_run_report). The outputs to compare are the files listed in the report :
+    an implementation that does not write one (written before the instrumentation of the stages) cannot be compared, and raises a FileNotFoundError.'''
+
+    report_path = os.path.join(os.path.abspath(root),"Output","run_reports","equivalence")
+    runner = ("import sys, json, inspect\n"
+              "from pipeline_functions import run_pipeline\n"
+              "kwargs = {'report_path':sys.argv[3]} if 'report_path' in inspect.signature(run_pipeline).parameters else {}\n"
+              "run_pipeline(json.loads(sys.argv[1]),json.loads(sys.argv[2]),overwrite_files=True,**kwargs)")
+    env = os.environ|{'PYTHONPATH':os.pathsep.join([code_dir]+[path for path in os.environ.get('PYTHONPATH','').split(os.pathsep) if path!=''])}
+    subprocess.run([sys.executable,'-c',runner,json.dumps(list(targets)),json.dumps(params_list),report_path],cwd=root,env=env,check=True)
+    if os.path.exists(report_path+'.json')==False :
+        raise FileNotFoundError(f"The implementation {code_dir} wrote no run report {report_path}.json : only the implementations with instrumented stages (see instrumentation_functions) can be compared")
+    with open(report_path+'.json') as f :
+        return json.load(f)
+
+#%%
+def difference_row(values_reference, values_candidate, rtol, atol):
+    '''This function compares two arrays of the same shape (masked or NaN values compared as such) and returns the number of values, the number of values differing beyond the tolerances,
+    the maximal absolute and relative differences and the status ('identical', 'within_tolerance' or 'drift').'''
+
+    mask_reference, mask_candidate = np.ma.getmaskarray(values_reference), np.ma.getmaskarray(values_candidate)
+    reference, candidate = np.ma.getdata(values_reference), np.ma.getdata(values_candidate)
+    if reference.dtype.kind not in 'fiub' or candidate.dtype.kind not in 'fiub' : #dates and strings
+        differences = (mask_reference!=mask_candidate) | (~mask_reference & (reference.astype(str)!=candidate.astype(str)))
+        nb_differences = int(np.sum(differences))
+        return {'nb_values':int(reference.size), 'nb_differences':nb_differences, 'max_abs_diff':np.nan, 'max_rel_diff':np.nan, 'status':'identical' if nb_differences==0 else 'drift'}
+    reference = np.where(mask_reference,np.nan,reference.astype(np.float64)) #masked values are compared as NaN
+    candidate = np.where(mask_candidate,np.nan,candidate.astype(np.float64))
+    both = ~np.isnan(reference) & ~np.isnan(candidate)
+    abs_diff = np.abs(candidate[both]-reference[both])
+    rel_diff = abs_diff/np.maximum(np.abs(reference[both]),np.finfo(np.float64).tiny)
+    nb_differences = int(np.sum(np.isnan(reference)!=np.isnan(candidate))+np.sum(~np.isclose(candidate[both],reference[both],rtol=rtol,atol=atol)))
+    if nb_differences>0 :
+        status = 'drift'
+    elif np.all(abs_diff==0) :
+        status = 'identical'
+    else :
+        status = 'within_tolerance'
+    return {'nb_values':int(reference.size), 'nb_differences':nb_differences, 'max_abs_diff':float(abs_diff.max()) if abs_diff.size>0 else 0., 'max_rel_diff':float(rel_diff.max()) if rel_diff.size>0 else 0., 'status':status}
+
+def compare_label_partitions(labels_reference, labels_candidate):
+    '''This function compares two label arrays (0 or masked outside the heatwaves) up to a renumbering : they are equivalent if they define the same heatwaves, whatever their labels.
+    It returns the comparison row (status 'identical', 'renumbered' or 'drift', the differences being the points labelled in only one of the arrays or belonging to heatwaves merged or split)
+    and the renumbering {candidate label : reference label}.'''
+
+    reference = np.ma.filled(labels_reference,0).astype(np.int64)
+    candidate = np.ma.filled(labels_candidate,0).astype(np.int64)
+    support = (reference!=0) | (candidate!=0)
+    pairs = pd.DataFrame({'reference':reference[support],'candidate':candidate[support]}).value_counts().reset_index()
+    labelled = pairs[(pairs['reference']!=0) & (pairs['candidate']!=0)].sort_values('count',ascending=False)
+    best_reference = labelled.drop_duplicates('candidate') #reference label mostly paired with each candidate label
+    best_candidate = labelled.drop_duplicates('reference')
+    #points labelled in only one of the arrays, and points of heatwaves merged or split (not paired with the main label of their heatwave)
+    nb_differences = int(pairs['count'].sum()-labelled['count'].sum()) + int(labelled['count'].sum()-min(best_reference['count'].sum(),best_candidate['count'].sum()))
+    mapping = {int(c):int(r) for c,r in zip(best_reference['candidate'],best_reference['reference'])}
+    if nb_differences>0 :
+        status = 'drift'
+    else :
+        status = 'identical' if np.array_equal(reference,candidate) else 'renumbered'
+    return {'nb_values':int(reference.size), 'nb_differences':nb_differences, 'max_abs_diff':np.nan, 'max_rel_diff':np.nan, 'status':status}, mapping
+
+def compare_netcdf(path_reference, path_candidate, rtol, atol):
+    '''This function compares the variables of two netCDF files. It returns one comparison row per variable, and the renumbering of the labels (see compare_label_partitions), empty if the file has no label variable.'''
+
+    rows, mapping = [], {}
+    f_reference, f_candidate = nc.Dataset(path_reference,mode='r'), nc.Dataset(path_candidate,mode='r')
+    try :
+        for name in sorted(set(f_reference.variables)|set(f_candidate.variables)) :
+            if name not in f_reference.variables or name not in f_candidate.variables :
+                rows.append({'item':name, 'status':'missing'})
+                continue
+            values_reference, values_candidate = f_reference.variables[name][:], f_candidate.variables[name][:]
+            if np.shape(values_reference)!=np.shape(values_candidate) :
+                rows.append({'item':name, 'status':'drift', 'nb_values':int(np.size(values_reference)), 'nb_differences':int(np.size(values_reference))})
+            elif name in label_variables :
+                row, mapping = compare_label_partitions(values_reference,values_candidate)
+                rows.append({'item':name}|row)
+            else :
+                rows.append({'item':name}|difference_row(values_reference,values_candidate,rtol,atol))
+    finally :
+        f_reference.close()
+        f_candidate.close()
+    return rows, mapping
+
+def read_comparison_table(path):
+    if path.endswith('.parquet') :
+        return pd.read_parquet(path)
+    return pd.read_excel(path,header=0,index_col=0)
+
+def compare_tables(path_reference, path_candidate, rtol, atol, mapping=None):
+    '''This function compares two tables (Parquet or Excel), column by column. If the heatwaves were renumbered (mapping {candidate label : reference label}, see compare_label_partitions),
+    the index of the candidate table (if it is made of labels) and its label columns are first renumbered as the reference labels, the tables indexed by rows being sorted,
+    and the group columns are compared up to a renumbering. It returns one comparison row per column, and a row 'index' for the rows missing in one of the tables.'''
+
+    df_reference, df_candidate = read_comparison_table(path_reference), read_comparison_table(path_candidate)
+    if mapping :
+        if len(df_candidate.index)>0 and all(label in mapping for label in df_candidate.index) :
+            df_candidate.index = df_candidate.index.map(mapping)
+        elif any(col in df_candidate.columns for col in label_variables) : #the order of the rows follows the labels
+            for col in label_variables :
+                if col in df_candidate.columns :
+                    df_candidate[col] = df_candidate[col].map(lambda label: mapping.get(label,label))
+            df_reference = df_reference.sort_values(list(df_reference.columns),key=lambda values: values.astype(str)).reset_index(drop=True)
+            df_candidate = df_candidate.sort_values(list(df_candidate.columns),key=lambda values: values.astype(str)).reset_index(drop=True)
+    rows = []
+    common_index = df_reference.index.intersection(df_candidate.index)
+    nb_missing_rows = len(df_reference.index.union(df_candidate.index))-len(common_index)
+    rows.append({'item':'index', 'nb_values':len(df_reference.index), 'nb_differences':nb_missing_rows, 'status':'identical' if nb_missing_rows==0 and df_reference.index.equals(df_candidate.index) else ('drift' if nb_missing_rows>0 else 'renumbered')})
+    for col in df_reference.columns.union(df_candidate.columns,sort=False) :
+        if col not in df_reference.columns or col not in df_candidate.columns :
+            rows.append({'item':str(col), 'status':'missing'})
+            continue
+        values_reference, values_candidate = df_reference.loc[common_index,col], df_candidate.loc[common_index,col]
+        if mapping and col in group_columns :
+            rows.append({'item':str(col)}|compare_label_partitions(values_reference.to_numpy(),values_candidate.to_numpy())[0])
+        elif pd.api.types.is_numeric_dtype(values_reference) and pd.api.types.is_numeric_dtype(values_candidate) :
+            rows.append({'item':str(col)}|difference_row(values_reference.to_numpy(dtype=np.float64,na_value=np.nan),values_candidate.to_numpy(dtype=np.float64,na_value=np.nan),rtol,atol))
+        else :
+            rows.append({'item':str(col)}|difference_row(np.ma.masked_array(values_reference.astype(str).to_numpy(),mask=values_reference.isna().to_numpy()),
+                                                         np.ma.masked_array(values_candidate.astype(str).to_numpy(),mask=values_candidate.isna().to_numpy()),rtol,atol))
+    return rows
+
+def compare_text_files(path_reference, path_candidate):
+    with open(path_reference) as f :
+        lines_reference = f.read().splitlines()
+    with open(path_candidate) as f :
+        lines_candidate = f.read().splitlines()
+    nb_differences = sum(line_reference!=line_candidate for line_reference,line_candidate in zip(lines_reference,lines_candidate))+abs(len(lines_reference)-len(lines_candidate))
+    return [{'item':'lines', 'nb_values':len(lines_reference), 'nb_differences':nb_differences, 'status':'identical' if nb_differences==0 else 'drift'}]
+
+#%%
+def written_files(report):
+    '''This function returns the files written by each stage of a run report, as a dictionary {path : stage} (the first stage writing a file), the run reports themselves excluded.
+    A missing report (None) raises a ValueError, so that a run without report is never compared as a run without outputs.'''
+
+    if report is None :
+        raise ValueError("No run report : the files written by the stages are unknown")
+    files = {}
+    for record in report['stages'] :
+        for path, file_record in record['files'].items() :
+            if file_record['bytes_written']>0 and not path.endswith('.manifest.json') :
+                files.setdefault(os.path.normpath(path),record['stage'])
+    return files
+
+def compare_outputs(root_reference, root_candidate, report_reference, report_candidate, tolerances=equivalence_tolerances):
+    '''This function compares the files written by the stages of the reference and of the candidate runs (see written_files), in the directories root_reference and root_candidate.
+    The label variables are compared first, so that the tables indexed by the heatwaves labels are compared with the same numbering.
+    It returns the table of the differences, one row per stage, file and compared item (variable or column).'''
+
+    function_to_stage = {pipeline_stages[stage]['function'].__name__:stage for stage in pipeline_stages}
+    files = written_files(report_candidate)|written_files(report_reference)
+    if len(files)==0 :
+        raise ValueError("The run reports list no file written by the stages : nothing to compare")
+    paths = sorted(files,key=lambda path: (not path.endswith('.nc'),path)) #netCDF files first, for the renumbering of the labels
+    mapping, rows = {}, []
+    for path in paths :
+        stage = function_to_stage.get(files[path],files[path])
+        tolerance = tolerances.get(stage,tolerances['default'])
+        path_reference, path_candidate = os.path.join(root_reference,path), os.path.join(root_candidate,path)
+        if os.path.exists(path_reference)==False or os.path.exists(path_candidate)==False :
+            file_rows = [{'item':'file', 'status':'missing', 'nb_differences':1}]
+        elif path.endswith('.nc') :
+            file_rows, file_mapping = compare_netcdf(path_reference,path_candidate,tolerance['rtol'],tolerance['atol'])
+            mapping |= file_mapping
+        elif path.endswith('.parquet') or path.endswith('.xlsx') :
+            file_rows = compare_tables(path_reference,path_candidate,tolerance['rtol'],tolerance['atol'],mapping)
+        elif path.endswith('.txt') or path.endswith('.csv') :
+            if any(c!=r for c,r in mapping.items()) : #the labels written in the text reports cannot be renumbered, they are compared through the tables
+                file_rows = [{'item':'lines', 'status':'not_compared'}]
+            else :
+                file_rows = compare_text_files(path_reference,path_candidate)
+        else : #figures and animations
+            file_rows = [{'item':'file', 'status':'not_compared'}]
+        rows += [{'stage':stage, 'file':path}|row for row in file_rows]
+    df_differences = pd.DataFrame(rows,columns=['stage','file','item','status','nb_values','nb_differences','max_abs_diff','max_rel_diff'])
+    return df_differences
+
+def summarize_differences(df_differences):
+    '''This function summarizes the table of the differences per stage : worst status of its items, number of files and items compared, of items drifting, and maximal differences.'''
+
+    df_summary = df_differences.groupby('stage',sort=False).agg(status=('status',lambda status: max(status,key=status_order.index)),nb_files=('file','nunique'),nb_items=('item','count'),
+                                                               nb_drifting_items=('status',lambda status: int(status.isin(['drift','missing']).sum())),
+                                                               max_abs_diff=('max_abs_diff','max'),max_rel_diff=('max_rel_diff','max'))
+    return df_summary
+
+#%%
+def run_equivalence(reference='HEAD', candidate='.', size='small', targets=tuple(pipeline_stages.keys()), database='ERA5', datavar='t2m', daily_var='tg', work_dir=None, tolerances=equivalence_tolerances, seed=0):
+    '''This function runs the target stages (default every stage) of the reference and of the candidate implementations (git revisions or code directories, default the last commit and the working tree)
+    on the same synthetic dataset of the given size, and compares their outputs (see compare_outputs). Everything is written in work_dir (default Benchmark/equivalence_{size}) :
+    the synthetic inputs, the runs of both implementations and the tables of the differences (equivalence_differences.csv) and of their summary per stage (equivalence_summary.csv).
+    It returns these two tables.'''
+
+    if work_dir is None :
+        work_dir = os.path.join("Benchmark",f"equivalence_{size}")
+    work_dir = os.path.abspath(work_dir)
+    p = synthetic_params(size,database,datavar,daily_var)
+    inputs_dir = os.path.join(work_dir,"inputs")
+    create_synthetic_dataset(inputs_dir,size,database,[datavar],[daily_var],params_list=[p],seed=seed)
+
+    reports = {}
+    for name, implementation in [('reference',reference),('candidate',candidate)] :
+        print(f"\n Running the {name} implementation ({implementation})... \n")
+        code_dir = export_code(implementation,os.path.join(work_dir,"code",name))
+        root = os.path.join(work_dir,name)
+        shutil.rmtree(root,ignore_errors=True)
+        shutil.copytree(inputs_dir,root) #same inputs for both implementations
+        reports[name] = run_implementation(code_dir,root,targets,[p])
+
+    df_differences = compare_outputs(os.path.join(work_dir,"reference"),os.path.join(work_dir,"candidate"),reports['reference'],reports['candidate'],tolerances)
+    df_summary = summarize_differences(df_differences)
+    for df, name in [(df_differences,"equivalence_differences.csv"),(df_summary,"equivalence_summary.csv")] :
+        df.to_csv(temporary_path(os.path.join(work_dir,name)),index=(name=="equivalence_summary.csv"))
+        commit_file(os.path.join(work_dir,name))
+    return df_differences, df_summary
@@ -0,0 +1,109 @@
+#%%
+import numpy as np
+
+#%%
+#Heatwaves indices registry
+#Each index is the product of primitive aggregates (terms) computed over a heatwave :
+# ('sum', var, weights) : sum over the points (time and space) of the heatwave of the variable var ('temp' or 'HWMId'), multiplied by the product of the weights
+# ('mean', var, weights) : same sum, divided by the number of points of the heatwave where var is defined
+# ('max', var, ()) : maximum of the variable var over the heatwave
+# ('sum', 'cells', weights) : sum of the product of the weights over the cells affected (at least one day) by the heatwave
+# ('count', 'days', ()) : number of days of the heatwave
+#The weights are 2D maps : 'area' (cell area in km²), 'area_ratio' (cell area as a ratio of the maximum possible cell area, obtained with lat=0°),
+#'pop' (population density) and 'pop_positive' (1 for populated cells, 0 otherwise).
+#If 'nonlinear' is True, the index is computed separately over densely populated cells (population density > threshold_NL), multiplied by coeff_PL, and over sparsely populated cells, and the two parts are added.
+#'scale' is the scale of the distribution plots ('linear' or 'log').
+affected_area = ('sum','cells',('area','pop_positive')) #area of the populated cells affected by the heatwave in km²
+affected_pop = ('sum','cells',('area','pop')) #population affected by the heatwave
+
+heatwaves_indices = {
+    'Global_mean' : {'terms':[('mean','temp',('area_ratio',))], 'nonlinear':False, 'scale':'linear'}, #mean temperature anomaly over every point recorded as a part of the heatwave
+    'Spatial_extent' : {'terms':[affected_area], 'nonlinear':False, 'scale':'log'}, #area of the considered heatwave in km²
+    'Duration' : {'terms':[('count','days',())], 'nonlinear':False, 'scale':'linear'}, #duration in days
+    'Max' : {'terms':[('max','temp',())], 'nonlinear':False, 'scale':'linear'}, #maximum temperature anomaly of the heatwave
+    'Max_spatial' : {'terms':[('max','temp',()),affected_area], 'nonlinear':False, 'scale':'log'}, #maximum of the temperature anomaly of the heatwave, multiplied by the affected area
+    'Temp_sum' : {'terms':[('sum','temp',('area_ratio',))], 'nonlinear':False, 'scale':'log'}, #sum of the normalized cell area multiplied by the temperature anomaly of every point recorded as a part of the heatwave
+    'Pseudo_HWMId' : {'terms':[('sum','HWMId',('area_ratio',))], 'nonlinear':False, 'scale':'log'}, #sum of HWMId index over the heatwave (time and space), multiplied by the normalized cell area
+    'Total_affected_pop' : {'terms':[affected_pop], 'nonlinear':False, 'scale':'log'},
+    'Global_mean_pop' : {'terms':[('mean','temp',('area_ratio',)),affected_pop], 'nonlinear':False, 'scale':'log'},
+    'Duration_pop' : {'terms':[('count','days',()),affected_pop], 'nonlinear':False, 'scale':'log'},
+    'Max_pop' : {'terms':[('max','temp',()),affected_pop], 'nonlinear':False, 'scale':'log'},
+    'Max_spatial_pop' : {'terms':[('max','temp',()),affected_area,affected_pop], 'nonlinear':False, 'scale':'log'},
+    'Spatial_extent_pop' : {'terms':[affected_area,affected_pop], 'nonlinear':False, 'scale':'log'},
+    'Temp_sum_pop' : {'terms':[('sum','temp',('area_ratio',)),affected_pop], 'nonlinear':False, 'scale':'log'},
+    'Pseudo_HWMId_pop' : {'terms':[('sum','HWMId',('area_ratio',)),affected_pop], 'nonlinear':False, 'scale':'log'},
+    'Multi_index_temp' : {'terms':[('sum','temp',('area_ratio','pop'))], 'nonlinear':False, 'scale':'log'},
+    'Multi_index_HWMId' : {'terms':[('sum','HWMId',('area_ratio','pop'))], 'nonlinear':False, 'scale':'log'},
+    'Temp_sum_pop_NL' : {'terms':[('sum','temp',('area_ratio',)),affected_pop], 'nonlinear':True, 'scale':'log'},
+    'Pseudo_HWMId_pop_NL' : {'terms':[('sum','HWMId',('area_ratio',)),affected_pop], 'nonlinear':True, 'scale':'log'},
+    'Multi_index_temp_NL' : {'terms':[('sum','temp',('area_ratio','pop'))], 'nonlinear':True, 'scale':'log'},
+    'Multi_index_HWMId_NL' : {'terms':[('sum','HWMId',('area_ratio','pop'))], 'nonlinear':True, 'scale':'log'},
+    }
+
+#%%
+def heatwaves_indices_primitives(indices=list(heatwaves_indices.keys())):
+    '''This function returns the minimal set of primitive aggregates needed to compute the given indices of the registry, as a sorted list of (term, population class) tuples.
+    The population class is None for linear indices, 'high' (densely populated cells) or 'low' (sparsely populated cells) for nonlinear ones.'''
+
+    primitives = set()
+    for index in indices :
+        for pop_class in (['high','low'] if heatwaves_indices[index]['nonlinear'] else [None]) :
+            primitives.update([(term,pop_class) for term in heatwaves_indices[index]['terms']])
+    return sorted(primitives, key=str)
+
+def compute_heatwaves_primitives(primitives, nb_htw, pairs_htw, pairs_cell, pairs_values, cells_maps, duration):
+    '''This function computes the primitive aggregates of all the heatwaves of a year from the time-collapsed (heatwave, cell) pairs.
+    pairs_htw and pairs_cell are the heatwave index (from 0 to nb_htw-1) and the flattened cell index of each pair, pairs_values the per pair sum, count and maximum of each variable (keys f'{var}_sum', f'{var}_count', f'{var}_max'),
+    cells_maps the 2D weights and population classes maps ('area', 'area_ratio', 'pop', 'pop_positive', 'high', 'low') and duration the number of days of each heatwave.
+    It returns the dictionary {(term, population class) : array of the nb_htw values}.'''
+
+    def pairs_sum(weights) :
+        #sum over the cells affected by each heatwave
+        return np.bincount(pairs_htw,weights=weights,minlength=nb_htw)
+
+    pairs_maps = {} #2D maps taken at the cell of each pair, only gathered once
+    def pairs_map(name) :
+        if name not in pairs_maps :
+            pairs_maps[name] = cells_maps[name].ravel()[pairs_cell].astype(np.float64)
+        return pairs_maps[name]
+
+    primitives_values = {}
+    for (kind,var,weights),pop_class in primitives :
+        pairs_weights = np.ones(len(pairs_htw))
+        for weight in weights+((pop_class,) if pop_class is not None else ()) :
+            pairs_weights = pairs_weights*pairs_map(weight)
+        if kind=='count' : #number of days, independent of the population class
+            values = np.asarray(duration,dtype=np.float64)
+        elif var=='cells' :
+            values = pairs_sum(pairs_weights)
+        elif kind=='sum' :
+            values = pairs_sum(pairs_values[f'{var}_sum']*pairs_weights)
+        elif kind=='mean' :
+            count = pairs_sum(pairs_values[f'{var}_count']*(pairs_weights!=0))
+            values = np.full(nb_htw,np.nan)
+            np.divide(pairs_sum(pairs_values[f'{var}_sum']*pairs_weights),count,out=values,where=count>0)
+        elif kind=='max' :
+            defined = (pairs_values[f'{var}_count']>0)*(pairs_weights!=0)
+            values = np.full(nb_htw,-np.inf)
+            np.maximum.at(values,pairs_htw[defined],pairs_values[f'{var}_max'][defined])
+            values[np.isinf(values)] = np.nan
+        primitives_values[((kind,var,weights),pop_class)] = values
+    return primitives_values
+
+def compute_heatwaves_indices(primitives_values, coeff_PL=1000, indices=list(heatwaves_indices.keys())):
+    '''This function combines the primitive aggregates computed by compute_heatwaves_primitives into the given indices of the registry.
+    It returns the dictionary {index : array of the values of the index for every heatwave}.'''
+
+    indices_values = {}
+    for index in indices :
+        if heatwaves_indices[index]['nonlinear'] :
+            pop_classes = {'high':coeff_PL,'low':1}
+        else :
+            pop_classes = {None:1}
+        indices_values[index] = 0
+        for pop_class,coeff in pop_classes.items() :
+            values = coeff
+            for term in heatwaves_indices[index]['terms'] :
+                values = values*primitives_values[(term,pop_class)]
+            indices_values[index] = indices_values[index]+values
+    return indices_values
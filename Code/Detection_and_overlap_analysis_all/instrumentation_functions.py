@@ -0,0 +1,233 @@
+#%%
+import os #read data directories
+import sys
+import time
+import json #run reports
+import functools
+import threading #sampling profiler
+import cProfile
+import inspect #parameters of the instrumented stages
+from collections import Counter
+from datetime import datetime #date of the run reports
+import pathlib
+import netCDF4 as nc #count the netCDF reads
+import pandas as pd #handle dataframes
+
+import storage_functions
+from storage_functions import temporary_path, commit_file
+
+#%%
+#Instrumentation of the stages : every function decorated with instrument_stage records, for each call, a dictionary with its wall and CPU time, peak RSS,
+#the bytes read and written per file, the number of netCDF read calls and the cache hits and misses (see storage_functions.notify_file_event).
+#The records of the process are gathered in stage_records, and written as a run report (JSON and CSV) by write_run_report.
+stage_records = []
+
+#'profiler' : None, 'cprofile' (deterministic, one .prof file per stage, to open with pstats or snakeviz) or 'sampling' (the stack of the stage is sampled every
+#'sampling_interval' seconds and written as collapsed stacks, one .folded file per stage, to open with flamegraph.pl or speedscope). The files are written in 'profile_dir'.
+instrumentation_settings = {'profiler':None, 'sampling_interval':0.005, 'profile_dir':os.path.join("Output","run_reports","profiles")}
+
+active_records = [] #records of the stages running in this process (a stage called by another stage is recorded in both)
+
+#%%
+class VariableReadCounter:
+    '''This class wraps a netCDF variable of a file opened for reading : each read (variable[...]) is notified as a 'netcdf_read' event with the number of bytes read,
+    everything else is delegated to the netCDF variable.'''
+
+    def __init__(self, variable, path):
+        self.__dict__['_variable'] = variable
+        self.__dict__['_path'] = path
+
+    def __getitem__(self, item):
+        values = self._variable[item]
+        storage_functions.notify_file_event('netcdf_read',self._path,getattr(values,'nbytes',0))
+        return values
+
+    def __array__(self, *args, **kwargs):
+        return self[:].__array__(*args,**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._variable,name)
+
+    def __setattr__(self, name, value):
+        setattr(self._variable,name,value)
+
+    def __len__(self):
+        return len(self._variable)
+
+netcdf_dataset = nc.Dataset
+
+def counted_dataset(*args, **kwargs):
+    '''This function opens a netCDF file as netCDF4.Dataset does, the variables of the files opened for reading being wrapped by VariableReadCounter.'''
+
+    dataset = netcdf_dataset(*args,**kwargs)
+    if kwargs.get('mode',args[1] if len(args)>1 else 'r')=='r' :
+        for name, variable in dataset.variables.items() : #the dictionary of the variables cannot be replaced, but it can be modified
+            dataset.variables[name] = VariableReadCounter(variable,dataset.filepath())
+    return dataset
+
+#%%
+def peak_rss_reset():
+    '''This function resets the peak resident set size of the process, if the system allows it (Linux), so that the peak of each stage is measured. It returns True if the peak was reset.'''
+
+    if os.name == 'posix' and os.path.exists("/proc/self/clear_refs") :
+        try :
+            with open("/proc/self/clear_refs",'w') as f :
+                f.write('5')
+            return True
+        except OSError :
+            return False
+    return False
+
+def peak_rss():
+    '''This function returns the peak resident set size of the process in MB (since the last peak_rss_reset on Linux, since the start of the process otherwise).'''
+
+    if os.path.exists("/proc/self/status") :
+        with open("/proc/self/status") as f :
+            for line in f :
+                if line.startswith('VmHWM:') :
+                    return int(line.split()[1])/1024
+    if os.name == 'posix' :
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024 #kB on Linux
+    return float('nan')
+
+def process_io():
+    '''This function returns the bytes read and written by the process (all the files, including the ones not tracked by the stages), where the system provides them (Linux).'''
+
+    counters = {}
+    if os.path.exists("/proc/self/io") :
+        with open("/proc/self/io") as f :
+            for line in f :
+                name, value = line.split(':')
+                counters[name] = int(value)
+    return counters.get('rchar',0), counters.get('wchar',0)
+
+#%%
+class SamplingProfiler:
+    '''This class samples the call stack of a thread every interval seconds in a background thread, and counts the collapsed stacks (functions separated by ;).'''
+
+    def __init__(self, interval, thread_id):
+        self.interval = interval
+        self.thread_id = thread_id
+        self.stacks = Counter()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run,daemon=True)
+
+    def run(self):
+        while self.stop_event.wait(self.interval)==False :
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None :
+                stack.append(f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self, output_path):
+        self.stop_event.set()
+        self.thread.join()
+        with open(output_path,'w') as f :
+            for stack, count in self.stacks.most_common() :
+                f.write(f"{stack} {count}\n")
+
+#%%
+def record_file_event(event, path, nbytes=0):
+    '''This function adds a file event (see storage_functions.notify_file_event) to the records of the running stages.'''
+
+    for record in active_records :
+        file_record = record['files'].setdefault(path,{'bytes_read':0, 'bytes_written':0, 'netcdf_read_calls':0})
+        if event in ('read','netcdf_read') :
+            file_record['bytes_read'] += nbytes
+            record['bytes_read'] += nbytes
+        if event=='netcdf_read' :
+            file_record['netcdf_read_calls'] += 1
+            record['netcdf_read_calls'] += 1
+        elif event=='write' :
+            file_record['bytes_written'] += nbytes
+            record['bytes_written'] += nbytes
+        elif event=='cache_hit' :
+            record['cache_hits'] += 1
+        elif event=='cache_miss' :
+            record['cache_misses'] += 1
+    return
+
+def instrument_stage(function):
+    '''This decorator instruments a stage function : each call adds a record to stage_records (see write_run_report for its fields), and is profiled if instrumentation_settings['profiler'] is set.'''
+
+    signature = inspect.signature(function)
+
+    @functools.wraps(function)
+    def instrumented(*args, **kwargs):
+        arguments = signature.bind(*args,**kwargs)
+        arguments.apply_defaults()
+        record = {'stage':function.__name__, 'params':dict(arguments.arguments), 'start':datetime.now().isoformat(timespec='seconds'), 'status':'running',
+                  'wall_time':0., 'cpu_time':0., 'peak_rss_mb':0., 'bytes_read':0, 'bytes_written':0, 'netcdf_read_calls':0, 'cache_hits':0, 'cache_misses':0,
+                  'peak_rss_of_stage':False, 'process_bytes_read':0, 'process_bytes_written':0, 'profile':None, 'files':{}}
+        outermost = len(active_records)==0
+        if outermost : #the observers are installed once, for the stage called first
+            storage_functions.file_observers.append(record_file_event)
+            nc.Dataset = counted_dataset
+            rss_reset = peak_rss_reset()
+        active_records.append(record)
+        profiler = instrumentation_settings['profiler'] if outermost else None
+        if profiler is not None :
+            pathlib.Path(instrumentation_settings['profile_dir']).mkdir(parents=True,exist_ok=True)
+            record['profile'] = os.path.join(instrumentation_settings['profile_dir'],f"{function.__name__}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{os.getpid()}"+{'cprofile':'.prof','sampling':'.folded'}[profiler])
+            if profiler=='cprofile' :
+                stage_profiler = cProfile.Profile()
+                stage_profiler.enable()
+            else :
+                stage_profiler = SamplingProfiler(instrumentation_settings['sampling_interval'],threading.get_ident())
+                stage_profiler.start()
+        rchar, wchar = process_io()
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        try :
+            result = function(*args,**kwargs)
+            record['status'] = 'ok'
+            return result
+        except BaseException :
+            record['status'] = 'error'
+            raise
+        finally :
+            record['wall_time'] = time.perf_counter()-wall_start
+            record['cpu_time'] = time.process_time()-cpu_start
+            rchar_end, wchar_end = process_io()
+            record['process_bytes_read'], record['process_bytes_written'] = rchar_end-rchar, wchar_end-wchar
+            if profiler=='cprofile' :
+                stage_profiler.disable()
+                stage_profiler.dump_stats(record['profile'])
+            elif profiler=='sampling' :
+                stage_profiler.stop(record['profile'])
+            active_records.remove(record)
+            if outermost :
+                storage_functions.file_observers.remove(record_file_event)
+                nc.Dataset = netcdf_dataset
+                record['peak_rss_mb'] = peak_rss()
+                record['peak_rss_of_stage'] = rss_reset #False if the peak could not be reset : it is then the peak of the process so far
+            else :
+                record['peak_rss_mb'] = float('nan') #the peak of a nested stage is included in the one of the stage calling it
+            stage_records.append(record)
+    return instrumented
+
+#%%
+def write_run_report(records=None, report_path=None, **run_info):
+    '''This function writes the run report of the stage records (default stage_records, the records of this process) in JSON (every field, with the bytes read and written per file)
+    and in CSV (one row per stage call, without the per file details, the parameters being prefixed by params.). run_info (for instance nb_workers) is added to the JSON report.
+    report_path is the path of the report without extension (default Output/run_reports/run_report_{date}). It returns the paths of the JSON and CSV reports.'''
+
+    if records is None :
+        records = stage_records
+    if report_path is None :
+        report_path = os.path.join("Output","run_reports",f"run_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    pathlib.Path(report_path).parents[0].mkdir(parents=True, exist_ok=True)
+    report = {'created':datetime.now().isoformat(timespec='seconds'), 'host':os.uname().nodename if os.name == 'posix' else os.environ.get('COMPUTERNAME',''),
+              'cpu_count':os.cpu_count(), **run_info, 'stages':records}
+    with open(temporary_path(report_path+'.json'),'w') as f :
+        json.dump(report,f,indent=1,default=str)
+    commit_file(report_path+'.json')
+    df_report = pd.json_normalize([{key:value for key,value in record.items() if key!='files'} for record in records])
+    df_report.to_csv(temporary_path(report_path+'.csv'),index=False)
+    commit_file(report_path+'.csv')
+    return report_path+'.json', report_path+'.csv'
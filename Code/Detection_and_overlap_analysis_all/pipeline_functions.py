@@ -0,0 +1,249 @@
+#%%
+import os #read data directories
+import itertools #parameters sweep
+import inspect #arguments of the stage functions
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED #run independent stages in parallel
+
+from detection_overlap_functions import compute_climatology_smooth, compute_distrib_percentile, select_scale_jja, detect_potential_heatwaves, cc3d_scan_heatwaves, analyse_impact_overlap, undetected_heatwaves_animation
+from analysis_classification_plot_functions import compute_Russo_HWMId, create_heatwaves_indices_database, compute_heatwaves_indices_scores, plot_heatwaves_distribution, analysis_top_detected_events
+from data_preprocessing_functions import load_emdat_event_table, load_hammond_event_table, load_population_cube
+from storage_functions import read_table, write_manifest, check_manifest
+from instrumentation_functions import instrumentation_settings, stage_records, write_run_report
+
+#%%
+name_dict_anomaly = {True : 'anomaly', False : 'absolute'}
+name_dict_threshold = {True : 'th', False : 'C'} #If relative threshold, value is a percentile; if absolute threshold, value is in °C
+
+def datadir():
+    if os.name == 'posix' :
+        return "Data/"
+    return os.environ["DATADIR"]
+
+def scan_suffix(p):
+    #suffix shared by the files of the detected heatwaves
+    return f"{p['nb_days']}days_before_scan_{p['year_beg']}_{p['year_end']}_{p['threshold_value']}{name_dict_threshold[p['relative_threshold']]}_{p['distrib_window_size']}days_window_climatology_{p['year_beg_climatology']}_{p['year_end_climatology']}"
+
+def output_dir(p):
+    return os.path.join("Output",p['database'],f"{p['datavar']}_{p['daily_var']}",f"{p['database']}_{p['datavar']}_{p['daily_var']}_{name_dict_anomaly[p['anomaly']]}_JJA_{scan_suffix(p)}")
+
+def var_dir(p):
+    return os.path.join(datadir(),p['database'],p['datavar'])
+
+def distrib_path(p):
+    return os.path.join(var_dir(p),f"distrib_{p['database']}_{p['datavar']}_{p['daily_var']}_{name_dict_anomaly[p['anomaly']]}_{p['year_beg_climatology']}_{p['year_end_climatology']}_{p['threshold_value']}th_threshold_{p['distrib_window_size']}days.nc")
+
+def load_dates_converter():
+    #Excel table of the day indices of leap and non leap years, read by the climatology, percentile and JJA stages
+    return read_table(os.path.join(datadir(),"Dates_converter.xlsx"))
+
+def load_emdat_table():
+    #EM-DAT heatwaves table (not merged by event), read by create_heatwaves_indices_database
+    return read_table(os.path.join(datadir(),"GDIS_EM-DAT","EMDAT_Europe-1950-2022-heatwaves.xlsx"))
+
+def jja_lock(p):
+    #select_scale_jja also writes the not scaled JJA file, that does not depend on the threshold and is read by compute_Russo_HWMId : these stages must not run at the same time for the same file
+    return ('jja_not_scaled',p['database'],p['datavar'],p['daily_var'],p['anomaly'],p['year_beg'],p['year_end'],p['year_beg_climatology'],p['year_end_climatology'],p['distrib_window_size'])
+
+def summary_lock(p):
+    #analysis_top_detected_events reads, updates and rewrites the sensitivity summary shared by all the parameters sets : these stages must not run at the same time
+    return ('sensitivity_summary',)
+
+#%%
+#Stages registry
+#Each stage produces one artifact, keyed by exactly the parameters it depends on ('params') : two parameters sets sharing these values share the artifact, which is computed once.
+#'options' are passed to the function but do not change the artifact. 'output' is the path of the artifact (the stage is run if it has no valid manifest, see stage_is_cached),
+#'requires' the list of (stage, parameters overrides) needed to compute it, 'lock' (optional) a key of the files shared with other stages, that cannot run at the same time,
+#and 'tables' (optional) the shared tables it reads (see shared_tables).
+common_params = ('database','datavar','daily_var','year_beg','year_end','year_beg_climatology','year_end_climatology')
+distrib_params = common_params+('anomaly','distrib_window_size')
+jja_params = distrib_params+('threshold_value','relative_threshold')
+scan_params = jja_params+('nb_days',)
+overlap_params = scan_params+('flex_time_span',)
+indices_params = overlap_params+('count_all_impacts','threshold_NL','coeff_PL','pop_interpolation')
+
+pipeline_stages = {
+    'climatology' : {'function':compute_climatology_smooth, 'params':common_params,
+                     'output':lambda p: os.path.join(var_dir(p),f"{p['database']}_{p['datavar']}_{p['daily_var']}_daily_avg_{p['year_beg_climatology']}_{p['year_end_climatology']}_smoothed.nc"),
+                     'requires':lambda p: [], 'tables':('dates_converter',)},
+    'distrib_percentile' : {'function':compute_distrib_percentile, 'params':distrib_params+('threshold_value',),
+                            'output':distrib_path,
+                            'requires':lambda p: [('climatology',{})]*p['anomaly'], 'tables':('dates_converter',)},
+    'select_scale_jja' : {'function':select_scale_jja, 'params':jja_params,
+                          'output':lambda p: os.path.join(var_dir(p),f"{p['database']}_{p['datavar']}_{p['daily_var']}_{name_dict_anomaly[p['anomaly']]}_JJA_{p['year_beg']}_{p['year_end']}_scaled_{p['threshold_value']}{name_dict_threshold[p['relative_threshold']]}_{p['distrib_window_size']}days_window_climatology_{p['year_beg_climatology']}_{p['year_end_climatology']}.nc"),
+                          'requires':lambda p: [('climatology',{})]*p['anomaly']+[('distrib_percentile',{})]*p['relative_threshold'], 'tables':('dates_converter',),
+                          'lock':jja_lock},
+    'potential_heatwaves' : {'function':detect_potential_heatwaves, 'params':scan_params,
+                             'output':lambda p: os.path.join(var_dir(p),"Detection_Heatwave",f"potential_heatwaves_{p['database']}_{p['datavar']}_{p['daily_var']}_{name_dict_anomaly[p['anomaly']]}_{scan_suffix(p)}.nc"),
+                             'requires':lambda p: [('select_scale_jja',{})]},
+    'cc3d_scan' : {'function':cc3d_scan_heatwaves, 'params':scan_params, 'options':('run_animation','excel_export'),
+                   'output':lambda p: os.path.join(var_dir(p),"Detection_Heatwave",f"detected_heatwaves_{p['database']}_{p['datavar']}_{p['daily_var']}_{name_dict_anomaly[p['anomaly']]}_JJA_{scan_suffix(p)}.nc"),
+                   'requires':lambda p: [('potential_heatwaves',{})]},
+    'impact_overlap' : {'function':analyse_impact_overlap, 'params':overlap_params,
+                        'output':lambda p: os.path.join(output_dir(p),f"emdat_detected_heatwaves_{p['database']}_{p['datavar']}_{p['daily_var']}_{name_dict_anomaly[p['anomaly']]}_{p['threshold_value']}{name_dict_threshold[p['relative_threshold']]}_flex_time_{p['flex_time_span']}_days.txt"),
+                        'requires':lambda p: [('cc3d_scan',{})], 'tables':('emdat_events',)},
+    'undetected_animation' : {'function':undetected_heatwaves_animation, 'params':overlap_params,
+                              'output':lambda p: os.path.join(output_dir(p),f"maps_undetected_htws_flex_{p['flex_time_span']}_ds"),
+                              'requires':lambda p: [('impact_overlap',{})], 'tables':('emdat_events',)},
+    'Russo_HWMId' : {'function':compute_Russo_HWMId, 'params':distrib_params,
+                     'output':lambda p: os.path.join(var_dir(p),f"Russo_HWMId_{p['database']}_{p['datavar']}_{p['daily_var']}_{name_dict_anomaly[p['anomaly']]}_{p['year_beg_climatology']}_{p['year_end_climatology']}_{p['distrib_window_size']}days.nc.nc"),
+                     'requires':lambda p: [('distrib_percentile',{'threshold_value':25}),('distrib_percentile',{'threshold_value':75}),('select_scale_jja',{})],
+                     'lock':jja_lock},
+    'heatwaves_indices' : {'function':create_heatwaves_indices_database, 'params':indices_params, 'options':('excel_export',),
+                           'output':lambda p: os.path.join(output_dir(p),f"df_htws_detected{'_count_all_impacts'*p['count_all_impacts']}_flex_time_{p['flex_time_span']}days.parquet"),
+                           'requires':lambda p: [('impact_overlap',{}),('Russo_HWMId',{})], 'tables':('population_cube','emdat_table')},
+    'indices_scores' : {'function':compute_heatwaves_indices_scores, 'params':indices_params, 'options':('excel_export',),
+                        'output':lambda p: os.path.join(output_dir(p),f"df_scores{'_count_all_impacts'*p['count_all_impacts']}_flex_time_span_{p['flex_time_span']}_days.parquet"),
+                        'requires':lambda p: [('heatwaves_indices',{})]},
+    'distribution_plots' : {'function':plot_heatwaves_distribution, 'params':indices_params, 'options':('label_placement',),
+                            'output':lambda p: os.path.join(output_dir(p),f"figs_flex_time_span_{p['flex_time_span']}",f"distrib{'_count_all_impacts'*p['count_all_impacts']}"),
+                            'requires':lambda p: [('indices_scores',{})]},
+    'top_events' : {'function':analysis_top_detected_events, 'params':indices_params+('nb_top_events',), 'options':('excel_export',),
+                    'output':lambda p: os.path.join(output_dir(p),f"top_{p['nb_top_events']}_events_overlap{'_count_all_impacts'*p['count_all_impacts']}_flex_time_{p['flex_time_span']}days.xlsx"),
+                    'requires':lambda p: [('indices_scores',{})], 'tables':('hammond_events',),
+                    'lock':summary_lock},
+    }
+
+#Tables shared by the stages of several parameters sets, keyed by the parameters of their loader ('params'), which (re)creates the file of the table if it is missing or outdated
+#(including the Parquet copies of the Excel input tables, see storage_functions.read_table). They are built by run_pipeline before the stages are run in parallel (see prepare_shared_tables),
+#so that the stages run in parallel only read them, and the table of every stage declaring it in 'tables' is up to date.
+shared_tables = {
+    'dates_converter' : {'function':load_dates_converter, 'params':()},
+    'emdat_table' : {'function':load_emdat_table, 'params':()},
+    'emdat_events' : {'function':load_emdat_event_table, 'params':('year_beg','year_end','flex_time_span')},
+    'hammond_events' : {'function':load_hammond_event_table, 'params':('year_beg',)},
+    'population_cube' : {'function':load_population_cube, 'params':('database',)},
+    }
+
+#%%
+def check_parameters(p):
+    '''This function checks the consistency of a set of parameters of the detection and overlap analysis.'''
+
+    if p['distrib_window_size']%2==0:
+        raise ValueError('distrib_window_size is even. It has to be odd so the window can be centered on the computed day.')
+    if p['relative_threshold']==False and p['anomaly']==True:
+        raise ValueError("Using an absolute threshold can only work by working on absolute values, and not anomalies. The parameter 'anomaly' should be set to False.")
+    if p['relative_threshold']==False and p['threshold_value']>=60 and p['threshold_value']<100 :
+        raise ValueError("It seems that the value given for the threshold is a percentile and not an absolute value, but the parameter 'relative_threshold' is set to False.")
+    return
+
+def sweep_parameters(base_params, **sweep):
+    '''This function returns the list of the parameters sets of a sensitivity sweep : every combination of the values given in sweep (for instance datavar=['t2m','wbgt']), the other parameters being taken from base_params.'''
+
+    return [base_params|dict(zip(sweep.keys(),values)) for values in itertools.product(*sweep.values())]
+
+def stage_key(stage, p):
+    '''This function returns the key of the artifact of a stage for the parameters set p : the stage name and the values of the parameters the artifact depends on.'''
+
+    return (stage,)+tuple((name,p[name]) for name in pipeline_stages[stage]['params'])
+
+def stage_params(stage, p):
+    '''This function returns the dictionary of the parameters the artifact of a stage depends on, recorded in its manifest.'''
+
+    return {name:p[name] for name in pipeline_stages[stage]['params']}
+
+def stage_inputs(stage, p):
+    '''This function returns the paths of the artifacts of the stages required by a stage, whose fingerprints are recorded in its manifest.'''
+
+    return [pipeline_stages[required_stage]['output'](p|overrides) for required_stage, overrides in pipeline_stages[stage]['requires'](p)]
+
+def stage_is_cached(stage, p):
+    '''This function returns True if the artifact of a stage can be reused : it was completed by run_stage with the same parameters, and neither the artifact nor its inputs changed since (see check_manifest).
+    Artifacts without manifest (written before the manifests were introduced, or by an interrupted run) are computed again.'''
+
+    return check_manifest(pipeline_stages[stage]['output'](p),stage_params(stage,p),stage_inputs(stage,p))
+
+def build_pipeline_graph(targets, params_list, overwrite_files=False):
+    '''This function builds the graph of the stages needed to produce the target stages for every parameters set of params_list.
+    Stages whose artifact is cached (see stage_is_cached) are not run, unless overwrite_files is True or one of the stages they require is run.
+    It returns the dictionary {key : {'stage', 'params', 'requires' (set of keys)}} of the stages to run, each artifact appearing once whatever the number of parameters sets sharing it.'''
+
+    graph, cached = {}, set()
+    def add_stage(stage, p) :
+        key = stage_key(stage,p)
+        if key in graph :
+            return key
+        if key in cached :
+            return None
+        required_keys = set()
+        for required_stage, overrides in pipeline_stages[stage]['requires'](p) :
+            required_key = add_stage(required_stage,p|overrides)
+            if required_key is not None :
+                required_keys.add(required_key)
+        if overwrite_files==False and len(required_keys)==0 and stage_is_cached(stage,p) :
+            cached.add(key)
+            return None
+        graph[key] = {'stage':stage, 'params':p, 'requires':required_keys}
+        return key
+
+    for p in params_list :
+        check_parameters(p)
+        for stage in targets :
+            add_stage(stage,p)
+    return graph
+
+def prepare_shared_tables(graph):
+    '''This function builds (if missing or outdated) the shared tables read by the stages of the graph (see shared_tables), each one once whatever the number of stages reading it.'''
+
+    tables = {(table,)+tuple(node['params'][name] for name in shared_tables[table]['params']) for node in graph.values() for table in pipeline_stages[node['stage']].get('tables',())}
+    for table, *values in sorted(tables,key=str) :
+        shared_tables[table]['function'](**dict(zip(shared_tables[table]['params'],values)))
+    return
+
+def run_stage(stage, p, profiler=None):
+    '''This function runs a stage with the parameters set p, then writes the manifest of its artifact. It is a top-level function so that it can be run in a process pool.
+    profiler is the profiler of the stage (see instrumentation_settings). It returns the instrumentation records of the stage (see instrument_stage).'''
+
+    print(f"\n Running {pipeline_stages[stage]['function'].__name__}... \n")
+    instrumentation_settings['profiler'] = profiler
+    nb_records = len(stage_records)
+    function = pipeline_stages[stage]['function']
+    arguments = inspect.signature(function).parameters #the parameters keying the artifact of a downstream stage (such as coeff_PL for the scores) are not all arguments of its function
+    function(**{name:p[name] for name in pipeline_stages[stage]['params']+pipeline_stages[stage].get('options',()) if name in arguments})
+    write_manifest(pipeline_stages[stage]['output'](p),stage_params(stage,p),stage_inputs(stage,p)) #only reached if the stage completed
+    return stage_records[nb_records:]
+
+def run_pipeline(targets, params_list, nb_workers=1, overwrite_files=False, profiler=None, report_path=None):
+    '''This function runs the stages needed to produce the target stages for every parameters set of params_list (see build_pipeline_graph).
+    A stage is run once all the stages it requires are done. If nb_workers>1, the independent stages are run in parallel in a pool of nb_workers processes,
+    once the shared tables they read are built (see prepare_shared_tables).
+    The instrumentation records of the stages are written in a run report (see write_run_report, report_path being its path without extension), the stages being profiled if profiler is set ('cprofile' or 'sampling').
+    It returns the list of the keys of the stages run, in the order of their completion.'''
+
+    graph = build_pipeline_graph(targets,params_list,overwrite_files=overwrite_files)
+    print(f"{len(graph)} stages to run")
+    done, running, completed, records = set(), {}, [], []
+    def ready_stages() :
+        locks = {pipeline_stages[graph[key]['stage']]['lock'](graph[key]['params']) for key in running.values() if 'lock' in pipeline_stages[graph[key]['stage']]}
+        for key, node in graph.items() :
+            if key in done or key in running.values() or node['requires']-done :
+                continue
+            lock = pipeline_stages[node['stage']]['lock'](node['params']) if 'lock' in pipeline_stages[node['stage']] else None
+            if lock is not None and lock in locks :
+                continue
+            locks.add(lock)
+            yield key
+
+    try :
+        if nb_workers<=1 :
+            while len(done)<len(graph) :
+                key = next(ready_stages())
+                records += run_stage(graph[key]['stage'],graph[key]['params'],profiler)
+                done.add(key)
+                completed.append(key)
+            return completed
+
+        prepare_shared_tables(graph)
+        with ProcessPoolExecutor(max_workers=nb_workers) as executor :
+            while len(done)<len(graph) :
+                for key in list(ready_stages())[:nb_workers-len(running)] :
+                    running[executor.submit(run_stage,graph[key]['stage'],graph[key]['params'],profiler)] = key
+                finished, _ = wait(running,return_when=FIRST_COMPLETED)
+                for future in finished :
+                    records += future.result() #raise the exception of the stage, if any
+                    key = running.pop(future)
+                    done.add(key)
+                    completed.append(key)
+        return completed
+    finally : #the report is also written if a stage failed, with the stages completed so far
+        if len(records)>0 :
+            write_run_report(records,report_path,targets=targets,nb_workers=nb_workers,nb_params_sets=len(params_list),stages_to_run=len(graph),stages_run=len(completed))
@@ -8,4 +8,19 @@ import sys,os #read inputs
 import pandas as pd #handle dataframes
 import pathlib #check existence and create folders
 
-from data_preprocessing_functions import *
\ No newline at end of file
+from data_preprocessing_functions import *
+#%%
+year_beg = 1950 #beginning of the studied period, default 1950
+year_end = 2021 #end of the studied period, default 2021
+flex_time_span = 7 #In order to account for potential EM-DAT imprecisions, set a flexibility window of flex_time_span days, default value is 7
+
+#EM-DAT/GDIS formatting : typed event tables, reused by every stage of the detection and overlap analysis
+print("\n Running create_emdat_event_table... \n")
+create_emdat_event_table(year_beg=year_beg, year_end=year_end, flex_time_span=flex_time_span)
+print("\n Running create_hammond_event_table... \n")
+create_hammond_event_table(year_beg=year_beg)
+
+#GHS-POP formatting : all population epochs stacked in a single file
+for database in ['ERA5','E-OBS'] :
+    print(f"\n Running create_population_cube for {database}... \n")
+    create_population_cube(database=database)
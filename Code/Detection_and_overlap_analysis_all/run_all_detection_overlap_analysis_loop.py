@@ -10,6 +10,7 @@ import pathlib #check existence and create folders
 
 from detection_overlap_functions import *
 from analysis_classification_plot_functions import *
+from pipeline_functions import sweep_parameters, run_pipeline
 #%%
 # wbgt absolute thresholds : [25,26,28,30,33]
 # utci absolute thresholds : [26,32,38,46]
@@ -43,75 +44,26 @@ threshold_NL = 1000 #threshold for testing non-linearity in population, in ppl/k
 coeff_PL = 1000 #coefficient for testing non linearity: grid points exceeding thershold_NL will be multiplied by coeff_PL, default 1000
 
 count_all_impacts=True
+excel_export=False #If True, Excel copies of the intermediate tables (detected heatwaves, indices, scores, sensitivity summary) are also written as reports, default False
 #normalize_impact_country=False
 #normalize_impact_affected_region=False
 
 nb_top_events=10 #number of top detected events to look for in the litterature
 
-for datavar in ['t2m','wbgt','utci']:
-    for daily_var in ['tx','tg','tn']:
-        for threshold_value in [95,90]:
-            for nb_days in [3,5] :
-                if distrib_window_size%2==0:
-                    raise ValueError('distrib_window_size is even. It has to be odd so the window can be centered on the computed day.')
-                if relative_threshold==False and anomaly==True:
-                    raise ValueError("Using an absolute threshold can only work by working on absolute values, and not anomalies. The parameter 'anomaly' should be set to False.")
-                if relative_threshold==False and threshold_value>=60 and threshold_value<100 :
-                    raise ValueError("It seems that the value given for the threshold is a percentile and not an absolute value, but the parameter 'relative_threshold' is set to False.")
-
-                overwrite_files=False #If True, overwrite output files that already exists (may be relevant in case of code or data update)
-                # if overwrite_file is True or if output file does not exist : call function ; else pass
-                if (overwrite_files or os.path.exists(os.path.join(datadir,database,datavar,f"{database}_{datavar}_{daily_var}_daily_avg_{year_beg_climatology}_{year_end_climatology}_smoothed.nc"))==False) and anomaly==True: #Only used for anomaly computation
-                    print("\n Running compute_climatology_smooth... \n")
-                    compute_climatology_smooth(database=database, datavar=datavar, daily_var=daily_var, year_beg=year_beg, year_end=year_end, year_beg_climatology=year_beg_climatology, year_end_climatology=year_end_climatology)
-
-                if (overwrite_files or os.path.exists(os.path.join(datadir,database,datavar,f"distrib_{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_{year_beg_climatology}_{year_end_climatology}_{threshold_value}th_threshold_{distrib_window_size}days.nc"))==False) and relative_threshold==True :#Only used for relative thresholds
-                    print("\n Running compute_distrib_percentile... \n")
-                    compute_distrib_percentile(database=database, datavar=datavar, daily_var=daily_var, year_beg=year_beg, year_end=year_end, threshold_value=threshold_value, year_beg_climatology=year_beg_climatology, year_end_climatology=year_end_climatology, distrib_window_size=distrib_window_size, anomaly=anomaly)
-
-                if overwrite_files or os.path.exists(os.path.join(datadir,database,datavar,f"{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_JJA_{year_beg}_{year_end}_scaled_{threshold_value}{name_dict_threshold[relative_threshold]}_{distrib_window_size}days_window_climatology_{year_beg_climatology}_{year_end_climatology}.nc"))==False :
-                    print("\n Running select_scale_jja... \n")
-                    select_scale_jja(database=database, datavar=datavar, daily_var=daily_var, year_beg=year_beg, year_end=year_end, threshold_value=threshold_value, year_beg_climatology=year_beg_climatology, year_end_climatology=year_end_climatology, distrib_window_size=distrib_window_size,anomaly=anomaly, relative_threshold=relative_threshold)
-
-                if overwrite_files or os.path.exists(os.path.join(datadir,database,datavar,"Detection_Heatwave",f"potential_heatwaves_{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_{nb_days}days_before_scan_{year_beg}_{year_end}_{threshold_value}{name_dict_threshold[relative_threshold]}_{distrib_window_size}days_window_climatology_{year_beg_climatology}_{year_end_climatology}.nc"))==False :
-                    print("\n Running detect_potential_heatwaves... \n")
-                    detect_potential_heatwaves(database=database, datavar=datavar, daily_var=daily_var, year_beg=year_beg, year_end=year_end, threshold_value=threshold_value, year_beg_climatology=year_beg_climatology, year_end_climatology=year_end_climatology, distrib_window_size=distrib_window_size, nb_days=nb_days, anomaly=anomaly, relative_threshold=relative_threshold)
-
-                if overwrite_files or os.path.exists(os.path.join(datadir,database,datavar,"Detection_Heatwave",f"detected_heatwaves_{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_JJA_{nb_days}days_before_scan_{year_beg}_{year_end}_{threshold_value}{name_dict_threshold[relative_threshold]}_{distrib_window_size}days_window_climatology_{year_beg_climatology}_{year_end_climatology}.nc"))==False :
-                    print("\n Running cc3d_scan_heatwaves... \n")
-                    cc3d_scan_heatwaves(database=database, datavar=datavar, daily_var=daily_var, year_beg=year_beg, year_end=year_end, threshold_value=threshold_value, year_beg_climatology=year_beg_climatology, year_end_climatology=year_end_climatology, distrib_window_size=distrib_window_size, nb_days=nb_days, run_animation=run_animation, anomaly=anomaly, relative_threshold=relative_threshold)
-
-                if overwrite_files or os.path.exists(os.path.join("Output",database,f"{datavar}_{daily_var}" ,f"{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_JJA_{nb_days}days_before_scan_{year_beg}_{year_end}_{threshold_value}{name_dict_threshold[relative_threshold]}_{distrib_window_size}days_window_climatology_{year_beg_climatology}_{year_end_climatology}",f"emdat_detected_heatwaves_{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_{threshold_value}{name_dict_threshold[relative_threshold]}_flex_time_{flex_time_span}_days.txt"))==False :
-                    print("\n Running analyse_impact_overlap... \n")
-                    analyse_impact_overlap(database=database, datavar=datavar, daily_var=daily_var, year_beg=year_beg, year_end=year_end, threshold_value=threshold_value, year_beg_climatology=year_beg_climatology, year_end_climatology=year_end_climatology, distrib_window_size=distrib_window_size, nb_days=nb_days, flex_time_span=flex_time_span, anomaly=anomaly, relative_threshold=relative_threshold)
-
-                if overwrite_files or os.path.exists(os.path.join("Output",database,f"{datavar}_{daily_var}",f"{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_JJA_{nb_days}days_before_scan_{year_beg}_{year_end}_{threshold_value}{name_dict_threshold[relative_threshold]}_{distrib_window_size}days_window_climatology_{year_beg_climatology}_{year_end_climatology}",f"maps_undetected_htws_flex_{flex_time_span}_ds"))==False :
-                    print("\n Running undetected_heatwaves_animation... \n")
-                    undetected_heatwaves_animation(database=database, datavar=datavar, daily_var=daily_var, year_beg=year_beg, year_end=year_end, threshold_value=threshold_value, year_beg_climatology=year_beg_climatology, year_end_climatology=year_end_climatology, distrib_window_size=distrib_window_size, nb_days=nb_days, flex_time_span=flex_time_span, anomaly=anomaly, relative_threshold=relative_threshold)
-
-                #compute 25th and 75th distribution percentile for Russo_HWMId calculation.
-                if overwrite_files or os.path.exists(os.path.join(datadir,database,datavar,f"distrib_{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_{year_beg_climatology}_{year_end_climatology}_{25}th_threshold_{distrib_window_size}days.nc"))==False :
-                    print("\n Running compute_distrib_ano_percentile... \n")
-                    compute_distrib_percentile(database=database, datavar=datavar, daily_var=daily_var, year_beg=year_beg, year_end=year_end, threshold_value=25, year_beg_climatology=year_beg_climatology, year_end_climatology=year_end_climatology, distrib_window_size=distrib_window_size, anomaly=anomaly)
-                if overwrite_files or os.path.exists(os.path.join(datadir,database,datavar,f"distrib_{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_{year_beg_climatology}_{year_end_climatology}_{75}th_threshold_{distrib_window_size}days.nc"))==False :
-                    print("\n Running compute_distrib_ano_percentile... \n")
-                    compute_distrib_percentile(database=database, datavar=datavar, daily_var=daily_var, year_beg=year_beg, year_end=year_end, threshold_value=75, year_beg_climatology=year_beg_climatology, year_end_climatology=year_end_climatology, distrib_window_size=distrib_window_size, anomaly=anomaly)
-                if overwrite_files or os.path.exists(os.path.join(datadir,database,datavar,f"Russo_HWMId_{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_{year_beg_climatology}_{year_end_climatology}_{distrib_window_size}days.nc.nc"))==False :
-                    print("\n Running compute_Russo_HWMId... \n")
-                    compute_Russo_HWMId(database=database, datavar=datavar, daily_var=daily_var, year_beg=year_beg, year_end=year_end, year_beg_climatology=year_beg_climatology, year_end_climatology=year_end_climatology, distrib_window_size=distrib_window_size, anomaly=anomaly)
-
-                if overwrite_files or os.path.exists(os.path.join("Output",database,f"{datavar}_{daily_var}",f"{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_JJA_{nb_days}days_before_scan_{year_beg}_{year_end}_{threshold_value}{name_dict_threshold[relative_threshold]}_{distrib_window_size}days_window_climatology_{year_beg_climatology}_{year_end_climatology}",f"df_htws_detected{'_count_all_impacts'*count_all_impacts}_flex_time_{flex_time_span}days.xlsx"))==False :
-                    print("\n Running create_heatwaves_indices_database... \n")
-                create_heatwaves_indices_database(database=database, datavar=datavar, daily_var=daily_var, year_beg=year_beg, year_end=year_end, threshold_value=threshold_value, year_beg_climatology=year_beg_climatology, year_end_climatology=year_end_climatology, distrib_window_size=distrib_window_size,count_all_impacts=count_all_impacts, anomaly=anomaly, relative_threshold=relative_threshold, threshold_NL=threshold_NL, coeff_PL=coeff_PL, nb_days=nb_days)#,normalize_impact_country=normalize_impact_country,normalize_impact_affected_region=normalize_impact_affected_region)
-
-                if overwrite_files or os.path.exists(os.path.join("Output",database,f"{datavar}_{daily_var}",f"{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_JJA_{nb_days}days_before_scan_{year_beg}_{year_end}_{threshold_value}{name_dict_threshold[relative_threshold]}_{distrib_window_size}days_window_climatology_{year_beg_climatology}_{year_end_climatology}",f"df_scores{'_count_all_impacts'*(count_all_impacts)}_flex_time_span_{flex_time_span}_days.xlsx"))==False :
-                    print("\n Running compute_heatwaves_indices_scores... \n")
-                compute_heatwaves_indices_scores(database=database, datavar=datavar, daily_var=daily_var, year_beg=year_beg, year_end=year_end, threshold_value=threshold_value, year_beg_climatology=year_beg_climatology, year_end_climatology=year_end_climatology, distrib_window_size=distrib_window_size,count_all_impacts=count_all_impacts, anomaly=anomaly, relative_threshold=relative_threshold, nb_days=nb_days)#,normalize_impact_country=normalize_impact_country,normalize_impact_affected_region=normalize_impact_affected_region)
-
-                if overwrite_files or os.path.exists(os.path.join("Output",database,f"{datavar}_{daily_var}",f"{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_JJA_{nb_days}days_before_scan_{year_beg}_{year_end}_{threshold_value}{name_dict_threshold[relative_threshold]}_{distrib_window_size}days_window_climatology_{year_beg_climatology}_{year_end_climatology}",f"figs_flex_time_span_{flex_time_span}",f"distrib{'_count_all_impacts'*count_all_impacts}"))==False :
-                    print("\n Running plot_heatwaves_distribution... \n")
-                plot_heatwaves_distribution(database=database, datavar=datavar, daily_var=daily_var, year_beg=year_beg, year_end=year_end, threshold_value=threshold_value, year_beg_climatology=year_beg_climatology, year_end_climatology=year_end_climatology, distrib_window_size=distrib_window_size,count_all_impacts=count_all_impacts, anomaly=anomaly, relative_threshold=relative_threshold, nb_days=nb_days)#,normalize_impact_country=normalize_impact_country,normalize_impact_affected_region=normalize_impact_affected_region)
-
-                if overwrite_files or os.path.exists(os.path.join("Output",database,f"{datavar}_{daily_var}",f"{database}_{datavar}_{daily_var}_{name_dict_anomaly[anomaly]}_JJA_{nb_days}days_before_scan_{year_beg}_{year_end}_{threshold_value}{name_dict_threshold[relative_threshold]}_{distrib_window_size}days_window_climatology_{year_beg_climatology}_{year_end_climatology}",f"top_{nb_top_events}_events_overlap{'_count_all_impacts'*count_all_impacts}_flex_time_{flex_time_span}days.xlsx"))==False :
-                    print("\n Running analysis_top_detected_events... \n")
-                analysis_top_detected_events(database=database, datavar=datavar, daily_var=daily_var, year_beg=year_beg, year_end=year_end, threshold_value=threshold_value, year_beg_climatology=year_beg_climatology, year_end_climatology=year_end_climatology, distrib_window_size=distrib_window_size,count_all_impacts=count_all_impacts,nb_top_events=nb_top_events, anomaly=anomaly, relative_threshold=relative_threshold, nb_days=nb_days)#,normalize_impact_country=normalize_impact_country,normalize_impact_affected_region=normalize_impact_affected_region)
\ No newline at end of file
+pop_interpolation=False #If True, the population density of each year is linearly interpolated between the GHS-POP epochs, default False
+label_placement='adjust_text' #'adjust_text' or 'fast' (deterministic placement of the labels of the distribution figures), default 'adjust_text'
+overwrite_files=False #If True, overwrite output files that already exists (may be relevant in case of code or data update)
+nb_workers=4 #number of processes running the independent stages in parallel, default 4
+profiler=None #None, 'cprofile' or 'sampling' : profile of each stage, written in Output/run_reports/profiles next to the run report (wall and CPU time, I/O, peak memory and cache hits of each stage), default None
+
+#Each stage is run once for the parameters its output depends on (see pipeline_functions) : for instance the climatology is shared by all the thresholds and durations,
+#and the thresholds by all the durations. Stages whose output is complete and up to date (see stage_is_cached) are not run again, unless overwrite_files is True.
+base_params = {'database':database, 'datavar':datavar, 'daily_var':daily_var, 'year_beg':year_beg, 'year_end':year_end, 'year_beg_climatology':year_beg_climatology, 'year_end_climatology':year_end_climatology,
+               'anomaly':anomaly, 'nb_days':nb_days, 'relative_threshold':relative_threshold, 'threshold_value':threshold_value, 'distrib_window_size':distrib_window_size, 'run_animation':run_animation,
+               'flex_time_span':flex_time_span, 'threshold_NL':threshold_NL, 'coeff_PL':coeff_PL, 'count_all_impacts':count_all_impacts, 'pop_interpolation':pop_interpolation,
+               'excel_export':excel_export, 'nb_top_events':nb_top_events, 'label_placement':label_placement}
+params_list = sweep_parameters(base_params, datavar=['t2m','wbgt','utci'], daily_var=['tx','tg','tn'], threshold_value=[95,90], nb_days=[3,5])
+targets = ['impact_overlap','undetected_animation','heatwaves_indices','indices_scores','distribution_plots','top_events']
+
+if __name__ == '__main__' :
+    run_pipeline(targets, params_list, nb_workers=nb_workers, overwrite_files=overwrite_files, profiler=profiler)
@@ -0,0 +1,29 @@
+#%%
+import pandas as pd #handle dataframes
+
+from benchmark_functions import run_benchmark, compare_benchmarks
+from pipeline_functions import pipeline_stages
+#%%
+size = 'small' #'small' (33x41 grid points, 20 years), 'medium' (81x101 grid points, 30 years) or 'full' (ERA5 Europe grid, 1950-2021), default 'small'
+database = 'ERA5' # 'ERA5' or 'E-OBS', default value is 'ERA5'
+datavar = 't2m' # 't2m', 'wbgt' or 'utci' for ERA5 ; 't2m' for 'E-OBS', default value is 't2m'
+daily_var = 'tg' # 'tg', 'tn' or 'tx' (mean, min, max), default value is 'tg'
+targets = list(pipeline_stages.keys()) #stages to benchmark (with the stages they require), default all the stages
+nb_repeats = 3 #number of benchmark runs, the comparison uses the median of the runs of each revision, default 3
+nb_workers = 1 #number of processes running the stages, default 1 (the timings of the stages are not disturbed by each other)
+profiler = None #None, 'cprofile' or 'sampling' : profile of each stage, written next to the run reports of Benchmark/{size}/Output/run_reports, default None
+seed = 0 #seed of the synthetic dataset, default 0
+
+#The synthetic dataset is written once in Benchmark/{size}, every run appends its timings to Benchmark/benchmark_history.csv with the git revision of the code.
+#Run this script on two commits to compare them : the wall time of each stage is compared with the previous benchmarked revision.
+if __name__ == '__main__' :
+    for k in range(nb_repeats) :
+        print(f'Benchmark run {k+1}/{nb_repeats}')
+        run_benchmark(size,targets,database,datavar,daily_var,nb_workers=nb_workers,profiler=profiler,seed=seed)
+    try :
+        df_comparison = compare_benchmarks(size=size)
+        with pd.option_context('display.max_columns',None,'display.width',200) :
+            print(f"Revision {df_comparison.attrs['revision'][:10]} compared to {df_comparison.attrs['reference'][:10]} :")
+            print(df_comparison)
+    except ValueError as error : #first benchmarked revision
+        print(error)
@@ -0,0 +1,25 @@
+#%%
+import pandas as pd #handle dataframes
+
+from equivalence_functions import run_equivalence
+#%%
+reference = 'HEAD' #git revision (or directory of the code) of the reference implementation, default 'HEAD' (last commit)
+candidate = '.' #git revision (or directory of the code) of the candidate implementation, default '.' (working tree, run this script from the code directory)
+size = 'small' #'small', 'medium' or 'full' synthetic dataset (see synthetic_data_functions), default 'small'
+database = 'ERA5' # 'ERA5' or 'E-OBS', default value is 'ERA5'
+datavar = 't2m' # 't2m', 'wbgt' or 'utci' for ERA5 ; 't2m' for 'E-OBS', default value is 't2m'
+daily_var = 'tg' # 'tg', 'tn' or 'tx' (mean, min, max), default value is 'tg'
+targets = ['indices_scores','top_events'] #stages to compare (with the stages they require), default the stages of the detection and of the indices
+seed = 0 #seed of the synthetic dataset, default 0
+
+#Both implementations are run on the same synthetic inputs in Benchmark/equivalence_{size}, and every output file of the stages is compared (see equivalence_functions).
+#The differences are written in equivalence_differences.csv (one row per file and variable or column) and summarized per stage in equivalence_summary.csv.
+if __name__ == '__main__' :
+    df_differences, df_summary = run_equivalence(reference,candidate,size,targets,database,datavar,daily_var,seed=seed)
+    with pd.option_context('display.max_columns',None,'display.width',200) :
+        print(df_summary)
+        df_drift = df_differences[df_differences['status'].isin(['drift','missing'])]
+        if len(df_drift)>0 :
+            print(df_drift)
+        else :
+            print(f"The outputs of the stages of {candidate} are equivalent to the ones of {reference}.")
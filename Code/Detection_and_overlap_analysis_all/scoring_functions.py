@@ -0,0 +1,159 @@
+#%%
+import warnings
+import numpy as np
+from scipy import stats
+
+#%%
+def rank_rows(values):
+    '''This function returns the average ranks (ties get the mean of their ranks, starting at 1) of each row of the 2D array values, all the rows being ranked at once.'''
+
+    return stats.rankdata(values,method='average',axis=1)
+
+def batch_pearson(impact, meteo):
+    '''This function computes at once the linear regression of every row of the 2D array meteo (one row per meteorological criterion) against the 1D array impact, as stats.linregress(impact, meteo[k]) would.
+    It returns the Pearson correlation coefficients, the two-sided p-values (Student t distribution with n-2 degrees of freedom), the slopes and the intercepts.'''
+
+    TINY = 1.0e-20
+    n = len(impact)
+    impact_c = impact-np.mean(impact)
+    meteo_c = meteo-np.mean(meteo,axis=1,keepdims=True)
+    ssxm = np.mean(impact_c**2)
+    ssym = np.mean(meteo_c**2,axis=1)
+    ssxym = meteo_c@impact_c/n
+    with np.errstate(divide='ignore',invalid='ignore') :
+        r = np.clip(ssxym/np.sqrt(ssxm*ssym),-1,1)
+        r[(ssxm==0)|(ssym==0)] = np.nan
+        slope = ssxym/ssxm
+        intercept = np.mean(meteo,axis=1)-slope*np.mean(impact)
+        if n==2 : #only two points, the fit is exact
+            pvalue = np.where(meteo[:,0]==meteo[:,1],1.0,0.0)
+        else :
+            t = r*np.sqrt((n-2)/((1.0-r+TINY)*(1.0+r+TINY)))
+            pvalue = 2*stats.t.sf(np.abs(t),n-2)
+    return r, pvalue, slope, intercept
+
+def batch_spearman(impact, meteo):
+    '''This function computes at once the Spearman correlation coefficients between the 1D array impact and every row of the 2D array meteo, as the Pearson correlation of their average ranks.'''
+
+    impact_ranks = rank_rows(impact[np.newaxis,:])[0]
+    meteo_ranks = rank_rows(meteo)
+    return batch_pearson(impact_ranks,meteo_ranks)[0]
+
+def batch_kendall(impact, meteo):
+    '''This function computes at once the Kendall tau-b coefficients between the 1D array impact and every row of the 2D array meteo, from the sign matrices of the pairwise differences.
+    tau-b = sum(sign(dx)*sign(dy)) / sqrt(number of pairs not tied in x * number of pairs not tied in y), as stats.kendalltau.'''
+
+    impact_signs = np.sign(impact[:,np.newaxis]-impact[np.newaxis,:]).astype(np.int8) #(n,n)
+    with np.errstate(invalid='ignore') : #the criteria with non-finite values get NaN scores (see batch_scores)
+        meteo_signs = np.sign(meteo[:,:,np.newaxis]-meteo[:,np.newaxis,:]).astype(np.int8) #(criteria,n,n)
+    concordance = (meteo_signs*impact_signs).sum(axis=(1,2),dtype=np.int64) #concordant minus discordant pairs, each pair being counted twice
+    untied_impact = np.count_nonzero(impact_signs)
+    untied_meteo = np.count_nonzero(meteo_signs,axis=(1,2))
+    with np.errstate(divide='ignore',invalid='ignore') :
+        tau = concordance/np.sqrt(untied_impact*untied_meteo.astype(np.float64))
+    return np.clip(tau,-1,1)
+
+def batch_roc_auc(extreme_bool, meteo):
+    '''This function computes at once the ROC AUC of every row of the 2D array meteo (scores of the computed heatwaves) for the 1D boolean array extreme_bool (labels of the computed heatwaves),
+    with the Mann-Whitney U statistic computed from the average ranks (ties count for one half, as metrics.roc_auc_score). The AUC is NaN if only one class is present.'''
+
+    extreme_bool = np.asarray(extreme_bool,dtype=bool)
+    nb_pos = np.count_nonzero(extreme_bool)
+    nb_neg = len(extreme_bool)-nb_pos
+    if nb_pos==0 or nb_neg==0 :
+        return np.full(len(meteo),np.nan)
+    meteo_ranks = rank_rows(meteo)
+    return (meteo_ranks[:,extreme_bool].sum(axis=1)-nb_pos*(nb_pos+1)/2)/(nb_pos*nb_neg)
+
+def batch_scores(impact, extreme_meteo, extreme_bool, computed_meteo):
+    '''This function computes the scores of all the meteorological criteria at once.
+    impact is the impact of the extreme heatwaves (1D array), extreme_meteo the criteria of the extreme heatwaves (2D array, one row per criterion),
+    extreme_bool the extreme flag of the computed heatwaves and computed_meteo the criteria of the computed heatwaves (one row per criterion).
+    It returns a dictionary of 1D arrays (one value per criterion) : 'r_pearson', 'pvalue', 'slope', 'intercept', 'r_spearman', 'kendall_tau' and 'roc_auc'.
+    Criteria with non-finite values get NaN scores.'''
+
+    impact = np.asarray(impact,dtype=np.float64)
+    extreme_meteo = np.asarray(extreme_meteo,dtype=np.float64)
+    computed_meteo = np.asarray(computed_meteo,dtype=np.float64)
+    r_pearson, pvalue, slope, intercept = batch_pearson(impact,extreme_meteo)
+    scores = {'r_pearson':r_pearson, 'pvalue':pvalue, 'slope':slope, 'intercept':intercept,
+              'r_spearman':batch_spearman(impact,extreme_meteo),
+              'kendall_tau':batch_kendall(impact,extreme_meteo),
+              'roc_auc':batch_roc_auc(extreme_bool,computed_meteo)}
+    undefined = ~np.isfinite(extreme_meteo).all(axis=1) | (~np.isfinite(impact).all())
+    for key in scores :
+        if key=='roc_auc' :
+            scores[key][~np.isfinite(computed_meteo).all(axis=1)] = np.nan
+        else :
+            scores[key][undefined] = np.nan
+    return scores
+
+#%%
+def resample_counts(rng, n, nb_resamples):
+    '''This function draws nb_resamples resamples with replacement of n elements, and returns the number of times each element is drawn in each resample (2D float array of shape (nb_resamples, n)).'''
+
+    draws = rng.integers(0,max(n,1),size=(nb_resamples,n))+n*np.arange(nb_resamples)[:,np.newaxis]
+    return np.bincount(draws.ravel(),minlength=nb_resamples*n).reshape(nb_resamples,n).astype(np.float64)
+
+def bootstrap_scores(impact, meteo, extreme_bool, nb_resamples=10000, confidence=0.95, seed=0, chunk_size=1000):
+    '''This function estimates by bootstrap the uncertainty of the scores of all the meteorological criteria at once.
+    meteo is the 2D array of the criteria of the computed heatwaves (one row per criterion), extreme_bool the extreme flag of the computed heatwaves and impact the impact of the extreme heatwaves (in the order of meteo[:,extreme_bool]).
+    The bootstrap is stratified : each resample draws with replacement as many extreme (and non extreme) heatwaves as in the data, so that the ROC AUC is always defined.
+    A resample is represented by the number of times each heatwave is drawn (see resample_counts), so that the scores of all the resamples of a chunk are weighted sums computed with matrix products :
+    the Pearson correlation from weighted moments, the ROC AUC (Mann-Whitney U) from the cumulative sum of the weights of the non extreme heatwaves sorted by criterion.
+    It returns a dictionary of 1D arrays (one value per criterion) : the bounds of the confidence interval of 'r_pearson', 'roc_auc' and 'Global_score' (keys f'{score}_low' and f'{score}_high'),
+    and the rank stability of the Global_score : 'prob_best' (probability to be the best criterion) and 'mean_rank' (mean rank, 1 being the best). Criteria with non-finite values get NaN.'''
+
+    impact = np.asarray(impact,dtype=np.float64)
+    meteo = np.asarray(meteo,dtype=np.float64)
+    extreme_bool = np.asarray(extreme_bool,dtype=bool)
+    nb_criteria = len(meteo)
+    rng = np.random.default_rng(seed)
+    pos_meteo = meteo[:,extreme_bool] #(criteria, extreme heatwaves)
+    neg_meteo = meteo[:,~extreme_bool] #(criteria, non extreme heatwaves)
+    nb_pos, nb_neg = pos_meteo.shape[1], neg_meteo.shape[1]
+    valid = np.isfinite(meteo).all(axis=1) & np.isfinite(impact).all()
+
+    #Pearson : centered data (the correlation does not depend on the centering, but the weighted moments are more accurate)
+    x = impact-np.mean(impact)
+    y = pos_meteo-np.mean(pos_meteo,axis=1,keepdims=True)
+    #ROC AUC : non extreme heatwaves sorted once per criterion, and position of each extreme heatwave among them (left and right of the ties)
+    neg_order = np.argsort(neg_meteo,axis=1,kind='stable')
+    neg_sorted = np.take_along_axis(neg_meteo,neg_order,axis=1)
+    below_idx = np.array([np.searchsorted(neg_sorted[k],pos_meteo[k],side='left') for k in range(nb_criteria)])
+    tied_idx = np.array([np.searchsorted(neg_sorted[k],pos_meteo[k],side='right') for k in range(nb_criteria)])
+
+    r_pearson = np.full((nb_criteria,nb_resamples),np.nan)
+    roc_auc = np.full((nb_criteria,nb_resamples),np.nan)
+    for start in range(0,nb_resamples,chunk_size) :
+        nb_chunk = min(chunk_size,nb_resamples-start)
+        w_pos = resample_counts(rng,nb_pos,nb_chunk) #(resamples, extreme heatwaves)
+        w_neg = resample_counts(rng,nb_neg,nb_chunk) #(resamples, non extreme heatwaves)
+        #weighted moments of all the criteria for all the resamples of the chunk
+        mean_x = w_pos@x/nb_pos
+        mean_y = w_pos@y.T/nb_pos #(resamples, criteria)
+        var_x = w_pos@x**2/nb_pos-mean_x**2
+        var_y = w_pos@(y**2).T/nb_pos-mean_y**2
+        cov_xy = w_pos@(x*y).T/nb_pos-mean_x[:,np.newaxis]*mean_y
+        with np.errstate(divide='ignore',invalid='ignore') :
+            r_pearson[:,start:start+nb_chunk] = np.clip(cov_xy/np.sqrt(var_x[:,np.newaxis]*var_y),-1,1).T
+        if nb_pos>0 and nb_neg>0 :
+            neg_cumsum = np.zeros((nb_chunk,nb_neg+1))
+            for k in range(nb_criteria) :
+                np.cumsum(w_neg[:,neg_order[k]],axis=1,out=neg_cumsum[:,1:]) #weight of the non extreme heatwaves below each position
+                below = neg_cumsum[:,below_idx[k]]
+                tied = neg_cumsum[:,tied_idx[k]]-below
+                roc_auc[k,start:start+nb_chunk] = np.sum(w_pos*(below+0.5*tied),axis=1)/(nb_pos*nb_neg)
+    global_score = np.sqrt(np.abs(r_pearson*roc_auc))
+
+    results = {}
+    alpha = (1-confidence)/2
+    for name, score in [('r_pearson',r_pearson),('roc_auc',roc_auc),('Global_score',global_score)] :
+        with warnings.catch_warnings() : #criteria without any defined score give NaN bounds
+            warnings.simplefilter('ignore',RuntimeWarning)
+            results[f'{name}_low'], results[f'{name}_high'] = np.nanpercentile(np.where(valid[:,np.newaxis],score,np.nan),[100*alpha,100*(1-alpha)],axis=1)
+    #rank of each criterion in each resample, according to the Global_score (undefined scores are ranked last)
+    ranks = stats.rankdata(-np.where(valid[:,np.newaxis]&np.isfinite(global_score),global_score,-np.inf),method='min',axis=0)
+    results['prob_best'] = np.where(valid,np.mean(ranks==1,axis=1),np.nan)
+    results['mean_rank'] = np.where(valid,np.mean(ranks,axis=1),np.nan)
+    return results
@@ -0,0 +1,148 @@
+#%%
+import os #read data directories
+import pandas as pd #handle dataframes
+import pathlib
+import json #manifests of the stage outputs
+import hashlib #fingerprints of the input files
+import threading #temporary files of each writer
+from datetime import datetime #creation date of the manifests
+
+#%%
+#Observers of the file operations : functions called with (event, path, nbytes) on every committed output file ('write'), table or netCDF read ('read', 'netcdf_read')
+#and cache lookup ('cache_hit', 'cache_miss'). They are registered by the instrumentation of the stages (see instrumentation_functions).
+file_observers = []
+
+def notify_file_event(event, path, nbytes=0):
+    for observer in file_observers :
+        observer(event,path,nbytes)
+    return
+
+#%%
+def table_path(path, extension='.parquet'):
+    '''This function returns the path of a table with its extension replaced (default .parquet, the working format of the stage-to-stage tables).'''
+
+    return os.path.splitext(path)[0]+extension
+
+def write_table(df, path, excel_export=False):
+    '''This function writes a table in the Parquet working format, next to the given path (whatever its extension, it is replaced by .parquet).
+    Object columns are converted to their inferred type so that Parquet keeps the dtypes (columns mixing numbers and strings are stored as strings). If excel_export is True, an Excel copy (.xlsx) is also written as a report.'''
+
+    pathlib.Path(path).parents[0].mkdir(parents=True, exist_ok=True) #create output directory and parent directories if necessary
+    df = df.infer_objects()
+    for col in df.columns[df.dtypes==object] :
+        if pd.api.types.infer_dtype(df[col],skipna=True).startswith('mixed') :
+            df[col] = df[col].where(df[col].isna(),df[col].astype(str))
+    if excel_export : #written before the Parquet file, so that read_table does not consider the Excel copy as more recent
+        df.to_excel(temporary_path(table_path(path,'.xlsx')))
+        commit_file(table_path(path,'.xlsx'))
+    df.to_parquet(temporary_path(table_path(path)))
+    commit_file(table_path(path))
+    return
+
+def read_table(path, **excel_kwargs):
+    '''This function reads a table written by write_table (the extension of path is replaced by .parquet).
+    If there is no Parquet version, or if the Excel version (.xlsx) is more recent (for instance an input table edited by hand, such as EM-DAT), the Excel file is read with excel_kwargs (default header=0, index_col=0)
+    and converted to Parquet, so that the following reads are fast.'''
+
+    parquet_path = table_path(path)
+    excel_path = table_path(path,'.xlsx')
+    if os.path.exists(excel_path) and (os.path.exists(parquet_path)==False or os.path.getmtime(parquet_path)<os.path.getmtime(excel_path)) :
+        notify_file_event('cache_miss',parquet_path)
+        notify_file_event('read',excel_path,os.path.getsize(excel_path))
+        df = pd.read_excel(excel_path,**({'header':0,'index_col':0}|excel_kwargs))
+        write_table(df,parquet_path)
+        return df
+    notify_file_event('read',parquet_path,os.path.getsize(parquet_path))
+    return pd.read_parquet(parquet_path)
+
+#%%
+#Atomic writes : a stage writes each output file to temporary_path(path), then commit_file(path) flushes it to the disk and renames it to path.
+#A crashed or killed run can only leave a temporary file, never a truncated file at the final path.
+#The temporary path is specific to the process and thread writing the file, so that two writers of the same file (for instance two stages run in parallel) never share it : the last one committed wins.
+def temporary_path(path):
+    '''This function returns the temporary path an output file is written to before commit_file (same directory and extension, so that the writers recognize the format),
+    made unique to the writing process and thread.'''
+
+    root, extension = os.path.splitext(path)
+    return f"{root}.tmp.{os.getpid()}.{threading.get_ident()}{extension}"
+
+def commit_file(path):
+    '''This function flushes the temporary file of path to the disk (fsync) and renames it to path atomically (os.replace), replacing any previous version.'''
+
+    tmp_path = temporary_path(path)
+    with open(tmp_path,'rb+') as f :
+        os.fsync(f.fileno())
+    os.replace(tmp_path,path)
+    notify_file_event('write',path,os.path.getsize(path))
+    if os.name == 'posix' : #the renaming itself is made durable by syncing the directory
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)),os.O_RDONLY)
+        try :
+            os.fsync(dir_fd)
+        finally :
+            os.close(dir_fd)
+    return
+
+#%%
+#Manifests : once a stage is complete, a manifest (path + '.manifest.json') records its parameters and the fingerprints of its output and input files.
+#A cached output is only trusted if its manifest is complete and still matches the output, the parameters and the inputs.
+def manifest_path(path):
+    return path+'.manifest.json'
+
+fingerprints_cache = {} #{(path, size, modification time) : fingerprint}, so that a file checked by several stages is only hashed once
+
+def hash_file(path, size, full_hash_size, block_size):
+    '''This function returns the SHA-256 hash of a file of the given size (see file_fingerprint).'''
+
+    sha = hashlib.sha256()
+    with open(path,'rb') as f :
+        if size<=full_hash_size :
+            for block in iter(lambda: f.read(block_size),b'') :
+                sha.update(block)
+        else :
+            sha.update(f.read(block_size))
+            f.seek(size-block_size)
+            sha.update(f.read(block_size))
+    return sha.hexdigest()
+
+def file_fingerprint(path, full_hash_size=256*2**20, block_size=16*2**20):
+    '''This function returns a fingerprint of a file (or of the files of a directory) : its size and the SHA-256 hash of its content.
+    Files larger than full_hash_size are only hashed on their first and last block_size bytes (with their size), which detects truncated and rewritten files without reading gigabytes of data.'''
+
+    if os.path.isdir(path) :
+        files = sorted(os.listdir(path))
+        return {'files':len(files), 'size':sum(os.path.getsize(os.path.join(path,name)) for name in files if os.path.isfile(os.path.join(path,name)))}
+    stat = os.stat(path)
+    if (path,stat.st_size,stat.st_mtime_ns) not in fingerprints_cache :
+        fingerprints_cache[(path,stat.st_size,stat.st_mtime_ns)] = {'size':stat.st_size, 'sha256':hash_file(path,stat.st_size,full_hash_size,block_size)}
+    return fingerprints_cache[(path,stat.st_size,stat.st_mtime_ns)]
+
+def write_manifest(path, params, inputs=()):
+    '''This function writes (atomically) the manifest of the output path of a complete stage, with the parameters params (dictionary) and the fingerprints of the output and of the input files.'''
+
+    manifest = {'output':os.path.basename(path), 'params':params, 'output_fingerprint':file_fingerprint(path),
+                'inputs':{input_path:file_fingerprint(input_path) for input_path in inputs if os.path.exists(input_path)},
+                'created':datetime.now().isoformat(timespec='seconds'), 'complete':True}
+    with open(temporary_path(manifest_path(path)),'w') as f :
+        json.dump(manifest,f,indent=1,default=str)
+    commit_file(manifest_path(path))
+    return manifest
+
+def check_manifest(path, params, inputs=()):
+    '''This function returns True if the output path of a stage can be reused : it exists, its manifest is complete,
+    and the output, the parameters and the input files still match the ones recorded in the manifest.'''
+
+    if os.path.exists(path)==False or os.path.exists(manifest_path(path))==False :
+        return False
+    try :
+        with open(manifest_path(path)) as f :
+            manifest = json.load(f)
+    except ValueError : #unreadable manifest
+        return False
+    if manifest.get('complete')!=True or manifest.get('params')!=json.loads(json.dumps(params,default=str)) :
+        return False
+    if manifest.get('output_fingerprint')!=file_fingerprint(path) :
+        return False
+    for input_path in inputs :
+        if os.path.exists(input_path)==False or manifest['inputs'].get(input_path)!=file_fingerprint(input_path) :
+            return False
+    return True
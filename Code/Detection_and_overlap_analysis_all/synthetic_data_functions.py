@@ -0,0 +1,311 @@
+#%%
+import numpy as np
+import netCDF4 as nc #load and write netcdf data
+from datetime import date, timedelta, datetime #create file history with creation date
+from tqdm import tqdm #create a user-friendly feedback while script is running
+import os #read data directories
+import json
+import pandas as pd #handle dataframes
+import pathlib
+from scipy import ndimage #spatially correlated noise
+
+from data_preprocessing_functions import country_dict, dict_country_labels, pop_epochs
+from storage_functions import temporary_path, commit_file
+
+#%%
+#Synthetic inputs of the detection and overlap analysis, written with the names, variables and units the stages expect, in a root directory (the working directory of the stages, containing Data/ and Output/).
+#They are meant for benchmarks and equivalence tests (see benchmark_functions), not for science : the heatwaves are injected in a seasonal cycle with spatially correlated noise,
+#and the EM-DAT (and Hammond) events are drawn from the injected heatwaves.
+#'years' is the studied period (also used as climatology), 'lat' and 'lon' the bounds of the grid, at the resolution of the database.
+synthetic_sizes = {'test' : {'years':(1950,1959), 'lat':(50.,46.25), 'lon':(0.,7.75)}, #16x32 ERA5 grid points, for the regression tests
+                   'small' : {'years':(1950,1969), 'lat':(50.,42.), 'lon':(0.,10.)},
+                   'medium' : {'years':(1950,1979), 'lat':(60.,40.), 'lon':(-5.,20.)},
+                   'full' : {'years':(1950,2021), 'lat':(72.,34.), 'lon':(-25.,45.)}} #ERA5 Europe grid and period
+
+resolution_dict = {"ERA5" : "0.25", "E-OBS" : "0.1"}
+long_name_dict = {'utci' : 'Universal Thermal Climate Index', 't2m' : '2 meters temperature', 'wbgt':'Wet Bulb Globe Temperature (Brimicombe et al., 2023)'}
+#mean value (at 45°N) and amplitude of the seasonal cycle of each variable, in the units of the database (K for ERA5 t2m and utci, °C otherwise)
+synthetic_climate = {'t2m' : {'mean':284., 'amplitude':9., 'noise':3.}, 'utci' : {'mean':284., 'amplitude':11., 'noise':4.}, 'wbgt' : {'mean':11., 'amplitude':8., 'noise':2.5}}
+daily_var_offset = {'tn':-5., 'tg':0., 'tx':5.}
+
+def synthetic_grid(size='small', database='ERA5'):
+    '''This function returns the latitudes (decreasing, as ERA5) and longitudes of the synthetic grid of a size of synthetic_sizes.'''
+
+    resolution = float(resolution_dict[database])
+    lat_bounds, lon_bounds = synthetic_sizes[size]['lat'], synthetic_sizes[size]['lon']
+    lat = np.linspace(lat_bounds[0],lat_bounds[1],int(round(abs(lat_bounds[0]-lat_bounds[1])/resolution))+1)
+    lon = np.linspace(lon_bounds[0],lon_bounds[1],int(round(abs(lon_bounds[1]-lon_bounds[0])/resolution))+1)
+    return lat, lon
+
+def write_synthetic_map(path, lat, lon, name, values, units='', fill_value=None, time_values=None):
+    '''This function writes a (lat, lon) map, or a (time, lat, lon) cube if time_values is given, in a NETCDF4_CLASSIC file.'''
+
+    pathlib.Path(path).parents[0].mkdir(parents=True, exist_ok=True)
+    nc_file_out = nc.Dataset(temporary_path(path),mode='w',format='NETCDF4_CLASSIC')
+    dims = ('lat','lon')
+    if time_values is not None :
+        nc_file_out.createDimension('time', len(time_values))
+        time = nc_file_out.createVariable('time', np.int32, ('time',))
+        time[:] = time_values
+        dims = ('time',)+dims
+    nc_file_out.createDimension('lat', len(lat))
+    nc_file_out.createDimension('lon', len(lon))
+    nc_file_out.title = f"Synthetic {name} for benchmarks"
+    nc_file_out.history = "Created with synthetic_data_functions.py on " +datetime.today().strftime("%d/%m/%y")
+    lat_var = nc_file_out.createVariable('lat', np.float32, ('lat',))
+    lat_var.units = 'degrees_north'
+    lat_var[:] = lat
+    lon_var = nc_file_out.createVariable('lon', np.float32, ('lon',))
+    lon_var.units = 'degrees_east'
+    lon_var[:] = lon
+    output_var = nc_file_out.createVariable(name, np.float32, dims, fill_value=fill_value)
+    output_var.units = units
+    output_var[:] = values
+    nc_file_out.close()
+    commit_file(path)
+    return
+
+#%%
+def create_synthetic_masks(rng, lat, lon, database='ERA5'):
+    '''This function writes the land-sea mask and the country masks (1 outside of the area, 0 inside, as the original masks) of a synthetic grid.
+    Land is a smoothed random field covering about 70% of the grid, and the land points are shared between the countries of dict_country_labels by nearest random centers.
+    It returns the land-sea mask and the (lat, lon) map of the country identifiers (0 at sea).'''
+
+    if os.name == 'posix' :
+        datadir = "Data/"
+    else :
+        datadir = os.environ["DATADIR"]
+    resolution = resolution_dict[database]
+
+    land_field = ndimage.gaussian_filter(rng.normal(size=(len(lat),len(lon))),sigma=max(2,len(lat)/10))
+    land_sea_mask = (land_field<np.quantile(land_field,0.3)).astype(np.float32) #1 at sea
+    countries = list(dict_country_labels.keys())
+    centers = np.column_stack([rng.integers(0,len(lat),len(countries)),rng.integers(0,len(lon),len(countries))])
+    lat_idx, lon_idx = np.meshgrid(np.arange(len(lat)),np.arange(len(lon)),indexing='ij')
+    nearest = np.argmin((lat_idx[:,:,np.newaxis]-centers[:,0])**2+(lon_idx[:,:,np.newaxis]-centers[:,1])**2,axis=2)
+    country_map = np.where(land_sea_mask==0,np.array([dict_country_labels[country] for country in countries])[nearest],0)
+
+    write_synthetic_map(os.path.join(datadir,database,"Mask",f"Mask_Europe_land_only_{database}_{resolution}deg.nc"),lat,lon,'mask',land_sea_mask)
+    for country in countries :
+        write_synthetic_map(os.path.join(datadir,database,"Mask",f"Mask_{country}_{database}_{resolution}deg.nc"),lat,lon,'mask',(country_map!=dict_country_labels[country]).astype(np.float32))
+    return land_sea_mask, country_map
+
+def create_synthetic_socio_economic_maps(rng, lat, lon, years, database='ERA5'):
+    '''This function writes the GHS-POP population density maps of every epoch (log-normal density growing by 0.5% per year) and the GDP per capita maps of a synthetic grid.'''
+
+    if os.name == 'posix' :
+        datadir = "Data/"
+    else :
+        datadir = os.environ["DATADIR"]
+    resolution = resolution_dict[database]
+
+    density = np.exp(ndimage.gaussian_filter(rng.normal(size=(len(lat),len(lon))),sigma=1.5)*3+3.5) #inhabitants per km², from a few to several thousands
+    for epoch in pop_epochs :
+        write_synthetic_map(os.path.join(datadir,"Pop","GHS_POP",f"GHS_POP_{epoch}_{database}_grid_Europe.nc"),lat,lon,'Band1',density*1.005**(epoch-pop_epochs[0]),units='inhabitants per km²',fill_value=-9999.)
+    gdp = 2e4*np.exp(ndimage.gaussian_filter(rng.normal(size=(len(lat),len(lon))),sigma=3))
+    write_synthetic_map(os.path.join(datadir,database,"Socio_eco_maps",f"GDP_cap_{database}_Europe_{resolution}deg.nc"),lat,lon,'gdp_cap',
+                        np.array([gdp*1.02**(year-years[0]) for year in range(years[0],years[1]+1)]),units='US$ per capita',time_values=np.arange(years[0],years[1]+1))
+    return
+
+def draw_synthetic_heatwaves(rng, lat, lon, years, nb_per_year=1.5):
+    '''This function draws the heatwaves injected in the synthetic temperature : for each year, nb_per_year heatwaves on average on the small grid (proportionally more on larger grids) starting in JJA,
+    with their first day of the year (0 is the 1st January), duration (7 to 15 days), center, radius (in grid points, large enough to exceed the dust threshold of cc3d_scan_heatwaves) and amplitude.'''
+
+    heatwaves = []
+    for year in range(years[0],years[1]+1) :
+        first_june = (date(year,6,1)-date(year,1,1)).days
+        for k in range(max(1,rng.poisson(nb_per_year*len(lat)*len(lon)/(33*41)))) : #the heatwaves cover about 2% of the JJA days of each point, so that they exceed the 95th percentile of the climatology they are part of
+            duration = int(rng.integers(7,16))
+            heatwaves.append({'year':year, 'day_beg':first_june+int(rng.integers(0,92-duration)), 'duration':duration,
+                              'center_lat':int(rng.integers(4,len(lat)-4)), 'center_lon':int(rng.integers(4,len(lon)-4)),
+                              'radius':float(rng.uniform(6,9)), 'amplitude':float(rng.uniform(10,16))})
+    return heatwaves
+
+def create_synthetic_temperature(rng, lat, lon, years, heatwaves, database='ERA5', datavar='t2m', daily_var='tg'):
+    '''This function writes the daily cube of a variable (all the days of the period, as the ERA5 and E-OBS files) : a seasonal cycle decreasing with latitude,
+    spatially correlated noise with a one day memory (AR(1), coefficient 0.7), and the injected heatwaves (flat inside their radius, sine shaped in time).
+    The cube is written one year at a time, so that the full size does not need to fit in memory.'''
+
+    if os.name == 'posix' :
+        datadir = "Data/"
+    else :
+        datadir = os.environ["DATADIR"]
+    resolution = resolution_dict[database]
+    climate = synthetic_climate[datavar]
+    nc_out_path = os.path.join(datadir,database,datavar,f"{database}_{datavar}_{daily_var}_Europe_day_{resolution}deg_{years[0]}-{years[1]}.nc")
+    pathlib.Path(nc_out_path).parents[0].mkdir(parents=True, exist_ok=True)
+    nb_days_total = (date(years[1],12,31)-date(years[0],1,1)).days+1
+
+    nc_file_out = nc.Dataset(temporary_path(nc_out_path),mode='w',format='NETCDF4_CLASSIC')
+    nc_file_out.createDimension('time', nb_days_total)
+    nc_file_out.createDimension('lat', len(lat))
+    nc_file_out.createDimension('lon', len(lon))
+    nc_file_out.title = f"Synthetic daily {datavar} ({daily_var}) for benchmarks"
+    nc_file_out.history = "Created with synthetic_data_functions.py on " +datetime.today().strftime("%d/%m/%y")
+    lat_var = nc_file_out.createVariable('lat', np.float32, ('lat',))
+    lat_var.units = 'degrees_north'
+    lat_var[:] = lat
+    lon_var = nc_file_out.createVariable('lon', np.float32, ('lon',))
+    lon_var.units = 'degrees_east'
+    lon_var[:] = lon
+    time = nc_file_out.createVariable('time', np.int32, ('time',))
+    time.units = f'days since {years[0]}-01-01'
+    time[:] = np.arange(nb_days_total)
+    output_var = nc_file_out.createVariable(datavar, np.float32, ('time','lat','lon'), chunksizes=(1,len(lat),len(lon)))
+    output_var.units = 'K' if (datavar=='utci' or (database=='ERA5' and datavar=='t2m')) else '°C'
+    output_var.long_name = long_name_dict[datavar]
+
+    lat_idx, lon_idx = np.meshgrid(np.arange(len(lat)),np.arange(len(lon)),indexing='ij')
+    mean_map = climate['mean']+daily_var_offset[daily_var]-0.6*(lat[:,np.newaxis]-45)+np.zeros((1,len(lon))) #colder in the north
+    noise = np.zeros((len(lat),len(lon)))
+    idx_start = 0
+    for year in tqdm(range(years[0],years[1]+1)) :
+        nb_days = (date(year,12,31)-date(year,1,1)).days+1
+        values = np.zeros((nb_days,len(lat),len(lon)),dtype=np.float32)
+        for day in range(nb_days) :
+            innovation = ndimage.gaussian_filter(rng.normal(size=(len(lat),len(lon))),sigma=3)
+            noise = 0.7*noise+np.sqrt(1-0.7**2)*innovation/max(innovation.std(),1e-6)*climate['noise']
+            values[day] = mean_map+climate['amplitude']*np.cos(2*np.pi*(day-200)/365.25)+noise #warmest around the 20th July
+        for htw in heatwaves :
+            if htw['year']==year :
+                spatial = np.exp(-(((lat_idx-htw['center_lat'])**2+(lon_idx-htw['center_lon'])**2)/htw['radius']**2)**2) #flat inside the radius
+                for k in range(htw['duration']) :
+                    values[htw['day_beg']+k] += htw['amplitude']*np.sin(np.pi*(k+0.5)/htw['duration'])**0.5*spatial
+        output_var[idx_start:idx_start+nb_days,:,:] = values
+        idx_start += nb_days
+    nc_file_out.close()
+    commit_file(nc_out_path)
+    return
+
+#%%
+def create_synthetic_impact_tables(rng, heatwaves, country_map, density, years, detection_rate=0.6):
+    '''This function writes the EM-DAT heatwaves table (and its merged version) and the Hammond table, drawn from the injected heatwaves :
+    a fraction detection_rate of the heatwaves are recorded, once per country covered by their core (one disasterno per heatwave, one Dis No per country),
+    with deaths, affected people and damages increasing with the amplitude, the duration and the exposed population. 10% of the events have an unknown start day.'''
+
+    if os.name == 'posix' :
+        datadir = "Data/"
+    else :
+        datadir = os.environ["DATADIR"]
+
+    emdat_country_names = {}
+    for emdat_name, mask_country in country_dict.items() : #first EM-DAT name of each mask country
+        if mask_country is not None and mask_country not in emdat_country_names :
+            emdat_country_names[mask_country] = emdat_name
+    label_to_country = {label:country for country,label in dict_country_labels.items()}
+    lat_idx, lon_idx = np.meshgrid(np.arange(country_map.shape[0]),np.arange(country_map.shape[1]),indexing='ij')
+
+    rows, hammond_rows, event_number = [], [], {}
+    for htw in heatwaves :
+        if rng.random()>detection_rate :
+            continue
+        core = ((lat_idx-htw['center_lat'])**2+(lon_idx-htw['center_lon'])**2)<=(htw['radius']/2)**2
+        country_ids, counts = np.unique(country_map[core],return_counts=True)
+        country_ids = country_ids[(country_ids>0)&(counts>=3)]
+        if len(country_ids)==0 :
+            continue
+        event_number[htw['year']] = event_number.get(htw['year'],0)+1
+        disasterno = f"{htw['year']}-{event_number[htw['year']]:04d}"
+        start = date(htw['year'],1,1)+timedelta(days=htw['day_beg'])
+        end = start+timedelta(days=htw['duration']-1)
+        start_day_unknown = rng.random()<0.1
+        for country_id in country_ids :
+            country = label_to_country[int(country_id)]
+            exposed = float(np.sum(density[core&(country_map==country_id)]))
+            deaths = float(np.round(htw['amplitude']*htw['duration']*exposed/2e4*rng.lognormal(0,0.5)))
+            rows.append({'Dis No':f"{disasterno}-{country[:3].upper()}", 'disasterno':disasterno, 'Country':emdat_country_names[country], 'Year':htw['year'],
+                         'Start Year':start.year, 'Start Month':start.month, 'Start Day':np.nan if start_day_unknown else start.day,
+                         'End Year':end.year, 'End Month':end.month, 'End Day':np.nan if start_day_unknown else end.day,
+                         'Total Deaths':deaths if rng.random()>0.1 else np.nan, 'Total Affected':np.round(exposed*rng.uniform(0.5,5)) if rng.random()>0.5 else np.nan,
+                         "Total Damages, Adjusted ('000 US$)":np.round(exposed*htw['amplitude']*rng.uniform(0,10)) if rng.random()>0.7 else np.nan})
+            if rng.random()<0.5 :
+                hammond_rows.append({'Country':emdat_country_names[country], 'Deaths':deaths, 'Start date':pd.Timestamp(start), 'End date':pd.Timestamp(end)})
+
+    df_emdat = pd.DataFrame(rows)
+    pathlib.Path(os.path.join(datadir,"GDIS_EM-DAT")).mkdir(parents=True, exist_ok=True)
+    for name in ["EMDAT_Europe-1950-2022-heatwaves.xlsx","EMDAT_Europe-1950-2022-heatwaves_merged.xlsx"] :
+        df_emdat.to_excel(temporary_path(os.path.join(datadir,"GDIS_EM-DAT",name)))
+        commit_file(os.path.join(datadir,"GDIS_EM-DAT",name))
+    pd.DataFrame(hammond_rows).to_excel(temporary_path(os.path.join(datadir,"GDIS_EM-DAT","Lucy_Hammond_ETE_data_V2.xlsx")))
+    commit_file(os.path.join(datadir,"GDIS_EM-DAT","Lucy_Hammond_ETE_data_V2.xlsx"))
+    return df_emdat
+
+def create_dates_converter(years):
+    '''This function writes the dates converter table (number of days and index of the 1st January of each year in the daily files) of the synthetic period.'''
+
+    if os.name == 'posix' :
+        datadir = "Data/"
+    else :
+        datadir = os.environ["DATADIR"]
+
+    year_list = list(range(years[0],years[1]+1))
+    nb_days = [(date(year,12,31)-date(year,1,1)).days+1 for year in year_list]
+    df_dates = pd.DataFrame({'Nb_days':nb_days, 'Idx_start':np.cumsum([0]+nb_days[:-1]), 'Idx_end':np.cumsum(nb_days)-1},index=pd.Index(year_list,name='Year'))
+    pathlib.Path(datadir).mkdir(parents=True, exist_ok=True)
+    df_dates.to_excel(temporary_path(os.path.join(datadir,"Dates_converter.xlsx")))
+    commit_file(os.path.join(datadir,"Dates_converter.xlsx"))
+    return
+
+def create_sensitivity_summary(params_list):
+    '''This function writes the summary table of the sensitivity analysis (one row per parameters set, updated by analysis_top_detected_events).'''
+
+    summary_columns = ['database','datavar','daily_var','year_beg','year_end','year_beg_climatology','year_end_climatology','anomaly','nb_days','relative_threshold','threshold_value','distrib_window_size','flex_time_span','count_all_impacts']
+    df_summary = pd.DataFrame([{name:p[name] for name in summary_columns} for p in params_list])
+    for col in ['nb_detected_htws','emdat_undetected_htws','best_score'] :
+        df_summary[col] = np.nan
+    df_summary['best_index'] = None
+    pathlib.Path("Output").mkdir(parents=True, exist_ok=True)
+    df_summary.to_excel(temporary_path(os.path.join("Output","summary_detection_overlap_sensitivity.xlsx")))
+    commit_file(os.path.join("Output","summary_detection_overlap_sensitivity.xlsx"))
+    return
+
+#%%
+def create_synthetic_dataset(root, size='small', database='ERA5', datavar_list=('t2m',), daily_var_list=('tg',), params_list=(), seed=0):
+    '''This function writes in the directory root (created if necessary) all the inputs of the detection and overlap analysis for a synthetic dataset of a size of synthetic_sizes ('test', 'small', 'medium' or 'full') :
+    daily cubes of each variable of datavar_list and daily_var_list, dates converter, land-sea and country masks, GHS-POP population, GDP per capita, EM-DAT and Hammond tables,
+    and the sensitivity summary for the parameters sets of params_list. The description of the dataset is written in root/synthetic_dataset.json ;
+    if it already describes the same dataset, nothing is written again. It returns the description, with the injected heatwaves.'''
+
+    description = {'size':size, 'database':database, 'datavar_list':list(datavar_list), 'daily_var_list':list(daily_var_list), 'seed':seed,
+                   'params_list':[{key:value for key,value in p.items()} for p in params_list]}
+    pathlib.Path(root).mkdir(parents=True, exist_ok=True)
+    description_path = os.path.join(root,"synthetic_dataset.json")
+    if os.path.exists(description_path) :
+        with open(description_path) as f :
+            previous_description = json.load(f)
+        if {key:previous_description.get(key) for key in description}==json.loads(json.dumps(description,default=str)) :
+            return previous_description
+
+    current_dir = os.getcwd()
+    os.chdir(root) #the stages read Data/ and write Output/ in their working directory
+    try :
+        rng = np.random.default_rng(seed)
+        years = synthetic_sizes[size]['years']
+        lat, lon = synthetic_grid(size,database)
+        print(f"Synthetic {size} dataset : {len(lat)}x{len(lon)} grid points, {years[0]}-{years[1]}")
+        create_dates_converter(years)
+        land_sea_mask, country_map = create_synthetic_masks(rng,lat,lon,database)
+        create_synthetic_socio_economic_maps(rng,lat,lon,years,database)
+        density = nc.Dataset(os.path.join("Data","Pop","GHS_POP",f"GHS_POP_{pop_epochs[-1]}_{database}_grid_Europe.nc"),mode='r').variables['Band1'][:].filled(0)
+        heatwaves = draw_synthetic_heatwaves(rng,lat,lon,years)
+        for datavar in datavar_list :
+            for daily_var in daily_var_list :
+                create_synthetic_temperature(rng,lat,lon,years,heatwaves,database,datavar,daily_var)
+        create_synthetic_impact_tables(rng,heatwaves,country_map,density,years)
+        create_sensitivity_summary(params_list)
+    finally :
+        os.chdir(current_dir)
+    description['heatwaves'] = heatwaves
+    with open(temporary_path(description_path),'w') as f :
+        json.dump(description,f,indent=1,default=str)
+    commit_file(description_path)
+    return description
+
+def synthetic_params(size='small', database='ERA5', datavar='t2m', daily_var='tg'):
+    '''This function returns the parameters set of the detection and overlap analysis matching a synthetic dataset (studied and climatology periods of the size), the other parameters having their default values.'''
+
+    years = synthetic_sizes[size]['years']
+    return {'database':database, 'datavar':datavar, 'daily_var':daily_var, 'year_beg':years[0], 'year_end':years[1], 'year_beg_climatology':years[0], 'year_end_climatology':years[1],
+            'anomaly':True, 'nb_days':4, 'relative_threshold':True, 'threshold_value':95, 'distrib_window_size':15, 'run_animation':False,
+            'flex_time_span':7, 'threshold_NL':1000, 'coeff_PL':1000, 'count_all_impacts':True, 'pop_interpolation':False,
+            'excel_export':False, 'nb_top_events':10, 'label_placement':'fast'}
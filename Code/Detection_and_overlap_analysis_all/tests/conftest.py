@@ -0,0 +1,82 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# last revision computing the heatwaves indices one heatwave at a time, the reference of the regression tests
+# (another revision or a directory of the code can be given with JUICCE_BASELINE)
+BASELINE_REVISION = "66e5f449fd19a691513b8d72a360513d6f50bd52"
+BASELINE_RUNNER = (
+    "import sys, json, inspect\n"
+    "from detection_overlap_functions import analyse_impact_overlap\n"
+    "from analysis_classification_plot_functions import create_heatwaves_indices_database\n"
+    "p = json.loads(sys.argv[1])\n"
+    "for function in [analyse_impact_overlap, create_heatwaves_indices_database]:\n"
+    "    function(**{key: value for key, value in p.items() if key in inspect.signature(function).parameters})\n"
+)
+
+
+@pytest.fixture(scope="session")
+def synthetic_dataset(tmp_path_factory):
+    # 'test' synthetic dataset (16x32 grid points, 1950-1959), written once for the session
+    sdf = pytest.importorskip("synthetic_data_functions")
+    root = tmp_path_factory.mktemp("synthetic_test")
+    description = sdf.create_synthetic_dataset(str(root), size="test", seed=0)
+    return root, description
+
+
+@pytest.fixture(scope="session")
+def baseline_regression(synthetic_dataset, tmp_path_factory):
+    # outputs of analyse_impact_overlap and create_heatwaves_indices_database of the baseline and of the current code, computed from the same detected heatwaves
+    sdf = pytest.importorskip("synthetic_data_functions")
+    pf = pytest.importorskip("pipeline_functions")
+    eqf = pytest.importorskip("equivalence_functions")
+    work_dir = tmp_path_factory.mktemp("baseline_regression")
+    try:
+        baseline_code = eqf.export_code(
+            os.environ.get("JUICCE_BASELINE", BASELINE_REVISION),
+            str(work_dir / "baseline_code"),
+        )
+    except (OSError, subprocess.CalledProcessError):
+        pytest.skip("the baseline code cannot be exported (git repository needed)")
+    # 90th percentile: a few heatwaves on the 'test' grid, some of them linked to EM-DAT events
+    # the Excel copies are read by the baseline code
+    p = sdf.synthetic_params("test") | {"threshold_value": 90, "excel_export": True}
+    new_root, baseline_root = work_dir / "new", work_dir / "baseline"
+    shutil.copytree(synthetic_dataset[0], new_root)
+    current_dir = os.getcwd()
+    os.chdir(new_root)
+    try:
+        # the upstream stages are run once, by the current code
+        pf.run_pipeline(["cc3d_scan", "Russo_HWMId"], [p], overwrite_files=True)
+        shutil.copytree(new_root, baseline_root)
+        pf.run_pipeline(["heatwaves_indices"], [p])
+    finally:
+        os.chdir(current_dir)
+    subprocess.run(
+        [sys.executable, "-c", BASELINE_RUNNER, json.dumps(p)],
+        cwd=baseline_root,
+        env=os.environ | {"PYTHONPATH": baseline_code},
+        check=True,
+        capture_output=True,
+    )
+    return {
+        "params": p,
+        "baseline_output": baseline_root / pf.output_dir(p),
+        "new_output": new_root / pf.output_dir(p),
+    }
+
+
+@pytest.fixture(scope="session")
+def indices_regression(baseline_regression):
+    # indices tables of the baseline and of the current create_heatwaves_indices_database
+    table = f"df_htws_detected_count_all_impacts_flex_time_{baseline_regression['params']['flex_time_span']}days"
+    return (
+        str(baseline_regression["baseline_output"] / table) + ".xlsx",
+        str(baseline_regression["new_output"] / table) + ".parquet",
+    )
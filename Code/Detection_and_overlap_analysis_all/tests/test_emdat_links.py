@@ -0,0 +1,147 @@
+import ast
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+dof = pytest.importorskip("detection_overlap_functions")
+
+
+def links_table(links):
+    # links (Dis No, label), the disasterno being the first 9 characters of the Dis No
+    return pd.DataFrame(
+        {
+            "Dis No": [dis_no for dis_no, label in links],
+            "disasterno": [dis_no[:9] for dis_no, label in links],
+            "label": [label for dis_no, label in links],
+        }
+    ).astype({"label": "int32"})
+
+
+def test_load_emdat_detected_heatwaves(tmp_path):
+    path = tmp_path / "links.parquet"
+    links_table(
+        [
+            ("2003-0391-FRA", 12),
+            ("2003-0391-FRA", 4),
+            ("2003-0391-SPI", 4),
+            ("2003-0391-SPI", 4),  # duplicated link
+            ("2006-0400-DEU", 30),
+        ]
+    ).to_parquet(path)
+    emdat_to_labels, labels_to_emdat = dof.load_emdat_detected_heatwaves(path)
+    assert emdat_to_labels == {
+        "2003-0391-FRA": [4, 12],
+        "2003-0391-SPI": [4],
+        "2006-0400-DEU": [30],
+    }
+    assert labels_to_emdat == {
+        4: ["2003-0391-FRA", "2003-0391-SPI"],
+        12: ["2003-0391-FRA"],
+        30: ["2006-0400-DEU"],
+    }
+    assert all(type(label) is int for label in labels_to_emdat)
+    # merged events
+    emdat_to_labels, labels_to_emdat = dof.load_emdat_detected_heatwaves(
+        path, key="disasterno"
+    )
+    assert emdat_to_labels == {"2003-0391": [4, 12], "2006-0400": [30]}
+    assert labels_to_emdat == {4: ["2003-0391"], 12: ["2003-0391"], 30: ["2006-0400"]}
+
+
+def test_emdat_detected_heatwaves_baseline(baseline_regression):
+    # the links table holds the links of the text file of the baseline, read as the baseline did
+    name = "emdat_detected_heatwaves_ERA5_t2m_tg_anomaly_90th_flex_time_7_days"
+    with open(baseline_regression["baseline_output"] / f"{name}.txt") as f:
+        baseline_links = {
+            line[:13]: ast.literal_eval(line[14:]) for line in f.read().splitlines()
+        }
+    emdat_to_labels, labels_to_emdat = dof.load_emdat_detected_heatwaves(
+        baseline_regression["new_output"] / f"{name}.parquet"
+    )
+    assert emdat_to_labels == baseline_links
+    assert set(labels_to_emdat) == {
+        label for labels in baseline_links.values() for label in labels
+    }
+
+
+def reference_groups(links):
+    # connected components of the labels linked to the same merged events, merged until nothing changes
+    groups = [
+        {label} | {other for dis_no, other in links if dis_no[:9] == event}
+        for event, label in {(dis_no[:9], label) for dis_no, label in links}
+    ]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(groups)):
+            for j in range(i + 1, len(groups)):
+                if groups[i] & groups[j]:
+                    groups[i] |= groups.pop(j)
+                    merged = True
+                    break
+            if merged:
+                break
+    return {label: min(group) for group in groups for label in group}
+
+
+def test_group_emdat_detected_heatwaves():
+    links = [
+        ("2003-0391-FRA", 2),
+        ("2003-0391-SPI", 4),
+        (
+            "2003-0392-ITA",
+            4,
+        ),  # label 4 is shared by two events: one group for both events
+        ("2003-0392-ITA", 7),
+        ("2006-0400-DEU", 30),
+        ("2006-0401-POL", 31),
+    ]
+    df_groups = dof.group_emdat_detected_heatwaves(links_table(links))
+    assert list(df_groups["label"]) == [2, 4, 7, 30, 31]
+    assert list(df_groups["group"]) == [2, 2, 2, 30, 31]
+    assert list(df_groups["group_size"]) == [3, 3, 3, 1, 1]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_group_emdat_detected_heatwaves_random(seed):
+    rng = np.random.default_rng(seed)
+    links = [
+        (
+            f"{2000 + rng.integers(0, 3)}-{rng.integers(0, 15):04d}-FRA",
+            int(rng.integers(1, 40)),
+        )
+        for _ in range(40)
+    ]
+    df_groups = dof.group_emdat_detected_heatwaves(links_table(links))
+    assert dict(zip(df_groups["label"], df_groups["group"])) == reference_groups(links)
+    assert (
+        df_groups["group_size"] == df_groups.groupby("group")["label"].transform("size")
+    ).all()
+
+
+def test_load_heatwaves_groups(tmp_path):
+    path = tmp_path / "groups.parquet"
+    dof.group_emdat_detected_heatwaves(
+        links_table([("2003-0391-FRA", 9), ("2003-0391-SPI", 4), ("2006-0400-DEU", 30)])
+    ).to_parquet(path)
+    label_to_group, group_to_labels = dof.load_heatwaves_groups(path)
+    assert label_to_group == {4: 4, 9: 4, 30: 30}
+    assert group_to_labels == {4: [4, 9], 30: [30]}
+
+
+def test_heatwaves_groups_regression(baseline_regression):
+    # the groups written by analyse_impact_overlap are the components of its links
+    suffix = "ERA5_t2m_tg_anomaly_90th_flex_time_7_days.parquet"
+    df_links = pd.read_parquet(
+        baseline_regression["new_output"] / f"emdat_detected_heatwaves_{suffix}"
+    )
+    label_to_group, _ = dof.load_heatwaves_groups(
+        baseline_regression["new_output"] / f"emdat_heatwaves_groups_{suffix}"
+    )
+    assert label_to_group == reference_groups(
+        list(zip(df_links["Dis No"], df_links["label"]))
+    )
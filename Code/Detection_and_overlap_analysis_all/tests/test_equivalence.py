@@ -0,0 +1,272 @@
+import os
+import sys
+
+import netCDF4 as nc
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+eqf = pytest.importorskip("equivalence_functions")
+
+
+def test_difference_row_status():
+    reference = np.array([1.0, 2.0, 3.0])
+    assert (
+        eqf.difference_row(reference, reference.copy(), 1e-5, 1e-6)["status"]
+        == "identical"
+    )
+    row = eqf.difference_row(reference, reference * (1 + 1e-7), 1e-5, 1e-6)
+    assert row["status"] == "within_tolerance"
+    assert row["nb_differences"] == 0
+    assert row["max_rel_diff"] == pytest.approx(1e-7)
+    row = eqf.difference_row(reference, reference + [0, 0, 1e-3], 1e-5, 1e-6)
+    assert row["status"] == "drift"
+    assert row["nb_differences"] == 1
+    assert row["max_abs_diff"] == pytest.approx(1e-3)
+
+
+def test_difference_row_masked_and_nan():
+    reference = np.ma.masked_array([1.0, 2.0, 3.0], mask=[False, True, False])
+    # a masked value is compared as NaN
+    assert (
+        eqf.difference_row(reference, np.array([1.0, np.nan, 3.0]), 1e-5, 1e-6)[
+            "status"
+        ]
+        == "identical"
+    )
+    row = eqf.difference_row(reference, np.array([1.0, 2.0, 3.0]), 1e-5, 1e-6)
+    assert row["status"] == "drift"
+    assert row["nb_differences"] == 1
+    # strings and dates are compared as text
+    strings = np.array(["a", "b"], dtype=object)
+    assert eqf.difference_row(strings, strings.copy(), 0, 0)["status"] == "identical"
+    assert (
+        eqf.difference_row(strings, np.array(["a", "c"], dtype=object), 0, 0)[
+            "nb_differences"
+        ]
+        == 1
+    )
+
+
+def test_compare_label_partitions():
+    reference = np.array([[0, 1, 1, 0], [2, 2, 0, 3]])
+    row, mapping = eqf.compare_label_partitions(reference, reference.copy())
+    assert row["status"] == "identical"
+    assert mapping == {1: 1, 2: 2, 3: 3}
+
+    renumbered = np.array([[0, 7, 7, 0], [5, 5, 0, 9]])
+    row, mapping = eqf.compare_label_partitions(reference, renumbered)
+    assert row["status"] == "renumbered"
+    assert row["nb_differences"] == 0
+    assert mapping == {7: 1, 5: 2, 9: 3}
+
+    # masked points are outside of the heatwaves
+    row, mapping = eqf.compare_label_partitions(
+        np.ma.masked_equal(reference, 0), renumbered
+    )
+    assert row["status"] == "renumbered"
+
+    merged = np.array([[0, 1, 1, 0], [1, 1, 0, 3]])  # heatwaves 1 and 2 merged
+    row, mapping = eqf.compare_label_partitions(reference, merged)
+    assert row["status"] == "drift"
+    assert row["nb_differences"] == 2
+    extended = np.array([[4, 1, 1, 0], [2, 2, 0, 3]])  # one more labelled point
+    assert eqf.compare_label_partitions(reference, extended)[0]["nb_differences"] == 1
+
+
+def write_netcdf(path, variables):
+    with nc.Dataset(path, mode="w") as f:
+        f.createDimension("time", None)
+        f.createDimension("lat", 2)
+        for name, values in variables.items():
+            f.createVariable(name, values.dtype, ("time", "lat"))[:] = values
+
+
+def test_compare_netcdf(tmp_path):
+    labels = np.array([[1, 0], [1, 2]], dtype=np.int32)
+    values = np.array([[0.5, 1.5], [2.5, 3.5]], dtype=np.float32)
+    write_netcdf(
+        tmp_path / "reference.nc",
+        {"label": labels, "t2m": values, "only_reference": values},
+    )
+    write_netcdf(
+        tmp_path / "candidate.nc",
+        {
+            "label": np.where(labels == 0, 0, 3 - labels).astype(np.int32),
+            "t2m": values + np.float32(1e-3),
+        },
+    )
+    rows, mapping = eqf.compare_netcdf(
+        str(tmp_path / "reference.nc"), str(tmp_path / "candidate.nc"), 1e-5, 1e-6
+    )
+    status = {row["item"]: row["status"] for row in rows}
+    assert status == {
+        "label": "renumbered",
+        "t2m": "drift",
+        "only_reference": "missing",
+    }
+    assert mapping == {2: 1, 1: 2}
+
+
+def test_compare_tables_renumbered(tmp_path):
+    df_reference = pd.DataFrame(
+        {
+            "duration": [3, 5, 4],
+            "group": [1, 1, 3],
+            "country": ["France", "Spain", None],
+        },
+        index=[1, 2, 3],
+    )
+    df_candidate = pd.DataFrame(
+        {
+            "duration": [4, 3, 5],
+            "group": [6, 4, 4],
+            "country": [None, "France", "Spain"],
+        },
+        index=[6, 4, 5],
+    )
+    df_reference.to_parquet(tmp_path / "reference.parquet")
+    df_candidate.to_parquet(tmp_path / "candidate.parquet")
+    rows = eqf.compare_tables(
+        str(tmp_path / "reference.parquet"),
+        str(tmp_path / "candidate.parquet"),
+        1e-6,
+        1e-9,
+        mapping={4: 1, 5: 2, 6: 3},
+    )
+    status = {row["item"]: row["status"] for row in rows}
+    assert status == {
+        "index": "renumbered",
+        "duration": "identical",
+        "group": "renumbered",
+        "country": "identical",
+    }
+
+    # without the renumbering, the tables differ
+    rows = eqf.compare_tables(
+        str(tmp_path / "reference.parquet"),
+        str(tmp_path / "candidate.parquet"),
+        1e-6,
+        1e-9,
+    )
+    assert {row["item"]: row["status"] for row in rows}["index"] == "drift"
+
+
+def test_compare_tables_missing(tmp_path):
+    df_reference = pd.DataFrame({"a": [1.0, 2.0], "b": [1, 2]})
+    df_candidate = pd.DataFrame({"a": [1.0, 2.0, 3.0]})
+    df_reference.to_excel(tmp_path / "reference.xlsx")
+    df_candidate.to_parquet(tmp_path / "candidate.parquet")
+    rows = eqf.compare_tables(
+        str(tmp_path / "reference.xlsx"),
+        str(tmp_path / "candidate.parquet"),
+        1e-6,
+        1e-9,
+    )
+    rows = {row["item"]: row for row in rows}
+    assert rows["index"]["status"] == "drift"
+    assert rows["index"]["nb_differences"] == 1
+    assert rows["a"]["status"] == "identical"
+    assert rows["b"]["status"] == "missing"
+
+
+def test_compare_text_files(tmp_path):
+    (tmp_path / "reference.txt").write_text("a\nb\nc\n")
+    (tmp_path / "candidate.txt").write_text("a\nx\n")
+    (row,) = eqf.compare_text_files(
+        str(tmp_path / "reference.txt"), str(tmp_path / "candidate.txt")
+    )
+    assert row["nb_differences"] == 2
+    assert row["status"] == "drift"
+
+
+def report(files):
+    return {
+        "stages": [
+            {
+                "stage": stage,
+                "files": {
+                    path: {"bytes_written": nbytes}
+                    for path, nbytes in stage_files.items()
+                },
+            }
+            for stage, stage_files in files.items()
+        ]
+    }
+
+
+def test_written_files():
+    files = eqf.written_files(
+        report(
+            {
+                "select_scale_jja": {
+                    "Data/a.nc": 10,
+                    "Data/a.nc.manifest.json": 1,
+                    "Data/read.nc": 0,
+                },
+                "cc3d_scan_heatwaves": {"Data/a.nc": 10, "Data/b.nc": 5},
+            }
+        )
+    )
+    assert files == {
+        "Data/a.nc": "select_scale_jja",
+        "Data/b.nc": "cc3d_scan_heatwaves",
+    }
+    with pytest.raises(ValueError):
+        eqf.written_files(None)
+
+
+def test_compare_outputs(tmp_path):
+    for name, shift in [("reference", 0), ("candidate", 1e-3)]:
+        os.makedirs(tmp_path / name / "Output")
+        pd.DataFrame({"x": [1.0 + shift, 2.0]}).to_parquet(
+            tmp_path / name / "Output" / "df.parquet"
+        )
+        (tmp_path / name / "Output" / "log.txt").write_text("done\n")
+    run_report = report(
+        {
+            "create_heatwaves_indices_database": {
+                os.path.join("Output", "df.parquet"): 1,
+                os.path.join("Output", "log.txt"): 1,
+            }
+        }
+    )
+    df_differences = eqf.compare_outputs(
+        str(tmp_path / "reference"), str(tmp_path / "candidate"), run_report, run_report
+    )
+    assert set(df_differences["stage"]) == {"heatwaves_indices"}
+    assert dict(zip(df_differences["item"], df_differences["status"])) == {
+        "index": "identical",
+        "x": "drift",
+        "lines": "identical",
+    }
+    df_summary = eqf.summarize_differences(df_differences)
+    assert df_summary.loc["heatwaves_indices", "status"] == "drift"
+    assert df_summary.loc["heatwaves_indices", "nb_drifting_items"] == 1
+
+    # a run without report is not a run without outputs
+    with pytest.raises(ValueError):
+        eqf.compare_outputs(
+            str(tmp_path / "reference"), str(tmp_path / "candidate"), run_report, None
+        )
+    with pytest.raises(ValueError):
+        eqf.compare_outputs(
+            str(tmp_path / "reference"),
+            str(tmp_path / "candidate"),
+            report({}),
+            report({}),
+        )
+
+
+def test_run_implementation_without_report(tmp_path):
+    # an implementation of the pipeline written before the run reports
+    code_dir = tmp_path / "code"
+    code_dir.mkdir()
+    (code_dir / "pipeline_functions.py").write_text(
+        "def run_pipeline(targets, params_list, overwrite_files=False):\n    return []\n"
+    )
+    root = tmp_path / "root"
+    root.mkdir()
+    with pytest.raises(FileNotFoundError, match="no run report"):
+        eqf.run_implementation(str(code_dir), str(root), ["climatology"], [{}])
@@ -0,0 +1,193 @@
+import os
+import sys
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+dpf = pytest.importorskip("data_preprocessing_functions")
+stf = pytest.importorskip("storage_functions")
+
+EMDAT_PATH = os.path.join(
+    "Data", "GDIS_EM-DAT", "EMDAT_Europe-1950-2022-heatwaves.xlsx"
+)
+HAMMOND_PATH = os.path.join("Data", "GDIS_EM-DAT", "Lucy_Hammond_ETE_data_V2.xlsx")
+
+
+def emdat_row(dis_no, country, start, end):
+    # start and end are (year, month, day), the day being None when it is unknown
+    return {
+        "Dis No": dis_no,
+        "disasterno": dis_no[:9],
+        "Country": country,
+        "Year": start[0],
+        "Start Year": start[0],
+        "Start Month": start[1],
+        "Start Day": np.nan if start[2] is None else start[2],
+        "End Year": end[0],
+        "End Month": end[1],
+        "End Day": np.nan if end[2] is None else end[2],
+        "Total Deaths": 10.0,
+        "Total Affected": np.nan,
+        "Total Damages, Adjusted ('000 US$)": 5.0,
+    }
+
+
+@pytest.fixture
+def emdat_table(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(os.path.dirname(EMDAT_PATH))
+    rows = [
+        emdat_row("2003-0391-FRA", "France", (2003, 8, 1), (2003, 8, 15)),
+        emdat_row("2003-0391-SPI", "Spain", (2003, 7, None), (2003, 8, 10)),
+        emdat_row("2003-0392-ITA", "Italy", (2003, 6, 3), (2003, 6, None)),
+        emdat_row("2006-0400-DEU", "Germany", (2006, 8, 20), (2006, 8, 30)),
+        emdat_row("1994-0759-ROU", "Romania", (1994, 5, 20), (1994, 6, 10)),
+        emdat_row("2004-0361-SPI", "Canary Is", (2004, 7, 1), (2004, 7, 5)),
+        emdat_row("2022-0100-FRA", "France", (2022, 7, 1), (2022, 7, 5)),
+    ]
+    pd.DataFrame(rows).to_excel(EMDAT_PATH)
+    return tmp_path
+
+
+def test_create_emdat_event_table(emdat_table):
+    df_events = dpf.create_emdat_event_table(
+        year_beg=1950, year_end=2021, flex_time_span=7
+    )
+    # the events after the studied period are dropped
+    assert list(df_events["Dis No"]) == [
+        "2003-0391-FRA",
+        "2003-0391-SPI",
+        "2003-0392-ITA",
+        "2006-0400-DEU",
+        "1994-0759-ROU",
+        "2004-0361-SPI",
+    ]
+    df_events = df_events.set_index("Dis No")
+    # JJA indices (0 is the 1st June, bounds included), raw and extended by 7 days when the day is known
+    expected = {
+        "2003-0391-FRA": (61, 75, 54, 82),
+        "2003-0391-SPI": (
+            30,
+            91,
+            30,
+            91,
+        ),  # unknown start day: whole months, no flexibility
+        "2003-0392-ITA": (
+            2,
+            29,
+            0,
+            29,
+        ),  # unknown end day: until the end of the end month
+        "2006-0400-DEU": (80, 90, 73, 91),
+    }
+    for dis_no, bounds in expected.items():
+        row = df_events.loc[dis_no]
+        assert (
+            row["idx_beg_JJA"],
+            row["idx_end_JJA"],
+            row["idx_beg_JJA_flex"],
+            row["idx_end_JJA_flex"],
+        ) == bounds
+        first_june = (date(row["Year"], 6, 1) - date(1950, 1, 1)).days
+        assert row["idx_beg_all_year"] == first_june + bounds[0]
+        assert row["idx_end_all_year_flex"] == first_june + bounds[3]
+        assert not row["ignored"]
+    assert df_events.loc["2003-0391-FRA", "mask_country"] == "France"
+    assert (
+        df_events.loc["2003-0391-FRA", "country_id"]
+        == dpf.dict_country_labels["France"]
+    )
+    # May event, and event outside of the studied area
+    assert df_events.loc["1994-0759-ROU", "ignored"]
+    assert pd.isna(df_events.loc["1994-0759-ROU", "idx_beg_JJA"])
+    assert df_events.loc["2004-0361-SPI", "ignored"]
+    assert df_events.loc["2004-0361-SPI", "country_id"] == 0
+    # typed columns
+    assert df_events["Start Day"].dtype == "Int32"
+    assert df_events["idx_beg_JJA"].dtype == "Int32"
+    assert df_events["Year"].dtype == np.int32
+    assert df_events["ignored"].dtype == bool
+
+
+def test_load_emdat_event_table(emdat_table, monkeypatch):
+    events = []
+    monkeypatch.setattr(
+        stf, "file_observers", [lambda event, path, nbytes: events.append(event)]
+    )
+    df_events = dpf.load_emdat_event_table(
+        year_beg=1950, year_end=2021, flex_time_span=7
+    )
+    assert "cache_miss" in events
+    events.clear()
+    pd.testing.assert_frame_equal(
+        dpf.load_emdat_event_table(year_beg=1950, year_end=2021, flex_time_span=7),
+        df_events,
+    )
+    assert events == ["cache_hit"]
+    # an EM-DAT file edited after the table was created: the table is created again
+    df_emdat = pd.read_excel(EMDAT_PATH, index_col=0)
+    df_emdat.loc[0, "End Day"] = 20
+    df_emdat.to_excel(EMDAT_PATH)
+    table_path = os.path.join(
+        "Data",
+        "GDIS_EM-DAT",
+        "EMDAT_Europe-1950-2022-heatwaves_events_1950_2021_flex_time_7_days.parquet",
+    )
+    os.utime(EMDAT_PATH, (os.path.getmtime(table_path) + 10,) * 2)
+    df_events = dpf.load_emdat_event_table(
+        year_beg=1950, year_end=2021, flex_time_span=7
+    )
+    assert df_events.loc[0, "idx_end_JJA"] == 61 + 19
+
+
+def test_hammond_event_table(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(os.path.dirname(HAMMOND_PATH))
+    pd.DataFrame(
+        {
+            "Country": ["France", "England", "Canary Is", "Japan"],
+            "Deaths": [100.0, 20.0, 1.0, 3.0],
+            "Start date": [
+                pd.Timestamp(2003, 8, 1),
+                pd.Timestamp(1976, 6, 23, 12),  # normalized to the day
+                pd.Timestamp(2004, 7, 1),
+                pd.Timestamp(2003, 8, 1),
+            ],
+            "End date": [
+                pd.Timestamp(2003, 8, 15),
+                pd.Timestamp(1976, 7, 8),
+                pd.Timestamp(2004, 7, 5),
+                pd.Timestamp(2003, 8, 15),
+            ],
+        }
+    ).to_excel(HAMMOND_PATH)
+    df_events = dpf.load_hammond_event_table(year_beg=1950)
+    # only the countries of the studied area
+    assert list(df_events["mask_country"]) == ["France", "United_Kingdom"]
+    assert list(df_events["Year"]) == [2003, 1976]
+    assert list(df_events["idx_beg_all_year"]) == [
+        (date(2003, 8, 1) - date(1950, 1, 1)).days,
+        (date(1976, 6, 23) - date(1950, 1, 1)).days,
+    ]
+    assert list(df_events["idx_end_all_year"]) == [
+        (date(2003, 8, 15) - date(1950, 1, 1)).days,
+        (date(1976, 7, 8) - date(1950, 1, 1)).days,
+    ]
+    assert df_events["country_id"].dtype == np.int32
+    pd.testing.assert_frame_equal(
+        dpf.load_hammond_event_table(year_beg=1950), df_events
+    )
+
+
+def test_impact_overlap_baseline(baseline_regression):
+    # the overlap computed from the event table gives the same detected and undetected EM-DAT heatwaves as the baseline
+    for kind in ["detected", "undetected"]:
+        name = f"emdat_{kind}_heatwaves_ERA5_t2m_tg_anomaly_90th_flex_time_7_days.txt"
+        with open(baseline_regression["baseline_output"] / name) as f:
+            baseline_lines = f.read().splitlines()
+        with open(baseline_regression["new_output"] / name) as f:
+            assert f.read().splitlines() == baseline_lines
+        assert baseline_lines != []
@@ -0,0 +1,36 @@
+import os
+import sys
+
+import netCDF4 as nc
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+acpf = pytest.importorskip("analysis_classification_plot_functions")
+
+
+def test_read_heatwave_labels_masked(tmp_path):
+    # cc3d label file: the points outside of the heatwaves are masked and hold the int32 fill value
+    labels = np.zeros((4, 3, 5), dtype=np.int32)
+    labels[1:3, 0, 1:3] = 2
+    labels[3, 2, 4] = 5
+    with nc.Dataset(tmp_path / "labels.nc", mode="w") as f:
+        f.createDimension("time", None)
+        f.createDimension("lat", 3)
+        f.createDimension("lon", 5)
+        label = f.createVariable("label", "i4", ("time", "lat", "lon"))
+        label[:] = np.ma.masked_equal(labels, 0)
+
+    with nc.Dataset(tmp_path / "labels.nc", mode="r") as f:
+        assert np.ma.is_masked(f.variables["label"][:])
+        data_label = acpf.read_heatwave_labels(f.variables["label"], slice(1, 4))
+
+    assert data_label.dtype == np.int64
+    np.testing.assert_array_equal(data_label, labels[1:4])
+    # the labels index the lookup table of the computed heatwaves
+    label_to_idx = np.full(int(np.max(data_label)) + 1, -1, dtype=np.int64)
+    label_to_idx[[2, 5]] = [0, 1]
+    htw_idx = label_to_idx[data_label]
+    assert np.count_nonzero(htw_idx == 0) == 4
+    assert np.count_nonzero(htw_idx == 1) == 1
+    assert np.count_nonzero(htw_idx == -1) == data_label.size - 5
@@ -0,0 +1,277 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+eqf = pytest.importorskip("equivalence_functions")
+hif = pytest.importorskip("heatwaves_indices_functions")
+
+
+def test_heatwaves_indices_database_baseline(indices_regression):
+    baseline_path, new_path = indices_regression
+    rows = eqf.compare_tables(baseline_path, new_path, rtol=1e-6, atol=0)
+    assert [
+        row for row in rows if row["status"] not in ("identical", "within_tolerance")
+    ] == []
+    # every index and impact of the table is compared
+    df_htw = pd.read_parquet(new_path)
+    assert len(rows) == len(df_htw.columns) + 1
+    assert df_htw["Computed_heatwave"].all() and df_htw["Extreme_heatwave"].any()
+
+
+def synthetic_year(seed=0, shape=(92, 6, 8)):
+    # labels, temperature and HWMId of a year (with masked values), sea points and population density (dense and masked cells)
+    rng = np.random.default_rng(seed)
+    nb_time, nb_lat, nb_lon = shape
+    labels = np.zeros(shape, dtype=np.int64)
+    for label in range(1, 8):
+        t0, i0, j0 = (
+            rng.integers(0, nb_time - 10),
+            rng.integers(0, nb_lat - 2),
+            rng.integers(0, nb_lon - 3),
+        )
+        labels[
+            t0 : t0 + rng.integers(3, 10),
+            i0 : i0 + rng.integers(1, 4),
+            j0 : j0 + rng.integers(1, 5),
+        ] = label
+    temp = np.ma.masked_array(rng.normal(5, 3, shape), mask=rng.random(shape) < 0.05)
+    hwmid = np.ma.masked_array(rng.exponential(2, shape), mask=rng.random(shape) < 0.05)
+    sea = rng.random(shape[1:]) < 0.2
+    pop = np.ma.masked_array(
+        rng.lognormal(5, 2, shape[1:]), mask=rng.random(shape[1:]) < 0.1
+    )
+    lat = np.linspace(50, 50 - 0.25 * (nb_lat - 1), nb_lat)
+    cell_area = np.array(
+        [6371**2 * np.cos(np.pi * lat / 180) * (0.25 * np.pi / 180) ** 2] * nb_lon
+    ).T
+    cell_area_ratio = cell_area / (6371**2 * (0.25 * np.pi / 180) ** 2)
+    return labels, temp, hwmid, sea, pop, cell_area, cell_area_ratio
+
+
+def reference_indices(
+    labels,
+    label,
+    temp,
+    hwmid,
+    sea,
+    pop,
+    cell_area,
+    cell_area_ratio,
+    threshold_NL=1000,
+    coeff_PL=1000,
+):
+    # indices of one heatwave, computed on the 3D points of the heatwave as before the time collapse
+    in_htw = labels == label
+    pop_unique = np.where(
+        in_htw.any(axis=0) & ~np.ma.getmaskarray(pop), np.ma.getdata(pop), 0
+    )
+    area_unique = cell_area * (pop_unique > 0)
+    affected_pop = np.sum(pop_unique * cell_area)
+    ratio = np.broadcast_to(cell_area_ratio, labels.shape)
+    temp_points = in_htw & ~sea & ~np.ma.getmaskarray(temp)
+    hwmid_points = in_htw & ~sea & ~np.ma.getmaskarray(hwmid)
+    temp_values, hwmid_values = np.ma.getdata(temp), np.ma.getdata(hwmid)
+    # the cells of unknown population are in none of the population classes
+    pop_valid = ~np.ma.getmaskarray(pop)
+    high, low = pop_valid & (pop_unique > threshold_NL), pop_valid & (
+        pop_unique <= threshold_NL
+    )
+
+    def temp_sum(weights=1):
+        return np.sum((temp_values * ratio * weights)[temp_points])
+
+    def hwmid_sum(weights=1):
+        return np.sum((hwmid_values * ratio * weights)[hwmid_points])
+
+    indices = {
+        "Global_mean": (
+            np.mean((temp_values * ratio)[temp_points]) if temp_points.any() else np.nan
+        ),
+        "Spatial_extent": np.sum(area_unique),
+        "Duration": len(np.unique(np.nonzero(in_htw)[0])),
+        "Max": np.max(temp_values[temp_points]) if temp_points.any() else np.nan,
+        "Temp_sum": temp_sum(),
+        "Pseudo_HWMId": hwmid_sum(),
+        "Total_affected_pop": affected_pop,
+        "Multi_index_temp": temp_sum(pop_unique),
+        "Multi_index_HWMId": hwmid_sum(pop_unique),
+        "Temp_sum_pop_NL": temp_sum(coeff_PL * high)
+        * np.sum(pop_unique * cell_area * high)
+        + temp_sum(low) * np.sum(pop_unique * cell_area * low),
+        "Pseudo_HWMId_pop_NL": hwmid_sum(coeff_PL * high)
+        * np.sum(pop_unique * cell_area * high)
+        + hwmid_sum(low) * np.sum(pop_unique * cell_area * low),
+        "Multi_index_temp_NL": temp_sum(pop_unique * coeff_PL * high)
+        + temp_sum(pop_unique * low),
+        "Multi_index_HWMId_NL": hwmid_sum(pop_unique * coeff_PL * high)
+        + hwmid_sum(pop_unique * low),
+    }
+    indices["Max_spatial"] = indices["Max"] * indices["Spatial_extent"]
+    for index in [
+        "Global_mean",
+        "Duration",
+        "Max",
+        "Max_spatial",
+        "Spatial_extent",
+        "Temp_sum",
+        "Pseudo_HWMId",
+    ]:
+        indices[f"{index}_pop"] = indices[index] * affected_pop
+    return indices
+
+
+def heatwaves_pairs(labels, htw_labels, variables, sea):
+    # time-collapsed (heatwave, cell) pairs of the heatwaves htw_labels, as in create_heatwaves_indices_database
+    label_to_idx = np.full(labels.max() + 1, -1, dtype=np.int64)
+    label_to_idx[htw_labels] = np.arange(len(htw_labels))
+    htw_idx = label_to_idx[labels]
+    in_htw = htw_idx >= 0
+    nb_cells = labels[0].size
+    cells = np.broadcast_to(np.arange(nb_cells).reshape(labels.shape[1:]), labels.shape)
+    pairs_keys, pairs_inverse = np.unique(
+        htw_idx[in_htw] * nb_cells + cells[in_htw], return_inverse=True
+    )
+    pairs_land = ~sea.ravel()[pairs_keys % nb_cells][pairs_inverse]
+    pairs_values = {}
+    for name, table in variables.items():
+        values = np.ma.getdata(table)[in_htw]
+        valid = pairs_land & ~np.ma.getmaskarray(table)[in_htw]
+        pairs_values[f"{name}_sum"] = np.bincount(
+            pairs_inverse[valid], weights=values[valid], minlength=len(pairs_keys)
+        )
+        pairs_values[f"{name}_count"] = np.bincount(
+            pairs_inverse[valid], minlength=len(pairs_keys)
+        )
+        pairs_values[f"{name}_max"] = np.full(len(pairs_keys), -np.inf)
+        np.maximum.at(pairs_values[f"{name}_max"], pairs_inverse[valid], values[valid])
+    return pairs_keys // nb_cells, pairs_keys % nb_cells, pairs_values
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_heatwaves_pairs_aggregation(seed):
+    labels, temp, hwmid, sea, pop, cell_area, cell_area_ratio = synthetic_year(seed)
+    htw_labels = np.unique(labels[labels > 0])
+    pairs_htw, pairs_cell, pairs_values = heatwaves_pairs(
+        labels, htw_labels, {"temp": temp, "HWMId": hwmid}, sea
+    )
+    pop_valid = ~np.ma.getmaskarray(pop)
+    pop0 = np.ma.filled(pop, 0)
+    cells_maps = {
+        "area": cell_area,
+        "area_ratio": cell_area_ratio,
+        "pop": pop0,
+        "pop_positive": pop_valid * (pop0 > 0),
+        "high": pop_valid * (pop0 > 1000),
+        "low": pop_valid * (pop0 <= 1000),
+    }
+    duration = [len(np.unique(np.nonzero(labels == label)[0])) for label in htw_labels]
+    primitives_values = hif.compute_heatwaves_primitives(
+        hif.heatwaves_indices_primitives(),
+        len(htw_labels),
+        pairs_htw,
+        pairs_cell,
+        pairs_values,
+        cells_maps,
+        duration,
+    )
+    indices_values = hif.compute_heatwaves_indices(primitives_values)
+    for k, label in enumerate(htw_labels):
+        reference = reference_indices(
+            labels, label, temp, hwmid, sea, pop, cell_area, cell_area_ratio
+        )
+        assert set(reference) == set(indices_values)
+        for index, value in reference.items():
+            np.testing.assert_allclose(
+                indices_values[index][k], value, rtol=1e-12, err_msg=index
+            )
+
+
+def test_heatwaves_indices_registry(indices_regression):
+    # the indices of the registry are the columns of the indices of the baseline table, in the same order
+    baseline_path, _ = indices_regression
+    df_baseline = pd.read_excel(baseline_path, header=0, index_col=0)
+    htw_criteria = list(hif.heatwaves_indices.keys())
+    assert len(htw_criteria) == 21
+    assert list(df_baseline.columns[-len(htw_criteria) :]) == htw_criteria
+    for index in htw_criteria:
+        assert hif.heatwaves_indices[index]["scale"] in ("linear", "log")
+
+
+def test_heatwaves_indices_primitives():
+    temp_sum = ("sum", "temp", ("area_ratio",))
+    assert hif.heatwaves_indices_primitives(["Temp_sum", "Temp_sum_pop"]) == sorted(
+        [(temp_sum, None), (hif.affected_pop, None)], key=str
+    )
+    # nonlinear indices: each term on the densely and on the sparsely populated cells
+    assert set(hif.heatwaves_indices_primitives(["Temp_sum_pop_NL"])) == {
+        (term, pop_class)
+        for term in [temp_sum, hif.affected_pop]
+        for pop_class in ["high", "low"]
+    }
+    # no meteorological variable is needed by the area and duration indices
+    primitives = hif.heatwaves_indices_primitives(["Spatial_extent", "Duration"])
+    assert {var for (kind, var, weights), pop_class in primitives} == {"cells", "days"}
+    primitives = hif.heatwaves_indices_primitives()
+    assert len(primitives) == len(set(primitives))
+
+
+def test_compute_heatwaves_indices():
+    rng = np.random.default_rng(0)
+    primitives = hif.heatwaves_indices_primitives()
+    primitives_values = {primitive: rng.random(5) for primitive in primitives}
+    indices_values = hif.compute_heatwaves_indices(primitives_values, coeff_PL=1000)
+    assert set(indices_values) == set(hif.heatwaves_indices)
+
+    def value(term, pop_class=None):
+        return primitives_values[(term, pop_class)]
+
+    temp_max, area = ("max", "temp", ()), hif.affected_area
+    np.testing.assert_allclose(
+        indices_values["Max_spatial_pop"],
+        value(temp_max) * value(area) * value(hif.affected_pop),
+    )
+    temp_sum = ("sum", "temp", ("area_ratio",))
+    np.testing.assert_allclose(
+        indices_values["Temp_sum_pop_NL"],
+        1000 * value(temp_sum, "high") * value(hif.affected_pop, "high")
+        + value(temp_sum, "low") * value(hif.affected_pop, "low"),
+    )
+    np.testing.assert_allclose(indices_values["Duration"], value(("count", "days", ())))
+    # a subset of the registry only needs its own primitives
+    subset = ["Global_mean", "Multi_index_HWMId_NL"]
+    indices_subset = hif.compute_heatwaves_indices(
+        {
+            primitive: primitives_values[primitive]
+            for primitive in hif.heatwaves_indices_primitives(subset)
+        },
+        indices=subset,
+    )
+    for index in subset:
+        np.testing.assert_array_equal(indices_subset[index], indices_values[index])
+
+
+def test_heatwaves_indices_table_types(indices_regression):
+    baseline_path, new_path = indices_regression
+    df_baseline = pd.read_excel(baseline_path, header=0, index_col=0)
+    df_htw = pd.read_parquet(new_path)
+    assert list(df_htw.columns) == list(df_baseline.columns)
+    # typed columns instead of object columns filled cell by cell
+    assert df_htw["Computed_heatwave"].dtype == bool
+    assert df_htw["Extreme_heatwave"].dtype == bool
+    assert df_htw["Duration"].dtype == "Int64"
+    impacts = ["Total_Deaths", "Total_Affected", "Material_Damages", "Impact_sum"]
+    for col in impacts + [
+        index for index in hif.heatwaves_indices if index != "Duration"
+    ]:
+        assert df_htw[col].dtype == np.float64, col
+    # the impacts are only defined for the extreme heatwaves, the indices for the computed heatwaves
+    extreme = df_htw["Extreme_heatwave"].to_numpy()
+    assert df_htw.loc[~extreme, impacts].isna().all().all()
+    assert df_htw.loc[extreme, impacts].notna().all().all()
+    computed = df_htw["Computed_heatwave"].to_numpy()
+    assert df_htw.loc[~computed, list(hif.heatwaves_indices)].isna().all().all()
+    assert df_htw.loc[computed, "Duration"].notna().all()
@@ -0,0 +1,136 @@
+import json
+import os
+import sys
+
+import netCDF4 as nc
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+inf = pytest.importorskip("instrumentation_functions")
+import storage_functions  # noqa: E402
+
+
+@pytest.fixture
+def records(monkeypatch):
+    monkeypatch.setattr(inf, "stage_records", [])
+    monkeypatch.setitem(inf.instrumentation_settings, "profiler", None)
+    yield inf.stage_records
+    assert inf.active_records == []
+    assert inf.record_file_event not in storage_functions.file_observers
+
+
+def write_netcdf(path):
+    with nc.Dataset(path, mode="w") as f:
+        f.createDimension("time", 4)
+        f.createVariable("t2m", "f4", ("time",))[:] = np.arange(4)
+
+
+@inf.instrument_stage
+def read_stage(path, nb_reads=2):
+    # the stages read the netCDF files through netCDF4.Dataset
+    assert nc.Dataset is inf.counted_dataset
+    with nc.Dataset(path, mode="r") as f:
+        for k in range(nb_reads):
+            f.variables["t2m"][:]
+    return nb_reads
+
+
+@inf.instrument_stage
+def write_stage(path):
+    df = pd.DataFrame({"a": np.arange(10)})
+    storage_functions.write_table(df, path)
+    return read_table_stage(path)
+
+
+@inf.instrument_stage
+def read_table_stage(path):
+    return len(storage_functions.read_table(path))
+
+
+@inf.instrument_stage
+def failing_stage(path):
+    with nc.Dataset(path, mode="r") as f:
+        f.variables["t2m"][:]
+    raise RuntimeError("stage failure")
+
+
+def test_dataset_restored(tmp_path, records):
+    write_netcdf(tmp_path / "t2m.nc")
+    dataset = nc.Dataset
+    assert read_stage(str(tmp_path / "t2m.nc"), nb_reads=3) == 3
+    assert nc.Dataset is dataset
+    (record,) = records
+    assert record["stage"] == "read_stage"
+    assert record["status"] == "ok"
+    assert record["params"] == {"path": str(tmp_path / "t2m.nc"), "nb_reads": 3}
+    assert record["netcdf_read_calls"] == 3
+    assert record["bytes_read"] == 3 * 4 * 4
+    assert record["files"][str(tmp_path / "t2m.nc")]["netcdf_read_calls"] == 3
+
+    # the files opened for writing are not wrapped
+    write_netcdf(tmp_path / "other.nc")
+    with nc.Dataset(tmp_path / "other.nc") as f:
+        assert isinstance(f.variables["t2m"], nc.Variable)
+
+
+def test_dataset_restored_after_failure(tmp_path, records):
+    write_netcdf(tmp_path / "t2m.nc")
+    dataset = nc.Dataset
+    with pytest.raises(RuntimeError, match="stage failure"):
+        failing_stage(str(tmp_path / "t2m.nc"))
+    assert nc.Dataset is dataset
+    (record,) = records
+    assert record["status"] == "error"
+    assert record["netcdf_read_calls"] == 1
+
+
+def test_nested_stages(tmp_path, records):
+    dataset = nc.Dataset
+    assert write_stage(str(tmp_path / "table.parquet")) == 10
+    assert nc.Dataset is dataset
+    nested, outer = records
+    assert (nested["stage"], outer["stage"]) == ("read_table_stage", "write_stage")
+    size = os.path.getsize(tmp_path / "table.parquet")
+    # the reads of the nested stage are also recorded in the stage calling it
+    assert nested["bytes_read"] == size
+    assert outer["bytes_read"] == size
+    assert outer["bytes_written"] == size
+    assert nested["bytes_written"] == 0
+    assert np.isnan(nested["peak_rss_mb"])
+    assert outer["peak_rss_mb"] > 0
+
+
+def test_write_run_report(tmp_path, records):
+    write_netcdf(tmp_path / "t2m.nc")
+    read_stage(str(tmp_path / "t2m.nc"))
+    read_stage(str(tmp_path / "t2m.nc"), nb_reads=1)
+    json_path, csv_path = inf.write_run_report(
+        report_path=str(tmp_path / "reports" / "run"), nb_workers=1
+    )
+    with open(json_path) as f:
+        report = json.load(f)
+    assert report["nb_workers"] == 1
+    assert [record["netcdf_read_calls"] for record in report["stages"]] == [2, 1]
+    df_report = pd.read_csv(csv_path)
+    assert list(df_report["stage"]) == ["read_stage", "read_stage"]
+    assert list(df_report["params.nb_reads"]) == [2, 1]
+    assert "files" not in df_report.columns
+
+
+@pytest.mark.parametrize(
+    "profiler, extension", [("cprofile", ".prof"), ("sampling", ".folded")]
+)
+def test_profilers(tmp_path, monkeypatch, records, profiler, extension):
+    write_netcdf(tmp_path / "t2m.nc")
+    monkeypatch.setitem(inf.instrumentation_settings, "profiler", profiler)
+    monkeypatch.setitem(inf.instrumentation_settings, "sampling_interval", 0.001)
+    monkeypatch.setitem(
+        inf.instrumentation_settings, "profile_dir", str(tmp_path / "profiles")
+    )
+    read_stage(str(tmp_path / "t2m.nc"))
+    (record,) = records
+    assert record["profile"].endswith(extension)
+    assert os.path.dirname(record["profile"]) == str(tmp_path / "profiles")
+    assert os.path.getsize(record["profile"]) > 0 or profiler == "sampling"
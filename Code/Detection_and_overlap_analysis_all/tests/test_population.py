@@ -0,0 +1,115 @@
+import os
+import sys
+
+import netCDF4 as nc
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+dpf = pytest.importorskip("data_preprocessing_functions")
+stf = pytest.importorskip("storage_functions")
+
+
+def epoch_path(epoch):
+    return os.path.join(
+        "Data", "Pop", "GHS_POP", f"GHS_POP_{epoch}_ERA5_grid_Europe.nc"
+    )
+
+
+def write_epoch(epoch, values):
+    # GHS-POP map of an epoch on the database grid, the masked points holding the fill value
+    os.makedirs(os.path.dirname(epoch_path(epoch)), exist_ok=True)
+    with nc.Dataset(epoch_path(epoch), mode="w", format="NETCDF4_CLASSIC") as f:
+        f.createDimension("lat", values.shape[0])
+        f.createDimension("lon", values.shape[1])
+        f.createVariable("lat", np.float32, ("lat",))[:] = 50 - 0.25 * np.arange(
+            values.shape[0]
+        )
+        f.createVariable("lon", np.float32, ("lon",))[:] = 0.25 * np.arange(
+            values.shape[1]
+        )
+        f.createVariable("Band1", np.float32, ("lat", "lon"), fill_value=-9999.0)[:] = (
+            values
+        )
+
+
+@pytest.fixture
+def population_epochs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(dpf, "pop_cube_cache", {})
+    rng = np.random.default_rng(0)
+    maps = {}
+    for epoch in dpf.pop_epochs:
+        maps[epoch] = np.ma.masked_array(
+            rng.lognormal(4, 1, (4, 5)).astype(np.float32),
+            mask=np.zeros((4, 5), dtype=bool),
+        )
+        maps[epoch][0, 0] = np.ma.masked  # no data
+        write_epoch(epoch, maps[epoch])
+    return maps
+
+
+def test_load_population_cube(population_epochs, monkeypatch):
+    events = []
+    monkeypatch.setattr(
+        stf, "file_observers", [lambda event, path, nbytes: events.append(event)]
+    )
+    epochs, pop_cube = dpf.load_population_cube("ERA5")
+    np.testing.assert_array_equal(epochs, dpf.pop_epochs)
+    assert pop_cube.shape == (len(dpf.pop_epochs), 4, 5)
+    for i, epoch in enumerate(dpf.pop_epochs):
+        np.testing.assert_array_equal(
+            np.ma.getmaskarray(pop_cube[i]),
+            np.ma.getmaskarray(population_epochs[epoch]),
+        )
+        np.testing.assert_array_equal(
+            pop_cube[i].compressed(), population_epochs[epoch].compressed()
+        )
+    assert "cache_miss" in events
+    # kept in memory: read once per session
+    events.clear()
+    assert dpf.load_population_cube("ERA5")[1] is pop_cube
+    assert events == ["cache_hit"]
+
+
+def test_population_cube_outdated(population_epochs, monkeypatch):
+    dpf.load_population_cube("ERA5")
+    cube_path = os.path.join(
+        "Data", "Pop", "GHS_POP", "GHS_POP_1975_2020_ERA5_grid_Europe.nc"
+    )
+    # an epoch file more recent than the cube: the cube is created again
+    new_map = population_epochs[2000] * 2
+    write_epoch(2000, new_map)
+    os.utime(epoch_path(2000), (os.path.getmtime(cube_path) + 10,) * 2)
+    monkeypatch.setattr(dpf, "pop_cube_cache", {})
+    epochs, pop_cube = dpf.load_population_cube("ERA5")
+    np.testing.assert_allclose(
+        pop_cube[list(epochs).index(2000)].compressed(), new_map.compressed()
+    )
+
+
+def test_get_population_year(population_epochs):
+    epochs, pop_cube = dpf.load_population_cube("ERA5")
+    # nearest epoch, as the former hand-written redirection of the years (1975 until 1977, then 5 years around each epoch)
+    for year in range(1950, 2023):
+        epoch = 1975 if year < 1978 else min(1975 + 5 * ((year - 1978) // 5 + 1), 2020)
+        np.testing.assert_array_equal(
+            dpf.get_population_year(epochs, pop_cube, year),
+            pop_cube[list(epochs).index(epoch)],
+        )
+    # linear interpolation between the surrounding epochs, the first and last epochs outside of the covered period
+    pop_1992 = dpf.get_population_year(epochs, pop_cube, 1992, interpolation=True)
+    np.testing.assert_allclose(
+        pop_1992, 0.6 * pop_cube[3] + 0.4 * pop_cube[4], rtol=1e-6
+    )
+    assert np.ma.is_masked(pop_1992[0, 0])
+    np.testing.assert_array_equal(
+        dpf.get_population_year(epochs, pop_cube, 1960, interpolation=True), pop_cube[0]
+    )
+    np.testing.assert_array_equal(
+        dpf.get_population_year(epochs, pop_cube, 2022, interpolation=True),
+        pop_cube[-1],
+    )
+    np.testing.assert_array_equal(
+        dpf.get_population_year(epochs, pop_cube, 1985, interpolation=True), pop_cube[2]
+    )
@@ -0,0 +1,136 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+from scipy import stats
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+scf = pytest.importorskip("scoring_functions")
+metrics = pytest.importorskip("sklearn.metrics")
+
+
+def scoring_data(seed=0, nb_computed=60, nb_criteria=6):
+    # criteria of the computed heatwaves (rounded, so that there are ties), extreme flags and impacts of the extreme heatwaves
+    rng = np.random.default_rng(seed)
+    computed_meteo = np.round(rng.lognormal(0, 1, (nb_criteria, nb_computed)), 1)
+    computed_meteo[1] = np.round(computed_meteo[1])  # many ties
+    extreme_bool = rng.random(nb_computed) < 0.4
+    impact = np.round(
+        computed_meteo[0, extreme_bool] * rng.lognormal(0, 0.5, extreme_bool.sum())
+    )
+    return impact, computed_meteo, extreme_bool
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_batch_scores(seed):
+    impact, computed_meteo, extreme_bool = scoring_data(seed)
+    extreme_meteo = computed_meteo[:, extreme_bool]
+    scores = scf.batch_scores(impact, extreme_meteo, extreme_bool, computed_meteo)
+    for k in range(len(computed_meteo)):
+        regression = stats.linregress(impact, extreme_meteo[k])
+        assert scores["r_pearson"][k] == pytest.approx(regression.rvalue, abs=4e-16)
+        assert scores["pvalue"][k] == pytest.approx(regression.pvalue, rel=1e-12)
+        assert scores["slope"][k] == pytest.approx(regression.slope, rel=1e-12)
+        assert scores["intercept"][k] == pytest.approx(regression.intercept, rel=1e-12)
+        assert scores["r_spearman"][k] == pytest.approx(
+            stats.spearmanr(impact, extreme_meteo[k]).statistic, abs=4e-16
+        )
+        assert scores["kendall_tau"][k] == pytest.approx(
+            stats.kendalltau(impact, extreme_meteo[k]).statistic, abs=4e-16
+        )
+        assert scores["roc_auc"][k] == pytest.approx(
+            metrics.roc_auc_score(extreme_bool, computed_meteo[k]), abs=4e-16
+        )
+
+
+def test_batch_scores_undefined():
+    impact, computed_meteo, extreme_bool = scoring_data()
+    computed_meteo[2] = 1.0  # constant criterion
+    computed_meteo[3, np.flatnonzero(extreme_bool)[0]] = np.nan
+    extreme_meteo = computed_meteo[:, extreme_bool]
+    scores = scf.batch_scores(impact, extreme_meteo, extreme_bool, computed_meteo)
+    assert np.isnan(scores["r_pearson"][2]) and scores["roc_auc"][2] == 0.5
+    for key in scores:
+        assert np.isnan(scores[key][3]), key
+    # a single class: the ROC AUC is undefined
+    scores = scf.batch_scores(
+        impact, extreme_meteo, np.ones(len(extreme_bool), dtype=bool), computed_meteo
+    )
+    assert np.isnan(scores["roc_auc"]).all()
+
+
+def test_resample_counts():
+    counts = scf.resample_counts(np.random.default_rng(0), 7, 50)
+    assert counts.shape == (50, 7)
+    np.testing.assert_array_equal(counts.sum(axis=1), 7)
+    assert counts.dtype == np.float64
+
+
+@pytest.mark.parametrize("chunk_size", [1000, 64])
+def test_bootstrap_scores(chunk_size):
+    impact, computed_meteo, extreme_bool = scoring_data(nb_computed=40)
+    nb_resamples, confidence = 200, 0.9
+    results = scf.bootstrap_scores(
+        impact,
+        computed_meteo,
+        extreme_bool,
+        nb_resamples=nb_resamples,
+        confidence=confidence,
+        seed=3,
+        chunk_size=chunk_size,
+    )
+    # the same resamples, drawn with the same seed and scored one at a time by scipy and scikit-learn
+    # stratified: each resample draws as many extreme (and non extreme) heatwaves as in the data
+    rng = np.random.default_rng(3)
+    pos_idx, neg_idx = np.flatnonzero(extreme_bool), np.flatnonzero(~extreme_bool)
+    r_pearson = np.zeros((len(computed_meteo), nb_resamples))
+    roc_auc = np.zeros((len(computed_meteo), nb_resamples))
+    for start in range(0, nb_resamples, chunk_size):
+        nb_chunk = min(chunk_size, nb_resamples - start)
+        w_pos = scf.resample_counts(rng, len(pos_idx), nb_chunk).astype(int)
+        w_neg = scf.resample_counts(rng, len(neg_idx), nb_chunk).astype(int)
+        for i in range(nb_chunk):
+            pos = np.repeat(np.arange(len(pos_idx)), w_pos[i])
+            drawn = np.concatenate([pos_idx[pos], np.repeat(neg_idx, w_neg[i])])
+            for k in range(len(computed_meteo)):
+                r_pearson[k, start + i] = stats.pearsonr(
+                    impact[pos], computed_meteo[k, pos_idx[pos]]
+                ).statistic
+                roc_auc[k, start + i] = metrics.roc_auc_score(
+                    extreme_bool[drawn], computed_meteo[k, drawn]
+                )
+    alpha = (1 - confidence) / 2
+    for name, score in [
+        ("r_pearson", r_pearson),
+        ("roc_auc", roc_auc),
+        ("Global_score", np.sqrt(np.abs(r_pearson * roc_auc))),
+    ]:
+        low, high = np.percentile(score, [100 * alpha, 100 * (1 - alpha)], axis=1)
+        np.testing.assert_allclose(results[f"{name}_low"], low, rtol=1e-10)
+        np.testing.assert_allclose(results[f"{name}_high"], high, rtol=1e-10)
+    global_score = np.sqrt(np.abs(r_pearson * roc_auc))
+    ranks = stats.rankdata(-global_score, method="min", axis=0)
+    np.testing.assert_allclose(results["mean_rank"], ranks.mean(axis=1))
+    np.testing.assert_allclose(results["prob_best"], np.mean(ranks == 1, axis=1))
+
+
+def test_bootstrap_scores_seed():
+    impact, computed_meteo, extreme_bool = scoring_data()
+    computed_meteo[3, np.flatnonzero(extreme_bool)[0]] = np.nan
+    results = scf.bootstrap_scores(
+        impact, computed_meteo, extreme_bool, nb_resamples=300, seed=1
+    )
+    same = scf.bootstrap_scores(
+        impact, computed_meteo, extreme_bool, nb_resamples=300, seed=1
+    )
+    other = scf.bootstrap_scores(
+        impact, computed_meteo, extreme_bool, nb_resamples=300, seed=2
+    )
+    for key in results:
+        np.testing.assert_array_equal(results[key], same[key])
+        # criteria with non-finite values get NaN
+        assert np.isnan(results[key][3]), key
+    assert not np.array_equal(results["r_pearson_low"], other["r_pearson_low"])
+    assert np.nansum(results["prob_best"]) == pytest.approx(1)
+    assert (results["roc_auc_low"] <= results["roc_auc_high"])[[0, 1, 2, 4, 5]].all()
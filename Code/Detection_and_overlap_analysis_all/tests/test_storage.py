@@ -0,0 +1,98 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+stf = pytest.importorskip("storage_functions")
+
+
+@pytest.fixture
+def file_events(monkeypatch):
+    events = []
+    monkeypatch.setattr(
+        stf,
+        "file_observers",
+        [lambda event, path, nbytes: events.append((event, os.path.basename(path)))],
+    )
+    return events
+
+
+def sample_table():
+    return pd.DataFrame(
+        {
+            "Year": np.array([2003, 2006, 2010], dtype=np.int64),
+            "Global_mean": [1.5, np.nan, 2.25],
+            "Extreme_heatwave": [True, False, True],
+            "Duration": pd.array([5, None, 7], dtype="Int64"),
+            "Start": pd.to_datetime(["2003-08-01", "2006-07-12", "2010-07-20"]),
+            "Country": ["France", "Germany", None],
+            "Mixed": [1, "a", None],  # numbers and strings: stored as strings
+        },
+        index=pd.Index([3, 8, 12], name="label"),
+    )
+
+
+def test_write_read_table(tmp_path, file_events):
+    df = sample_table()
+    path = str(tmp_path / "tables" / "df_htws.xlsx")
+    stf.write_table(df, path)
+    # the working format only, the extension is replaced
+    assert sorted(os.listdir(tmp_path / "tables")) == ["df_htws.parquet"]
+    df_read = stf.read_table(path)
+    expected = df.assign(Mixed=["1", "a", None])
+    pd.testing.assert_frame_equal(df_read, expected)
+    assert ("read", "df_htws.parquet") in file_events
+    assert ("cache_miss", "df_htws.parquet") not in file_events
+
+
+def test_write_table_excel_export(tmp_path, file_events):
+    df = sample_table().drop(columns=["Mixed"])
+    path = str(tmp_path / "df_htws.parquet")
+    stf.write_table(df, path, excel_export=True)
+    assert sorted(os.listdir(tmp_path)) == ["df_htws.parquet", "df_htws.xlsx"]
+    # the Excel copy is older than the Parquet file: it is not read
+    assert os.path.getmtime(tmp_path / "df_htws.xlsx") <= os.path.getmtime(path)
+    file_events.clear()
+    pd.testing.assert_frame_equal(stf.read_table(path), df)
+    assert file_events == [("read", "df_htws.parquet")]
+    df_excel = pd.read_excel(tmp_path / "df_htws.xlsx", index_col=0)
+    np.testing.assert_array_equal(df_excel["Year"], df["Year"])
+
+
+def test_read_table_excel_input(tmp_path, file_events):
+    # input table edited by hand: converted to Parquet once, then read from the Parquet file until the Excel file changes
+    excel_path = tmp_path / "EMDAT.xlsx"
+    df = pd.DataFrame(
+        {"Dis No": ["2003-0391-FRA", "2006-0400-DEU"], "Total Deaths": [10.0, np.nan]}
+    )
+    df.to_excel(excel_path)
+    df_read = stf.read_table(str(excel_path))
+    pd.testing.assert_frame_equal(df_read, df)
+    assert ("cache_miss", "EMDAT.parquet") in file_events
+    assert ("write", "EMDAT.parquet") in file_events
+    file_events.clear()
+    pd.testing.assert_frame_equal(stf.read_table(str(excel_path)), df)
+    assert file_events == [("read", "EMDAT.parquet")]
+    # the Excel file is edited after the conversion
+    df.loc[1, "Total Deaths"] = 25.5
+    df.to_excel(excel_path)
+    os.utime(excel_path, (os.path.getmtime(tmp_path / "EMDAT.parquet") + 10,) * 2)
+    file_events.clear()
+    pd.testing.assert_frame_equal(stf.read_table(str(excel_path)), df)
+    assert ("cache_miss", "EMDAT.parquet") in file_events
+    pd.testing.assert_frame_equal(pd.read_parquet(tmp_path / "EMDAT.parquet"), df)
+    # arguments of the Excel reading
+    os.remove(tmp_path / "EMDAT.parquet")
+    assert list(stf.read_table(str(excel_path), index_col=None).columns) == [
+        "Unnamed: 0",
+        "Dis No",
+        "Total Deaths",
+    ]
+
+
+def test_read_table_missing(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        stf.read_table(str(tmp_path / "missing.parquet"))
@@ -0,0 +1,171 @@
+import os
+import sys
+from datetime import date
+
+import netCDF4 as nc
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sdf = pytest.importorskip("synthetic_data_functions")
+dpf = pytest.importorskip("data_preprocessing_functions")
+
+YEARS = sdf.synthetic_sizes["test"]["years"]
+
+
+def read_variable(path, name):
+    with nc.Dataset(path, mode="r") as f:
+        return f.variables[name][:]
+
+
+def test_synthetic_grid():
+    lat, lon = sdf.synthetic_grid("test")
+    assert (len(lat), len(lon)) == (16, 32)
+    # decreasing latitudes, as ERA5, at the resolution of the database
+    np.testing.assert_allclose(np.diff(lat), -0.25)
+    np.testing.assert_allclose(np.diff(lon), 0.25)
+    lat, lon = sdf.synthetic_grid("small", "E-OBS")
+    np.testing.assert_allclose(np.diff(lat), -0.1)
+    assert (lat[0], lat[-1], lon[0], lon[-1]) == pytest.approx((50, 42, 0, 10))
+
+
+def test_synthetic_dataset_files(synthetic_dataset):
+    root, description = synthetic_dataset
+    data = root / "Data"
+    cube_path = (
+        data
+        / "ERA5"
+        / "t2m"
+        / f"ERA5_t2m_tg_Europe_day_0.25deg_{YEARS[0]}-{YEARS[1]}.nc"
+    )
+    for path in [
+        cube_path,
+        data / "Dates_converter.xlsx",
+        data / "ERA5" / "Mask" / "Mask_Europe_land_only_ERA5_0.25deg.nc",
+        data / "ERA5" / "Socio_eco_maps" / "GDP_cap_ERA5_Europe_0.25deg.nc",
+        data / "GDIS_EM-DAT" / "EMDAT_Europe-1950-2022-heatwaves.xlsx",
+        data / "GDIS_EM-DAT" / "EMDAT_Europe-1950-2022-heatwaves_merged.xlsx",
+        data / "GDIS_EM-DAT" / "Lucy_Hammond_ETE_data_V2.xlsx",
+        root / "Output" / "summary_detection_overlap_sensitivity.xlsx",
+    ] + [
+        data / "Pop" / "GHS_POP" / f"GHS_POP_{epoch}_ERA5_grid_Europe.nc"
+        for epoch in dpf.pop_epochs
+    ]:
+        assert path.exists(), path
+    # every day of the period, no temporary file left
+    nb_days = (date(YEARS[1], 12, 31) - date(YEARS[0], 1, 1)).days + 1
+    assert read_variable(cube_path, "t2m").shape == (nb_days, 16, 32)
+    assert not [path for path in root.rglob("*") if ".tmp." in path.name]
+    assert description["size"] == "test"
+    assert {htw["year"] for htw in description["heatwaves"]} == set(
+        range(YEARS[0], YEARS[1] + 1)
+    )
+
+
+def test_synthetic_dates_converter(synthetic_dataset):
+    root, _ = synthetic_dataset
+    df_dates = pd.read_excel(root / "Data" / "Dates_converter.xlsx", index_col=0)
+    assert list(df_dates.index) == list(range(YEARS[0], YEARS[1] + 1))
+    for year, row in df_dates.iterrows():
+        assert row["Nb_days"] == (date(year, 12, 31) - date(year, 1, 1)).days + 1
+        assert row["Idx_start"] == (date(year, 1, 1) - date(YEARS[0], 1, 1)).days
+        assert row["Idx_end"] == row["Idx_start"] + row["Nb_days"] - 1
+
+
+def test_synthetic_heatwaves_injected(synthetic_dataset):
+    root, description = synthetic_dataset
+    values = read_variable(
+        root
+        / "Data"
+        / "ERA5"
+        / "t2m"
+        / f"ERA5_t2m_tg_Europe_day_0.25deg_{YEARS[0]}-{YEARS[1]}.nc",
+        "t2m",
+    )
+    anomalies, amplitudes = [], []
+    for htw in description["heatwaves"]:
+        # middle day of the heatwave at its center, compared with the same day of the other years
+        day = htw["day_beg"] + htw["duration"] // 2
+        other_days = [
+            (date(year, 1, 1) - date(YEARS[0], 1, 1)).days + day
+            for year in range(YEARS[0], YEARS[1] + 1)
+            if year != htw["year"]
+        ]
+        htw_day = (date(htw["year"], 1, 1) - date(YEARS[0], 1, 1)).days + day
+        center = (htw["center_lat"], htw["center_lon"])
+        anomalies.append(
+            values[(htw_day,) + center] - np.mean(values[(other_days,) + center])
+        )
+        amplitudes.append(htw["amplitude"])
+    assert np.mean(anomalies) == pytest.approx(np.mean(amplitudes), abs=3)
+    assert np.min(anomalies) > 0
+
+
+def test_synthetic_impact_tables(synthetic_dataset):
+    root, description = synthetic_dataset
+    df_emdat = pd.read_excel(
+        root / "Data" / "GDIS_EM-DAT" / "EMDAT_Europe-1950-2022-heatwaves.xlsx",
+        index_col=0,
+    )
+    assert len(df_emdat.index) > 0
+    assert df_emdat["Dis No"].is_unique
+    assert all(
+        dis_no.startswith(disasterno)
+        for dis_no, disasterno in zip(df_emdat["Dis No"], df_emdat["disasterno"])
+    )
+    assert df_emdat["Year"].between(*YEARS).all()
+    # each event is one of the injected heatwaves, recorded in countries of its area
+    htw_starts = {
+        (htw["year"], htw["day_beg"], htw["duration"])
+        for htw in description["heatwaves"]
+    }
+    for _, row in df_emdat.iterrows():
+        start = date(row["Start Year"], row["Start Month"], 1)
+        end = date(row["End Year"], row["End Month"], 1)
+        if not np.isnan(row["Start Day"]):
+            start = start.replace(day=int(row["Start Day"]))
+            end = end.replace(day=int(row["End Day"]))
+            day_beg = (start - date(start.year, 1, 1)).days
+            assert (row["Year"], day_beg, (end - start).days + 1) in htw_starts
+        mask = read_variable(
+            root
+            / "Data"
+            / "ERA5"
+            / "Mask"
+            / f"Mask_{dpf.country_dict[row['Country']]}_ERA5_0.25deg.nc",
+            "mask",
+        )
+        assert np.count_nonzero(mask == 0) >= 3
+
+
+def test_synthetic_dataset_cached(synthetic_dataset):
+    root, description = synthetic_dataset
+    mtimes = {path: path.stat().st_mtime_ns for path in root.rglob("*.nc")}
+    assert sdf.create_synthetic_dataset(str(root), size="test", seed=0) == description
+    assert {path: path.stat().st_mtime_ns for path in root.rglob("*.nc")} == mtimes
+
+
+def test_synthetic_dataset_seed(synthetic_dataset, tmp_path):
+    root, description = synthetic_dataset
+    cube = f"Data/ERA5/t2m/ERA5_t2m_tg_Europe_day_0.25deg_{YEARS[0]}-{YEARS[1]}.nc"
+    # same seed in another root: same dataset
+    same = sdf.create_synthetic_dataset(str(tmp_path / "same"), size="test", seed=0)
+    assert same["heatwaves"] == description["heatwaves"]
+    np.testing.assert_array_equal(
+        read_variable(tmp_path / "same" / cube, "t2m"),
+        read_variable(root / cube, "t2m"),
+    )
+    # another seed: another dataset
+    other = sdf.create_synthetic_dataset(str(tmp_path / "other"), size="test", seed=1)
+    assert other["heatwaves"] != description["heatwaves"]
+
+
+def test_synthetic_params():
+    p = sdf.synthetic_params("test")
+    assert (p["year_beg"], p["year_end"]) == YEARS
+    assert (p["year_beg_climatology"], p["year_end_climatology"]) == YEARS
+    pf = pytest.importorskip("pipeline_functions")
+    pf.check_parameters(p)
+    for stage in pf.pipeline_stages.values():
+        assert set(stage["params"]) <= set(p)
@@ -8,6 +8,8 @@
 
 from math import cos, radians
 
+import numpy as np
+
 import thermofeel
 
 
@@ -40,6 +42,49 @@ def test_calculate_cos_solar_zenith_angle_integrated():
     assert abs(cossza - 0.34495713937581207) < 1e-6
 
 
+def test_calculate_cos_solar_zenith_angle_integrated_grid():
+
+    # polar night first, Paris as in the test above
+    cossza = thermofeel.calculate_cos_solar_zenith_angle_integrated(
+        lat=np.array([89.0, 48.81667]),
+        lon=np.array([2.28972, 2.28972]),
+        d=15,
+        m=11,
+        y=2006,
+        h=10.58333,
+        base=0,
+        step=3,
+    )
+
+    assert cossza[0] == 0.0
+    assert abs(cossza[1] - 0.34495713937581207) < 1e-6
+
+    # one day of hourly values on a (time, lat, lon) grid
+    lat = np.linspace(-89.5, 89.5, 37)[:, np.newaxis]
+    lon = np.linspace(-180.0, 175.0, 72)
+    hours = np.arange(24)
+    cossza = thermofeel.calculate_cos_solar_zenith_angle_integrated(
+        lat=lat,
+        lon=lon,
+        d=21,
+        m=6,
+        y=2021,
+        h=hours[:, np.newaxis, np.newaxis],
+        base=0,
+        step=1,
+    )
+
+    assert cossza.shape == (24, 37, 72)
+    assert np.all((cossza >= 0.0) & (cossza <= 1.0))
+    assert np.all(cossza[:, 0, :] == 0.0)  # polar night
+    assert np.all(cossza[:, -1, :] > 0.0)  # polar day
+    for h in hours:
+        cossza_h = thermofeel.calculate_cos_solar_zenith_angle_integrated(
+            lat=lat, lon=lon, d=21, m=6, y=2021, h=h, base=0, step=1
+        )
+        np.testing.assert_allclose(cossza[h], cossza_h, rtol=0, atol=1e-12)
+
+
 def test_solar_declination_angle():
     sda1, tc1 = thermofeel.solar_declination_angle(jd=166, h=0)
     assert abs(sda1 - 23.32607701732299) < 1e-6
@@ -57,4 +102,5 @@ def test_solar_declination_angle():
 if __name__ == "__main__":
     test_calculate_cos_solar_zenith_angle()  # pragma: no cover
     test_calculate_cos_solar_zenith_angle_integrated()  # pragma: no cover
+    test_calculate_cos_solar_zenith_angle_integrated_grid()  # pragma: no cover
     test_solar_declination_angle()  # pragma: no cover
@@ -0,0 +1,128 @@
+# (C) Copyright 1996- ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+
+import numpy as np
+import pytest
+
+import thermofeel
+
+t2_k = np.array([293.15, 303.15, 273.15, 313.15, 283.15, 258.15])
+va_ms = np.array([0.5, 3.0, 10.0, 1.0, 5.0, 15.0])
+mrt_k = np.array([293.15, 333.15, 263.15, 343.15, 290.15, 250.15])
+e_hPa = np.array([10.0, 25.0, 5.0, 30.0, 12.0, 1.5])
+
+# computed with the term by term evaluation of the polynomial
+utci_reference = np.array(
+    [19.53116794, 36.79208416, -27.87354705, 49.83006599, 3.13685411, -56.26258864]
+)
+
+
+def random_inputs(n, seed=0):
+    rng = np.random.default_rng(seed)
+    t2 = rng.uniform(230.0, 330.0, n)
+    va = rng.uniform(0.5, 16.0, n)
+    mrt = t2 + rng.uniform(-25.0, 90.0, n)
+    e = rng.uniform(0.5, 45.0, n)
+    return t2, va, mrt, e
+
+
+def polynomial_utci(t2, va, mrt, e):
+    t2m = t2 - 273.15
+    e_mrt = (mrt - 273.15) - t2m
+    rh = e / 10.0
+    utci = t2m.copy()
+    for c, p_t2m, p_va, p_e_mrt, p_rh in thermofeel.thermofeel._UTCI_COEFFICIENTS:
+        utci += c * t2m ** p_t2m * va ** p_va * e_mrt ** p_e_mrt * rh ** p_rh
+    return utci
+
+
+def test_calculate_utci():
+    utci = thermofeel.calculate_utci(t2_k, va_ms, mrt_k, e_hPa)
+    np.testing.assert_allclose(utci, utci_reference, rtol=0, atol=1e-7)
+
+    utci = thermofeel.calculate_utci(293.15, 0.5, 293.15, 10.0)
+    assert utci.shape == ()
+    assert abs(utci - utci_reference[0]) < 1e-7
+
+
+def test_calculate_utci_polynomial():
+    inputs = random_inputs(10000)
+    utci = thermofeel.calculate_utci(*inputs)
+    np.testing.assert_allclose(utci, polynomial_utci(*inputs), rtol=1e-10, atol=1e-9)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1000, 16384])
+def test_calculate_utci_chunk_size(chunk_size):
+    inputs = random_inputs(3001)
+    utci = thermofeel.calculate_utci(*inputs)
+    utci_chunks = thermofeel.calculate_utci(*inputs, chunk_size=chunk_size)
+    np.testing.assert_array_equal(utci_chunks, utci)
+
+
+def test_calculate_utci_out():
+    t2, va, mrt, e = [x.reshape(10, 20, 30) for x in random_inputs(6000)]
+    utci = thermofeel.calculate_utci(t2, va, mrt, e)
+
+    out = np.empty((10, 20, 30), dtype=np.float32)
+    result = thermofeel.calculate_utci(t2, va, mrt, e, out=out)
+    assert result is out
+    np.testing.assert_allclose(out, utci, rtol=1e-6, atol=1e-4)
+
+    with pytest.raises(ValueError):
+        thermofeel.calculate_utci(t2, va, mrt, e, out=np.empty((10, 20)))
+    with pytest.raises(ValueError):
+        thermofeel.calculate_utci(t2, va, mrt, e, out=np.empty((30, 20, 10)).T)
+
+
+def test_calculate_utci_broadcast():
+    t2 = np.full((4, 6), 293.15)
+    utci = thermofeel.calculate_utci(t2, va_ms, mrt_k, e_hPa)
+    assert utci.shape == (4, 6)
+    np.testing.assert_allclose(utci[:, 0], utci_reference[0], rtol=0, atol=1e-7)
+
+
+def test_calculate_utci_validity_range():
+    t2 = np.array([293.15, 343.15, 193.15, 293.15, 293.15, 293.15, 293.15, 293.15])
+    va = np.array([3.0, 3.0, 3.0, 17.0, 0.0, 3.0, 3.0, 3.0])
+    mrt = np.array([293.15, 343.15, 193.15, 293.15, 293.15, 293.15, 393.15, 263.15])
+    e = np.array([10.0, 10.0, 1.0, 10.0, 10.0, 51.0, 10.0, 10.0])
+    utci = thermofeel.calculate_utci(t2, va, mrt, e)
+    assert utci[0] != -9999
+    np.testing.assert_array_equal(utci[1:], -9999)
+
+
+def test_calculate_utci_masked():
+    t2, va, mrt, e = random_inputs(100)
+    t2 = np.ma.masked_greater(t2, 320.0)
+    utci = thermofeel.calculate_utci(t2, va, mrt, e)
+    assert np.ma.isMaskedArray(utci)
+    np.testing.assert_array_equal(np.ma.getmaskarray(utci), np.ma.getmaskarray(t2))
+    valid = ~t2.mask
+    np.testing.assert_array_equal(
+        utci.compressed(),
+        thermofeel.calculate_utci(t2.compressed(), va[valid], mrt[valid], e[valid]),
+    )
+
+
+def test_calculate_utci_numexpr():
+    pytest.importorskip("numexpr")
+    inputs = random_inputs(5000)
+    utci = thermofeel.calculate_utci(*inputs, chunk_size=1024, backend="numexpr")
+    np.testing.assert_allclose(
+        utci, thermofeel.calculate_utci(*inputs), rtol=1e-10, atol=1e-9
+    )
+
+
+def test_calculate_utci_backend():
+    with pytest.raises(ValueError):
+        thermofeel.calculate_utci(t2_k, va_ms, mrt_k, e_hPa, backend="fortran")
+
+
+if __name__ == "__main__":
+    test_calculate_utci()  # pragma: no cover
+    test_calculate_utci_polynomial()  # pragma: no cover
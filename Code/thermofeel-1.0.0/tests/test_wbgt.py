@@ -0,0 +1,90 @@
+# (C) Copyright 1996- ECMWF.
+#
+# This software is licensed under the terms of the Apache Licence Version 2.0
+# which can be obtained at http://www.apache.org/licenses/LICENSE-2.0.
+# In applying this licence, ECMWF does not waive the privileges and immunities
+# granted to it by virtue of its status as an intergovernmental organisation
+# nor does it submit to any jurisdiction.
+
+import numpy as np
+import pytest
+
+import thermofeel
+
+t2_k = np.array([293.15, 303.15, 273.15, 313.15, 283.15, 258.15])
+va_ms = np.array([0.5, 3.0, 10.0, 1.0, 5.0, 15.0])
+mrt_k = np.array([293.15, 333.15, 263.15, 343.15, 290.15, 250.15])
+
+# computed with the former solver, recomputing every sub-expression in float64
+wbgt_reference = np.array(
+    [20.0, 36.6932657929, -0.7450031013, 51.4997674318, 10.9149443732, -15.4086162545]
+)
+
+
+def random_inputs(n, seed=0):
+    rng = np.random.default_rng(seed)
+    t2 = rng.uniform(230.0, 325.0, n)
+    mrt = t2 + rng.uniform(-30.0, 70.0, n)
+    va = np.exp(rng.uniform(np.log(0.1), np.log(60.0), n))
+    return t2, mrt, va
+
+
+def test_calculate_wbgt():
+    wbgt = thermofeel.calculate_wbgt(t2_k, mrt_k, va_ms)
+    np.testing.assert_allclose(wbgt, wbgt_reference, rtol=0, atol=1e-9)
+
+    wbgt = thermofeel.calculate_wbgt(293.15, 293.15, 0.5)
+    assert wbgt.shape == ()
+    assert abs(wbgt - 20.0) < 1e-9
+
+
+def test_calculate_wbgt_float32():
+    t2, mrt, va = random_inputs(100000)
+    wbgt = thermofeel.calculate_wbgt(t2, mrt, va)
+    wbgt32 = thermofeel.calculate_wbgt(
+        t2.astype(np.float32),
+        mrt.astype(np.float32),
+        va.astype(np.float32),
+        dtype=np.float32,
+    )
+    assert wbgt32.dtype == np.float32
+    np.testing.assert_allclose(wbgt32, wbgt, rtol=0, atol=1e-3)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1000, 65536])
+def test_calculate_wbgt_chunk_size(chunk_size):
+    inputs = random_inputs(3001)
+    wbgt = thermofeel.calculate_wbgt(*inputs)
+    wbgt_chunks = thermofeel.calculate_wbgt(*inputs, chunk_size=chunk_size)
+    np.testing.assert_array_equal(wbgt_chunks, wbgt)
+
+
+def test_calculate_wbgt_out():
+    t2, mrt, va = [x.reshape(10, 20, 30) for x in random_inputs(6000)]
+    wbgt = thermofeel.calculate_wbgt(t2, mrt, va)
+
+    out = np.empty((10, 20, 30), dtype=np.float32)
+    result = thermofeel.calculate_wbgt(t2, mrt, va, out=out)
+    assert result is out
+    np.testing.assert_allclose(out, wbgt, rtol=0, atol=1e-4)
+
+    with pytest.raises(ValueError):
+        thermofeel.calculate_wbgt(t2, mrt, va, out=np.empty((10, 20)))
+
+
+def test_calculate_wbgt_masked():
+    t2, mrt, va = random_inputs(100)
+    va = np.ma.masked_less(va, 1.0)
+    wbgt = thermofeel.calculate_wbgt(t2, mrt, va)
+    assert np.ma.isMaskedArray(wbgt)
+    np.testing.assert_array_equal(np.ma.getmaskarray(wbgt), np.ma.getmaskarray(va))
+    valid = ~va.mask
+    np.testing.assert_array_equal(
+        wbgt.compressed(),
+        thermofeel.calculate_wbgt(t2[valid], mrt[valid], va.compressed()),
+    )
+
+
+if __name__ == "__main__":
+    test_calculate_wbgt()  # pragma: no cover
+    test_calculate_wbgt_float32()  # pragma: no cover